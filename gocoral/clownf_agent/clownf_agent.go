@@ -17,6 +17,8 @@ import (
 	"sync"
 	"bytes"
 	"sort"
+	"net"
+	"encoding/json"
 	yaml "gopkg.in/yaml.v2"
 	"github.com/hashicorp/consul/api"
 	"github.com/hashicorp/consul/api/watch"
@@ -29,6 +31,10 @@ const (
 	// lockPath is the path used to acquire a coordinating lock
 	// for a highly-available deploy.
 	SessionTTLSeconds = 10
+	// Timeout of connecting to the resident Clownfish server
+	ServerDialTimeout = 10 * time.Second
+	// Timeout of a mount request to the resident Clownfish server
+	ServerMountTimeout = 30 * time.Minute
 )
 
 type LustreService struct {
@@ -277,6 +283,51 @@ type ServiceAgent struct {
 	SARuntimeConfig RuntimeConfig
 }
 
+// Mount the service through the resident Clownfish server. Return false if
+// the server is not available, then the clownf command should be used.
+// Once the request might have been sent, return true with the error, so
+// the mount is retried through the server in the next loop instead of
+// running clownf command at the same time.
+func serverServiceMount(serviceName string, stdout *bytes.Buffer,
+			stderr *bytes.Buffer) (bool, error) {
+	conn, err := net.DialTimeout("unix", CLOWNF_SERVER_SOCKET,
+				     ServerDialTimeout)
+	if err != nil {
+		return false, nil
+	}
+	defer conn.Close()
+
+	err = conn.SetDeadline(time.Now().Add(ServerMountTimeout))
+	if err != nil {
+		return true, fmt.Errorf("failed to set deadline of Clownfish server connection: %v", err)
+	}
+
+	request := map[string]interface{}{
+		"operation": "mount",
+		"service_name": serviceName,
+	}
+	err = json.NewEncoder(conn).Encode(request)
+	if err != nil {
+		return true, fmt.Errorf("failed to send request to Clownfish server: %v", err)
+	}
+
+	var response struct {
+		Ret int `json:"ret"`
+		Stdout string `json:"stdout"`
+		Stderr string `json:"stderr"`
+	}
+	err = json.NewDecoder(conn).Decode(&response)
+	if err != nil {
+		return true, fmt.Errorf("failed to get response from Clownfish server: %v", err)
+	}
+	stdout.WriteString(response.Stdout)
+	stderr.WriteString(response.Stderr)
+	if response.Ret != 0 {
+		return true, fmt.Errorf("Clownfish server failed with %d", response.Ret)
+	}
+	return true, nil
+}
+
 func (agent *ServiceAgent) SAMaintainService(logger log.Logger,
 					     waitGroup *sync.WaitGroup,
 					     exitChannel <-chan struct{}) {
@@ -307,13 +358,19 @@ func (agent *ServiceAgent) SAMaintainService(logger log.Logger,
 			if status == SSUnknown || status == SSMountFailed {
 				logger.Info("starting service", "service", agent.SAServiceName)
 			}
-			cmd := exec.Command("clownf", "service", "mount", agent.SAServiceName)
 			stdout.Reset()
 			stderr.Reset()
-			cmd.Stdout = &stdout
-			cmd.Stderr = &stderr
 			startTime := time.Now()
-			err := cmd.Run()
+			handled, err := serverServiceMount(agent.SAServiceName,
+							   &stdout, &stderr)
+			if !handled {
+				stdout.Reset()
+				stderr.Reset()
+				cmd := exec.Command("clownf", "service", "mount", agent.SAServiceName)
+				cmd.Stdout = &stdout
+				cmd.Stderr = &stderr
+				err = cmd.Run()
+			}
 			duration := int(time.Since(startTime).Seconds())
 			stdoutString := stdout.String()
 			stdoutString = strings.Replace(stdoutString, "\n", "\\n", -1)
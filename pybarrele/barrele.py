@@ -3,7 +3,6 @@ Barreleye is a performance monitoring system for Lustre
 """
 # pylint: disable=too-many-lines
 import json
-import prettytable
 from fire import Fire
 from pycoral import parallel
 from pycoral import cmd_general
@@ -12,19 +11,30 @@ from pycoral import clog
 from pycoral import constant
 from pycoral import lustre_version
 from pycoral import ssh_host
+from pycoral import ssh_basic
+from pycoral import utils
+from pycoral import lazy_import
 from pybarrele import barrele_instance
 from pybarrele import barrele_constant
+from pybarrele import barrele_dashboard
+from pybarrele import barrele_query_proxy
+from pybarrele import barrele_server
 
+prettytable = lazy_import.lazy_module("prettytable")  # pylint: disable=invalid-name
+asyncio = lazy_import.lazy_module("asyncio")  # pylint: disable=invalid-name
 
-def init_env(config_fpath, logdir, log_to_file, iso):
+
+def init_env(config_fpath, logdir, log_to_file, iso, background_writer=False):
     """
     Init log and instance for commands that needs it
     """
     log_dir_is_default = (logdir == barrele_constant.BARRELE_LOG_DIR)
-    log, workspace, barrele_config = cmd_general.init_env(config_fpath,
-                                                          logdir,
-                                                          log_to_file,
-                                                          log_dir_is_default)
+    log, workspace, barrele_config = \
+        cmd_general.init_env(config_fpath, logdir, log_to_file,
+                             log_dir_is_default,
+                             background_writer=background_writer)
+    # Reuse SSH connections to the hosts across commands
+    ssh_basic.ssh_master_pool_enable()
     local_host = ssh_host.get_local_host(ssh=True)
     if iso is not None:
         iso = cmd_general.check_argument_fpath(log, local_host, iso)
@@ -195,56 +205,57 @@ class BarreleAgentStatusCache():
         # The Collectd version. clog.ERROR_MSG on error.
         self.basc_collectd_version = None
 
-    def basc_is_up(self, log):
+    async def basc_is_up(self, log):
         """
         Return whether the host is up
         """
         if self._basc_is_up is None:
-            self._basc_is_up = self.basc_agent.bea_host.sh_is_up(log)
+            host = self.basc_agent.bea_host
+            self._basc_is_up = await host.sh_is_up_async(log)
             if not self._basc_is_up:
                 self.basc_failed = True
         return self._basc_is_up
 
-    def basc_init_collectd_up(self, log):
+    async def basc_init_collectd_up(self, log):
         """
         Init the status of whether collectd is up
         """
-        if not self.basc_is_up(log):
+        if not await self.basc_is_up(log):
             self.basc_running_collectd = -1
             return
         self.basc_running_collectd = \
-            self.basc_agent.bea_collectd_running(log)
+            await self.basc_agent.bea_collectd_running_async(log)
         if self.basc_running_collectd < 0:
             self.basc_failed = True
 
-    def basc_init_collectd_version(self, log):
+    async def basc_init_collectd_version(self, log):
         """
         Init the status of collectd version
         """
-        if not self.basc_is_up(log):
+        if not await self.basc_is_up(log):
             self.basc_collectd_version = clog.ERROR_MSG
             return
-        collectd_version = self.basc_agent.bea_collectd_version(log)
+        collectd_version = \
+            await self.basc_agent.bea_collectd_version_async(log)
         if collectd_version is None:
             self.basc_collectd_version = clog.ERROR_MSG
             self.basc_failed = True
         else:
             self.basc_collectd_version = collectd_version
 
-    def basc_init_fields(self, log, field_names):
+    async def basc_init_fields(self, log, field_names):
         """
         Init this status cache according to required field names
         """
-        # pylint: disable=no-self-use
         for field in field_names:
             if field == barrele_constant.BARRELE_FIELD_HOST:
                 continue
             if field == barrele_constant.BARRELE_FIELD_UP:
-                self.basc_is_up(log)
+                await self.basc_is_up(log)
             elif field == barrele_constant.BARRELE_FIELD_COLLECTD:
-                self.basc_init_collectd_up(log)
+                await self.basc_init_collectd_up(log)
             elif field == barrele_constant.BARRELE_FIELD_COLLECTD_VERSION:
-                self.basc_init_collectd_version(log)
+                await self.basc_init_collectd_version(log)
             else:
                 log.cl_error("unknown field [%s]", field)
                 return -1
@@ -315,12 +326,36 @@ class BarreleAgentStatusCache():
         return False
 
 
-def agent_status_init(log, workspace, agent_status, field_names):
+async def agent_status_init(log, agent_status, field_names, semaphore,
+                            printer=None):
     """
-    Init status of a agent
+    Init status of a agent. If printer is not None, print the status of the
+    agent as soon as it is ready.
     """
-    # pylint: disable=unused-argument
-    return agent_status.basc_init_fields(log, field_names)
+    async with semaphore:
+        ret = await agent_status.basc_init_fields(log, field_names)
+    if printer is not None:
+        printer.lsp_item_print(log, agent_status)
+    return ret
+
+
+async def agents_status_init(log, agent_status_list, field_names,
+                             parallelism, printer=None):
+    """
+    Init status of the agents concurrently in the event loop. Return the
+    number of agents that failed.
+    """
+    semaphore = asyncio.Semaphore(parallelism)
+    coroutines = []
+    for agent_status in agent_status_list:
+        coroutines.append(agent_status_init(log, agent_status, field_names,
+                                            semaphore, printer=printer))
+    rets = await asyncio.gather(*coroutines)
+    failures = 0
+    for ret in rets:
+        if ret:
+            failures += 1
+    return failures
 
 
 def agent_status_field(log, agent_status, field_name):
@@ -332,9 +367,11 @@ def agent_status_field(log, agent_status, field_name):
 
 
 def print_agents(log, barreleye_instance, agents, status=False,
-                 print_table=True, field_string=None):
+                 print_table=True, field_string=None,
+                 output_format=cmd_general.OUTPUT_FORMAT_TABLE):
     """
-    Print table of BarreleAgent.
+    Print table of BarreleAgent. If output_format is not table, print a
+    line for each agent as soon as its status is ready.
     """
     # pylint: disable=too-many-branches,too-many-locals,too-many-statements
     if not print_table and len(agents) > 1:
@@ -370,29 +407,26 @@ def print_agents(log, barreleye_instance, agents, status=False,
                                                agent)
         agent_status_list.append(agent_status)
 
+    printer = cmd_general.list_stream_printer(log, field_names,
+                                              agent_status_field,
+                                              output_format)
     if (len(agent_status_list) > 0 and
             not agent_status_list[0].basc_can_skip_init_fields(field_names)):
-        args_array = []
-        thread_ids = []
-        for agent_status in agent_status_list:
-            args = (agent_status, field_names)
-            args_array.append(args)
-            agent = agent_status.basc_agent
-            hostname = agent.bea_host.sh_hostname
-            thread_id = "agent_status_%s" % hostname
-            thread_ids.append(thread_id)
-
-        parallel_execute = parallel.ParallelExecute(barreleye_instance.bei_workspace,
-                                                    "agent_status",
-                                                    agent_status_init,
-                                                    args_array,
-                                                    thread_ids=thread_ids)
-        ret = parallel_execute.pe_run(log, parallelism=10)
+        ret = utils.run_coroutine(agents_status_init(log, agent_status_list,
+                                                     field_names, 10,
+                                                     printer=printer))
         if ret:
             log.cl_error("failed to init fields %s for agents",
                          field_names)
+            if printer is not None:
+                printer.lsp_finish(log, rc=-1)
             return -1
+    elif printer is not None:
+        for agent_status in agent_status_list:
+            printer.lsp_item_print(log, agent_status)
 
+    if printer is not None:
+        return printer.lsp_finish(log)
     rc = cmd_general.print_list(log, agent_status_list, quick_fields,
                                 slow_fields, none_table_fields,
                                 agent_status_field,
@@ -598,12 +632,17 @@ class BarreleServerStatusCache():
         return False
 
 
-def server_status_init(log, workspace, server_status, field_names):
+def server_status_init(log, workspace, server_status, field_names,
+                       printer=None):
     """
-    Init status of a server
+    Init status of a server. If printer is not None, print the status of the
+    server as soon as it is ready.
     """
     # pylint: disable=unused-argument
-    return server_status.bssc_init_fields(log, field_names)
+    ret = server_status.bssc_init_fields(log, field_names)
+    if printer is not None:
+        printer.lsp_item_print(log, server_status)
+    return ret
 
 
 def server_status_field(log, server_status, field_name):
@@ -615,9 +654,11 @@ def server_status_field(log, server_status, field_name):
 
 
 def print_servers(log, barreleye_instance, servers, status=False,
-                  print_table=True, field_string=None):
+                  print_table=True, field_string=None,
+                  output_format=cmd_general.OUTPUT_FORMAT_TABLE):
     """
-    Print table of BarreleServer.
+    Print table of BarreleServer. If output_format is not table, print a
+    line for each server as soon as its status is ready.
     """
     # pylint: disable=too-many-branches,too-many-locals,too-many-statements
     if not print_table and len(servers) > 1:
@@ -654,12 +695,15 @@ def print_servers(log, barreleye_instance, servers, status=False,
                                                  server)
         server_status_list.append(server_status)
 
+    printer = cmd_general.list_stream_printer(log, field_names,
+                                              server_status_field,
+                                              output_format)
     if (len(server_status_list) > 0 and
             not server_status_list[0].bssc_can_skip_init_fields(field_names)):
         args_array = []
         thread_ids = []
         for server_status in server_status_list:
-            args = (server_status, field_names)
+            args = (server_status, field_names, printer)
             args_array.append(args)
             server = server_status.bssc_server
             hostname = server.bes_server_host.sh_hostname
@@ -675,8 +719,15 @@ def print_servers(log, barreleye_instance, servers, status=False,
         if ret:
             log.cl_error("failed to init fields %s for servers",
                          field_names)
+            if printer is not None:
+                printer.lsp_finish(log, rc=-1)
             return -1
+    elif printer is not None:
+        for server_status in server_status_list:
+            printer.lsp_item_print(log, server_status)
 
+    if printer is not None:
+        return printer.lsp_finish(log)
     rc = cmd_general.print_list(log, server_status_list, quick_fields,
                                 slow_fields, none_table_fields,
                                 server_status_field,
@@ -698,18 +749,22 @@ class BarreleServerCommand():
         self._bsc_log_to_file = log_to_file
         self._bsc_iso = iso
 
-    def status(self):
+    def status(self, output_format="table"):
         """
         Print the status of the Barreleye server.
+        :param output_format: table, jsonl or csv, default: table.
         """
         log, barreleye_instance = init_env(self._bsc_config_fpath,
                                            self._bsc_logdir,
                                            self._bsc_log_to_file,
                                            self._bsc_iso)
+        output_format = cmd_general.check_argument_output_format(log,
+                                                                 "output_format",
+                                                                 output_format)
         server = barreleye_instance.bei_barreleye_server
         servers = [server]
         ret = print_servers(log, barreleye_instance, servers, status=True,
-                            print_table=False)
+                            print_table=False, output_format=output_format)
         cmd_general.cmd_exit(log, ret)
 
     def host(self):
@@ -724,6 +779,95 @@ class BarreleServerCommand():
         log.cl_stdout(server.bes_server_host.sh_hostname)
         cmd_general.cmd_exit(log, 0)
 
+    def check_dashboards(self, time_range=None, all_queries=False,
+                         generate=False, output_format="table",
+                         dashboard_dir=barrele_server.GRAFANA_DASHBOARD_DIR):
+        """
+        Check the queries of Grafana dashboards against the continuous
+        queries. Missing continuous queries, raw queries that could read
+        the data of continuous queries, and raw queries that read too many
+        points are printed.
+        :param time_range: Time range to check the queries with, e.g. 7d.
+            Default: the time ranges of the dashboards.
+        :param all_queries: Print all queries, not only the ones with
+            problems, default: False.
+        :param generate: Print the definitions of the continuous queries
+            that fix the problems instead of the queries, default: False.
+        :param output_format: table, jsonl or csv, default: table.
+        :param dashboard_dir: The dir of dashboards,
+            default: /var/lib/coral/barrele/grafana_dashboards.
+        """
+        # pylint: disable=too-many-arguments,too-many-locals
+        log, barreleye_instance = init_env(self._bsc_config_fpath,
+                                           self._bsc_logdir,
+                                           self._bsc_log_to_file,
+                                           self._bsc_iso)
+        cmd_general.check_argument_bool(log, "all_queries", all_queries)
+        cmd_general.check_argument_bool(log, "generate", generate)
+        output_format = cmd_general.check_argument_output_format(log,
+                                                                 "output_format",
+                                                                 output_format)
+        dashboard_dir = cmd_general.check_argument_str(log, "dashboard_dir",
+                                                       dashboard_dir)
+        if time_range is not None:
+            time_range = cmd_general.check_argument_str(log, "time_range",
+                                                        time_range)
+        dashboard_queries = \
+            barrele_dashboard.dashboards_check(log, barreleye_instance,
+                                               dashboard_dir=dashboard_dir,
+                                               time_range=time_range)
+        if dashboard_queries is None:
+            cmd_general.cmd_exit(log, -1)
+
+        if generate:
+            definitions = \
+                barrele_dashboard.dashboards_missing_cq_definitions(barreleye_instance,
+                                                                    dashboard_queries)
+            for definition in definitions:
+                log.cl_stdout(definition)
+            cmd_general.cmd_exit(log, 0)
+
+        if all_queries:
+            printed_queries = dashboard_queries
+        else:
+            printed_queries = []
+            for dashboard_query in dashboard_queries:
+                if dashboard_query.dq_status != barrele_dashboard.QUERY_STATUS_OK:
+                    printed_queries.append(dashboard_query)
+        quick_fields = [barrele_constant.BARRELE_FIELD_DASHBOARD,
+                        barrele_constant.BARRELE_FIELD_PANEL,
+                        barrele_constant.BARRELE_FIELD_MEASUREMENT,
+                        barrele_constant.BARRELE_FIELD_KIND,
+                        barrele_constant.BARRELE_FIELD_POINTS,
+                        barrele_constant.BARRELE_FIELD_STATUS,
+                        barrele_constant.BARRELE_FIELD_SUGGESTION]
+        none_table_fields = [barrele_constant.BARRELE_FIELD_REF_ID]
+        rc = cmd_general.print_list(log, printed_queries, quick_fields, [],
+                                    none_table_fields,
+                                    barrele_dashboard.dashboard_query_field,
+                                    output_format=output_format)
+        cmd_general.cmd_exit(log, rc)
+
+    def query_proxy(self, port=barrele_constant.BARRELE_QUERY_PROXY_PORT):
+        """
+        Run the query proxy between Grafana and Influxdb in foreground.
+        The proxy caches the query results shared by Grafana viewers.
+        :param port: The port to listen on, default: 8087.
+        """
+        # The proxy logs every request, keep the file writes off the
+        # request threads
+        log, barreleye_instance = init_env(self._bsc_config_fpath,
+                                           self._bsc_logdir,
+                                           self._bsc_log_to_file,
+                                           self._bsc_iso,
+                                           background_writer=True)
+        if not isinstance(port, int) or port <= 0 or port >= 65536:
+            log.cl_error("invalid port [%s]", port)
+            cmd_general.cmd_exit(log, -1)
+        ret = barrele_query_proxy.query_proxy_run(log, barreleye_instance,
+                                                  port=port)
+        cmd_general.cmd_exit(log, ret)
+
 
 class BarreleAgentCommand():
     """
@@ -737,21 +881,28 @@ class BarreleAgentCommand():
         self._bac_log_to_file = log_to_file
         self._bac_iso = iso
 
-    def ls(self, status=False):
+    def ls(self, status=False, output_format="table"):
         """
         List all Barreleye agents.
 
         Please note there might be some agents that are not configured in Barreleye
         configuration. So this command might not list all of the agents.
         :param status: print the status of agents, default: False.
+        :param output_format: table, jsonl or csv. A line is printed for
+            each agent as soon as its status is ready if jsonl or csv,
+            default: table.
         """
         log, barreleye_instance = init_env(self._bac_config_fpath,
                                            self._bac_logdir,
                                            self._bac_log_to_file,
                                            self._bac_iso)
         cmd_general.check_argument_bool(log, "status", status)
+        output_format = cmd_general.check_argument_output_format(log,
+                                                                 "output_format",
+                                                                 output_format)
         agents = list(barreleye_instance.bei_agent_dict.values())
-        ret = print_agents(log, barreleye_instance, agents, status=status)
+        ret = print_agents(log, barreleye_instance, agents, status=status,
+                           output_format=output_format)
         cmd_general.cmd_exit(log, ret)
 
     def status(self, host=None, ssh_key=None):
@@ -869,40 +1020,66 @@ class BarreleAgentCommand():
         cmd_general.cmd_exit(log, ret)
 
 
-def print_query_result(log, barreleye_instance, query):
+def _print_query_table(log, field_names, rows, header=True):
     """
-    Print result of Influxdb query.
+    Print the rows of a serie as a table.
     """
-    server = barreleye_instance.bei_barreleye_server
-    influxdb_client = server.bes_influxdb_client
-    serie = influxdb_client.bic_query_serie(log, query)
-    if serie is None:
-        return -1
-
-    json_string = json.dumps(serie, indent=4, separators=(',', ': '))
-    if barrele_constant.INFLUX_COLUMNS not in serie:
-        log.cl_error("missing [%s] in serie result of influxdb: %s",
-                     barrele_constant.INFLUX_COLUMNS, json_string)
-        return -1
-    field_names = serie[barrele_constant.INFLUX_COLUMNS]
-
-    if barrele_constant.INFLUX_VALUES not in serie:
-        log.cl_error("missing [%s] in serie result of influxdb: %s",
-                     barrele_constant.INFLUX_VALUES, json_string)
-        return -1
-    rows = serie[barrele_constant.INFLUX_VALUES]
-
     table = prettytable.PrettyTable()
     table.set_style(prettytable.PLAIN_COLUMNS)
     cmd_general.table_add_field_names(table, field_names)
+    table.header = header
     for row in rows:
         table.add_row(row)
     cmd_general.table_set_sortby(table, field_names[0])
     log.cl_stdout(table)
-    #
-    #log.cl_stdout(json_string)
+
+
+def print_query_result(log, barreleye_instance, query):
+    """
+    Print result of Influxdb query. Each chunk is printed once it arrives,
+    so the rows of a huge result are never held in memory together.
+    """
+    server = barreleye_instance.bei_barreleye_server
+    influxdb_client = server.bes_influxdb_client
+    # The serie being printed, a big serie can be split into multiple
+    # chunks
+    current = {"key": None}
+
+    def serie_func(statement_id, serie):
+        """
+        Print a chunk of a serie. The header is only printed for the first
+        chunk of the serie.
+        """
+        if barrele_constant.INFLUX_COLUMNS not in serie:
+            log.cl_error("missing [%s] in serie result of influxdb: %s",
+                         barrele_constant.INFLUX_COLUMNS,
+                         json.dumps(serie, indent=4, separators=(',', ': ')))
+            return -1
+
+        if barrele_constant.INFLUX_VALUES not in serie:
+            log.cl_error("missing [%s] in serie result of influxdb: %s",
+                         barrele_constant.INFLUX_VALUES,
+                         json.dumps(serie, indent=4, separators=(',', ': ')))
+            return -1
+
+        key = (statement_id, serie.get("name"),
+               json.dumps(serie.get("tags"), sort_keys=True))
+        header = key != current["key"]
+        current["key"] = key
+        _print_query_table(log, serie[barrele_constant.INFLUX_COLUMNS],
+                           serie[barrele_constant.INFLUX_VALUES],
+                           header=header)
+        return 0
+
+    ret = influxdb_client.bic_query_stream(log, query, serie_func, epoch="s")
+    if ret:
+        return -1
+    if current["key"] is None:
+        log.cl_error("no serie in result of query [%s]", query)
+        return -1
     return 0
 
+
 class BarreleInfluxCommand():
     """
     Commands to manage the Influxdb of Barreleye.
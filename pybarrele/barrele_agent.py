@@ -335,20 +335,22 @@ class BarreleAgent():
         if serie is None:
             return -1
 
-        json_string = json.dumps(serie, indent=4, separators=(',', ': '))
         if barrele_constant.INFLUX_COLUMNS not in serie:
+            json_string = json.dumps(serie, indent=4, separators=(',', ': '))
             log.cl_debug("missing [%s] in serie result of influxdb: %s",
                          json_string, barrele_constant.INFLUX_COLUMNS)
             return -1
         columns = serie[barrele_constant.INFLUX_COLUMNS]
 
         if barrele_constant.INFLUX_VALUES not in serie:
+            json_string = json.dumps(serie, indent=4, separators=(',', ': '))
             log.cl_debug("missing [%s] in serie result of influxdb: %s",
                          barrele_constant.INFLUX_VALUES, json_string)
             return -1
         serie_values = serie[barrele_constant.INFLUX_VALUES]
 
         if len(serie_values) != 1:
+            json_string = json.dumps(serie, indent=4, separators=(',', ': '))
             log.cl_debug("invalid [%s] in serie result of influxdb: %s",
                          barrele_constant.INFLUX_VALUES, json_string)
             return -1
@@ -363,6 +365,7 @@ class BarreleAgent():
             i += 1
 
         if time_index == -1:
+            json_string = json.dumps(serie, indent=4, separators=(',', ': '))
             log.cl_debug("got wrong InfluxDB data [%s], no [time] in "
                          "the columns", json_string)
             return -1
@@ -503,6 +506,20 @@ class BarreleAgent():
         """
         command = "systemctl is-active collectd"
         retval = self.bea_host.sh_run(log, command)
+        return self._bea_collectd_running_parse(log, command, retval)
+
+    async def bea_collectd_running_async(self, log):
+        """
+        Async version of bea_collectd_running()
+        """
+        command = "systemctl is-active collectd"
+        retval = await self.bea_host.sh_run_async(log, command)
+        return self._bea_collectd_running_parse(log, command, retval)
+
+    def _bea_collectd_running_parse(self, log, command, retval):
+        """
+        Parse the result of the command run by bea_collectd_running()
+        """
         if retval.cr_stdout == "active\n":
             return 1
         if retval.cr_stdout == "unknown\n":
@@ -554,3 +571,14 @@ class BarreleAgent():
             log.cl_error("failed to get the Collectd RPM version on host [%s]",
                          host.sh_hostname)
         return version
+
+    async def bea_collectd_version_async(self, log):
+        """
+        Async version of bea_collectd_version()
+        """
+        host = self.bea_host
+        ret, version = await host.sh_rpm_version_async(log, "collectd-")
+        if ret or version is None:
+            log.cl_error("failed to get the Collectd RPM version on host [%s]",
+                         host.sh_hostname)
+        return version
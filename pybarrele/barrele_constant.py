@@ -5,6 +5,12 @@ from pycoral import constant
 
 # The Influxdb database name.
 BARRELE_INFLUXDB_DATABASE_NAME = "barreleye_database"
+# The Influxdb retention policy that keeps the config of Barreleye forever,
+# e.g. the time ranges that the retention policies are used for.
+BARRELE_INFLUXDB_CONFIG_RP = "barreleye_config"
+# The measurement of the time ranges that each retention policy is
+# used for by Grafana dashboards.
+BARRELE_INFLUXDB_RP_MEASUREMENT = "barreleye_rp_ranges"
 # Config file of Barreleye
 BARRELE_CONFIG_FNAME = "barreleye.conf"
 BARRELE_DIR = constant.CORAL_DIR + "/barrele"
@@ -37,12 +43,17 @@ BARRELE_SERVER_DEPENDENT_RPMS = ["influxdb", "grafana"]
 BARRELE_SERVER_DEPENDENT_RPMS += BARRELE_DOWNLOAD_DEPENDENT_RPMS
 BARRELE_DEPENDENT_RPMS = BARRELE_AGENT_DEPENDENT_RPMS + BARRELE_SERVER_DEPENDENT_RPMS
 BARRELE_TEST_LOG_DIR_BASENAME = "barrele_test"
+# The systemd service of the query proxy between Grafana and Influxdb
+BARRELE_QUERY_PROXY_SERVICE_NAME = "barrele_query_proxy"
+# The port that the query proxy listens on
+BARRELE_QUERY_PROXY_PORT = 8087
 
 
 BRL_AGENTS = "agents"
 BRL_CONTINUOUS_QUERY_PERIODS = "continuous_query_periods"
 BRL_COLLECT_INTERVAL = "collect_interval"
 BRL_DATA_PATH = "data_path"
+BRL_DURATION = "duration"
 BRL_ENABLE_DISK = "enable_disk"
 BRL_ENABLE_IME = "enable_ime"
 BRL_ENABLE_INFINIBAND = "enable_infiniband"
@@ -51,9 +62,13 @@ BRL_ENABLE_LUSTRE_MDS = "enable_lustre_mds"
 BRL_ENABLE_LUSTRE_OSS = "enable_lustre_oss"
 BRL_ENABLE_LUSTRE_EXP_MDT = "enable_lustre_exp_mdt"
 BRL_ENABLE_LUSTRE_EXP_OST = "enable_lustre_exp_ost"
+BRL_ENABLE_QUERY_PROXY = "enable_query_proxy"
 BRL_HOSTNAME = "hostname"
+BRL_INTERVAL = "interval"
 BRL_JOBSTAT_PATTERN = "jobstat_pattern"
 BRL_LUSTRE_FALLBACK_VERSION = "lustre_fallback_version"
+BRL_NAME = "name"
+BRL_RETENTION_POLICIES = "retention_policies"
 BRL_SERVER = "server"
 BRL_SSH_IDENTITY_FILE = "ssh_identity_file"
 
@@ -107,6 +122,22 @@ BARRELE_FIELD_GRAFANA_VERSION = "Grafana Version"
 BARRELE_FIELD_INFLUXDB = "Influxdb"
 # The version of Influxdb
 BARRELE_FIELD_INFLUXDB_VERSION = "Influxdb Version"
+# The title of Grafana dashboard
+BARRELE_FIELD_DASHBOARD = "Dashboard"
+# The title of Grafana panel
+BARRELE_FIELD_PANEL = "Panel"
+# The ref ID of the query in a Grafana panel
+BARRELE_FIELD_REF_ID = "Ref ID"
+# The measurement that a query reads from
+BARRELE_FIELD_MEASUREMENT = "Measurement"
+# Whether a query reads raw data or data of continuous query
+BARRELE_FIELD_KIND = "Kind"
+# The number of points per serie that a query reads
+BARRELE_FIELD_POINTS = "Points"
+# The status of checking a query
+BARRELE_FIELD_STATUS = "Status"
+# The suggestion to fix a query
+BARRELE_FIELD_SUGGESTION = "Suggestion"
 
 # results in Influx query output
 INFLUX_RESULTS = "results"
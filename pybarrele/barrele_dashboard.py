@@ -0,0 +1,443 @@
+"""
+Library to check the queries of Grafana dashboards against the continuous
+queries of Barreleye server.
+
+A query of a panel either reads the raw data written by agents, or reads
+the measurement written by a continuous query (CQ), which has far fewer
+series. If no CQ writes the measurement that a panel reads, the panel is
+always empty. A panel that reads raw data over a long time range scans
+many points of many series.
+"""
+import re
+import json
+from pybarrele import barrele_constant
+from pybarrele import barrele_influxdb
+from pybarrele import barrele_server
+
+# The query reads the data written by agents
+QUERY_KIND_RAW = "raw"
+# The query reads the measurement written by a continuous query
+QUERY_KIND_CQ = "cq"
+# Nothing wrong with the query
+QUERY_STATUS_OK = "ok"
+# No continuous query writes the measurement that the query reads
+QUERY_STATUS_MISSING_CQ = "missing_cq"
+# The query reads raw data, but a continuous query has the same result
+QUERY_STATUS_CQ_AVAILABLE = "cq_available"
+# The query reads too many raw points per serie for the time range
+QUERY_STATUS_LONG_RANGE = "raw_long_range"
+# The query can not be parsed
+QUERY_STATUS_UNPARSED = "unparsed"
+# The measurement in FROM clause, optionally qualified with database or
+# retention policy
+QUERY_FROM_PATTERN = re.compile(r'\bFROM\s+(?:"[^"]*"\s*\.\s*)*'
+                                r'("[^"]*"|/(?:\\.|[^/\\])*/|[\w.\-]+)',
+                                re.I)
+# The aggregation function of the first field in SELECT clause
+QUERY_FUNCTION_PATTERN = re.compile(r'\bSELECT\s+(\w+)\s*\(', re.I)
+# The tag matched with a value in WHERE clause
+QUERY_TAG_FILTER_PATTERN = re.compile(r'"(\w+)"\s*=~?\s*[\'/]')
+# GROUP BY clause
+QUERY_GROUP_BY_PATTERN = re.compile(r'\bGROUP\s+BY\s+(.*?)(?:\b(?:fill|ORDER|'
+                                    r'LIMIT|SLIMIT|OFFSET|SOFFSET|tz)\b|$)',
+                                    re.I | re.S)
+# time() in GROUP BY clause
+QUERY_GROUP_BY_TIME_PATTERN = re.compile(r'\btime\s*\([^)]*\)', re.I)
+# The select parts of Grafana query builder that are not aggregations
+GRAFANA_SELECT_NONE_FUNCTIONS = ["field", "math", "alias"]
+
+
+def grafana_range_seconds(time_from, time_to="now"):
+    """
+    Return the seconds of a Grafana time range like "now-7d" to "now".
+    Return None if the range is not relative to now.
+    """
+    seconds = []
+    for text in [time_from, time_to]:
+        if not isinstance(text, str):
+            return None
+        text = text.strip()
+        if text == "now":
+            seconds.append(0)
+            continue
+        if not text.startswith("now-"):
+            return None
+        duration = barrele_influxdb.influx_duration_seconds(text[4:])
+        if duration is None:
+            return None
+        seconds.append(duration)
+    return seconds[0] - seconds[1]
+
+
+def grafana_dashboard_panels(value):
+    """
+    Return the panels that have queries in a dashboard, including the
+    panels in rows.
+    """
+    panels = []
+    if isinstance(value, dict):
+        if isinstance(value.get("targets"), list):
+            panels.append(value)
+        for child in value.values():
+            if isinstance(child, (dict, list)):
+                panels += grafana_dashboard_panels(child)
+    elif isinstance(value, list):
+        for child in value:
+            panels += grafana_dashboard_panels(child)
+    return panels
+
+
+def _grafana_raw_query_parse(target):
+    """
+    Return (measurement, function, filter_tags, group_tags) of a target
+    written as raw InfluxQL. Return None if the query can not be parsed.
+    """
+    query = target.get("query")
+    if not isinstance(query, str):
+        return None
+    match = QUERY_FROM_PATTERN.search(query)
+    if match is None:
+        return None
+    measurement = match.group(1)
+    if measurement.startswith('"'):
+        measurement = measurement[1:-1]
+    match = QUERY_FUNCTION_PATTERN.search(query)
+    function = None
+    if match is not None:
+        function = match.group(1).lower()
+    filter_tags = QUERY_TAG_FILTER_PATTERN.findall(query)
+    group_tags = []
+    match = QUERY_GROUP_BY_PATTERN.search(query)
+    if match is not None:
+        groups = QUERY_GROUP_BY_TIME_PATTERN.sub("", match.group(1))
+        for group in groups.split(","):
+            group = group.strip().strip('"')
+            if group != "":
+                group_tags.append(group)
+    return measurement, function, filter_tags, group_tags
+
+
+def _grafana_builder_query_parse(target):
+    """
+    Return (measurement, function, filter_tags, group_tags) of a target
+    built by Grafana query builder. Return None if no measurement.
+    """
+    measurement = target.get("measurement")
+    if not isinstance(measurement, str):
+        return None
+    function = None
+    for select in target.get("select", []):
+        for part in select:
+            part_type = part.get("type")
+            if part_type not in GRAFANA_SELECT_NONE_FUNCTIONS:
+                function = part_type
+                break
+        if function is not None:
+            break
+    filter_tags = []
+    for tag in target.get("tags", []):
+        if tag.get("operator") in ["=", "=~"]:
+            filter_tags.append(tag.get("key"))
+    group_tags = []
+    for group in target.get("groupBy", []):
+        if group.get("type") == "tag":
+            group_tags += group.get("params", [])
+    return measurement, function, filter_tags, group_tags
+
+
+def grafana_target_parse(target):
+    """
+    Return (measurement, function, filter_tags, group_tags) of a query
+    target of a Grafana panel. The function is None if the values are not
+    aggregated. Return None if the target can not be parsed.
+    """
+    if target.get("rawQuery"):
+        parsed = _grafana_raw_query_parse(target)
+    else:
+        parsed = _grafana_builder_query_parse(target)
+    if parsed is None:
+        return None
+    measurement, function, filter_tags, group_tags = parsed
+    return (measurement, function, sorted(set(filter_tags)),
+            sorted(set(group_tags)))
+
+
+class DashboardQuery():
+    """
+    The checking result of a query of a Grafana panel.
+    """
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    def __init__(self, dashboard, panel, ref_id):
+        # The title of the dashboard
+        self.dq_dashboard = dashboard
+        # The title of the panel
+        self.dq_panel = panel
+        # The ref ID of the query in the panel
+        self.dq_ref_id = ref_id
+        # The measurement that the query reads
+        self.dq_measurement = None
+        # QUERY_KIND_*
+        self.dq_kind = None
+        # The points per serie that the query reads, None if unknown
+        self.dq_points = None
+        # QUERY_STATUS_*
+        self.dq_status = QUERY_STATUS_UNPARSED
+        # The suggestion to fix the query
+        self.dq_suggestion = ""
+        # The InfluxdbContinuousQuery that should be created for the
+        # query, None if not needed
+        self.dq_continuous_query = None
+
+
+def dashboard_query_field(log, dashboard_query, field_name):
+    """
+    Return (ret, value) of a field of DashboardQuery.
+    """
+    # pylint: disable=too-many-return-statements
+    if field_name == barrele_constant.BARRELE_FIELD_DASHBOARD:
+        return 0, dashboard_query.dq_dashboard
+    if field_name == barrele_constant.BARRELE_FIELD_PANEL:
+        return 0, dashboard_query.dq_panel
+    if field_name == barrele_constant.BARRELE_FIELD_REF_ID:
+        return 0, dashboard_query.dq_ref_id
+    if field_name == barrele_constant.BARRELE_FIELD_MEASUREMENT:
+        return 0, dashboard_query.dq_measurement
+    if field_name == barrele_constant.BARRELE_FIELD_KIND:
+        return 0, dashboard_query.dq_kind
+    if field_name == barrele_constant.BARRELE_FIELD_POINTS:
+        return 0, dashboard_query.dq_points
+    if field_name == barrele_constant.BARRELE_FIELD_STATUS:
+        if dashboard_query.dq_status == QUERY_STATUS_MISSING_CQ:
+            return -1, dashboard_query.dq_status
+        return 0, dashboard_query.dq_status
+    if field_name == barrele_constant.BARRELE_FIELD_SUGGESTION:
+        return 0, dashboard_query.dq_suggestion
+    log.cl_error("unknown field [%s] of dashboard query", field_name)
+    return -1, None
+
+
+class DashboardChecker():
+    """
+    Check the queries of Grafana dashboards.
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, barreleye_instance, continuous_queries):
+        # The Barreleye instance
+        self.dc_instance = barreleye_instance
+        # Key is the measurement written by the continuous query, value is
+        # InfluxdbContinuousQuery
+        self.dc_cq_dict = {}
+        for continuous_query in continuous_queries:
+            cq_measurement = \
+                barrele_server.influxdb_cq_measurement(continuous_query.icq_measurement,
+                                                       continuous_query.icq_groups)
+            self.dc_cq_dict[cq_measurement] = continuous_query
+        # Seconds between the points of raw data
+        self.dc_collect_interval = int(barreleye_instance.bei_collect_interval)
+        # Seconds between the points written by continuous queries
+        self.dc_cq_interval = (self.dc_collect_interval *
+                               int(barreleye_instance.bei_continuous_query_periods))
+
+    def _dc_points(self, kind, range_seconds):
+        """
+        Return the points per serie to read for the time range, None if
+        unknown.
+        """
+        if range_seconds is None:
+            return None
+        if kind == QUERY_KIND_CQ:
+            interval = self.dc_cq_interval
+        else:
+            interval = self.dc_collect_interval
+        retention_policies = self.dc_instance.bei_retention_policies
+        ranges = barrele_server.retention_policy_ranges(retention_policies)
+        for retention_policy, rp_range in zip(retention_policies, ranges):
+            _, min_range, max_range = rp_range
+            if min_range <= range_seconds < max_range:
+                interval = max(interval, retention_policy.irp_interval)
+                break
+        return range_seconds // interval
+
+    def _dc_cq_query_check(self, dashboard_query, measurement):
+        """
+        Check a query that reads the measurement of a continuous query.
+        """
+        name = measurement[len(barrele_server.INFLUXDB_CQ_MEASUREMENT_PREFIX):]
+        fields = name.split("-")
+        expected = barrele_server.influxdb_cq_measurement(fields[0],
+                                                          fields[1:])
+        if measurement in self.dc_cq_dict:
+            dashboard_query.dq_status = QUERY_STATUS_OK
+            return
+        dashboard_query.dq_status = QUERY_STATUS_MISSING_CQ
+        if expected in self.dc_cq_dict:
+            dashboard_query.dq_suggestion = "read [%s]" % expected
+            return
+        continuous_query = \
+            barrele_influxdb.InfluxdbContinuousQuery(fields[0], fields[1:])
+        dashboard_query.dq_continuous_query = continuous_query
+        if expected != measurement:
+            dashboard_query.dq_suggestion = ("create CQ and read [%s]" %
+                                             expected)
+        else:
+            dashboard_query.dq_suggestion = "create CQ"
+
+    def _dc_raw_query_check(self, dashboard_query, measurement, function,
+                            tags):
+        """
+        Check a query that reads raw data.
+        """
+        cq_measurement = None
+        if function == "sum" and not measurement.startswith("/"):
+            cq_measurement = barrele_server.influxdb_cq_measurement(measurement,
+                                                                    tags)
+        if cq_measurement in self.dc_cq_dict:
+            dashboard_query.dq_status = QUERY_STATUS_CQ_AVAILABLE
+            dashboard_query.dq_suggestion = "read [%s]" % cq_measurement
+            return
+
+        points = dashboard_query.dq_points
+        if points is None or points <= barrele_server.GRAFANA_RP_MAX_POINTS:
+            dashboard_query.dq_status = QUERY_STATUS_OK
+            return
+        dashboard_query.dq_status = QUERY_STATUS_LONG_RANGE
+        if cq_measurement is not None:
+            continuous_query = \
+                barrele_influxdb.InfluxdbContinuousQuery(measurement, tags)
+            dashboard_query.dq_continuous_query = continuous_query
+            dashboard_query.dq_suggestion = ("create CQ and read [%s]" %
+                                             cq_measurement)
+        elif len(self.dc_instance.bei_retention_policies) == 0:
+            dashboard_query.dq_suggestion = ("configure [%s]" %
+                                             barrele_constant.BRL_RETENTION_POLICIES)
+
+    def dc_query_check(self, dashboard_query, target, range_seconds):
+        """
+        Check a query target of a panel.
+        """
+        result = grafana_target_parse(target)
+        if result is None:
+            return
+        measurement, function, filter_tags, group_tags = result
+        dashboard_query.dq_measurement = measurement
+        if measurement.startswith(barrele_server.INFLUXDB_CQ_MEASUREMENT_PREFIX):
+            dashboard_query.dq_kind = QUERY_KIND_CQ
+        else:
+            dashboard_query.dq_kind = QUERY_KIND_RAW
+        dashboard_query.dq_points = self._dc_points(dashboard_query.dq_kind,
+                                                    range_seconds)
+        if dashboard_query.dq_kind == QUERY_KIND_CQ:
+            self._dc_cq_query_check(dashboard_query, measurement)
+        else:
+            tags = sorted(set(filter_tags + group_tags))
+            self._dc_raw_query_check(dashboard_query, measurement, function,
+                                     tags)
+
+
+def dashboard_load(log, dashboard_dir, fname, collect_interval):
+    """
+    Return the dashboard loaded from the template or JSON file.
+    """
+    fpath = dashboard_dir + "/" + fname
+    template_fpath = fpath + ".template"
+    try:
+        with open(template_fpath, "r", encoding="utf-8") as template_file:
+            content = template_file.read()
+        content = content.replace(barrele_server.TEMPLATE_COLLECT_INTERVAL,
+                                  str(collect_interval))
+        content = content.replace(barrele_server.TEMPLATE_DATASOURCE_NAME,
+                                  barrele_server.GRAFANA_DATASOURCE_NAME)
+    except FileNotFoundError:
+        try:
+            with open(fpath, "r", encoding="utf-8") as json_file:
+                content = json_file.read()
+        except OSError as error:
+            log.cl_error("failed to read dashboard [%s]: %s", fpath, error)
+            return None
+    except OSError as error:
+        log.cl_error("failed to read dashboard template [%s]: %s",
+                     template_fpath, error)
+        return None
+    try:
+        return json.loads(content)
+    except ValueError as error:
+        log.cl_error("invalid JSON of dashboard [%s]: %s", fname, error)
+        return None
+
+
+def dashboards_check(log, barreleye_instance,
+                     dashboard_dir=barrele_server.GRAFANA_DASHBOARD_DIR,
+                     time_range=None):
+    """
+    Return a list of DashboardQuery of all the queries in the enabled
+    dashboards. If time_range is not None, it overrides the time ranges of
+    the dashboards, e.g. "7d". Return None on error.
+    """
+    # pylint: disable=too-many-locals
+    server = barreleye_instance.bei_barreleye_server
+    continuous_queries = \
+        server.bes_influxdb_continuous_queries(log, barreleye_instance)
+    if continuous_queries is None:
+        log.cl_error("failed to get the continuous queries of Influxdb")
+        return None
+    checker = DashboardChecker(barreleye_instance, continuous_queries)
+
+    range_override = None
+    if time_range is not None:
+        range_override = barrele_influxdb.influx_duration_seconds(str(time_range))
+        if range_override is None or range_override <= 0:
+            log.cl_error("invalid time range [%s]", time_range)
+            return None
+
+    dashboard_queries = []
+    for name, fname in barrele_server.GRAFANA_DASHBOARDS.items():
+        if barrele_server.grafana_dashboard_disabled(name,
+                                                     barreleye_instance.bei_jobstat_pattern):
+            log.cl_debug("skipping disabled dashboard [%s]", name)
+            continue
+        dashboard = dashboard_load(log, dashboard_dir, fname,
+                                   barreleye_instance.bei_collect_interval)
+        if dashboard is None:
+            log.cl_error("failed to load dashboard [%s]", name)
+            return None
+
+        time_dict = dashboard.get("time")
+        dashboard_range = None
+        if isinstance(time_dict, dict):
+            dashboard_range = grafana_range_seconds(time_dict.get("from"),
+                                                    time_dict.get("to"))
+        for panel in grafana_dashboard_panels(dashboard):
+            range_seconds = range_override
+            if range_seconds is None:
+                range_seconds = dashboard_range
+                if panel.get("timeFrom"):
+                    range_seconds = grafana_range_seconds("now-" +
+                                                          str(panel["timeFrom"]))
+            for target in panel["targets"]:
+                if not isinstance(target, dict) or target.get("hide"):
+                    continue
+                dashboard_query = DashboardQuery(name, panel.get("title", ""),
+                                                 target.get("refId", ""))
+                checker.dc_query_check(dashboard_query, target, range_seconds)
+                dashboard_queries.append(dashboard_query)
+    return dashboard_queries
+
+
+def dashboards_missing_cq_definitions(barreleye_instance, dashboard_queries):
+    """
+    Return the CREATE statements of the continuous queries that the
+    dashboard queries need.
+    """
+    server = barreleye_instance.bei_barreleye_server
+    cq_dict = {}
+    for dashboard_query in dashboard_queries:
+        continuous_query = dashboard_query.dq_continuous_query
+        if continuous_query is None:
+            continue
+        cq_name, query = \
+            server.bes_influxdb_cq_definition(barreleye_instance,
+                                              continuous_query.icq_measurement,
+                                              continuous_query.icq_groups,
+                                              where=continuous_query.icq_where)
+        cq_dict[cq_name] = query
+    return [cq_dict[cq_name] for cq_name in sorted(cq_dict)]
@@ -3,10 +3,114 @@ Library for access Influxdb through HTTP API
 """
 import http
 import json
+import gzip
+import re
 import traceback
-import requests
+from pycoral import lazy_import
 from pybarrele import barrele_constant
 
+requests = lazy_import.lazy_module("requests")  # pylint: disable=invalid-name
+
+
+# Number of points in each chunk of chunked query responses
+INFLUX_QUERY_CHUNK_SIZE = 10000
+# Number of lines in each request of writing
+INFLUX_WRITE_BATCH_SIZE = 5000
+# statement_id in Influx query output
+INFLUX_STATEMENT_ID = "statement_id"
+# error in Influx query output
+INFLUX_ERROR = "error"
+
+
+def influx_data_string(data):
+    """
+    Return the indented JSON string of Influxdb data for messages.
+    """
+    return json.dumps(data, indent=4, separators=(',', ': '))
+
+
+# Seconds of the units of InfluxDB duration
+INFLUX_DURATION_UNITS = {"w": 604800, "d": 86400, "h": 3600, "m": 60,
+                         "s": 1, "ms": 0.001, "u": 0.000001,
+                         "\u00b5": 0.000001, "ns": 0.000000001}
+INFLUX_DURATION_PATTERN = re.compile(r"(\d+)(ns|ms|u|\u00b5|s|m|h|d|w)")
+INFLUX_CQ_SELECT_PATTERN = re.compile(r"\bSELECT\b(.*?)\bINTO\b(.*?)\bFROM\b"
+                                      r"(.*?)(?:\bWHERE\b|\bGROUP\s+BY\b)",
+                                      re.I | re.S)
+INFLUX_CQ_WHERE_PATTERN = re.compile(r"\bWHERE\b(.*?)\bGROUP\s+BY\b",
+                                     re.I | re.S)
+INFLUX_CQ_GROUP_PATTERN = re.compile(r"\bGROUP\s+BY\s+time\(([^)]*)\)(.*?)"
+                                     r"\bEND\b", re.I | re.S)
+# The name of the retention policy created together with the database
+INFLUX_DEFAULT_RETENTION_POLICY = "autogen"
+# The duration of retention policy that keeps data forever
+INFLUX_DURATION_INFINITE = "INF"
+# The minimum seconds of the duration of retention policy
+INFLUX_RETENTION_DURATION_MIN = 3600
+# Valid name of retention policy
+INFLUX_RETENTION_POLICY_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_]+$")
+
+
+def influx_duration_seconds(duration):
+    """
+    Return the seconds of InfluxDB duration like "1m30s". None on error.
+    """
+    duration = duration.strip()
+    seconds = 0
+    end = 0
+    for match in INFLUX_DURATION_PATTERN.finditer(duration):
+        if match.start() != end:
+            return None
+        end = match.end()
+        seconds += int(match.group(1)) * INFLUX_DURATION_UNITS[match.group(2)]
+    if end == 0 or end != len(duration):
+        return None
+    return seconds
+
+
+def influx_cq_normalize(text):
+    """
+    Return the text of a CQ clause without quotes, spaces and case.
+    """
+    return re.sub(r'[\s"]', "", text).lower()
+
+
+def influx_cq_signature(query):
+    """
+    Return the parts of a CREATE CONTINUOUS QUERY statement that matter
+    when comparing with another one. InfluxDB rewrites the statement when
+    saving it (e.g. time(60s) becomes time(1m) and the quotes are changed),
+    so the text can not be compared directly.
+    Return a tuple of (select, into, from, where, interval seconds, groups),
+    or None if the statement can not be parsed.
+    """
+    match = INFLUX_CQ_SELECT_PATTERN.search(query)
+    if match is None:
+        return None
+    select = influx_cq_normalize(match.group(1))
+    into = influx_cq_normalize(match.group(2))
+    source = influx_cq_normalize(match.group(3))
+
+    match = INFLUX_CQ_GROUP_PATTERN.search(query)
+    if match is None:
+        return None
+    interval = influx_duration_seconds(match.group(1))
+    if interval is None:
+        return None
+    groups = []
+    for group in match.group(2).split(","):
+        group = group.strip().strip('"')
+        if group != "":
+            groups.append(group)
+    groups.sort()
+
+    match = INFLUX_CQ_WHERE_PATTERN.search(query)
+    if match is None:
+        where = ""
+    else:
+        where = influx_cq_normalize(match.group(1))
+    return select, into, source, where, interval, tuple(groups)
+
 
 class BarreleInfluxdbClient():
     """
@@ -20,19 +124,26 @@ class BarreleInfluxdbClient():
 
         self.bic_baseurl = "http://%s:8086" % (hostname)
         self.bic_queryurl = self.bic_baseurl + "/query"
+        self.bic_writeurl = self.bic_baseurl + "/write"
         self.bic_headers = {
             'Content-type': 'application/json',
             'Accept': 'text/plain'
         }
         self.bic_session = requests.Session()
 
-    def bic_query(self, log, query, epoch=None):
+    def bic_query(self, log, query, epoch=None, chunk_size=None,
+                  method='GET'):
         """
         Send a query to InfluxDB.
         :param epoch: response timestamps to be in epoch format either 'h',
             'm', 's', 'ms', 'u', or 'ns', defaults to `None` which is
             RFC3339 UTC format with nanosecond precision
         :type epoch: str
+        :param chunk_size: if not None, ask InfluxDB to return the points
+            in chunks of this size and return a streaming response
+        :param method: 'GET' or 'POST'. Statements that change the
+            database (CREATE, DROP etc.) should use 'POST'. With 'POST' the
+            query is sent in the body, so long queries are fine.
         """
         # pylint: disable=bare-except
         params = {}
@@ -42,12 +153,24 @@ class BarreleInfluxdbClient():
         if epoch is not None:
             params['epoch'] = epoch
 
+        if chunk_size is not None:
+            params['chunked'] = 'true'
+            params['chunk_size'] = str(chunk_size)
+
+        data = None
+        headers = self.bic_headers
+        if method == 'POST':
+            data = {'q': params.pop('q')}
+            headers = {'Accept': 'text/plain'}
+
         log.cl_debug("querying [%s] to [%s]", query, self.bic_queryurl)
         try:
-            response = self.bic_session.request(method='GET',
+            response = self.bic_session.request(method=method,
                                                 url=self.bic_queryurl,
                                                 params=params,
-                                                headers=self.bic_headers)
+                                                data=data,
+                                                headers=headers,
+                                                stream=chunk_size is not None)
         except:
             log.cl_error("got exception with query [%s]: %s", query,
                          traceback.format_exc())
@@ -55,27 +178,21 @@ class BarreleInfluxdbClient():
 
         return response
 
-    def bic_query_serie(self, log, query, quiet=False):
+    def bic_query_results(self, log, statements, epoch=None, quiet=False,
+                          method='GET'):
         """
-        Query on Influxdb, return a serie dict like:
-        {
-            "columns": [
-                "key"
-            ],
-            "values": [
-                [
-                    "aggregation.cpu-average.cpu.idle,fqdn=autotest-el7-vm311"
-                ],
-        }
+        Send multiple statements in a single query. Return a list of result
+        dicts, one for each statement in the same order. A result dict
+        might have "error" if the statement failed. Return None on error.
         """
-        response = self.bic_query(log, query, epoch="s")
         if quiet:
             log_func = log.cl_debug
         else:
             log_func = log.cl_error
+        query = ";".join(statements)
+        response = self.bic_query(log, query, epoch=epoch, method=method)
         if response is None:
-            log_func("failed to with query Influxdb with query [%s]",
-                     query)
+            log_func("failed to query Influxdb with query [%s]", query)
             return None
 
         if response.status_code != http.HTTPStatus.OK:
@@ -84,30 +201,245 @@ class BarreleInfluxdbClient():
             return None
 
         data = response.json()
-        json_string = json.dumps(data, indent=4, separators=(',', ': '))
         if barrele_constant.INFLUX_RESULTS not in data:
             log_func("got wrong InfluxDB data [%s], no [%s]",
-                     json_string, barrele_constant.INFLUX_RESULTS)
+                     influx_data_string(data), barrele_constant.INFLUX_RESULTS)
             return None
         results = data[barrele_constant.INFLUX_RESULTS]
+        if len(results) != len(statements):
+            log_func("got wrong InfluxDB data [%s], [%s] has [%d] elements "
+                     "but [%d] statements are sent",
+                     influx_data_string(data), barrele_constant.INFLUX_RESULTS,
+                     len(results), len(statements))
+            return None
 
-        if len(results) != 1:
-            log_func("got wrong InfluxDB data [%s], [%s] is not a "
-                     "array with only one element",
-                     json_string, barrele_constant.INFLUX_RESULTS)
+        ordered_results = [None] * len(statements)
+        for result in results:
+            statement_id = result.get(INFLUX_STATEMENT_ID)
+            if (not isinstance(statement_id, int) or statement_id < 0 or
+                    statement_id >= len(statements)):
+                log_func("got wrong InfluxDB data [%s], invalid [%s]",
+                         influx_data_string(data), INFLUX_STATEMENT_ID)
+                return None
+            ordered_results[statement_id] = result
+        return ordered_results
+
+    def bic_query_stream(self, log, query, serie_func, epoch=None,
+                         chunk_size=INFLUX_QUERY_CHUNK_SIZE, quiet=False):
+        """
+        Query with chunked response and parse the chunks incrementally, so
+        huge results do not need to be held in memory.
+        serie_func will be called for each chunk of serie with arguments
+        (statement_id, serie). A big serie can be split into multiple
+        chunks with the same name and tags. If serie_func returns non-zero,
+        the query will be aborted.
+        Return 0 on success, negative on error.
+        """
+        # pylint: disable=too-many-branches
+        if quiet:
+            log_func = log.cl_debug
+        else:
+            log_func = log.cl_error
+        response = self.bic_query(log, query, epoch=epoch,
+                                  chunk_size=chunk_size)
+        if response is None:
+            log_func("failed to query Influxdb with query [%s]", query)
+            return -1
+
+        with response:
+            if response.status_code != http.HTTPStatus.OK:
+                log_func("got InfluxDB status [%d] with query [%s]",
+                         response.status_code, query)
+                return -1
+
+            for line in response.iter_lines():
+                if len(line) == 0:
+                    continue
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    log_func("got invalid InfluxDB chunk [%s] with query [%s]",
+                             line, query)
+                    return -1
+                if INFLUX_ERROR in data:
+                    log_func("got InfluxDB error [%s] with query [%s]",
+                             data[INFLUX_ERROR], query)
+                    return -1
+                if barrele_constant.INFLUX_RESULTS not in data:
+                    log_func("got wrong InfluxDB chunk [%s], no [%s]",
+                             influx_data_string(data),
+                             barrele_constant.INFLUX_RESULTS)
+                    return -1
+                for result in data[barrele_constant.INFLUX_RESULTS]:
+                    if INFLUX_ERROR in result:
+                        log_func("got InfluxDB error [%s] with query [%s]",
+                                 result[INFLUX_ERROR], query)
+                        return -1
+                    if barrele_constant.INFLUX_SERIES not in result:
+                        continue
+                    statement_id = result.get(INFLUX_STATEMENT_ID, 0)
+                    for serie in result[barrele_constant.INFLUX_SERIES]:
+                        ret = serie_func(statement_id, serie)
+                        if ret:
+                            log.cl_debug("aborting query [%s]", query)
+                            return ret
+        return 0
+
+    def bic_write(self, log, lines, precision=None, compress=True,
+                  batch_size=INFLUX_WRITE_BATCH_SIZE, retention_policy=None):
+        """
+        Write points in line protocol to InfluxDB. The lines are sent in
+        batches, and compressed with gzip if compress is True.
+        :param precision: precision of the timestamps in the lines, 'n',
+            'u', 'ms', 's', 'm' or 'h'. Defaults to nanosecond.
+        :param retention_policy: the retention policy to write into.
+            Defaults to the default retention policy of the database.
+        Return 0 on success, negative on error.
+        """
+        # pylint: disable=bare-except,too-many-arguments
+        params = {}
+        params['db'] = self.bic_database
+        if precision is not None:
+            params['precision'] = precision
+        if retention_policy is not None:
+            params['rp'] = retention_policy
+        headers = {'Content-Type': 'application/octet-stream'}
+        if compress:
+            headers['Content-Encoding'] = 'gzip'
+
+        for start in range(0, len(lines), batch_size):
+            data = ("\n".join(lines[start:start + batch_size]) +
+                    "\n").encode()
+            if compress:
+                data = gzip.compress(data, compresslevel=1)
+            try:
+                response = self.bic_session.post(self.bic_writeurl,
+                                                  params=params,
+                                                  headers=headers,
+                                                  data=data)
+            except:
+                log.cl_error("got exception when writing to [%s]: %s",
+                             self.bic_writeurl, traceback.format_exc())
+                return -1
+            if response.status_code != http.HTTPStatus.NO_CONTENT:
+                log.cl_error("got InfluxDB status [%d] when writing points: "
+                             "%s", response.status_code, response.text)
+                return -1
+        return 0
+
+    def bic_show_continuous_queries(self, log):
+        """
+        Return a dict of the continuous queries on the database. Key is the
+        name of the CQ, value is the saved query. Return None on error.
+        """
+        results = self.bic_query_results(log, ["SHOW CONTINUOUS QUERIES"])
+        if results is None:
+            return None
+        result = results[0]
+        if INFLUX_ERROR in result:
+            log.cl_error("failed to show continuous queries: %s",
+                         result[INFLUX_ERROR])
+            return None
+        cq_dict = {}
+        if barrele_constant.INFLUX_SERIES not in result:
+            return cq_dict
+        for serie in result[barrele_constant.INFLUX_SERIES]:
+            # Each serie is for a database
+            if serie.get("name") != self.bic_database:
+                continue
+            columns = serie.get(barrele_constant.INFLUX_COLUMNS)
+            if (not isinstance(columns, list) or "name" not in columns or
+                    "query" not in columns):
+                log.cl_error("got wrong InfluxDB data [%s] of continuous "
+                             "queries", influx_data_string(serie))
+                return None
+            name_index = columns.index("name")
+            query_index = columns.index("query")
+            values = serie.get(barrele_constant.INFLUX_VALUES)
+            if values is None:
+                continue
+            for value in values:
+                cq_dict[value[name_index]] = value[query_index]
+        return cq_dict
+
+    def bic_show_retention_policies(self, log):
+        """
+        Return a dict of the retention policies on the database. Key is the
+        name of the retention policy, value is a tuple of (duration seconds,
+        whether default). Duration is 0 if infinite. Return None on error.
+        """
+        results = self.bic_query_results(log,
+                                         ['SHOW RETENTION POLICIES ON "%s"' %
+                                          self.bic_database])
+        if results is None:
+            return None
+        result = results[0]
+        if INFLUX_ERROR in result:
+            log.cl_error("failed to show retention policies: %s",
+                         result[INFLUX_ERROR])
+            return None
+        rp_dict = {}
+        if barrele_constant.INFLUX_SERIES not in result:
+            return rp_dict
+        for serie in result[barrele_constant.INFLUX_SERIES]:
+            columns = serie.get(barrele_constant.INFLUX_COLUMNS)
+            if (not isinstance(columns, list) or "name" not in columns or
+                    "duration" not in columns or "default" not in columns):
+                log.cl_error("got wrong InfluxDB data [%s] of retention "
+                             "policies", influx_data_string(serie))
+                return None
+            name_index = columns.index("name")
+            duration_index = columns.index("duration")
+            default_index = columns.index("default")
+            values = serie.get(barrele_constant.INFLUX_VALUES)
+            if values is None:
+                continue
+            for value in values:
+                duration = influx_duration_seconds(value[duration_index])
+                if duration is None:
+                    log.cl_error("invalid duration [%s] of retention policy "
+                                 "[%s]", value[duration_index],
+                                 value[name_index])
+                    return None
+                rp_dict[value[name_index]] = (duration,
+                                              bool(value[default_index]))
+        return rp_dict
+
+    def bic_query_serie(self, log, query, quiet=False):
+        """
+        Query on Influxdb, return a serie dict like:
+        {
+            "columns": [
+                "key"
+            ],
+            "values": [
+                [
+                    "aggregation.cpu-average.cpu.idle,fqdn=autotest-el7-vm311"
+                ],
+        }
+        """
+        if quiet:
+            log_func = log.cl_debug
+        else:
+            log_func = log.cl_error
+        results = self.bic_query_results(log, [query], epoch="s",
+                                         quiet=quiet)
+        if results is None:
             return None
         result = results[0]
 
         if barrele_constant.INFLUX_SERIES not in result:
             log_func("got wrong InfluxDB data [%s], no [%s] in result",
-                     json_string, barrele_constant.INFLUX_SERIES)
+                     influx_data_string(result),
+                     barrele_constant.INFLUX_SERIES)
             return None
 
         series = result[barrele_constant.INFLUX_SERIES]
         if len(series) != 1:
             log_func("got wrong InfluxDB data [%s], [%s] is not a "
                      "array with only one element",
-                     json_string, barrele_constant.INFLUX_SERIES)
+                     influx_data_string(result),
+                     barrele_constant.INFLUX_SERIES)
             return None
         serie = series[0]
 
@@ -126,3 +458,30 @@ class InfluxdbContinuousQuery():
         self.icq_groups = groups
         # where query
         self.icq_where = where
+
+
+class InfluxdbRetentionPolicy():
+    """
+    A retention policy that keeps data in a resolution for a duration. The
+    data of a retention policy is downsampled from its source retention
+    policy by continuous queries.
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, name, duration, interval, source=None):
+        # Name of the retention policy
+        self.irp_name = name
+        # Seconds to keep the data, 0 if forever
+        self.irp_duration = duration
+        # Seconds between the data points
+        self.irp_interval = interval
+        # The InfluxdbRetentionPolicy to downsample from, None if the data
+        # is written by agents directly
+        self.irp_source = source
+
+    def irp_duration_string(self):
+        """
+        Return the duration in the statements of InfluxDB.
+        """
+        if self.irp_duration == 0:
+            return INFLUX_DURATION_INFINITE
+        return "%ds" % self.irp_duration
@@ -11,6 +11,7 @@ from pycoral import cmd_general
 from pycoral import os_distro
 from pybarrele import barrele_constant
 from pybarrele import barrele_collectd
+from pybarrele import barrele_influxdb
 from pybarrele import barrele_server
 from pybarrele import barrele_agent
 
@@ -35,7 +36,7 @@ class BarreleInstance():
                  continuous_query_periods, jobstat_pattern, lustre_fallback_version,
                  enable_lustre_exp_mdt, enable_lustre_exp_ost, host_dict,
                  agent_dict, barreleye_server,
-                 lustre_version_db):
+                 lustre_version_db, retention_policies):
         # pylint: disable=too-many-locals
         # Log to file for debugging
         self.bei_log_to_file = log_to_file
@@ -76,6 +77,18 @@ class BarreleInstance():
         self.bei_iso_fpath = iso_fpath
         # LustreVersionDatabase
         self.bei_lustre_version_db = lustre_version_db
+        # List of InfluxdbRetentionPolicy from the finest to the coarsest.
+        # Empty if all data is kept in the default retention policy.
+        self.bei_retention_policies = retention_policies
+
+    def bei_raw_retention_policy(self):
+        """
+        Return the name of the retention policy that keeps the data from
+        agents.
+        """
+        if len(self.bei_retention_policies) == 0:
+            return barrele_influxdb.INFLUX_DEFAULT_RETENTION_POLICY
+        return self.bei_retention_policies[0].irp_name
 
 
     def _bei_get_collectd_package_type_dict(self, log):
@@ -434,11 +447,155 @@ def parse_server_config(log, config, config_fpath, host_dict):
     ssh_identity_file = utils.config_value(server_config,
                                            barrele_constant.BRL_SSH_IDENTITY_FILE)
 
+    enable_query_proxy = utils.config_value(server_config,
+                                            barrele_constant.BRL_ENABLE_QUERY_PROXY)
+    if enable_query_proxy is None:
+        log.cl_debug("no [%s] configured, using default value [False]",
+                     barrele_constant.BRL_ENABLE_QUERY_PROXY)
+        enable_query_proxy = False
+    elif not isinstance(enable_query_proxy, bool):
+        log.cl_error("invalid [%s] of server, should be a bool type, "
+                     "please correct file [%s]",
+                     barrele_constant.BRL_ENABLE_QUERY_PROXY, config_fpath)
+        return None
+
     host = ssh_host.get_or_add_host_to_dict(log, host_dict, hostname,
                                             ssh_identity_file)
     if host is None:
         return None
-    return barrele_server.BarreleServer(host, data_path)
+    return barrele_server.BarreleServer(host, data_path,
+                                        enable_query_proxy=enable_query_proxy)
+
+
+def parse_retention_policy_duration(log, rp_name, key, value, config_fpath):
+    """
+    Return the seconds of the duration or interval of a retention policy.
+    Return 0 for infinite duration, None on error.
+    """
+    if (key == barrele_constant.BRL_DURATION and
+            value == barrele_influxdb.INFLUX_DURATION_INFINITE):
+        return 0
+    if not isinstance(value, str):
+        log.cl_error("[%s] of retention policy [%s] should be a string in "
+                     "the config file [%s]", key, rp_name, config_fpath)
+        return None
+    seconds = barrele_influxdb.influx_duration_seconds(value)
+    if seconds is None or seconds <= 0 or seconds != int(seconds):
+        log.cl_error("invalid [%s] of retention policy [%s] as [%s] in the "
+                     "config file [%s], expected whole seconds like \"7d\"",
+                     key, rp_name, value, config_fpath)
+        return None
+    return int(seconds)
+
+
+def parse_retention_policies(log, config, config_fpath, collect_interval,
+                             cq_interval):
+    """
+    Return the list of InfluxdbRetentionPolicy from the finest to the
+    coarsest. Return [] if not configured, None on error.
+    """
+    # pylint: disable=too-many-branches,too-many-return-statements
+    rp_configs = utils.get_config_list(log, config,
+                                       barrele_constant.BRL_RETENTION_POLICIES)
+    if rp_configs is None:
+        if barrele_constant.BRL_RETENTION_POLICIES in config:
+            return None
+        log.cl_debug("no [%s] is configured in the config file [%s], "
+                     "keeping all data in the default retention policy",
+                     barrele_constant.BRL_RETENTION_POLICIES, config_fpath)
+        return []
+
+    retention_policies = []
+    source = None
+    for rp_config in rp_configs:
+        name = utils.config_value(rp_config, barrele_constant.BRL_NAME)
+        if (not isinstance(name, str) or
+                barrele_influxdb.INFLUX_RETENTION_POLICY_NAME_PATTERN.match(name) is None):
+            log.cl_error("invalid [%s] of retention policy as [%s] in the "
+                         "config file [%s]", barrele_constant.BRL_NAME,
+                         name, config_fpath)
+            return None
+        if name == barrele_constant.BARRELE_INFLUXDB_CONFIG_RP:
+            log.cl_error("retention policy [%s] is reserved, please use "
+                         "another name in the config file [%s]", name,
+                         config_fpath)
+            return None
+        for retention_policy in retention_policies:
+            if retention_policy.irp_name == name:
+                log.cl_error("retention policy [%s] is configured for "
+                             "multiple times in the config file [%s]", name,
+                             config_fpath)
+                return None
+
+        duration = utils.config_value(rp_config, barrele_constant.BRL_DURATION)
+        if duration is None:
+            log.cl_error("no [%s] of retention policy [%s] in the config "
+                         "file [%s]", barrele_constant.BRL_DURATION, name,
+                         config_fpath)
+            return None
+        duration = parse_retention_policy_duration(log, name,
+                                                   barrele_constant.BRL_DURATION,
+                                                   duration, config_fpath)
+        if duration is None:
+            return None
+        if 0 < duration < barrele_influxdb.INFLUX_RETENTION_DURATION_MIN:
+            log.cl_error("[%s] of retention policy [%s] is shorter than [%d] "
+                         "seconds in the config file [%s]",
+                         barrele_constant.BRL_DURATION, name,
+                         barrele_influxdb.INFLUX_RETENTION_DURATION_MIN,
+                         config_fpath)
+            return None
+
+        interval = utils.config_value(rp_config, barrele_constant.BRL_INTERVAL)
+        if source is None:
+            # The first retention policy keeps the data from agents
+            if interval is not None:
+                log.cl_error("[%s] should not be configured for the first "
+                             "retention policy [%s] in the config file [%s], "
+                             "its data points are collected every [%s] "
+                             "seconds", barrele_constant.BRL_INTERVAL, name,
+                             config_fpath, collect_interval)
+                return None
+            interval = int(collect_interval)
+        else:
+            if interval is None:
+                log.cl_error("no [%s] of retention policy [%s] in the config "
+                             "file [%s]", barrele_constant.BRL_INTERVAL, name,
+                             config_fpath)
+                return None
+            interval = parse_retention_policy_duration(log, name,
+                                                       barrele_constant.BRL_INTERVAL,
+                                                       interval, config_fpath)
+            if interval is None:
+                return None
+            # The first downsampled retention policy also downsamples the
+            # measurements of continuous queries.
+            if source.irp_source is None:
+                unit = cq_interval
+            else:
+                unit = source.irp_interval
+            if interval <= source.irp_interval or interval % unit:
+                log.cl_error("[%s] of retention policy [%s] should be a "
+                             "multiple of [%d] seconds and larger than the "
+                             "interval of retention policy [%s] in the config "
+                             "file [%s]", barrele_constant.BRL_INTERVAL, name,
+                             unit, source.irp_name, config_fpath)
+                return None
+            if 0 < source.irp_duration < interval:
+                log.cl_error("[%s] of retention policy [%s] is shorter than "
+                             "the [%s] of retention policy [%s] that "
+                             "downsamples from it in the config file [%s]",
+                             barrele_constant.BRL_DURATION, source.irp_name,
+                             barrele_constant.BRL_INTERVAL, name,
+                             config_fpath)
+                return None
+
+        retention_policy = \
+            barrele_influxdb.InfluxdbRetentionPolicy(name, duration, interval,
+                                                     source=source)
+        retention_policies.append(retention_policy)
+        source = retention_policy
+    return retention_policies
 
 
 def barrele_init_instance(log, local_host, workspace, config, config_fpath,
@@ -465,6 +622,15 @@ def barrele_init_instance(log, local_host, workspace, config, config_fpath,
                      config_fpath, BARRELE_CONTINUOUS_QUERY_PERIODS)
         continuous_query_periods = BARRELE_CONTINUOUS_QUERY_PERIODS
 
+    cq_interval = int(collect_interval) * int(continuous_query_periods)
+    retention_policies = parse_retention_policies(log, config, config_fpath,
+                                                  collect_interval,
+                                                  cq_interval)
+    if retention_policies is None:
+        log.cl_error("failed to parse [%s] in the config file [%s]",
+                     barrele_constant.BRL_RETENTION_POLICIES, config_fpath)
+        return None
+
     jobstat_pattern = utils.config_value(config, barrele_constant.BRL_JOBSTAT_PATTERN)
     if jobstat_pattern is None:
         log.cl_debug("no [%s] is configured in the config file [%s], "
@@ -633,7 +799,7 @@ def barrele_init_instance(log, local_host, workspace, config, config_fpath,
                                lustre_fallback_version, enable_lustre_exp_mdt,
                                enable_lustre_exp_ost, host_dict,
                                agent_dict, barreleye_server,
-                               version_db)
+                               version_db, retention_policies)
     for agent in agent_dict.values():
         agent.bea_instance = instance
     return instance
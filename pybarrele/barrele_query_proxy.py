@@ -0,0 +1,543 @@
+"""
+Query proxy between Grafana and Influxdb.
+
+When many Grafana viewers show the same dashboards, the same queries are
+sent to Influxdb again and again. The proxy aligns now() in the queries to
+the collect interval, so that the queries from all viewers during the same
+interval become identical. The results are cached until the end of the
+interval, and identical queries in flight are sent to Influxdb only once.
+The queries of time windows that are old enough to never change are cached
+for a long time.
+"""
+import re
+import json
+import time
+import threading
+import traceback
+import collections
+import socketserver
+import urllib.parse
+from http import HTTPStatus
+from http import server as http_server
+from pycoral import lazy_import
+from pybarrele import barrele_constant
+
+requests = lazy_import.lazy_module("requests")  # pylint: disable=invalid-name
+
+# The max bytes of the cached results
+QUERY_PROXY_CACHE_SIZE = 256 * 1024 * 1024
+# Seconds to cache the results of time windows that never change
+QUERY_PROXY_HISTORY_TTL = 24 * 3600
+# Seconds to wait for the response of Influxdb
+QUERY_PROXY_TIMEOUT = 300
+# The path to get the statistics of the proxy
+QUERY_PROXY_STATS_PATH = "/barreleye_query_proxy/stats"
+# The hop-by-hop headers of requests that are not forwarded to Influxdb.
+# The length is computed again since form data could be changed. The
+# content is encoded as requests supports.
+QUERY_PROXY_SKIPPED_REQUEST_HEADERS = ["accept-encoding", "connection",
+                                       "content-length", "host",
+                                       "keep-alive", "proxy-authenticate",
+                                       "proxy-authorization", "te",
+                                       "trailer", "transfer-encoding",
+                                       "upgrade"]
+# The headers of requests that could change the response, so they are part
+# of the cache key
+QUERY_PROXY_KEY_HEADERS = ["Accept", "Authorization"]
+# The headers of Influxdb responses that are not forwarded to Grafana. The
+# content is decoded by requests and its length is sent by the proxy.
+QUERY_PROXY_SKIPPED_RESPONSE_HEADERS = ["connection", "content-encoding",
+                                        "content-length", "date",
+                                        "keep-alive", "transfer-encoding"]
+# The tokens of InfluxQL that matter when normalizing a query: quoted
+# string or identifier, white spaces, statement separator and now()
+QUERY_TOKEN_PATTERN = re.compile(r"""('(?:\\.|[^'\\])*'|"(?:\\.|[^"\\])*")"""
+                                 r"""|(\s+)|(;)|(\bnow\(\s*\))""", re.I)
+# The upper bound of the time of a normalized statement
+QUERY_TIME_UPPER_PATTERN = re.compile(r"\btime\s*<=?\s*(\d+)ms\b", re.I)
+# INTO clause of a SELECT statement, which writes data
+QUERY_INTO_PATTERN = re.compile(r"\bINTO\b", re.I)
+
+
+def query_normalize(query, now_ms):
+    """
+    Return (normalized, uses_now, statements). White spaces outside quotes
+    are collapsed, now() is replaced by the given time in milliseconds.
+    The statements are the normalized ones with quoted strings removed,
+    which are used to check the kind of the query.
+    """
+    normalized = ""
+    statement = ""
+    statements = []
+    uses_now = False
+    position = 0
+    for match in QUERY_TOKEN_PATTERN.finditer(query):
+        text = query[position:match.start()]
+        normalized += text
+        statement += text
+        position = match.end()
+        quoted, spaces, separator, now = match.groups()
+        if quoted is not None:
+            normalized += quoted
+            statement += quoted[0] + quoted[0]
+        elif spaces is not None:
+            normalized += " "
+            statement += " "
+        elif separator is not None:
+            normalized += separator
+            statements.append(statement.strip())
+            statement = ""
+        elif now is not None:
+            uses_now = True
+            text = "%dms" % now_ms
+            normalized += text
+            statement += text
+    text = query[position:]
+    normalized += text
+    statement += text
+    statements.append(statement.strip())
+    statements = [statement for statement in statements if statement != ""]
+    return normalized.strip().rstrip(";").strip(), uses_now, statements
+
+
+def query_is_read_only(statements):
+    """
+    Return True if all the statements only read data.
+    """
+    if len(statements) == 0:
+        return False
+    for statement in statements:
+        keyword = statement.split(" ", 1)[0].upper()
+        if keyword == "SHOW":
+            continue
+        if keyword != "SELECT":
+            return False
+        if QUERY_INTO_PATTERN.search(statement):
+            return False
+    return True
+
+
+def query_time_upper_bound(statements):
+    """
+    Return the max upper bound of time in milliseconds of the SELECT
+    statements, None if any of the statements has no upper bound.
+    """
+    upper_bound = None
+    for statement in statements:
+        if statement.split(" ", 1)[0].upper() != "SELECT":
+            return None
+        bounds = QUERY_TIME_UPPER_PATTERN.findall(statement)
+        if len(bounds) == 0:
+            return None
+        bound = max(int(value) for value in bounds)
+        if upper_bound is None or bound > upper_bound:
+            upper_bound = bound
+    return upper_bound
+
+
+def query_request_cacheable(method, path, params, is_form, data):
+    """
+    Return True if the request is a single query whose result could be
+    cached.
+    """
+    if path != "/query" or method not in ["GET", "POST"]:
+        return False
+    if method == "POST" and not is_form and len(data) > 0:
+        return False
+    names = [name for name, value in params]
+    return names.count("q") == 1 and "chunked" not in names
+
+
+class QueryProxyFlight():
+    """
+    A query that has been sent to Influxdb and not replied yet. The
+    identical queries wait for its response.
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self):
+        # Set when the response is got
+        self.qpf_event = threading.Event()
+        # (status, headers, body)
+        self.qpf_response = None
+
+
+class BarreleQueryProxy():
+    """
+    The proxy that caches the results of queries.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, log, influxdb_url, align_interval, settle_time,
+                 cache_size=QUERY_PROXY_CACHE_SIZE):
+        # pylint: disable=too-many-arguments
+        # Log of the proxy
+        self.bqp_log = log
+        # URL of Influxdb, e.g. http://server1:8086
+        self.bqp_influxdb_url = influxdb_url
+        # Milliseconds that now() in queries is aligned to
+        self.bqp_align_ms = align_interval * 1000
+        # Milliseconds after which the data of a time window never change.
+        # All the continuous queries should have finished by then.
+        self.bqp_settle_ms = settle_time * 1000
+        # The max bytes of cached results
+        self.bqp_cache_size = cache_size
+        # Key is (path, params, headers in QUERY_PROXY_KEY_HEADERS,
+        # normalized query). Value is
+        # (expire_time, (status, headers, body)). The least recently used
+        # entry is the first one.
+        self.bqp_cache = collections.OrderedDict()
+        # Bytes of the cached bodies
+        self.bqp_cache_bytes = 0
+        # Time of the last cleanup of expired entries
+        self.bqp_cache_cleanup_time = time.time()
+        # Key is the same as bqp_cache, value is QueryProxyFlight
+        self.bqp_flights = {}
+        # Lock to protect bqp_cache, bqp_flights and bqp_counters
+        self.bqp_lock = threading.Lock()
+        # Key is the name of counter, value is the number of requests
+        self.bqp_counters = collections.OrderedDict()
+        for name in ["hits", "history_hits", "misses", "coalesced",
+                     "passthrough", "errors"]:
+            self.bqp_counters[name] = 0
+        # Requests session of each thread
+        self.bqp_local = threading.local()
+
+    def _bqp_count(self, name):
+        """
+        Increase a counter.
+        """
+        with self.bqp_lock:
+            self.bqp_counters[name] += 1
+
+    def _bqp_session(self):
+        """
+        Return the requests session of this thread.
+        """
+        session = getattr(self.bqp_local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self.bqp_local.session = session
+        return session
+
+    def _bqp_forward(self, method, path, params, data, headers):
+        """
+        Send the request to Influxdb and return (status, headers, body).
+        """
+        # pylint: disable=too-many-arguments,bare-except
+        url = self.bqp_influxdb_url + path
+        # The headers listed in Connection are hop-by-hop too
+        skipped_headers = list(QUERY_PROXY_SKIPPED_REQUEST_HEADERS)
+        for name in headers.get("Connection", "").split(","):
+            skipped_headers.append(name.strip().lower())
+        forward_headers = {}
+        for name, value in headers.items():
+            if name.lower() in skipped_headers:
+                continue
+            forward_headers[name] = value
+        try:
+            response = self._bqp_session().request(method, url, params=params,
+                                                   data=data,
+                                                   headers=forward_headers,
+                                                   timeout=QUERY_PROXY_TIMEOUT)
+        except:
+            self.bqp_log.cl_error("failed to send request to [%s]: %s",
+                                  url, traceback.format_exc())
+            self._bqp_count("errors")
+            body = json.dumps({"error": "query proxy failed to connect to "
+                                        "Influxdb"}).encode()
+            return (HTTPStatus.BAD_GATEWAY,
+                    [("Content-Type", "application/json")], body)
+        response_headers = []
+        for name, value in response.headers.items():
+            if name.lower() in QUERY_PROXY_SKIPPED_RESPONSE_HEADERS:
+                continue
+            response_headers.append((name, value))
+        return response.status_code, response_headers, response.content
+
+    def _bqp_cache_get(self, key, now):
+        """
+        Return the cached response or None. The lock should be held.
+        """
+        entry = self.bqp_cache.get(key)
+        if entry is None:
+            return None
+        expire_time, response = entry
+        if expire_time <= now:
+            self._bqp_cache_remove(key)
+            return None
+        self.bqp_cache.move_to_end(key)
+        return response
+
+    def _bqp_cache_remove(self, key):
+        """
+        Remove a cached response. The lock should be held.
+        """
+        _, response = self.bqp_cache.pop(key)
+        self.bqp_cache_bytes -= len(response[2])
+
+    def _bqp_cache_put(self, key, expire_time, response):
+        """
+        Cache a response. The lock should be held.
+        """
+        size = len(response[2])
+        if size > self.bqp_cache_size:
+            return
+        now = time.time()
+        if now - self.bqp_cache_cleanup_time > self.bqp_align_ms / 1000:
+            self.bqp_cache_cleanup_time = now
+            expired_keys = [cached_key for cached_key, entry
+                            in self.bqp_cache.items() if entry[0] <= now]
+            for expired_key in expired_keys:
+                self._bqp_cache_remove(expired_key)
+        if key in self.bqp_cache:
+            self._bqp_cache_remove(key)
+        while self.bqp_cache_bytes + size > self.bqp_cache_size:
+            oldest_key = next(iter(self.bqp_cache))
+            self._bqp_cache_remove(oldest_key)
+        self.bqp_cache[key] = (expire_time, response)
+        self.bqp_cache_bytes += size
+
+    def bqp_stats(self):
+        """
+        Return the response of the statistics.
+        """
+        with self.bqp_lock:
+            stats = collections.OrderedDict(self.bqp_counters)
+            stats["cache_entries"] = len(self.bqp_cache)
+            stats["cache_bytes"] = self.bqp_cache_bytes
+            stats["in_flight"] = len(self.bqp_flights)
+        body = json.dumps(stats, indent=4).encode()
+        return HTTPStatus.OK, [("Content-Type", "application/json")], body
+
+    def _bqp_parse_params(self, method, query_string, data, headers):
+        """
+        Return (params, is_form). The params of a form in the body are
+        included.
+        """
+        # pylint: disable=no-self-use
+        params = urllib.parse.parse_qsl(query_string, keep_blank_values=True)
+        content_type = headers.get("Content-Type", "")
+        is_form = (method == "POST" and
+                   content_type.startswith("application/x-www-form-urlencoded"))
+        if is_form:
+            try:
+                params += urllib.parse.parse_qsl(data.decode(),
+                                                 keep_blank_values=True)
+            except UnicodeDecodeError:
+                is_form = False
+        return params, is_form
+
+    def _bqp_expire_time(self, statements, uses_now, now, aligned_ms):
+        """
+        Return (expire_time, is_history) of the result of the query.
+        """
+        if not uses_now:
+            upper_bound = query_time_upper_bound(statements)
+            if (upper_bound is not None and
+                    upper_bound <= int(now * 1000) - self.bqp_settle_ms):
+                return now + QUERY_PROXY_HISTORY_TTL, True
+        return (aligned_ms + self.bqp_align_ms) / 1000, False
+
+    def _bqp_flight_join(self, key, now, is_history):
+        """
+        Return (response, flight, is_leader). If the response is cached,
+        flight is None. Otherwise, the leader of the flight should send
+        the query, and others should wait for its response.
+        """
+        with self.bqp_lock:
+            response = self._bqp_cache_get(key, now)
+            if response is not None:
+                if is_history:
+                    self.bqp_counters["history_hits"] += 1
+                else:
+                    self.bqp_counters["hits"] += 1
+                return response, None, False
+            flight = self.bqp_flights.get(key)
+            if flight is not None:
+                self.bqp_counters["coalesced"] += 1
+                return None, flight, False
+            self.bqp_counters["misses"] += 1
+            flight = QueryProxyFlight()
+            self.bqp_flights[key] = flight
+            return None, flight, True
+
+    def _bqp_flight_wait(self, flight):
+        """
+        Wait for the response of the flight sent by another request.
+        """
+        if flight.qpf_event.wait(QUERY_PROXY_TIMEOUT):
+            return flight.qpf_response
+        self._bqp_count("errors")
+        body = json.dumps({"error": "query proxy timeout"}).encode()
+        return (HTTPStatus.GATEWAY_TIMEOUT,
+                [("Content-Type", "application/json")], body)
+
+    def _bqp_flight_send(self, flight, key, expire_time, method, path,
+                         params, is_form, headers):
+        """
+        Send the query of the flight, cache the response and wake up the
+        requests waiting for it.
+        """
+        # pylint: disable=too-many-arguments
+        response = None
+        try:
+            if is_form:
+                response = self._bqp_forward(method, path, None, params,
+                                             headers)
+            else:
+                response = self._bqp_forward(method, path, params, None,
+                                             headers)
+        finally:
+            if response is None:
+                body = json.dumps({"error": "query proxy failure"}).encode()
+                response = (HTTPStatus.INTERNAL_SERVER_ERROR,
+                            [("Content-Type", "application/json")], body)
+            status, _, body = response
+            with self.bqp_lock:
+                # Results with error, e.g. timeout of Influxdb, are not
+                # cached so that the query is retried by the next viewer.
+                if status == HTTPStatus.OK and b'"error"' not in body:
+                    self._bqp_cache_put(key, expire_time, response)
+                del self.bqp_flights[key]
+            flight.qpf_response = response
+            flight.qpf_event.set()
+        return response
+
+    def bqp_handle(self, method, path, query_string, data, headers):
+        """
+        Handle a request from Grafana and return (status, headers, body).
+        """
+        # pylint: disable=too-many-arguments,too-many-locals
+        if path == QUERY_PROXY_STATS_PATH:
+            return self.bqp_stats()
+
+        params, is_form = self._bqp_parse_params(method, query_string, data,
+                                                 headers)
+        queries = [value for name, value in params if name == "q"]
+        if not query_request_cacheable(method, path, params, is_form, data):
+            self._bqp_count("passthrough")
+            return self._bqp_forward(method, path, query_string or None,
+                                     data or None, headers)
+
+        now = time.time()
+        now_ms = int(now * 1000)
+        aligned_ms = now_ms - now_ms % self.bqp_align_ms
+        normalized, uses_now, statements = query_normalize(queries[0],
+                                                           aligned_ms)
+        if not query_is_read_only(statements):
+            self._bqp_count("passthrough")
+            return self._bqp_forward(method, path, query_string or None,
+                                     data or None, headers)
+
+        expire_time, is_history = self._bqp_expire_time(statements, uses_now,
+                                                        now, aligned_ms)
+        other_params = sorted([(name, value) for name, value in params
+                               if name != "q"])
+        key_headers = tuple(headers.get(name)
+                            for name in QUERY_PROXY_KEY_HEADERS)
+        key = (path, tuple(other_params), key_headers, normalized)
+        response, flight, is_leader = self._bqp_flight_join(key, now,
+                                                            is_history)
+        if response is not None:
+            return response
+        if not is_leader:
+            return self._bqp_flight_wait(flight)
+        return self._bqp_flight_send(flight, key, expire_time, method, path,
+                                     other_params + [("q", normalized)],
+                                     is_form, headers)
+
+
+class BarreleQueryProxyHandler(http_server.BaseHTTPRequestHandler):
+    """
+    Handle a HTTP request from Grafana.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def _bqph_handle(self, method, send_body=True):
+        """
+        Handle the request and send the response.
+        """
+        url = urllib.parse.urlsplit(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        data = b""
+        if length > 0:
+            data = self.rfile.read(length)
+        # pylint: disable=no-member
+        proxy = self.server.bqps_proxy
+        status, headers, body = proxy.bqp_handle(method, url.path, url.query,
+                                                 data, self.headers)
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        # pylint: disable=invalid-name,missing-docstring
+        self._bqph_handle("GET")
+
+    def do_POST(self):
+        # pylint: disable=invalid-name,missing-docstring
+        self._bqph_handle("POST")
+
+    def do_HEAD(self):
+        # pylint: disable=invalid-name,missing-docstring
+        self._bqph_handle("HEAD", send_body=False)
+
+    def log_message(self, format, *args):
+        # pylint: disable=redefined-builtin,missing-docstring
+        # pylint: disable=no-member
+        self.server.bqps_proxy.bqp_log.cl_debug("%s - %s",
+                                                self.address_string(),
+                                                format % args)
+
+
+class BarreleQueryProxyServer(socketserver.ThreadingMixIn,
+                              http_server.HTTPServer):
+    """
+    HTTP server that handles each connection in a thread.
+    """
+    daemon_threads = True
+
+    def __init__(self, port, proxy):
+        # BarreleQueryProxy to handle the requests
+        self.bqps_proxy = proxy
+        super().__init__(("", port), BarreleQueryProxyHandler)
+
+
+def query_proxy_run(log, barreleye_instance,
+                    port=barrele_constant.BARRELE_QUERY_PROXY_PORT):
+    """
+    Run the query proxy until interrupted. Return 0 on normal exit,
+    negative on error.
+    """
+    server = barreleye_instance.bei_barreleye_server
+    influxdb_url = server.bes_influxdb_client.bic_baseurl
+    collect_interval = int(barreleye_instance.bei_collect_interval)
+    cq_interval = (collect_interval *
+                   int(barreleye_instance.bei_continuous_query_periods))
+    # Each retention policy is downsampled from the previous one after
+    # its interval ends, so the data of a window settles after all the
+    # intervals. Doubled to allow delayed writes of agents.
+    settle_time = cq_interval
+    for retention_policy in barreleye_instance.bei_retention_policies:
+        settle_time += retention_policy.irp_interval
+    settle_time *= 2
+    proxy = BarreleQueryProxy(log, influxdb_url, collect_interval,
+                              settle_time)
+    try:
+        http_server_instance = BarreleQueryProxyServer(port, proxy)
+    except OSError as error:
+        log.cl_error("failed to listen on port [%s]: %s", port, error)
+        return -1
+
+    log.cl_info("Barreleye query proxy is listening on port [%s] for "
+                "Influxdb [%s]", port, influxdb_url)
+    try:
+        http_server_instance.serve_forever()
+    except KeyboardInterrupt:
+        log.cl_info("Barreleye query proxy is interrupted")
+    finally:
+        http_server_instance.server_close()
+    return 0
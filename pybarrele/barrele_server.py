@@ -4,15 +4,18 @@ Barreleye is a performance monitoring system for Lustre.
 """
 # pylint: disable=too-many-lines
 import os
+import re
 import traceback
 import json
 from http import HTTPStatus
 from slugify import slugify
-import requests
 from pycoral import utils
+from pycoral import lazy_import
 from pybarrele import barrele_constant
 from pybarrele import barrele_influxdb
 
+requests = lazy_import.lazy_module("requests")  # pylint: disable=invalid-name
+
 
 # The Influxdb config fpath
 INFLUXDB_CONFIG_FPATH = "/etc/influxdb/influxdb.conf"
@@ -27,6 +30,19 @@ INFLUXDB_CONFIG_BACKUP_FPATH = (barrele_constant.BARRELE_DIR + "/" +
 INFLUXDB_CQ_PREFIX = "cq_"
 # The common prefix of Influxdb continuous query measurement
 INFLUXDB_CQ_MEASUREMENT_PREFIX = "cqm_"
+# The common prefix of Influxdb continuous query that downsamples data into
+# a retention policy
+INFLUXDB_CQ_RP_PREFIX = INFLUXDB_CQ_PREFIX + "rp_"
+# The max number of points of a serie that a Grafana panel should get from
+# a retention policy. If more points are needed for the time range, the
+# next coarser retention policy is used.
+GRAFANA_RP_MAX_POINTS = 2000
+# The variable of Grafana dashboards that is the retention policy to query
+GRAFANA_RP_VARIABLE = "barreleye_rp"
+# The measurement in FROM clause of InfluxDB queries, quoted or regex, and
+# not qualified with a retention policy yet
+INFLUXDB_FROM_MEASUREMENT_PATTERN = \
+    re.compile(r'\bFROM(\s+)("[^"]*"|/(?:\\.|[^/\\])*/)(?!\s*\.)', re.I)
 # Data source name of Influxdb on Grafana
 GRAFANA_DATASOURCE_NAME = "barreleye_datasource"
 # The dir of Grafana plugins
@@ -88,16 +104,141 @@ def grafana_dashboard_check(log, title_name, dashboard):
     return 0
 
 
+def influxdb_cq_measurement(measurement, groups):
+    """
+    Return the name of the measurement that a continuous query writes the
+    data of the measurement grouped by the tags into.
+    """
+    cq_measurement = INFLUXDB_CQ_MEASUREMENT_PREFIX + measurement
+    for group in sorted(groups):
+        cq_measurement += "-%s" % group
+    return cq_measurement
+
+
+def grafana_dashboard_disabled(name, jobstat_pattern):
+    """
+    Return True if the dashboard should be put into the Disabled folder.
+    """
+    user_patterns = [barrele_constant.BARRELE_JOBSTAT_PATTERN_PROCNAME_UID,
+                     barrele_constant.BARRELE_JOBSTAT_PATTERN_UID_GID]
+    group_patterns = [barrele_constant.BARRELE_JOBSTAT_PATTERN_UID_GID]
+    if name == DASHBOARD_NAME_LUSTRE_USER:
+        # If jobstat pattern is not recognized, put the Lustre User
+        # dashboard to "Disabled" folder
+        return jobstat_pattern not in user_patterns
+    if name == DASHBOARD_NAME_LUSTRE_GROUP:
+        # If jobstat pattern is not recognized, put the Lustre Group
+        # dashboard to "Disabled" folder
+        return jobstat_pattern not in group_patterns
+    # SFA dashboards is not supported yet.
+    return name in DASHBOARD_NAME_SFAS
+
+
+def retention_policy_ranges(retention_policies):
+    """
+    Return a list of (name, min range, max range) of the retention policies.
+    A Grafana dashboard uses a retention policy if the seconds of its time
+    range is in [min range, max range). A coarser retention policy is used
+    if the finer one does not keep the data of the whole range, or would
+    return too many points.
+    """
+    ranges = []
+    min_range = 0
+    for index, retention_policy in enumerate(retention_policies):
+        if index == len(retention_policies) - 1:
+            # Int64 max of InfluxDB in milliseconds
+            max_range = (2 ** 63 - 1) // 1000
+        else:
+            max_range = retention_policy.irp_interval * GRAFANA_RP_MAX_POINTS
+            if retention_policy.irp_duration != 0:
+                max_range = min(max_range, retention_policy.irp_duration)
+            max_range = max(max_range, min_range)
+        ranges.append((retention_policy.irp_name, min_range, max_range))
+        min_range = max_range
+    return ranges
+
+
+def grafana_dashboard_targets(value):
+    """
+    Return the query targets of all panels in a dashboard, including the
+    panels in rows.
+    """
+    targets = []
+    if isinstance(value, dict):
+        if isinstance(value.get("targets"), list):
+            targets += value["targets"]
+        for child in value.values():
+            if isinstance(child, (dict, list)):
+                targets += grafana_dashboard_targets(child)
+    elif isinstance(value, list):
+        for child in value:
+            targets += grafana_dashboard_targets(child)
+    return targets
+
+
+def grafana_dashboard_use_retention_policies(dashboard):
+    """
+    Change the queries of dashboard to use the retention policy selected
+    by the time range.
+    """
+    variable = "$" + GRAFANA_RP_VARIABLE
+    for target in grafana_dashboard_targets(dashboard):
+        if not isinstance(target, dict):
+            continue
+        if target.get("rawQuery") and isinstance(target.get("query"), str):
+            target["query"] = \
+                INFLUXDB_FROM_MEASUREMENT_PATTERN.sub(r'FROM\1"%s".\2' % variable,
+                                                      target["query"])
+        elif "measurement" in target:
+            target["policy"] = variable
+
+    time_range = "${__to} - ${__from}"
+    query = ('SELECT "rp" FROM "%s"."%s" WHERE "min_range_ms" <= %s AND '
+             '"max_range_ms" > %s' %
+             (barrele_constant.BARRELE_INFLUXDB_CONFIG_RP,
+              barrele_constant.BARRELE_INFLUXDB_RP_MEASUREMENT,
+              time_range, time_range))
+    rp_variable = {
+        "allValue": None,
+        "current": {},
+        "datasource": GRAFANA_DATASOURCE_NAME,
+        "hide": 2,
+        "includeAll": False,
+        "label": "Retention Policy",
+        "multi": False,
+        "name": GRAFANA_RP_VARIABLE,
+        "options": [],
+        "query": query,
+        # Refresh when the time range changes
+        "refresh": 2,
+        "regex": "",
+        "sort": 0,
+        "tagValuesQuery": "",
+        "tags": [],
+        "tagsQuery": "",
+        "type": "query",
+        "useTags": False
+    }
+    if not isinstance(dashboard.get("templating"), dict):
+        dashboard["templating"] = {}
+    templating = dashboard["templating"]
+    if not isinstance(templating.get("list"), list):
+        templating["list"] = []
+    templating["list"].insert(0, rp_variable)
+
+
 class BarreleServer():
     """
     Barreleye server object
     """
     # pylint: disable=too-few-public-methods,too-many-instance-attributes
-    def __init__(self, host, data_path):
+    def __init__(self, host, data_path, enable_query_proxy=False):
         # Host to run commands.
         self.bes_server_host = host
         # Dir to save monitoring data.
         self.bes_data_path = data_path
+        # Whether Grafana queries Influxdb through the caching query proxy
+        self.bes_enable_query_proxy = enable_query_proxy
         # Influxdb client to run queries.
         self.bes_influxdb_client = \
             barrele_influxdb.BarreleInfluxdbClient(host.sh_hostname,
@@ -337,6 +478,79 @@ class BarreleServer():
             return -1
         return 0
 
+    def _bes_influxdb_update_retention_policies(self, log, barreleye_instance):
+        """
+        Create or alter the retention policies of Influxdb, and save the
+        time ranges that each retention policy is used for by Grafana
+        dashboards. The retention policies not configured are kept
+        untouched, so that no data is removed.
+        """
+        # pylint: disable=too-many-locals
+        retention_policies = barreleye_instance.bei_retention_policies
+        if len(retention_policies) == 0:
+            return 0
+
+        client = self.bes_influxdb_client
+        existing_rps = client.bic_show_retention_policies(log)
+        if existing_rps is None:
+            log.cl_error("failed to get the existing retention policies")
+            return -1
+
+        database = barrele_constant.BARRELE_INFLUXDB_DATABASE_NAME
+        # The retention policy that keeps the time ranges forever
+        config_rp = \
+            barrele_influxdb.InfluxdbRetentionPolicy(barrele_constant.BARRELE_INFLUXDB_CONFIG_RP,
+                                                     0, 0)
+        statements = []
+        for retention_policy in [config_rp] + retention_policies:
+            name = retention_policy.irp_name
+            is_default = retention_policy is retention_policies[0]
+            duration = retention_policy.irp_duration_string()
+            if name not in existing_rps:
+                statement = ('CREATE RETENTION POLICY "%s" ON "%s" '
+                             'DURATION %s REPLICATION 1' %
+                             (name, database, duration))
+            elif existing_rps[name] != (retention_policy.irp_duration,
+                                        is_default):
+                statement = ('ALTER RETENTION POLICY "%s" ON "%s" '
+                             'DURATION %s' % (name, database, duration))
+            else:
+                continue
+            if is_default:
+                statement += " DEFAULT"
+            log.cl_info("running [%s] on Influxdb", statement)
+            statements.append(statement)
+        # Remove the time ranges of the retention policies not configured
+        # any more
+        statements.append('DELETE FROM "%s"' %
+                          barrele_constant.BARRELE_INFLUXDB_RP_MEASUREMENT)
+
+        results = client.bic_query_results(log, statements, method='POST')
+        if results is None:
+            log.cl_error("failed to update retention policies of Influxdb")
+            return -1
+        for statement, result in zip(statements, results):
+            if barrele_influxdb.INFLUX_ERROR in result:
+                log.cl_error("failed to run [%s] on Influxdb: %s",
+                             statement, result[barrele_influxdb.INFLUX_ERROR])
+                return -1
+
+        lines = []
+        for index, rp_range in \
+                enumerate(retention_policy_ranges(retention_policies)):
+            name, min_range, max_range = rp_range
+            lines.append('%s,index=%d rp="%s",min_range_ms=%di,'
+                         'max_range_ms=%di 0' %
+                         (barrele_constant.BARRELE_INFLUXDB_RP_MEASUREMENT,
+                          index, name, min_range * 1000, max_range * 1000))
+        ret = client.bic_write(log, lines, precision="s",
+                               retention_policy=config_rp.irp_name)
+        if ret:
+            log.cl_error("failed to write the time ranges of retention "
+                         "policies")
+            return -1
+        return 0
+
     def _bes_influxdb_check_service(self, log, drop_database=False):
         """
         Check whether Influxdb is still up when creating database.
@@ -498,7 +712,11 @@ class BarreleServer():
         Add Influxdb datasource to Grafana
         """
         # pylint: disable=bare-except
-        influxdb_url = "http://%s:8086" % self.bes_server_host.sh_hostname
+        port = 8086
+        if self.bes_enable_query_proxy:
+            port = barrele_constant.BARRELE_QUERY_PROXY_PORT
+        influxdb_url = "http://%s:%s" % (self.bes_server_host.sh_hostname,
+                                         port)
         data = {
             "name": GRAFANA_DATASOURCE_NAME,
             "isDefault": True,
@@ -912,22 +1130,11 @@ class BarreleServer():
             with open(dashboard_json_fpath, "r", encoding='utf-8') as json_file:
                 dashboard = json.load(json_file)
 
+            if len(barreleye_instance.bei_retention_policies) > 0:
+                grafana_dashboard_use_retention_policies(dashboard)
+
             folder_id = 0
-            user_patterns = [barrele_constant.BARRELE_JOBSTAT_PATTERN_PROCNAME_UID,
-                             barrele_constant.BARRELE_JOBSTAT_PATTERN_UID_GID]
-            group_patterns = [barrele_constant.BARRELE_JOBSTAT_PATTERN_UID_GID]
-            if name == DASHBOARD_NAME_LUSTRE_USER:
-                if jobstat_pattern not in user_patterns:
-                    # If jobstat pattern is not recognized, put the
-                    # Lustre User dashboard to "Disabled" folder
-                    folder_id = self.bes_disabled_folder_id
-            elif name == DASHBOARD_NAME_LUSTRE_GROUP:
-                if jobstat_pattern not in group_patterns:
-                    # If jobstat pattern is not recognized, put the
-                    # Lustre Group dashboard to "Disabled" folder
-                    folder_id = self.bes_disabled_folder_id
-            elif name in DASHBOARD_NAME_SFAS:
-                # SFA dashboards is not supported yet.
+            if grafana_dashboard_disabled(name, jobstat_pattern):
                 folder_id = self.bes_disabled_folder_id
 
             ret = self._bes_grafana_recreate_dashboard(log, name, dashboard,
@@ -1091,6 +1298,38 @@ class BarreleServer():
             return -1
         return 0
 
+    def _bes_query_proxy_reinstall(self, log):
+        """
+        Restart and enable the query proxy if enabled, otherwise stop and
+        disable it.
+        """
+        host = self.bes_server_host
+        service_name = barrele_constant.BARRELE_QUERY_PROXY_SERVICE_NAME
+        if not self.bes_enable_query_proxy:
+            ret = host.sh_service_check_exists(log, service_name)
+            if ret:
+                return 0
+            ret = host.sh_service_stop(log, service_name)
+            if ret:
+                log.cl_error("failed to stop service [%s] on host [%s]",
+                             service_name, host.sh_hostname)
+                return -1
+            ret = host.sh_service_disable(log, service_name)
+            if ret:
+                log.cl_error("failed to disable service [%s] on host [%s]",
+                             service_name, host.sh_hostname)
+                return -1
+            return 0
+
+        log.cl_info("restarting and enabling service [%s] on host [%s]",
+                    service_name, host.sh_hostname)
+        ret = host.sh_service_start_enable(log, service_name, restart=True)
+        if ret:
+            log.cl_error("failed to restart and enable service [%s] on "
+                         "host [%s]", service_name, host.sh_hostname)
+            return -1
+        return 0
+
     def bes_server_reinstall(self, log, barreleye_instance,
                              erase_influxdb=False,
                              drop_database=False):
@@ -1150,11 +1389,23 @@ class BarreleServer():
             log.cl_error("failed to create Influxdb database")
             return -1
 
+        ret = self._bes_influxdb_update_retention_policies(log,
+                                                           barreleye_instance)
+        if ret:
+            log.cl_error("failed to update retention policies of Influxdb")
+            return -1
+
         ret = self._bes_influxdb_recreate_cqs(log, barreleye_instance)
         if ret:
             log.cl_error("failed to recreate continuous queries of Influxdb")
             return -1
 
+        ret = self._bes_query_proxy_reinstall(log)
+        if ret:
+            log.cl_error("failed to reinstall query proxy on host [%s]",
+                         host.sh_hostname)
+            return -1
+
         ret = self._bes_grafana_reinstall(log, barreleye_instance)
         if ret:
             log.cl_error("failed to reinstall Grafana on host [%s]",
@@ -1162,42 +1413,69 @@ class BarreleServer():
             return -1
         return 0
 
-    def _bes_influxdb_cq_create(self, log, barreleye_instance,
-                                measurement, groups, where=""):
+    def bes_influxdb_cq_definition(self, barreleye_instance, measurement,
+                                   groups, where=""):
         """
-        Create continuous query in influxdb
+        Return the name and the CREATE statement of a continuous query
         """
-        # pylint: disable=bare-except
+        # pylint: disable=no-self-use
         collect_interval = barreleye_instance.bei_collect_interval
         continuous_query_periods = barreleye_instance.bei_continuous_query_periods
+        # Sort the groups so that we will get a unique cq name for the same groups
+        groups = sorted(groups)
         cq_query = INFLUXDB_CQ_PREFIX + measurement
         group_string = ""
-        cq_measurement = INFLUXDB_CQ_MEASUREMENT_PREFIX + measurement
+        cq_measurement = influxdb_cq_measurement(measurement, groups)
         for group in groups:
             group_string += ', "%s"' % group
             cq_query += "_%s" % group
-            cq_measurement += "-%s" % group
 
         cq_time = int(collect_interval) * int(continuous_query_periods)
+        database = barrele_constant.BARRELE_INFLUXDB_DATABASE_NAME
+        retention_policy = barreleye_instance.bei_raw_retention_policy()
         query = ('CREATE CONTINUOUS QUERY %s ON "%s" \n'
-                 'BEGIN SELECT sum("value") / %s INTO "%s" \n'
-                 '    FROM "%s" %s GROUP BY time(%ds)%s \n'
-                 'END;' %
-                 (cq_query, barrele_constant.BARRELE_INFLUXDB_DATABASE_NAME,
-                  continuous_query_periods, cq_measurement,
+                 'BEGIN SELECT sum("value") / %s INTO "%s"."%s"."%s" \n'
+                 '    FROM "%s"."%s"."%s" %s GROUP BY time(%ds)%s \n'
+                 'END' %
+                 (cq_query, database,
+                  continuous_query_periods, database, retention_policy,
+                  cq_measurement, database, retention_policy,
                   measurement, where, cq_time, group_string))
-        response = self.bes_influxdb_client.bic_query(log, query)
-        if response is None:
-            log.cl_error("failed to create continuous query with query [%s]",
-                         query)
-            return -1
+        return cq_query, query
 
-        if response.status_code != HTTPStatus.OK:
-            log.cl_error("got InfluxDB status [%d] when creating "
-                         "continuous query with query [%s]",
-                         response.status_code, query)
-            return -1
-        return 0
+    def _bes_influxdb_rp_cq_definitions(self, barreleye_instance):
+        """
+        Return a dict of the continuous queries that downsample the data
+        of each retention policy into the next coarser one. Key is the name
+        of the continuous query, value is the CREATE statement.
+        """
+        # pylint: disable=no-self-use
+        database = barrele_constant.BARRELE_INFLUXDB_DATABASE_NAME
+        cq_dict = {}
+        for retention_policy in barreleye_instance.bei_retention_policies:
+            source = retention_policy.irp_source
+            if source is None:
+                continue
+            # The data points from agents have field "value", and the
+            # measurements of continuous queries have field "sum". The
+            # field names are kept so the same queries work on all the
+            # retention policies.
+            for field, measurement_regex, suffix in \
+                    [("value", "/.*/", ""),
+                     ("sum", "/^%s/" % INFLUXDB_CQ_MEASUREMENT_PREFIX, "_cqm")]:
+                cq_name = (INFLUXDB_CQ_RP_PREFIX + retention_policy.irp_name +
+                           suffix)
+                query = ('CREATE CONTINUOUS QUERY %s ON "%s" \n'
+                         'BEGIN SELECT mean("%s") AS "%s" \n'
+                         '    INTO "%s"."%s".:MEASUREMENT \n'
+                         '    FROM "%s"."%s".%s GROUP BY time(%ds), * \n'
+                         'END' %
+                         (cq_name, database, field, field, database,
+                          retention_policy.irp_name, database,
+                          source.irp_name, measurement_regex,
+                          retention_policy.irp_interval))
+                cq_dict[cq_name] = query
+        return cq_dict
 
     def bes_influxdb_cq_delete(self, log, measurement, groups):
         """
@@ -1209,7 +1487,8 @@ class BarreleServer():
             cq_query += "_%s" % group
         query = ('DROP CONTINUOUS QUERY %s ON "%s";' %
                  (cq_query, barrele_constant.BARRELE_INFLUXDB_DATABASE_NAME))
-        response = self.bes_influxdb_client.bic_query(log, query)
+        response = self.bes_influxdb_client.bic_query(log, query,
+                                                      method='POST')
         if response is None:
             log.cl_error("failed to drop continuous query with query [%s]",
                          query)
@@ -1222,36 +1501,84 @@ class BarreleServer():
             return -1
         return 0
 
-    def _bes_influxdb_cq_recreate(self, log, barreleye_instance, measurement,
-                                  groups, where=""):
+    def _bes_influxdb_reconcile_cqs(self, log, barreleye_instance,
+                                    continuous_queries):
         """
-        Create continuous query in influxdb, delete one first if necesary
+        Make the continuous queries of Influxdb the same with the given
+        ones. Only the missing, changed and stale continuous queries are
+        created or dropped, all in a single request. Dropping a continuous
+        query loses its progress, so the unchanged ones are kept.
         """
-        # Sort the groups so that we will get a unique cq name for the same groups
-        groups.sort()
-        ret = self._bes_influxdb_cq_create(log, barreleye_instance,
-                                           measurement, groups, where=where)
-        if ret == 0:
-            return 0
+        # pylint: disable=too-many-locals,too-many-branches
+        client = self.bes_influxdb_client
+        existing_cqs = client.bic_show_continuous_queries(log)
+        if existing_cqs is None:
+            log.cl_error("failed to get the existing continuous queries")
+            return -1
 
-        ret = self.bes_influxdb_cq_delete(log, measurement, groups)
-        if ret:
-            return ret
+        database = barrele_constant.BARRELE_INFLUXDB_DATABASE_NAME
+        desired_cqs = {}
+        for continuous_query in continuous_queries:
+            cq_name, query = \
+                self.bes_influxdb_cq_definition(barreleye_instance,
+                                                continuous_query.icq_measurement,
+                                                continuous_query.icq_groups,
+                                                where=continuous_query.icq_where)
+            desired_cqs[cq_name] = query
+        desired_cqs.update(self._bes_influxdb_rp_cq_definitions(barreleye_instance))
+
+        statements = []
+        for cq_name, query in existing_cqs.items():
+            if not cq_name.startswith(INFLUXDB_CQ_PREFIX):
+                continue
+            if cq_name in desired_cqs:
+                signature = barrele_influxdb.influx_cq_signature(query)
+                desired_signature = \
+                    barrele_influxdb.influx_cq_signature(desired_cqs[cq_name])
+                if signature is not None and signature == desired_signature:
+                    log.cl_debug("continuous query [%s] is up to date",
+                                 cq_name)
+                    continue
+                log.cl_debug("continuous query [%s] changed from [%s]",
+                             cq_name, query)
+            else:
+                log.cl_debug("continuous query [%s] is stale", cq_name)
+            statements.append('DROP CONTINUOUS QUERY %s ON "%s"' %
+                              (cq_name, database))
+
+        for cq_name, query in desired_cqs.items():
+            if cq_name in existing_cqs:
+                drop = ('DROP CONTINUOUS QUERY %s ON "%s"' %
+                        (cq_name, database))
+                if drop not in statements:
+                    continue
+            statements.append(query)
+
+        if len(statements) == 0:
+            log.cl_info("all [%d] continuous queries of Influxdb are up to "
+                        "date", len(desired_cqs))
+            return 0
 
-        ret = self._bes_influxdb_cq_create(log, barreleye_instance,
-                                           measurement, groups, where=where)
-        if ret:
-            log.cl_error("failed to create continuous query for measurement [%s]",
-                         measurement)
-        return ret
+        log.cl_info("running [%d] statements to update continuous queries "
+                    "of Influxdb", len(statements))
+        results = client.bic_query_results(log, statements, method='POST')
+        if results is None:
+            log.cl_error("failed to update continuous queries of Influxdb")
+            return -1
+        rc = 0
+        for statement, result in zip(statements, results):
+            if barrele_influxdb.INFLUX_ERROR in result:
+                log.cl_error("failed to run [%s] on Influxdb: %s",
+                             statement, result[barrele_influxdb.INFLUX_ERROR])
+                rc = -1
+        return rc
 
-    def _bes_influxdb_recreate_cqs(self, log, barreleye_instance):
+    def bes_influxdb_continuous_queries(self, log, barreleye_instance):
         """
-        Create all the continuous queries of Influxdb
+        Return the list of InfluxdbContinuousQuery that Grafana dashboards
+        need. Return None on error.
         """
-        # pylint: disable=too-many-statements
-        log.cl_info("recreating continuous queries of Influxdb on host [%s]",
-                    self.bes_server_host.sh_hostname)
+        # pylint: disable=too-many-statements,no-self-use
         continuous_queries = []
         InfluxdbContinuousQuery = barrele_influxdb.InfluxdbContinuousQuery
         continuous_query = InfluxdbContinuousQuery("mdt_acctuser_samples",
@@ -1303,7 +1630,7 @@ class BarreleServer():
             log.cl_error("unknown jobstat pattern [%s] when creating "
                          "continuous queries for MDT",
                          barreleye_instance.bei_jobstat_pattern)
-            return -1
+            return None
         continuous_query = InfluxdbContinuousQuery("ost_stats_bytes",
                                                    ["fs_name", "optype",
                                                     "fqdn"])
@@ -1341,6 +1668,7 @@ class BarreleServer():
                                                    ["fs_name", "job_id",
                                                     "ost_index"],
                                                    where=where)
+        continuous_queries.append(continuous_query)
         if (barreleye_instance.bei_jobstat_pattern ==
                 barrele_constant.BARRELE_JOBSTAT_PATTERN_PROCNAME_UID):
             continuous_query = InfluxdbContinuousQuery("ost_jobstats_bytes",
@@ -1398,7 +1726,7 @@ class BarreleServer():
             log.cl_error("unknown jobstat pattern [%s] when creating "
                          "continuous queries for OST",
                          barreleye_instance.bei_jobstat_pattern)
-            return -1
+            return None
         continuous_query = InfluxdbContinuousQuery("ost_brw_stats_rpc_bulk_samples",
                                                    ["field", "fs_name",
                                                     "size"])
@@ -1428,17 +1756,25 @@ class BarreleServer():
         continuous_query = InfluxdbContinuousQuery("ost_kbytesinfo_used",
                                                    ["fs_name"])
         continuous_queries.append(continuous_query)
+        return continuous_queries
 
-        for continuous_query in continuous_queries:
-            ret = self._bes_influxdb_cq_recreate(log, barreleye_instance,
-                                                 continuous_query.icq_measurement,
-                                                 continuous_query.icq_groups,
-                                                 where=continuous_query.icq_where)
-            if ret:
-                log.cl_error("failed to create continuous query of "
-                             "measurement [%s]",
-                             continuous_query.icq_measurement)
-                return -1
+    def _bes_influxdb_recreate_cqs(self, log, barreleye_instance):
+        """
+        Create all the continuous queries of Influxdb
+        """
+        log.cl_info("updating continuous queries of Influxdb on host [%s]",
+                    self.bes_server_host.sh_hostname)
+        continuous_queries = \
+            self.bes_influxdb_continuous_queries(log, barreleye_instance)
+        if continuous_queries is None:
+            log.cl_error("failed to get the continuous queries of Influxdb")
+            return -1
+
+        ret = self._bes_influxdb_reconcile_cqs(log, barreleye_instance,
+                                               continuous_queries)
+        if ret:
+            log.cl_error("failed to update continuous queries of Influxdb")
+            return -1
         return 0
 
     def bes_grafana_running(self, log):
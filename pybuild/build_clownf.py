@@ -92,6 +92,8 @@ package main
             file_object.write("\n")
             file_object.write("\tCLOWNF_CONFIG = \"%s\"\n" %
                               clownf_constant.CLOWNF_CONFIG)
+            file_object.write("\tCLOWNF_SERVER_SOCKET = \"%s\"\n" %
+                              clownf_constant.CLOWNF_SERVER_SOCKET)
             file_object.write("\tMSG_ALREADY_MOUNTED = \"%s\\n\"\n" %
                               constant.MSG_ALREADY_MOUNTED[:-1])
             file_object.write("\tCLOWNF_MSG_ALREADY_STARTED = \"%s\\n\"\n" %
@@ -0,0 +1,124 @@
+"""
+Check the import time of the command entrances, so that commands keep
+starting quickly.
+
+Usage: python3 import_time_check.py [module]...
+"""
+import os
+import sys
+import subprocess
+
+# Key is the module of command entrance, value is the budget of import
+# time in milliseconds.
+IMPORT_TIME_BUDGETS = {
+    "pyclownf.clownf": 150,
+    "pybarrele.barrele": 400,
+    "pyreaf.reaf": 400,
+    "pybuild.coral": 300,
+}
+# Key is the module of command entrance, value is the list of modules
+# that should not be imported by the entrance.
+IMPORT_FORBIDDEN_MODULES = {
+    "pyclownf.clownf": ["pycoral.lustre", "pycoral.ssh_host", "requests",
+                        "prettytable", "toml"],
+    "pybarrele.barrele": ["requests", "prettytable"],
+    "pyreaf.reaf": ["requests", "prettytable"],
+    "pybuild.coral": ["requests", "prettytable"],
+}
+# Import for multiple times and use the shortest time to reduce noise
+IMPORT_TIME_ROUNDS = 3
+
+
+def import_time(module, source_dir):
+    """
+    Return the import time in microseconds and the names of the imported
+    modules. Return (-1, None) on error.
+    """
+    env = dict(os.environ)
+    if "PYTHONPATH" in env:
+        env["PYTHONPATH"] = source_dir + ":" + env["PYTHONPATH"]
+    else:
+        env["PYTHONPATH"] = source_dir
+    command = [sys.executable, "-X", "importtime", "-c", "import " + module]
+    process = subprocess.run(command, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, env=env, check=False)
+    stderr = process.stderr.decode()
+    if process.returncode:
+        errors = [line for line in stderr.splitlines()
+                  if not line.startswith("import time:")]
+        print("ERROR: failed to run command %s: %s" %
+              (command, "\n".join(errors)), file=sys.stderr)
+        return -1, None
+
+    cumulative = -1
+    imported = []
+    for line in stderr.splitlines():
+        # Format: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:"):
+            continue
+        fields = line.split("|")
+        if len(fields) != 3:
+            continue
+        name = fields[2].strip()
+        imported.append(name)
+        if name == module:
+            try:
+                cumulative = int(fields[1])
+            except ValueError:
+                continue
+    if cumulative < 0:
+        print("ERROR: no import time of module [%s] in output [%s]" %
+              (module, stderr), file=sys.stderr)
+        return -1, None
+    return cumulative, imported
+
+
+def check_module(module, source_dir):
+    """
+    Check the import time of the module. Return 0 if within budget.
+    """
+    best = None
+    imported = None
+    for _ in range(IMPORT_TIME_ROUNDS):
+        cumulative, imported = import_time(module, source_dir)
+        if cumulative < 0:
+            return -1
+        if best is None or cumulative < best:
+            best = cumulative
+
+    ret = 0
+    for forbidden in IMPORT_FORBIDDEN_MODULES.get(module, []):
+        if forbidden in imported:
+            print("ERROR: module [%s] is imported by [%s], please import it "
+                  "on demand" % (forbidden, module), file=sys.stderr)
+            ret = -1
+
+    budget = IMPORT_TIME_BUDGETS.get(module)
+    if budget is not None and best > budget * 1000:
+        print("ERROR: importing [%s] takes [%.1f] ms, budget is [%d] ms" %
+              (module, best / 1000, budget), file=sys.stderr)
+        ret = -1
+    elif ret == 0:
+        print("importing [%s] takes [%.1f] ms" % (module, best / 1000))
+    return ret
+
+
+def main():
+    """
+    Check the import time of the modules in arguments, or all command
+    entrances if no argument.
+    """
+    source_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    modules = sys.argv[1:]
+    if len(modules) == 0:
+        modules = list(IMPORT_TIME_BUDGETS.keys())
+    rc = 0
+    for module in modules:
+        ret = check_module(module, source_dir)
+        if ret:
+            rc = ret
+    sys.exit(rc)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,13 @@
 Clownfish command entrance
 """
 from fire import Fire
-from pyclownf import clownf_command_common
-from pyclownf import clownf_command_host
-from pyclownf import clownf_command_agent
+from pycoral import lazy_import
 from pyclownf import clownf_constant
-from pyclownf import clownf_command_cluster
-from pyclownf import clownf_command_fs
-from pyclownf import clownf_command_consul
-from pyclownf import clownf_command_client
-from pyclownf import clownf_command_service
+
+# The modules of sub-commands are imported only when used, so that commands
+# start quickly.
+clownf_command_common = lazy_import.lazy_module(  # pylint: disable=invalid-name
+    "pyclownf.clownf_command_common")
 
 
 def clownf_simplify_config(ccommand):
@@ -48,13 +46,22 @@ class ClownfCommand():
     :param iso: The Coral ISO to use for installation. Default: None.
     """
     # pylint: disable=too-few-public-methods
-    service = clownf_command_service.LustreServiceCommand()
-    cluster = clownf_command_cluster.ClusterCommand()
-    fs = clownf_command_fs.LustreFilesystemCommand()
-    consul = clownf_command_consul.ConsulCommand()
-    host = clownf_command_host.ClownfHostCommand()
-    agent = clownf_command_agent.ClownfAgentCommand()
-    client = clownf_command_client.LustreClientCommand()
+    service = lazy_import.LazyCommand("pyclownf.clownf_command_service",
+                                      "LustreServiceCommand")
+    cluster = lazy_import.LazyCommand("pyclownf.clownf_command_cluster",
+                                      "ClusterCommand")
+    fs = lazy_import.LazyCommand("pyclownf.clownf_command_fs",
+                                 "LustreFilesystemCommand")
+    consul = lazy_import.LazyCommand("pyclownf.clownf_command_consul",
+                                     "ConsulCommand")
+    host = lazy_import.LazyCommand("pyclownf.clownf_command_host",
+                                   "ClownfHostCommand")
+    agent = lazy_import.LazyCommand("pyclownf.clownf_command_agent",
+                                    "ClownfAgentCommand")
+    client = lazy_import.LazyCommand("pyclownf.clownf_command_client",
+                                     "LustreClientCommand")
+    server = lazy_import.LazyCommand("pyclownf.clownf_command_server",
+                                     "ClownfServerCommand")
     simple_config = clownf_simplify_config
 
     def __init__(self, config=clownf_constant.CLOWNF_CONFIG,
@@ -64,13 +71,14 @@ class ClownfCommand():
         self._cfc_logdir = log
         self._cfc_log_to_file = debug
         self._cfc_iso = iso
-        self.service._init(config, log, debug, iso)
-        self.cluster._init(config, log, debug, iso)
-        self.fs._init(config, log, debug, iso)
-        self.consul._init(config, log, debug, iso)
-        self.host._init(config, log, debug, iso)
-        self.client._init(config, log, debug, iso)
-        self.agent._init(config, log, debug, iso)
+
+    def _lazy_command_init(self, command):
+        """
+        Init the sub-command when it is first used.
+        """
+        # pylint: disable=protected-access
+        command._init(self._cfc_config_fpath, self._cfc_logdir,
+                      self._cfc_log_to_file, self._cfc_iso)
 
 
 def main():
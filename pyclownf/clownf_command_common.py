@@ -2,6 +2,7 @@
 Common libarary for Clownf commands
 """
 # pylint: disable=too-many-lines
+import threading
 from pycoral import parallel
 from pycoral import cmd_general
 from pycoral import clog
@@ -9,10 +10,51 @@ from pycoral import constant
 from pycoral import consul
 from pycoral import watched_io
 from pycoral import utils
+from pycoral import ssh_basic
 from pyclownf import clownf_constant
 from pyclownf import clownf_instance
 from pyclownf import clownf_consul
 
+# The max number of hosts/objects to collect status from at the same time
+STATUS_PARALLELISM = 32
+# Facts of hosts collected in a single pass before initing the status of
+# objects. Whether the host is up.
+STATUS_FACT_UP = "up"
+# The snapshot of Lustre mounts on the host
+STATUS_FACT_SNAPSHOT = "snapshot"
+# The health status of the host
+STATUS_FACT_HEALTH = "health"
+# Names of the checks whose commands are run in a single batch when
+# initing the status of a host. Whether clownf_agent is running.
+HSC_BATCH_AGENT = "agent"
+# Whether operation commands are running
+HSC_BATCH_OPERATING = "operating"
+# The status of Consul on the host
+HSC_BATCH_CONSUL = "consul"
+# The health status of the host
+HSC_BATCH_HEALTH = "health"
+# The snapshot of Lustre mounts on the host
+HSC_BATCH_SNAPSHOT = "snapshot"
+# The host fields that are got from the snapshot of Lustre mounts
+HSC_SNAPSHOT_FIELDS = [clownf_constant.CLOWNF_FIELD_SERVICE_LOAD,
+                       clownf_constant.CLOWNF_FIELD_MOUNTED_SERVICES,
+                       clownf_constant.CLOWNF_FIELD_NOT_MOUNTED_SERVICES,
+                       clownf_constant.CLOWNF_FIELD_LOAD_BALANCED]
+
+
+def status_fact_names(field_names, field_fact_dict):
+    """
+    Return the minimal list of host facts needed by the fields.
+    """
+    fact_names = []
+    for field_name in field_names:
+        if field_name not in field_fact_dict:
+            continue
+        for fact_name in field_fact_dict[field_name]:
+            if fact_name not in fact_names:
+                fact_names.append(fact_name)
+    return fact_names
+
 
 def init_env(config_fpath, logdir, log_to_file, iso,
              ssh_for_local=True
@@ -25,6 +67,8 @@ def init_env(config_fpath, logdir, log_to_file, iso,
                                                             logdir,
                                                             log_to_file,
                                                             log_dir_is_default)
+    # Reuse SSH connections to the hosts across commands
+    ssh_basic.ssh_master_pool_enable()
     clownfish_instance = clownf_instance.clownf_init_instance(log, workspace,
                                                               clownfish_config,
                                                               config_fpath,
@@ -103,13 +147,18 @@ class HostStatusCache():
         self.hsc_watching_candidate_hostnames = None
         # Names of services that could be watched by this host
         self.hsc_watching_candidate_services = None
+        # Results of the commands run in a batch by hsc_run_batch(). Key is
+        # HSC_BATCH_*, value is the list of CommandResult.
+        self.hsc_batch_results = {}
 
     def hsc_is_up(self, log):
         """
         Return whether the host is up
         """
         if self._hsc_is_up is None:
-            self._hsc_is_up = self.hsc_host.sh_is_up(log)
+            cluster_status = self.hsc_cluster_status
+            self._hsc_is_up = cluster_status.clsc_host_is_up(log,
+                                                             self.hsc_host)
             if not self.hsc_is_up:
                 self.hsc_failed = True
         return self._hsc_is_up
@@ -122,9 +171,11 @@ class HostStatusCache():
         if not self.hsc_is_up(log):
             self.hsc_running_agent = -1
             return
+        results = self.hsc_batch_results.get(HSC_BATCH_AGENT)
         self.hsc_running_agent = \
             clownfish_instance.ci_host_check_running_agent(log,
-                                                           self.hsc_host)
+                                                           self.hsc_host,
+                                                           results=results)
         if self.hsc_running_agent < 0:
             self.hsc_failed = True
 
@@ -137,9 +188,11 @@ class HostStatusCache():
             self.hsc_operating = -1
             return
 
+        results = self.hsc_batch_results.get(HSC_BATCH_OPERATING)
         self.hsc_operating = \
             clownfish_instance.ci_host_check_operating(log,
-                                                       self.hsc_host)
+                                                       self.hsc_host,
+                                                       results=results)
         if self.hsc_operating < 0:
             self.hsc_failed = True
 
@@ -201,7 +254,11 @@ class HostStatusCache():
             self.hsc_health_status = constant.LUSTRE_STR_ERROR
             return
 
-        self.hsc_health_status = self.hsc_host.lsh_healty_check(log)
+        cluster_status = self.hsc_cluster_status
+        results = self.hsc_batch_results.get(HSC_BATCH_HEALTH)
+        self.hsc_health_status = cluster_status.clsc_host_health(log,
+                                                                 self.hsc_host,
+                                                                 results=results)
         if self.hsc_health_status == constant.LUSTRE_STR_ERROR:
             self.hsc_failed = True
 
@@ -221,7 +278,9 @@ class HostStatusCache():
             self.hsc_consul_status = consul.CONSUL_STATUS_HOST_DOWN
             return
 
-        self.hsc_consul_status = consul.host_consul_status(log, self.hsc_host)
+        results = self.hsc_batch_results.get(HSC_BATCH_CONSUL)
+        self.hsc_consul_status = consul.host_consul_status(log, self.hsc_host,
+                                                           results=results)
         if self.hsc_consul_status != consul.CONSUL_STATUS_ALIVE:
             self.hsc_failed = True
 
@@ -236,6 +295,13 @@ class HostStatusCache():
         if consul_hostname is None:
             self.hsc_autostart_enabled = -1
             return
+        config_dict = cluster_status.clsc_host_config_dict
+        if config_dict is not None and hostname in config_dict:
+            if config_dict[hostname].chc_autostart:
+                self.hsc_autostart_enabled = 1
+            else:
+                self.hsc_autostart_enabled = 0
+            return
         rc = clownfish_instance.ci_host_autostart_check_enabled(log,
                                                                 hostname,
                                                                 consul_hostname=consul_hostname)
@@ -257,6 +323,11 @@ class HostStatusCache():
             self.hsc_watcher_init_status = -1
             self.hsc_autostart_enabled = -1
             return
+        watcher_dict = cluster_status.clsc_host_watcher_dict
+        if watcher_dict is not None and hostname in watcher_dict:
+            self.hsc_watcher = watcher_dict[hostname]
+            self.hsc_watcher_init_status = 0
+            return
         rc, self.hsc_watcher = clownfish_instance.ci_host_watcher(log, hostname,
                                                                   consul_hostname=consul_hostname)
         if rc:
@@ -300,6 +371,9 @@ class HostStatusCache():
             if hostname == watcher:
                 self.hsc_watching_hostnames.append(watched)
         self.hsc_watching_hostnames.sort()
+        if self.hsc_cluster_status.clsc_host_watcher_failed:
+            # Some watched hosts might be missing
+            self.hsc_failed = True
 
     def hsc_init_watching_services(self, log):
         """
@@ -313,6 +387,9 @@ class HostStatusCache():
             if hostname == watcher:
                 self.hsc_watching_services.append(service_name)
         self.hsc_watching_services.sort()
+        if self.hsc_cluster_status.clsc_service_watcher_failed:
+            # Some watched services might be missing
+            self.hsc_failed = True
 
     def hsc_init_candidate_watching_hosts(self):
         """
@@ -334,11 +411,75 @@ class HostStatusCache():
             clownfish_instance.ci_host_watching_candidate_services(host)
         self.hsc_watching_candidate_services.sort()
 
+    def _hsc_batch_commands(self, field_names):
+        """
+        Return the commands that the fields need to run on the host. Key is
+        HSC_BATCH_*, value is the list of commands.
+        """
+        host = self.hsc_host
+        clownfish_instance = self.hsc_clownfish_instance
+        health_dict = self.hsc_cluster_status.clsc_host_health_dict
+        command_dict = {}
+        for field in field_names:
+            if field == clownf_constant.CLOWNF_FIELD_AGENT:
+                command_dict[HSC_BATCH_AGENT] = \
+                    clownfish_instance.ci_host_running_agent_commands()
+            elif field == clownf_constant.CLOWNF_FIELD_OPERATING:
+                command_dict[HSC_BATCH_OPERATING] = \
+                    clownfish_instance.ci_host_operating_commands()
+            elif field == clownf_constant.CLOWNF_FIELD_CONSUL_STATUS:
+                command_dict[HSC_BATCH_CONSUL] = \
+                    consul.host_consul_status_commands()
+            elif field == clownf_constant.CLOWNF_FIELD_HEALTHY:
+                if host.sh_hostname not in health_dict:
+                    command_dict[HSC_BATCH_HEALTH] = \
+                        host.lsh_healty_check_commands()
+            elif field in HSC_SNAPSHOT_FIELDS:
+                if not host.lsh_snapshot_usable():
+                    command_dict[HSC_BATCH_SNAPSHOT] = \
+                        [host.lsh_snapshot_command()]
+        return command_dict
+
+    def hsc_run_batch(self, log, field_names):
+        """
+        Run the commands needed by the fields in a single round trip to the
+        host. The results are used when initing the fields.
+        """
+        command_dict = self._hsc_batch_commands(field_names)
+        commands = []
+        for batch_commands in command_dict.values():
+            commands += batch_commands
+        if len(commands) == 0:
+            return
+        if not self.hsc_is_up(log):
+            return
+
+        host = self.hsc_host
+        results = host.sh_run_batch(log, commands)
+        if results is None:
+            # Each field will run its own commands and report the error.
+            log.cl_debug("failed to run the status commands in batch on "
+                         "host [%s]", host.sh_hostname)
+            return
+
+        index = 0
+        for name, batch_commands in command_dict.items():
+            self.hsc_batch_results[name] = \
+                results[index:index + len(batch_commands)]
+            index += len(batch_commands)
+
+        if HSC_BATCH_SNAPSHOT in self.hsc_batch_results:
+            retval = self.hsc_batch_results[HSC_BATCH_SNAPSHOT][0]
+            # On failure, the snapshot will be collected again, and the
+            # error will be reported then.
+            host.lsh_snapshot_feed(log, retval)
+
     def hsc_init_fields(self, log, field_names):
         """
         Init this status cache according to required field names
         """
         # pylint: disable=too-many-branches
+        self.hsc_run_batch(log, field_names)
         for field in field_names:
             if field == clownf_constant.CLOWNF_FIELD_HOST:
                 continue
@@ -618,12 +759,17 @@ class HostStatusCache():
         return ret, result
 
 
-def host_status_init(log, workspace, host_status, field_names):
+def host_status_init(log, workspace, host_status, field_names,
+                     printer=None):
     """
-    Init status of a host
+    Init status of a host. If printer is not None, print the status of the
+    host as soon as it is ready.
     """
     # pylint: disable=unused-argument
-    return host_status.hsc_init_fields(log, field_names)
+    ret = host_status.hsc_init_fields(log, field_names)
+    if printer is not None:
+        printer.lsp_item_print(log, host_status)
+    return ret
 
 
 def host_status_field(log, host_status, field_name):
@@ -638,7 +784,7 @@ class ClusterStatusCache():
     """
     This instance saves cluster wide status.
     """
-    # pylint: disable=too-few-public-methods
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
     def __init__(self, clownfish_instance):
         # Instance
         self.clsc_clownfish_instance = clownfish_instance
@@ -654,6 +800,26 @@ class ClusterStatusCache():
         # Dict. Key is the service name, value is the watcher hostname of
         # the service.
         self.clsc_service_watcher_dict = None
+        # Dict. Key is the hostname, value is ClownfHostConfig. Loaded
+        # together with clsc_host_watcher_dict.
+        self.clsc_host_config_dict = None
+        # Dict. Key is the service name, value is LustreServiceConfig.
+        # Loaded together with clsc_service_watcher_dict.
+        self.clsc_service_config_dict = None
+        # Whether the watchers of some hosts failed to be got, so they are
+        # missing from clsc_host_watcher_dict
+        self.clsc_host_watcher_failed = False
+        # Whether the watchers of some services failed to be got, so they
+        # are missing from clsc_service_watcher_dict
+        self.clsc_service_watcher_failed = False
+        # Dict. Key is the hostname, value is whether the host is up.
+        self.clsc_host_up_dict = {}
+        # Dict. Key is the hostname, value is the health status of the host.
+        self.clsc_host_health_dict = {}
+        # The hosts that have their snapshots pinned by this status
+        self.clsc_pinned_hosts = []
+        # Lock to protect the host facts updated by parallel threads
+        self.clsc_lock = threading.Lock()
 
     def _clsc_init_consul_hostname(self, log):
         """
@@ -673,10 +839,11 @@ class ClusterStatusCache():
 
     def _clsc_init_host_watchers(self, log, only_hostnames=None):
         """
-        Init clsc_host_watcher_dict
+        Init clsc_host_watcher_dict and clsc_host_config_dict
         """
         clownfish_instance = self.clsc_clownfish_instance
         self.clsc_host_watcher_dict = {}
+        self.clsc_host_config_dict = {}
         consul_hostname = self.clsc_consul_hostname(log)
         if consul_hostname is None:
             return
@@ -684,24 +851,30 @@ class ClusterStatusCache():
         if only_hostnames is None:
             only_hostnames = list(clownfish_instance.ci_host_dict.keys())
 
-        for watching_hostname in only_hostnames:
-            ret, watcher = clownf_consul.host_get_watcher(log,
-                                                          clownfish_instance.ci_consul_cluster,
-                                                          watching_hostname,
-                                                          consul_hostname=consul_hostname)
-            if ret:
-                log.cl_error("failed to get the watcher of host [%s]",
-                             watching_hostname)
-                continue
-            self.clsc_host_watcher_dict[watching_hostname] = watcher
-
+        ret, config_dict, watcher_dict = \
+            clownf_consul.hosts_get_configs_and_watchers(log,
+                                                         clownfish_instance.ci_consul_cluster,
+                                                         only_hostnames,
+                                                         consul_hostname=consul_hostname)
+        if ret:
+            log.cl_error("failed to get the configs and watchers of hosts")
+            self.clsc_failed = True
+            return
+        # The hosts failed to be got will be reported as errors and read
+        # again when getting their own status.
+        for hostname in only_hostnames:
+            if hostname not in watcher_dict:
+                self.clsc_host_watcher_failed = True
+        self.clsc_host_watcher_dict = watcher_dict
+        self.clsc_host_config_dict = config_dict
 
     def _clsc_init_service_watchers(self, log, only_service_names=None):
         """
-        Init clsc_service_watcher_dict
+        Init clsc_service_watcher_dict and clsc_service_config_dict
         """
         clownfish_instance = self.clsc_clownfish_instance
         self.clsc_service_watcher_dict = {}
+        self.clsc_service_config_dict = {}
         consul_hostname = self.clsc_consul_hostname(log)
         if consul_hostname is None:
             return
@@ -709,16 +882,22 @@ class ClusterStatusCache():
         if only_service_names is None:
             only_service_names = list(clownfish_instance.ci_service_dict.keys())
 
-        for watching_service_name in only_service_names:
-            ret, watcher = clownf_consul.service_get_watcher(log,
-                                                             clownfish_instance.ci_consul_cluster,
-                                                             watching_service_name,
-                                                             consul_hostname=consul_hostname)
-            if ret:
-                log.cl_error("failed to get the watcher of host [%s]",
-                             watching_service_name)
-                continue
-            self.clsc_service_watcher_dict[watching_service_name] = watcher
+        ret, config_dict, watcher_dict = \
+            clownf_consul.services_get_configs_and_watchers(log,
+                                                            clownfish_instance.ci_consul_cluster,
+                                                            only_service_names,
+                                                            consul_hostname=consul_hostname)
+        if ret:
+            log.cl_error("failed to get the configs and watchers of services")
+            self.clsc_failed = True
+            return
+        # The services failed to be got will be reported as errors and
+        # read again when getting their own status.
+        for service_name in only_service_names:
+            if service_name not in watcher_dict:
+                self.clsc_service_watcher_failed = True
+        self.clsc_service_watcher_dict = watcher_dict
+        self.clsc_service_config_dict = config_dict
 
     def clsc_consul_hostname(self, log):
         """
@@ -746,6 +925,118 @@ class ClusterStatusCache():
                                              only_service_names=only_service_names)
         return 0
 
+    def clsc_host_facts_init(self, log, host, fact_names):
+        """
+        Collect the facts of a host.
+        """
+        hostname = host.sh_hostname
+        is_up = host.sh_is_up(log)
+        with self.clsc_lock:
+            self.clsc_host_up_dict[hostname] = is_up
+        if not is_up:
+            return 0
+
+        if STATUS_FACT_SNAPSHOT in fact_names:
+            # On failure, the snapshot will be collected again, and the
+            # error will be reported when checking the objects on the host.
+            ret = host.lsh_snapshot_pin(log)
+            if ret == 0:
+                with self.clsc_lock:
+                    self.clsc_pinned_hosts.append(host)
+
+        if STATUS_FACT_HEALTH in fact_names:
+            health_status = host.lsh_healty_check(log)
+            with self.clsc_lock:
+                self.clsc_host_health_dict[hostname] = health_status
+        return 0
+
+    def clsc_init_host_facts(self, log, hosts, fact_names,
+                             parallelism=STATUS_PARALLELISM):
+        """
+        Collect the facts of the hosts in a single parallel pass so that
+        the status of the objects on the same host do not need to get the
+        facts again.
+        """
+        if len(fact_names) == 0:
+            return 0
+        args_array = []
+        thread_ids = []
+        hostnames = []
+        for host in hosts:
+            hostname = host.sh_hostname
+            if hostname in hostnames or hostname in self.clsc_host_up_dict:
+                continue
+            hostnames.append(hostname)
+            args_array.append((self, host, fact_names))
+            thread_ids.append("host_facts_%s" % hostname)
+
+        if len(args_array) == 0:
+            return 0
+        if len(args_array) == 1:
+            return self.clsc_host_facts_init(log, args_array[0][1], fact_names)
+
+        clownfish_instance = self.clsc_clownfish_instance
+        parallel_execute = parallel.ParallelExecute(clownfish_instance.ci_workspace,
+                                                    "host_facts",
+                                                    cluster_host_facts_init,
+                                                    args_array,
+                                                    thread_ids=thread_ids)
+        ret = parallel_execute.pe_run(log, parallelism=parallelism)
+        if ret:
+            log.cl_error("failed to collect facts of hosts")
+            return -1
+        return 0
+
+    def clsc_host_is_up(self, log, host):
+        """
+        Return whether the host is up.
+        """
+        hostname = host.sh_hostname
+        if hostname in self.clsc_host_up_dict:
+            return self.clsc_host_up_dict[hostname]
+        return host.sh_is_up(log)
+
+    def clsc_host_health(self, log, host, results=None):
+        """
+        Return the health status of the host. If results is not None, it
+        is the results of lsh_healty_check_commands() run by the caller.
+        """
+        hostname = host.sh_hostname
+        if hostname in self.clsc_host_health_dict:
+            return self.clsc_host_health_dict[hostname]
+        if not self.clsc_host_up_dict.get(hostname, True):
+            return constant.LUSTRE_STR_ERROR
+        return host.lsh_healty_check(log, results=results)
+
+    def clsc_service_mounted_instance(self, log, service):
+        """
+        Return the mounted instance of the service, None if not mounted.
+        """
+        down_hostnames = []
+        for host in service.ls_hosts():
+            hostname = host.sh_hostname
+            if hostname not in self.clsc_host_up_dict:
+                return service.ls_mounted_instance(log)
+            if not self.clsc_host_up_dict[hostname]:
+                down_hostnames.append(hostname)
+        return service.ls_mounted_instance(log, down_hostnames=down_hostnames)
+
+    def clsc_fini(self):
+        """
+        Release the pinned snapshots of the hosts.
+        """
+        for host in self.clsc_pinned_hosts:
+            host.lsh_snapshot_unpin()
+        self.clsc_pinned_hosts = []
+
+
+def cluster_host_facts_init(log, workspace, cluster_status, host, fact_names):
+    """
+    Collect the facts of a host in a parallel thread
+    """
+    # pylint: disable=unused-argument
+    return cluster_status.clsc_host_facts_init(log, host, fact_names)
+
 
 def get_possible_watched_hostnames(clownfish_instance, hosts):
     """
@@ -776,9 +1067,12 @@ def get_possible_watched_service_names(clownfish_instance, hosts):
 
 
 def print_hosts(log, clownfish_instance, hosts, print_status=False,
-                print_table=True, field_string=None):
+                print_table=True, field_string=None,
+                parallelism=STATUS_PARALLELISM,
+                output_format=cmd_general.OUTPUT_FORMAT_TABLE):
     """
-    Print table of hosts
+    Print table of hosts. If output_format is not table, print a line for
+    each host as soon as its status is ready.
     """
     # pylint: disable=too-many-branches,too-many-locals,too-many-statements
     # pylint: disable=too-many-nested-blocks
@@ -838,9 +1132,17 @@ def print_hosts(log, clownfish_instance, hosts, print_status=False,
         if only_service_names is None:
             log.cl_error("failed to get possible watched service names")
             return -1
-    elif (clownf_constant.CLOWNF_FIELD_AUTOSTART in field_names or
-          clownf_constant.CLOWNF_FIELD_WATCHER_HOST in field_names):
+    if (clownf_constant.CLOWNF_FIELD_AUTOSTART in field_names or
+            clownf_constant.CLOWNF_FIELD_WATCHER_HOST in field_names):
+        # Load the configs and watchers of all the hosts with a few
+        # Consul requests.
         init_consul_hostname = True
+        init_host_watchers = True
+        if only_hostnames is None:
+            only_hostnames = []
+        for host in hosts:
+            if host.sh_hostname not in only_hostnames:
+                only_hostnames.append(host.sh_hostname)
     ret = cluster_status.clsc_init_fields(log, init_consul_hostname=init_consul_hostname,
                                           init_host_watchers=init_host_watchers,
                                           init_service_watchers=init_service_watchers,
@@ -850,26 +1152,53 @@ def print_hosts(log, clownfish_instance, hosts, print_status=False,
         log.cl_error("failed to init cluster status")
         return -1
 
+    field_fact_dict = {}
+    for field_name in [clownf_constant.CLOWNF_FIELD_UP,
+                       clownf_constant.CLOWNF_FIELD_AGENT,
+                       clownf_constant.CLOWNF_FIELD_OPERATING,
+                       clownf_constant.CLOWNF_FIELD_CONSUL_STATUS]:
+        field_fact_dict[field_name] = [STATUS_FACT_UP]
+    for field_name in [clownf_constant.CLOWNF_FIELD_SERVICE_LOAD,
+                       clownf_constant.CLOWNF_FIELD_MOUNTED_SERVICES,
+                       clownf_constant.CLOWNF_FIELD_NOT_MOUNTED_SERVICES,
+                       clownf_constant.CLOWNF_FIELD_LOAD_BALANCED]:
+        field_fact_dict[field_name] = [STATUS_FACT_SNAPSHOT]
+    field_fact_dict[clownf_constant.CLOWNF_FIELD_HEALTHY] = [STATUS_FACT_HEALTH]
+    fact_names = status_fact_names(field_names, field_fact_dict)
+    ret = cluster_status.clsc_init_host_facts(log, hosts, fact_names,
+                                              parallelism=parallelism)
+    if ret:
+        log.cl_error("failed to collect facts of hosts")
+        cluster_status.clsc_fini()
+        return -1
+
     host_status_list = []
     for host in hosts:
         host_status = HostStatusCache(clownfish_instance, cluster_status,
                                       host)
         host_status_list.append(host_status)
 
+    printer = cmd_general.list_stream_printer(log, field_names,
+                                              host_status_field,
+                                              output_format)
     if len(host_status_list) == 0:
         pass
     if host_status_list[0].hsc_can_skip_init_fields(field_names):
-        pass
+        if printer is not None:
+            for host_status in host_status_list:
+                printer.lsp_item_print(log, host_status)
     elif len(host_status_list) == 1:
-        # The overhead of ParallelExecute is about 1 second. In the case
+        # No need to start a thread with ParallelExecute. In the case
         # of status collection for command "clownf local status", we only
         # need to get status of one host.
-        ret = host_status_list[0].hsc_init_fields(log, field_names)
+        ret = host_status_init(log, clownfish_instance.ci_workspace,
+                               host_status_list[0], field_names,
+                               printer=printer)
     else:
         args_array = []
         thread_ids = []
         for host_status in host_status_list:
-            args = (host_status, field_names)
+            args = (host_status, field_names, printer)
             args_array.append(args)
             thread_id = "host_status_%s" % host_status.hsc_host.sh_hostname
             thread_ids.append(thread_id)
@@ -879,18 +1208,24 @@ def print_hosts(log, clownfish_instance, hosts, print_status=False,
                                                     host_status_init,
                                                     args_array,
                                                     thread_ids=thread_ids)
-        ret = parallel_execute.pe_run(log, parallelism=10)
+        ret = parallel_execute.pe_run(log, parallelism=parallelism)
+    cluster_status.clsc_fini()
     if ret:
         log.cl_error("failed to init fields %s for hosts",
                      field_names)
+        if printer is not None:
+            printer.lsp_finish(log, rc=-1)
         return -1
 
-    rc = cmd_general.print_list(log, host_status_list, quick_fields,
-                                slow_fields, none_table_fields,
-                                host_status_field,
-                                print_table=print_table,
-                                print_status=print_status,
-                                field_string=field_string)
+    if printer is not None:
+        rc = printer.lsp_finish(log)
+    else:
+        rc = cmd_general.print_list(log, host_status_list, quick_fields,
+                                    slow_fields, none_table_fields,
+                                    host_status_field,
+                                    print_table=print_table,
+                                    print_status=print_status,
+                                    field_string=field_string)
     if cluster_status.clsc_failed:
         rc = -1
     return rc
@@ -933,14 +1268,26 @@ class ServiceStatusCache():
         # Watch candidate hostnames.
         self.ssc_watcher_candidate_hostnames = None
 
+    def _ssc_cached_config(self):
+        """
+        Return the LustreServiceConfig loaded by the cluster status. None
+        if not loaded.
+        """
+        config_dict = self.ssc_cluster_status.clsc_service_config_dict
+        service_name = self.ssc_service.ls_service_name
+        if config_dict is None or service_name not in config_dict:
+            return None
+        return config_dict[service_name]
+
     def ssc_init_mounted_instance(self, log):
         """
         Init ssc_mounted_instance.
         """
         if self.ssc_mounted_instance_inited:
             return
-        service = self.ssc_service
-        self.ssc_mounted_instance = service.ls_mounted_instance(log)
+        cluster_status = self.ssc_cluster_status
+        self.ssc_mounted_instance = \
+            cluster_status.clsc_service_mounted_instance(log, self.ssc_service)
         self.ssc_mounted_instance_inited = True
 
     def ssc_init_enabled_hostnames(self, log):
@@ -952,7 +1299,8 @@ class ServiceStatusCache():
         clownfish_instance = self.ssc_clownfish_instance
         service = self.ssc_service
         self.ssc_enabled_hostnames = \
-            clownfish_instance.ci_service_enabled_hostnames(log, service)
+            clownfish_instance.ci_service_enabled_hostnames(log, service,
+                                                            service_config=self._ssc_cached_config())
         if self.ssc_enabled_hostnames is None:
             self.ssc_failed = True
         else:
@@ -968,7 +1316,8 @@ class ServiceStatusCache():
         clownfish_instance = self.ssc_clownfish_instance
         service = self.ssc_service
         self.ssc_prefered_hostnames = \
-            clownfish_instance.ci_service_prefered_hostnames(log, service)
+            clownfish_instance.ci_service_prefered_hostnames(log, service,
+                                                             service_config=self._ssc_cached_config())
         if self.ssc_prefered_hostnames is None:
             self.ssc_failed = True
         else:
@@ -986,6 +1335,13 @@ class ServiceStatusCache():
         if consul_hostname is None:
             self.ssc_autostart_enabled = -1
             return
+        config = self._ssc_cached_config()
+        if config is not None:
+            if config.lsc_autostart:
+                self.ssc_autostart_enabled = 1
+            else:
+                self.ssc_autostart_enabled = 0
+            return
         self.ssc_autostart_enabled = \
             clownfish_instance.ci_service_autostart_check_enabled(log,
                                                                   service_name,
@@ -1006,6 +1362,11 @@ class ServiceStatusCache():
         if consul_hostname is None:
             self.ssc_watcher_init_status = -1
             return
+        watcher_dict = cluster_status.clsc_service_watcher_dict
+        if watcher_dict is not None and service_name in watcher_dict:
+            self.ssc_watcher = watcher_dict[service_name]
+            self.ssc_watcher_init_status = 0
+            return
         rc, self.ssc_watcher = \
             clownfish_instance.ci_service_watcher(log,
                                                   service_name,
@@ -1194,12 +1555,17 @@ class ServiceStatusCache():
         return ret, result
 
 
-def service_status_init(log, workspace, service_status, field_names):
+def service_status_init(log, workspace, service_status, field_names,
+                        printer=None):
     """
-    Init status of a service
+    Init status of a service. If printer is not None, print the status of
+    the service as soon as it is ready.
     """
     # pylint: disable=unused-argument
-    return service_status.ssc_init_fields(log, field_names)
+    ret = service_status.ssc_init_fields(log, field_names)
+    if printer is not None:
+        printer.lsp_item_print(log, service_status)
+    return ret
 
 
 def service_status_field(log, service_status, field_name):
@@ -1211,9 +1577,12 @@ def service_status_field(log, service_status, field_name):
 
 
 def print_services(log, clownfish_instance, services, status=False,
-                   print_table=True, field_string=None):
+                   print_table=True, field_string=None,
+                   parallelism=STATUS_PARALLELISM,
+                   output_format=cmd_general.OUTPUT_FORMAT_TABLE):
     """
-    Print table of services
+    Print table of services. If output_format is not table, print a line
+    for each service as soon as its status is ready.
     """
     # pylint: disable=too-many-branches,too-many-locals,too-many-statements
     if not print_table and len(services) > 1:
@@ -1252,7 +1621,13 @@ def print_services(log, clownfish_instance, services, status=False,
         (clownf_constant.CLOWNF_FIELD_PREFERED_HOSTS in field_names) or
         (clownf_constant.CLOWNF_FIELD_AUTOSTART in field_names) or
         (clownf_constant.CLOWNF_FIELD_WATCHER_HOST in field_names)):
-        ret = cluster_status.clsc_init_fields(log)
+        # Load the configs and watchers of all the services with a few
+        # Consul requests.
+        service_names = []
+        for service in services:
+            service_names.append(service.ls_service_name)
+        ret = cluster_status.clsc_init_fields(log, init_service_watchers=True,
+                                              only_service_names=service_names)
         if ret:
             log.cl_error("failed to init cluster status")
             return -1
@@ -1263,20 +1638,41 @@ def print_services(log, clownfish_instance, services, status=False,
                                             service)
         service_status_list.append(service_status)
 
+    field_fact_dict = {}
+    field_fact_dict[clownf_constant.CLOWNF_FIELD_MOUNTED] = [STATUS_FACT_SNAPSHOT]
+    field_fact_dict[clownf_constant.CLOWNF_FIELD_MOUNT_HOST] = [STATUS_FACT_SNAPSHOT]
+    fact_names = status_fact_names(field_names, field_fact_dict)
+    hosts = []
+    for service in services:
+        hosts += service.ls_hosts()
+    ret = cluster_status.clsc_init_host_facts(log, hosts, fact_names,
+                                              parallelism=parallelism)
+    if ret:
+        log.cl_error("failed to collect facts of hosts")
+        cluster_status.clsc_fini()
+        return -1
+
+    printer = cmd_general.list_stream_printer(log, field_names,
+                                              service_status_field,
+                                              output_format)
     if len(service_status_list) == 0:
         pass
     if service_status_list[0].ssc_can_skip_init_fields(field_names):
-        pass
+        if printer is not None:
+            for service_status in service_status_list:
+                printer.lsp_item_print(log, service_status)
     elif len(service_status_list) == 1:
-        # The overhead of ParallelExecute is about 1 second. In the case
+        # No need to start a thread with ParallelExecute. In the case
         # of status collection for command "clownf service status", we only
         # need to get status of one host.
-        ret = service_status_list[0].ssc_init_fields(log, field_names)
+        ret = service_status_init(log, clownfish_instance.ci_workspace,
+                                  service_status_list[0], field_names,
+                                  printer=printer)
     else:
         args_array = []
         thread_ids = []
         for service_status in service_status_list:
-            args = (service_status, field_names)
+            args = (service_status, field_names, printer)
             args_array.append(args)
             thread_id = "service_status_%s" % service_status.ssc_service.ls_service_name
             thread_ids.append(thread_id)
@@ -1286,18 +1682,24 @@ def print_services(log, clownfish_instance, services, status=False,
                                                     service_status_init,
                                                     args_array,
                                                     thread_ids=thread_ids)
-        ret = parallel_execute.pe_run(log, parallelism=10)
-        if ret:
-            log.cl_error("failed to init fields %s for services",
-                         field_names)
-            return -1
+        ret = parallel_execute.pe_run(log, parallelism=parallelism)
+    cluster_status.clsc_fini()
+    if ret:
+        log.cl_error("failed to init fields %s for services",
+                     field_names)
+        if printer is not None:
+            printer.lsp_finish(log, rc=-1)
+        return -1
 
-    rc = cmd_general.print_list(log, service_status_list, quick_fields,
-                                slow_fields, none_table_fields,
-                                service_status_field,
-                                print_table=print_table,
-                                print_status=status,
-                                field_string=field_string)
+    if printer is not None:
+        rc = printer.lsp_finish(log)
+    else:
+        rc = cmd_general.print_list(log, service_status_list, quick_fields,
+                                    slow_fields, none_table_fields,
+                                    service_status_field,
+                                    print_table=print_table,
+                                    print_status=status,
+                                    field_string=field_string)
     if cluster_status.clsc_failed:
         rc = -1
     return rc
@@ -1334,8 +1736,9 @@ class InstanceStatusCache():
         """
         if self.isc_mounted_instance_inited:
             return
-        service = self.isc_service
-        self.isc_mounted_instance = service.ls_mounted_instance(log)
+        cluster_status = self.isc_cluster_status
+        self.isc_mounted_instance = \
+            cluster_status.clsc_service_mounted_instance(log, self.isc_service)
         self.isc_mounted_instance_inited = True
 
     def isc_init_enabled(self, log):
@@ -1503,7 +1906,8 @@ def instance_status_field(log, instance_status, field_name):
 
 
 def print_instances(log, clownfish_instance, instances, status=False,
-                    print_table=True, field_string=None):
+                    print_table=True, field_string=None,
+                    parallelism=STATUS_PARALLELISM):
     """
     Print table of service instances
     """
@@ -1550,6 +1954,19 @@ def print_instances(log, clownfish_instance, instances, status=False,
                                               instance)
         instance_status_list.append(instance_status)
 
+    field_fact_dict = {}
+    field_fact_dict[clownf_constant.CLOWNF_FIELD_MOUNTED] = [STATUS_FACT_SNAPSHOT]
+    fact_names = status_fact_names(field_names, field_fact_dict)
+    hosts = []
+    for instance in instances:
+        hosts += instance.lsi_service.ls_hosts()
+    ret = cluster_status.clsc_init_host_facts(log, hosts, fact_names,
+                                              parallelism=parallelism)
+    if ret:
+        log.cl_error("failed to collect facts of hosts")
+        cluster_status.clsc_fini()
+        return -1
+
     if (len(instance_status_list) > 0 and
             not instance_status_list[0].isc_can_skip_init_fields(field_names)):
         args_array = []
@@ -1568,11 +1985,13 @@ def print_instances(log, clownfish_instance, instances, status=False,
                                                     instance_status_init,
                                                     args_array,
                                                     thread_ids=thread_ids)
-        ret = parallel_execute.pe_run(log, parallelism=10)
+        ret = parallel_execute.pe_run(log, parallelism=parallelism)
         if ret:
             log.cl_error("failed to init fields %s for instances",
                          field_names)
+            cluster_status.clsc_fini()
             return -1
+    cluster_status.clsc_fini()
 
     rc = cmd_general.print_list(log, instance_status_list, quick_fields,
                                 slow_fields, none_table_fields,
@@ -1719,11 +2138,13 @@ class LustreFilesystemStatusCache():
         """
         if self.lfsc_mounted_service_names is not None:
             return
+        cluster_status = self.lfsc_cluster_status
         self.lfsc_mounted_service_names = []
         self.lfsc_umounted_service_names = []
         for service in self.lfsc_lustrefs.lf_service_dict.values():
             service_name = service.ls_service_name
-            mounted_instance = service.ls_mounted_instance(log)
+            mounted_instance = \
+                cluster_status.clsc_service_mounted_instance(log, service)
             if mounted_instance is not None:
                 self.lfsc_mounted_service_names.append(service_name)
             else:
@@ -1772,10 +2193,11 @@ class LustreFilesystemStatusCache():
         """
         Init lfsc_health_status
         """
+        cluster_status = self.lfsc_cluster_status
         host_dict = self.lfsc_lustrefs.lf_host_dict()
         self.lfsc_health_status = constant.LUSTRE_STR_HEALTHY
         for host in host_dict.values():
-            healty_result = host.lsh_healty_check(log)
+            healty_result = cluster_status.clsc_host_health(log, host)
             if healty_result == constant.LUSTRE_STR_ERROR:
                 log.cl_error("failed to check whether host [%s] is healthy",
                              host.sh_hostname)
@@ -1933,7 +2355,8 @@ def fs_status_field(log, fs_status, field_name):
 
 
 def print_filesystems(log, clownfish_instance, lustres, status=False,
-                      print_table=True, field_string=None):
+                      print_table=True, field_string=None,
+                      parallelism=STATUS_PARALLELISM):
     """
     Print table of LustreFilesystem.
     """
@@ -1976,6 +2399,24 @@ def print_filesystems(log, clownfish_instance, lustres, status=False,
                                                 lustrefs)
         fs_status_list.append(fs_status)
 
+    field_fact_dict = {}
+    for field_name in [clownf_constant.CLOWNF_FIELD_UMOUNTED_SERVICES,
+                       clownf_constant.CLOWNF_FIELD_MOUNTED_SERVICES,
+                       clownf_constant.CLOWNF_FIELD_MOUNTED_CLIENTS,
+                       clownf_constant.CLOWNF_FIELD_LOAD_BALANCED]:
+        field_fact_dict[field_name] = [STATUS_FACT_SNAPSHOT]
+    field_fact_dict[clownf_constant.CLOWNF_FIELD_HEALTHY] = [STATUS_FACT_HEALTH]
+    fact_names = status_fact_names(field_names, field_fact_dict)
+    hosts = []
+    for lustrefs in lustres:
+        hosts += list(lustrefs.lf_host_dict().values())
+    ret = cluster_status.clsc_init_host_facts(log, hosts, fact_names,
+                                              parallelism=parallelism)
+    if ret:
+        log.cl_error("failed to collect facts of hosts")
+        cluster_status.clsc_fini()
+        return -1
+
     if (len(fs_status_list) > 0 and
             not fs_status_list[0].lfsc_can_skip_init_fields(field_names)):
         args_array = []
@@ -1993,11 +2434,13 @@ def print_filesystems(log, clownfish_instance, lustres, status=False,
                                                     fs_status_init,
                                                     args_array,
                                                     thread_ids=thread_ids)
-        ret = parallel_execute.pe_run(log, parallelism=10)
+        ret = parallel_execute.pe_run(log, parallelism=parallelism)
         if ret:
             log.cl_error("failed to init fields %s for file systems",
                          field_names)
+            cluster_status.clsc_fini()
             return -1
+    cluster_status.clsc_fini()
 
     rc = cmd_general.print_list(log, fs_status_list, quick_fields,
                                 slow_fields, none_table_fields,
@@ -2136,7 +2579,8 @@ def client_status_field(log, client_status, field_name):
 
 
 def print_clients(log, clownfish_instance, clients, print_status=False,
-                  print_table=True, field_string=None):
+                  print_table=True, field_string=None,
+                  parallelism=STATUS_PARALLELISM):
     """
     Print table of clients
     """
@@ -2172,6 +2616,20 @@ def print_clients(log, clownfish_instance, clients, print_status=False,
                                                 client)
         client_status_list.append(client_status)
 
+    field_fact_dict = {}
+    field_fact_dict[clownf_constant.CLOWNF_FIELD_MOUNTED] = [STATUS_FACT_SNAPSHOT]
+    field_fact_dict[clownf_constant.CLOWNF_FIELD_HEALTHY] = [STATUS_FACT_HEALTH]
+    fact_names = status_fact_names(field_names, field_fact_dict)
+    hosts = []
+    for client in clients:
+        hosts.append(client.lc_host)
+    ret = cluster_status.clsc_init_host_facts(log, hosts, fact_names,
+                                              parallelism=parallelism)
+    if ret:
+        log.cl_error("failed to collect facts of hosts")
+        cluster_status.clsc_fini()
+        return -1
+
     if (len(client_status_list) > 0 and
             not client_status_list[0].lcsc_can_skip_init_fields(field_names)):
         args_array = []
@@ -2188,11 +2646,13 @@ def print_clients(log, clownfish_instance, clients, print_status=False,
                                                     client_status_init,
                                                     args_array,
                                                     thread_ids=thread_ids)
-        ret = parallel_execute.pe_run(log, parallelism=10)
+        ret = parallel_execute.pe_run(log, parallelism=parallelism)
         if ret:
             log.cl_error("failed to init fields %s for Lustre clients",
                          field_names)
+            cluster_status.clsc_fini()
             return -1
+    cluster_status.clsc_fini()
 
     rc = cmd_general.print_list(log, client_status_list, quick_fields,
                                 slow_fields, none_table_fields,
@@ -2381,7 +2841,7 @@ def print_autostart(log, clownfish_instance, hosts=None, services=None,
                                                     autostart_status_init,
                                                     args_array,
                                                     thread_ids=thread_ids)
-        ret = parallel_execute.pe_run(log, parallelism=10)
+        ret = parallel_execute.pe_run(log, parallelism=STATUS_PARALLELISM)
         if ret:
             log.cl_error("failed to init fields %s for autotart status",
                          field_names)
@@ -2505,7 +2965,7 @@ def print_watchers(log, clownfish_instance, watcher_hostname,
                                                     watcher_status_init,
                                                     args_array,
                                                     thread_ids=thread_ids)
-        ret = parallel_execute.pe_run(log, parallelism=10)
+        ret = parallel_execute.pe_run(log, parallelism=STATUS_PARALLELISM)
         if ret:
             log.cl_error("failed to init fields %s for hosts",
                          field_names)
@@ -2590,19 +3050,36 @@ def hosts_exec(log, hosts, command):
     """
     Run command on all hosts
     """
-    args_array = []
-    thread_ids = []
-    for host in hosts:
-        args = (host, command)
-        args_array.append(args)
-        thread_id = "%s" % host.sh_hostname
-        thread_ids.append(thread_id)
-
-    parallel_execute = parallel.ParallelExecute(None,
-                                                "exec",
-                                                host_exec,
-                                                args_array,
-                                                thread_ids=thread_ids)
-    ret = parallel_execute.pe_run(log, quit_on_error=False, parallelism=10)
-
+    def print_stdout(host, line):
+        """
+        Print a line of stdout
+        """
+        prefix = clog.colorful_message(clog.COLOR_LIGHT_BLUE,
+                                       host.sh_hostname + ": ")
+        log.cl_stdout(prefix + line)
+
+    def print_stderr(host, line):
+        """
+        Print a line of stderr
+        """
+        prefix = clog.colorful_message(clog.COLOR_LIGHT_BLUE,
+                                       host.sh_hostname + ": ")
+        log.cl_error(prefix + line)
+
+    origin_console_format = log.cl_console_format
+    if origin_console_format != clog.FMT_QUIET:
+        log.cl_change_config(console_format=clog.FMT_QUIET,
+                             resultsdir=log.cl_resultsdir)
+    results = ssh_basic.hosts_run(log, hosts, command, timeout=None,
+                                  parallelism=10, return_stdout=False,
+                                  return_stderr=False,
+                                  stdout_line_func=print_stdout,
+                                  stderr_line_func=print_stderr)
+    if origin_console_format != clog.FMT_QUIET:
+        log.cl_change_config(console_format=origin_console_format,
+                             resultsdir=log.cl_resultsdir)
+    ret = 0
+    for retval in results:
+        if retval.cr_exit_status:
+            ret = -1
     return ret
@@ -47,6 +47,28 @@ class WatchingServiceHostStatusCache():
             return True
         return False
 
+    def _wshsc_get_watcher(self, log):
+        """
+        Return (0, watcher) of the host/service read from Consul.
+        """
+        clownfish_instance = self.wshsc_clownfish_instance
+        consul_hostname = self.wshsc_cluster_status.clsc_consul_hostname(log)
+        if consul_hostname is None:
+            return -1, None
+        name = self.wshsc_host_service_name
+        if self.wshsc_is_host:
+            rc, watcher = \
+                clownfish_instance.ci_host_watcher(log, name,
+                                                   consul_hostname=consul_hostname)
+        else:
+            rc, watcher = \
+                clownfish_instance.ci_service_watcher(log, name,
+                                                      consul_hostname=consul_hostname)
+        if rc:
+            log.cl_error("failed to get the watcher of service/host [%s]",
+                         name)
+        return rc, watcher
+
     def wshsc_init_watching(self, log):
         """
         Init wshsc_watching
@@ -61,10 +83,19 @@ class WatchingServiceHostStatusCache():
             self.wshsc_watching = -1
             self.wshsc_failed = True
             return
-        if self.wshsc_host_service_name not in watcher_dict:
+        name = self.wshsc_host_service_name
+        if name in watcher_dict:
+            watcher = watcher_dict[name]
+        else:
+            # Failed to get it together with others, try it alone
+            rc, watcher = self._wshsc_get_watcher(log)
+            if rc:
+                self.wshsc_watching = -1
+                self.wshsc_failed = True
+                return
+        if watcher is None:
             self.wshsc_watching = 0
             return
-        watcher = watcher_dict[self.wshsc_host_service_name]
         if watcher == self.wshsc_host.sh_hostname:
             self.wshsc_watching = 1
         else:
@@ -347,11 +378,14 @@ class ClownfHostCommand():
                                                 print_table=False)
         clownf_command_common.exit_env(log, clownfish_instance, rc)
 
-    def ls(self, status=False, fields=None):
+    def ls(self, status=False, fields=None, output_format="table"):
         """
         List all configured hosts.
         :param status: print status of the hosts, default: False.
         :param fields: fields to print, seperated by comma.
+        :param output_format: table, jsonl or csv. A line is printed for
+            each host as soon as its status is ready if jsonl or csv,
+            default: table.
         """
         log, clownfish_instance = \
             clownf_command_common.init_env(self._hc_config_fpath,
@@ -363,10 +397,14 @@ class ClownfHostCommand():
                                          allow_none=True,
                                          allow_tuple=True, allow_str=True,
                                          allow_bool=True)
+        output_format = cmd_general.check_argument_output_format(log,
+                                                                 "output_format",
+                                                                 output_format)
         hosts = list(clownfish_instance.ci_host_dict.values())
         rc = clownf_command_common.print_hosts(log, clownfish_instance, hosts,
                                                print_status=status,
-                                               field_string=fields)
+                                               field_string=fields,
+                                               output_format=output_format)
         clownf_command_common.exit_env(log, clownfish_instance, rc)
 
     def prepare(self, host, nolazy=False):
@@ -700,11 +738,12 @@ class ClownfHostCommand():
         rc = clownfish_instance.ci_hosts_start(log, hostnames)
         clownf_command_common.exit_env(log, clownfish_instance, rc)
 
-    def status(self, host):
+    def status(self, host, output_format="table"):
         """
         Print the status of a host.
 
         :param host: Name of the host.
+        :param output_format: table, jsonl or csv, default: table.
         """
         log, clownfish_instance = \
             clownf_command_common.init_env(self._hc_config_fpath,
@@ -712,6 +751,9 @@ class ClownfHostCommand():
                                            self._hc_log_to_file,
                                            self._hc_iso)
         host = cmd_general.check_argument_str(log, "host", host)
+        output_format = cmd_general.check_argument_output_format(log,
+                                                                 "output_format",
+                                                                 output_format)
         if host not in clownfish_instance.ci_host_dict:
             log.cl_error("host [%s] is not configured", host)
             clownf_command_common.exit_env(log, clownfish_instance, -1)
@@ -719,7 +761,8 @@ class ClownfHostCommand():
         hosts = [host_obj]
         rc = clownf_command_common.print_hosts(log, clownfish_instance, hosts,
                                                print_status=True,
-                                               print_table=False)
+                                               print_table=False,
+                                               output_format=output_format)
         clownf_command_common.exit_env(log, clownfish_instance, rc)
 
     def watcher(self, hostname):
@@ -0,0 +1,137 @@
+"""
+Server commands of Clownf.
+
+The commands except run() are clients of the server, thus should not
+import the libraries of Clownfish instance, so that they start quickly.
+"""
+import sys
+from pycoral import lazy_import
+from pyclownf import clownf_constant
+from pyclownf import clownf_rpc
+
+clownf_server = lazy_import.lazy_module(  # pylint: disable=invalid-name
+    "pyclownf.clownf_server")
+
+
+def server_request(request, socket_path):
+    """
+    Send the request to the server, print the output and exit.
+    """
+    try:
+        response = clownf_rpc.rpc_call(socket_path, request)
+    except Exception as error:  # pylint: disable=broad-except
+        print("ERROR: failed to send request to Clownfish server on socket "
+              "[%s]: %s" % (socket_path, error), file=sys.stderr)
+        sys.exit(1)
+    if response is None:
+        print("ERROR: Clownfish server is not running on socket [%s]" %
+              socket_path, file=sys.stderr)
+        sys.exit(1)
+    sys.stdout.write(response.get(clownf_rpc.CLOWNF_RPC_STDOUT, ""))
+    sys.stderr.write(response.get(clownf_rpc.CLOWNF_RPC_STDERR, ""))
+    ret = response.get(clownf_rpc.CLOWNF_RPC_RET, -1)
+    if not isinstance(ret, int):
+        ret = -1
+    sys.exit(ret)
+
+
+def check_service_name(service_name):
+    """
+    Check the service name is valid and return it.
+    """
+    if (not isinstance(service_name, bool)) and isinstance(service_name, int):
+        service_name = str(service_name)
+    if not isinstance(service_name, str) or len(service_name) == 0:
+        print("ERROR: invalid service name [%s]" % service_name,
+              file=sys.stderr)
+        sys.exit(1)
+    return service_name
+
+
+class ClownfServerCommand():
+    """
+    Commands to run or use the resident Clownfish server. The server keeps
+    the parsed config, SSH connections and cached status of hosts, so that
+    the requests to it finish quickly.
+    """
+    def _init(self, config, logdir, log_to_file, iso):
+        # pylint: disable=attribute-defined-outside-init
+        self._csc_config_fpath = config
+        self._csc_logdir = logdir
+        self._csc_log_to_file = log_to_file
+        self._csc_iso = iso
+
+    def run(self, socket=clownf_constant.CLOWNF_SERVER_SOCKET):
+        """
+        Run the Clownfish server in foreground.
+        :param socket: The Unix domain socket to listen on.
+            Default: /run/clownf_server.sock.
+        """
+        clownf_server.clownf_server_run(self._csc_config_fpath,
+                                        self._csc_logdir,
+                                        self._csc_log_to_file,
+                                        self._csc_iso,
+                                        socket_path=socket)
+
+    def mount(self, service_name, socket=clownf_constant.CLOWNF_SERVER_SOCKET):
+        """
+        Mount a Lustre service through the Clownfish server.
+        :param service_name: Lustre service name.
+        :param socket: The Unix domain socket of the server.
+            Default: /run/clownf_server.sock.
+        """
+        # pylint: disable=no-self-use
+        service_name = check_service_name(service_name)
+        request = {clownf_rpc.CLOWNF_RPC_OPERATION:
+                   clownf_rpc.CLOWNF_RPC_OPERATION_MOUNT,
+                   clownf_rpc.CLOWNF_RPC_SERVICE_NAME: service_name}
+        server_request(request, socket)
+
+    def umount(self, service_name, force=False,
+               socket=clownf_constant.CLOWNF_SERVER_SOCKET):
+        """
+        Umount a Lustre service through the Clownfish server.
+        :param service_name: Lustre service name.
+        :param force: umount even autostart is enabled, default: False.
+        :param socket: The Unix domain socket of the server.
+            Default: /run/clownf_server.sock.
+        """
+        # pylint: disable=no-self-use
+        service_name = check_service_name(service_name)
+        if not isinstance(force, bool):
+            print("ERROR: invalid force option [%s], should be a bool type" %
+                  force, file=sys.stderr)
+            sys.exit(1)
+        request = {clownf_rpc.CLOWNF_RPC_OPERATION:
+                   clownf_rpc.CLOWNF_RPC_OPERATION_UMOUNT,
+                   clownf_rpc.CLOWNF_RPC_SERVICE_NAME: service_name,
+                   clownf_rpc.CLOWNF_RPC_FORCE: force}
+        server_request(request, socket)
+
+    def status(self, service_name, socket=clownf_constant.CLOWNF_SERVER_SOCKET):
+        """
+        Print the host that a Lustre service is mounted on through the
+        Clownfish server.
+        :param service_name: Lustre service name.
+        :param socket: The Unix domain socket of the server.
+            Default: /run/clownf_server.sock.
+        """
+        # pylint: disable=no-self-use
+        service_name = check_service_name(service_name)
+        request = {clownf_rpc.CLOWNF_RPC_OPERATION:
+                   clownf_rpc.CLOWNF_RPC_OPERATION_STATUS,
+                   clownf_rpc.CLOWNF_RPC_SERVICE_NAME: service_name}
+        server_request(request, socket)
+
+    def mount_stats(self, socket=clownf_constant.CLOWNF_SERVER_SOCKET):
+        """
+        Print the numbers of times that the Clownfish server found services
+        already mounted on local host quickly, or took the full path of
+        checking all hosts because of the printed reasons.
+        :param socket: The Unix domain socket of the server.
+            Default: /run/clownf_server.sock.
+        """
+        # pylint: disable=no-self-use
+        request = {clownf_rpc.CLOWNF_RPC_OPERATION:
+                   clownf_rpc.CLOWNF_RPC_OPERATION_MOUNT_STATS}
+        server_request(request, socket)
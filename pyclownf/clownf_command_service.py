@@ -52,11 +52,14 @@ class LustreServiceCommand():
                                                          force=force)
         clownf_command_common.exit_env(log, clownfish_instance, rc)
 
-    def ls(self, status=False, fields=None):
+    def ls(self, status=False, fields=None, output_format="table"):
         """
         List all Lustre services in the cluster.
         :param status: print the status of services, default: False.
         :param fields: fields to print, seperated by comma.
+        :param output_format: table, jsonl or csv. A line is printed for
+            each service as soon as its status is ready if jsonl or csv,
+            default: table.
         """
         log, clownfish_instance = \
             clownf_command_common.init_env(self._lsc_config_fpath,
@@ -68,10 +71,14 @@ class LustreServiceCommand():
                                          allow_none=True,
                                          allow_tuple=True, allow_str=True,
                                          allow_bool=True)
+        output_format = cmd_general.check_argument_output_format(log,
+                                                                 "output_format",
+                                                                 output_format)
         services = list(clownfish_instance.ci_service_dict.values())
         rc = clownf_command_common.print_services(log, clownfish_instance,
                                                   services, status=status,
-                                                  field_string=fields)
+                                                  field_string=fields,
+                                                  output_format=output_format)
         clownf_command_common.exit_env(log, clownfish_instance, rc)
 
     def autostart_enable(self, service_name):
@@ -129,11 +136,12 @@ class LustreServiceCommand():
                                                    full=True)
         clownf_command_common.exit_env(log, clownfish_instance, rc)
 
-    def status(self, service_name):
+    def status(self, service_name, output_format="table"):
         """
         Print the status of a Lustre service.
 
         :param service_name: Lustre service name.
+        :param output_format: table, jsonl or csv, default: table.
         """
         log, clownfish_instance = \
             clownf_command_common.init_env(self._lsc_config_fpath,
@@ -142,6 +150,9 @@ class LustreServiceCommand():
                                            self._lsc_iso)
         service_name = cmd_general.check_argument_str(log, "service_name",
                                                       service_name)
+        output_format = cmd_general.check_argument_output_format(log,
+                                                                 "output_format",
+                                                                 output_format)
         service = clownfish_instance.ci_lustre_name2service(log, service_name)
         if service is None:
             log.cl_error("Lustre service [%s] is not configured",
@@ -150,7 +161,8 @@ class LustreServiceCommand():
         services = [service]
         rc = clownf_command_common.print_services(log, clownfish_instance,
                                                   services, status=True,
-                                                  print_table=False)
+                                                  print_table=False,
+                                                  output_format=output_format)
         clownf_command_common.exit_env(log, clownfish_instance, rc)
 
     def format(self, service_name, yes=False, dryrun=False):
@@ -27,6 +27,35 @@ CLOWNF_MAX_WATCH_HOST = 5
 CLOWNF_MSG_ALREADY_STARTED = "Already started\n"
 
 CLONWF_AGENT_SERVICE_NAME = "clownf_agent"
+# Unix domain socket of the resident Clownfish server
+CLOWNF_SERVER_SOCKET = "/run/clownf_server.sock"
+# Seconds that the service config got from Consul is cached for checking
+# whether a service mounted on local host is allowed to keep mounted
+CLOWNF_SERVICE_CONFIG_CACHE_TTL = 30
+
+# Paths of mounting a service. The service is already mounted on local
+# host, and the cached service config is used.
+CLOWNF_MOUNT_PATH_LOCAL = "local"
+# The service is already mounted on local host, and the service config is
+# got from Consul since the cached one expired.
+CLOWNF_MOUNT_PATH_LOCAL_CONSUL = "local_consul"
+# The full path is taken since the hosts to mount on are specified
+CLOWNF_MOUNT_PATH_FULL_SPECIFIED = "full_hosts_specified"
+# The full path is taken since the service has no instance on local host
+CLOWNF_MOUNT_PATH_FULL_NO_LOCAL_INSTANCE = "full_no_local_instance"
+# The full path is taken since the service is not mounted on local host
+CLOWNF_MOUNT_PATH_FULL_NOT_MOUNTED = "full_not_mounted_locally"
+# The full path is taken since the local host is disabled for the service
+CLOWNF_MOUNT_PATH_FULL_DISABLED = "full_local_disabled"
+# The full path is taken since the local check is not conclusive
+CLOWNF_MOUNT_PATH_FULL_CHECK_FAILED = "full_local_check_failed"
+CLOWNF_MOUNT_PATHS = [CLOWNF_MOUNT_PATH_LOCAL,
+                      CLOWNF_MOUNT_PATH_LOCAL_CONSUL,
+                      CLOWNF_MOUNT_PATH_FULL_SPECIFIED,
+                      CLOWNF_MOUNT_PATH_FULL_NO_LOCAL_INSTANCE,
+                      CLOWNF_MOUNT_PATH_FULL_NOT_MOUNTED,
+                      CLOWNF_MOUNT_PATH_FULL_DISABLED,
+                      CLOWNF_MOUNT_PATH_FULL_CHECK_FAILED]
 
 CLOWNF_STR_AUTOSTART = "autostart"
 CLOWNF_BACKFSTYPE = "backfstype"
@@ -3,6 +3,7 @@ Consul library
 """
 # pylint: disable=too-many-lines
 import yaml
+from pycoral import consul
 from pycoral import coral_yaml
 from pycoral import utils
 from pyclownf import clownf_constant
@@ -11,6 +12,17 @@ from pyclownf import clownf_constant
 clownf_constant.CLOWNF_STR_AUTOSTART = "autostart"
 
 
+def watch_cache_enable(log, consul_cluster):
+    """
+    Cache the configs and locks of the hosts and services locally, so
+    repeated reads do not need to query Consul. The cache is kept fresh by
+    Consul blocking queries in background threads.
+    """
+    prefixes = [clownf_constant.CLOWNF_CONSUL_HOST_PATH + "/",
+                clownf_constant.CLOWNF_CONSUL_SERVICE_PATH + "/"]
+    consul_cluster.cclr_watch_cache_enable(log, prefixes)
+
+
 class LustreServiceConfig():
     """
     The config of Lustre service on Consul.
@@ -100,7 +112,13 @@ def service_get_config(log, consul_cluster, service_name, consul_hostname=None):
                                                  consul_hostname=consul_hostname)
     if ret:
         return None
+    return service_config_parse(service_name, config)
 
+
+def service_config_parse(service_name, config):
+    """
+    Return LustreServiceConfig from the config loaded from Consul.
+    """
     if config is not None:
         autostart = utils.config_value(config, clownf_constant.CLOWNF_STR_AUTOSTART)
         autostart = bool(autostart)
@@ -350,7 +368,13 @@ def host_get_config(log, consul_cluster, hostname, consul_hostname=None):
                                                  consul_hostname=consul_hostname)
     if ret:
         return None
+    return host_config_parse(hostname, config)
+
 
+def host_config_parse(hostname, config):
+    """
+    Return ClownfHostConfig from the config loaded from Consul.
+    """
     if config is not None:
         autostart = utils.config_value(config, clownf_constant.CLOWNF_STR_AUTOSTART)
         autostart = bool(autostart)
@@ -394,3 +418,89 @@ def host_autostart_check_enabled(log, consul_cluster, hostname,
     if config.chc_autostart:
         return 1
     return 0
+
+
+def _get_configs_and_watchers(log, consul_cluster, path, names,
+                              consul_hostname=None):
+    """
+    Get the raw configs and watchers of hosts or services with a few
+    requests.
+    Return (0, config_dict, watcher_dict), key of the dicts is the name.
+    A name is left out of a dict if its key failed to be read.
+    Return (negative, None, None) on error.
+    """
+    # pylint: disable=too-many-locals
+    config_key_paths = []
+    lock_key_paths = []
+    for name in names:
+        config_key_paths.append("%s/%s/%s" %
+                                (path, name,
+                                 clownf_constant.CLOWNF_CONSUL_CONFIG_KEY))
+        lock_key_paths.append("%s/%s/%s" %
+                              (path, name,
+                               clownf_constant.CLOWNF_CONSUL_LOCK_KEY))
+    # A single recursive request is cheaper than multiple transactions
+    if (len(config_key_paths) + len(lock_key_paths) >
+            consul.CONSUL_TXN_MAX_OPERATIONS):
+        prefix = path + "/"
+    else:
+        prefix = None
+    ret, key_config_dict, key_watcher_dict = \
+        consul_cluster.cclr_get_configs_and_watchers(log, config_key_paths,
+                                                     lock_key_paths,
+                                                     prefix=prefix,
+                                                     consul_hostname=consul_hostname)
+    if ret:
+        return -1, None, None
+    config_dict = {}
+    watcher_dict = {}
+    for name, config_key_path, lock_key_path in zip(names, config_key_paths,
+                                                    lock_key_paths):
+        if config_key_path in key_config_dict:
+            config_dict[name] = key_config_dict[config_key_path]
+        if lock_key_path in key_watcher_dict:
+            watcher_dict[name] = key_watcher_dict[lock_key_path]
+    return 0, config_dict, watcher_dict
+
+
+def hosts_get_configs_and_watchers(log, consul_cluster, hostnames,
+                                   consul_hostname=None):
+    """
+    Get the configs and watchers of hosts.
+    Return (0, config_dict, watcher_dict). Key of the dicts is hostname.
+    Value of config_dict is ClownfHostConfig. Value of watcher_dict is the
+    watcher hostname, None if no watcher. A host is left out of a dict if
+    its key failed to be read.
+    Return (negative, None, None) on error.
+    """
+    ret, config_dict, watcher_dict = \
+        _get_configs_and_watchers(log, consul_cluster,
+                                  clownf_constant.CLOWNF_CONSUL_HOST_PATH,
+                                  hostnames, consul_hostname=consul_hostname)
+    if ret:
+        return -1, None, None
+    for hostname, config in config_dict.items():
+        config_dict[hostname] = host_config_parse(hostname, config)
+    return 0, config_dict, watcher_dict
+
+
+def services_get_configs_and_watchers(log, consul_cluster, service_names,
+                                      consul_hostname=None):
+    """
+    Get the configs and watchers of services.
+    Return (0, config_dict, watcher_dict). Key of the dicts is service
+    name. Value of config_dict is LustreServiceConfig. Value of
+    watcher_dict is the watcher hostname, None if no watcher. A service is
+    left out of a dict if its key failed to be read.
+    Return (negative, None, None) on error.
+    """
+    ret, config_dict, watcher_dict = \
+        _get_configs_and_watchers(log, consul_cluster,
+                                  clownf_constant.CLOWNF_CONSUL_SERVICE_PATH,
+                                  service_names,
+                                  consul_hostname=consul_hostname)
+    if ret:
+        return -1, None, None
+    for service_name, config in config_dict.items():
+        config_dict[service_name] = service_config_parse(service_name, config)
+    return 0, config_dict, watcher_dict
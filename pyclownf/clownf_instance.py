@@ -5,10 +5,12 @@ Clownfish is a management system for Lustre
 # pylint: disable=too-many-lines
 import os
 import copy
-import toml
+import time
+import threading
 
 # Local libs
 from pycoral import utils
+from pycoral import lazy_import
 from pycoral import parallel
 from pycoral import lustre
 from pycoral import ssh_host
@@ -20,6 +22,8 @@ from pycoral import consul
 from pyclownf import clownf_consul
 from pyclownf import clownf_constant
 
+toml = lazy_import.lazy_module("toml")  # pylint: disable=invalid-name
+
 
 def lustre_service_instance_on_host(service, local_hostname):
     """
@@ -156,6 +160,17 @@ class ClownfishInstance():
         self.ci_simple_config = simple_config
         # ISO file path
         self.ci_iso_fpath = iso_fpath
+        # Lock to protect the caches and counters of mounting services
+        self.ci_service_mount_lock = threading.Lock()
+        # Key is service name, value is (time, LustreServiceConfig) got from
+        # Consul
+        self.ci_service_config_cache = {}
+        # Key is device of Lustre service mounted on local host, value is
+        # (mount options, service name in the label of the device)
+        self.ci_local_label_cache = {}
+        # Key is the path of mounting service, value is the number of times
+        # that the path is taken
+        self.ci_service_mount_counters = {}
 
     def ci_mdt_services(self):
         """
@@ -246,8 +261,9 @@ class ClownfishInstance():
         """
         The instance is cleaning up
         """
-        # pylint: disable=no-self-use
         log.cl_debug("finishing clownfish instance")
+        # Stop the threads watching Consul if any
+        self.ci_consul_cluster.cclr_watch_cache_disable()
 
     def _ci_consul_config_init(self, log):
         """
@@ -504,7 +520,7 @@ class ClownfishInstance():
             return -1
 
         for lustrefs in self.ci_fs_dict.values():
-            ret = lustrefs.lf_umount(log)
+            ret = lustrefs.lf_umount(log, workspace=self.ci_workspace)
             if ret:
                 log.cl_error("failed to umount file system [%s]",
                              lustrefs.lf_fsname)
@@ -559,7 +575,8 @@ class ClownfishInstance():
                 return -1
 
         for lustrefs in self.ci_fs_dict.values():
-            ret = lustrefs.lf_format(log, dryrun=dryrun)
+            ret = lustrefs.lf_format(log, dryrun=dryrun,
+                                     workspace=self.ci_workspace)
             if ret:
                 log.cl_error("failed to format file system [%s]",
                              lustrefs.lf_fsname)
@@ -1139,6 +1156,173 @@ class ClownfishInstance():
             return clownf_constant.CLOWNF_VALUE_CLIENT
         return constant.CMD_MSG_NONE
 
+    def _ci_service_config_get(self, log, service_name):
+        """
+        Get the service config from Consul and cache it.
+        """
+        service_config = clownf_consul.service_get_config(log,
+                                                          self.ci_consul_cluster,
+                                                          service_name)
+        if service_config is None:
+            log.cl_error("failed to get the config of service [%s]", service_name)
+            return None
+        with self.ci_service_mount_lock:
+            self.ci_service_config_cache[service_name] = (time.time(),
+                                                          service_config)
+        return service_config
+
+    def _ci_service_config_cached(self, service_name):
+        """
+        Return the cached service config, or None if not cached or expired.
+        """
+        with self.ci_service_mount_lock:
+            if service_name not in self.ci_service_config_cache:
+                return None
+            cache_time, service_config = \
+                self.ci_service_config_cache[service_name]
+        now = time.time()
+        if (now < cache_time or
+                now - cache_time > clownf_constant.CLOWNF_SERVICE_CONFIG_CACHE_TTL):
+            return None
+        return service_config
+
+    def _ci_service_mount_count(self, log, service_name, path):
+        """
+        Count the path taken by mounting the service.
+        """
+        with self.ci_service_mount_lock:
+            if path not in self.ci_service_mount_counters:
+                self.ci_service_mount_counters[path] = 0
+            self.ci_service_mount_counters[path] += 1
+        log.cl_debug("mounting service [%s] took path [%s]", service_name,
+                     path)
+
+    def ci_service_mount_counters_print(self, log):
+        """
+        Print the numbers of times that each path of mounting service is
+        taken.
+        """
+        with self.ci_service_mount_lock:
+            counters = self.ci_service_mount_counters.copy()
+        for path in clownf_constant.CLOWNF_MOUNT_PATHS:
+            log.cl_stdout("%s: %d", path, counters.get(path, 0))
+
+    def _ci_local_instance_check_mounted(self, log, instance, mounts):
+        """
+        Check whether the service instance on local host is mounted from
+        the mounts got by lustre_local_server_mounts(). The label of device
+        is read only if the mount has no svname option and the label is not
+        cached for the mount.
+        Return 1 when service is mounted
+        Return 0 when service is not mounted
+        Return negative when not sure
+        """
+        service = instance.lsi_service
+        service_name = service.ls_service_name
+        mounted_devices = [device for device, _ in mounts.values()]
+        with self.ci_service_mount_lock:
+            for device in list(self.ci_local_label_cache.keys()):
+                if device not in mounted_devices:
+                    del self.ci_local_label_cache[device]
+
+        if instance.lsi_mnt not in mounts:
+            return 0
+        device, options = mounts[instance.lsi_mnt]
+        devices = [instance.lsi_device]
+        if service.ls_backfstype != lustre.BACKFSTYPE_ZFS:
+            devices.append(os.path.realpath(instance.lsi_device))
+        if device not in devices:
+            log.cl_debug("device [%s] is mounted on [%s] of local host, "
+                         "expected device of service [%s] is [%s]",
+                         device, instance.lsi_mnt, service_name,
+                         instance.lsi_device)
+            return -1
+
+        label = lustre.lustre_mount_option_svname(options)
+        if label is None:
+            with self.ci_service_mount_lock:
+                cached = self.ci_local_label_cache.get(device)
+            if cached is not None and cached[0] == options:
+                label = cached[1]
+            else:
+                host = instance.lsi_host
+                label = host.lsh_lustre_device_service_name(log, device,
+                                                            backfstype=service.ls_backfstype)
+                if label is None:
+                    return -1
+                with self.ci_service_mount_lock:
+                    self.ci_local_label_cache[device] = (options, label)
+
+        if service.ls_service_type == lustre.LUSTRE_SERVICE_TYPE_MGT:
+            expected_label = "MGS"
+        else:
+            expected_label = service_name
+        if label != expected_label:
+            log.cl_debug("device [%s] mounted on [%s] of local host has "
+                         "label [%s], expected [%s]", device,
+                         instance.lsi_mnt, label, expected_label)
+            return -1
+        return 1
+
+    def _ci_service_mount_local(self, log, service, quiet=False):
+        """
+        The fast path of mounting a service that is already mounted on local
+        host. Only /proc/mounts of local host and the cached labels are
+        checked, and the service config is got from Consul only when the
+        cached one expired.
+        Return (True, path) if the service is already mounted on local host.
+        Return (False, path) if the full path needs to be taken.
+        """
+        service_name = service.ls_service_name
+        local_hostname = self.ci_local_host.sh_hostname
+        instance = lustre_service_instance_on_host(service, local_hostname)
+        if instance is None:
+            return False, clownf_constant.CLOWNF_MOUNT_PATH_FULL_NO_LOCAL_INSTANCE
+
+        mounts = lustre.lustre_local_server_mounts(log)
+        if mounts is None:
+            return False, clownf_constant.CLOWNF_MOUNT_PATH_FULL_CHECK_FAILED
+
+        ret = self._ci_local_instance_check_mounted(log, instance, mounts)
+        if ret < 0:
+            return False, clownf_constant.CLOWNF_MOUNT_PATH_FULL_CHECK_FAILED
+        if ret == 0:
+            return False, clownf_constant.CLOWNF_MOUNT_PATH_FULL_NOT_MOUNTED
+
+        path = clownf_constant.CLOWNF_MOUNT_PATH_LOCAL
+        service_config = self._ci_service_config_cached(service_name)
+        if service_config is None:
+            service_config = self._ci_service_config_get(log, service_name)
+            if service_config is None:
+                return False, clownf_constant.CLOWNF_MOUNT_PATH_FULL_CHECK_FAILED
+            path = clownf_constant.CLOWNF_MOUNT_PATH_LOCAL_CONSUL
+
+        if local_hostname in service_config.lsc_disabled_hostnames:
+            return False, clownf_constant.CLOWNF_MOUNT_PATH_FULL_DISABLED
+
+        log.cl_info("service [%s] is already mounted on host [%s]",
+                    service_name, local_hostname)
+        if not quiet:
+            log.cl_stdout(constant.MSG_ALREADY_MOUNTED_NO_NEWLINE)
+        return True, path
+
+    def _ci_service_mount_check_local(self, log, service, only_hostnames,
+                                      exclude_hostnames, quiet=False):
+        """
+        Check whether the service is already mounted on local host if the
+        hosts are not specified, and count the path of the mount. Return
+        True if no need to mount the service any more.
+        """
+        service_name = service.ls_service_name
+        if only_hostnames is not None or exclude_hostnames is not None:
+            self._ci_service_mount_count(log, service_name,
+                                         clownf_constant.CLOWNF_MOUNT_PATH_FULL_SPECIFIED)
+            return False
+        mounted, path = self._ci_service_mount_local(log, service,
+                                                     quiet=quiet)
+        self._ci_service_mount_count(log, service_name, path)
+        return mounted
+
     def ci_service_mount(self, log, service, only_hostnames=None,
                          exclude_hostnames=None, not_select_reason="not selected",
                          exclude_reason="excluded explicitly", quiet=False):
@@ -1146,18 +1330,21 @@ class ClownfishInstance():
         Mount Lustre service.
         This function will check Consul on the hosts that do not allow to
         mount this service.
+        If the service is already mounted on local host, return quickly
+        without checking other hosts.
         """
         service_name = service.ls_service_name
+        if self._ci_service_mount_check_local(log, service, only_hostnames,
+                                              exclude_hostnames, quiet=quiet):
+            return 0
+
         exclude_dict = {}
         if exclude_hostnames is not None:
             for hostname in exclude_hostnames:
                 exclude_dict[hostname] = exclude_reason
 
-        service_config = clownf_consul.service_get_config(log,
-                                                          self.ci_consul_cluster,
-                                                          service_name)
+        service_config = self._ci_service_config_get(log, service_name)
         if service_config is None:
-            log.cl_error("failed to get the config of service [%s]", service_name)
             return -1
 
         exclude_hostnames = service_config.lsc_disabled_hostnames
@@ -1198,7 +1385,6 @@ class ClownfishInstance():
         This function will check Consul on the hosts that do not allow to
         mount the service. Other things are the same with lf_mount()
         """
-        # pylint: disable=too-many-branches
         if only_service:
             log.cl_info("mounting services of file system [%s]",
                         lustrefs.lf_fsname)
@@ -1206,36 +1392,28 @@ class ClownfishInstance():
             log.cl_info("mounting services and clients of file system [%s]",
                         lustrefs.lf_fsname)
 
-        if lustrefs.lf_mgs is not None:
-            ret = self.ci_service_mount(log, lustrefs.lf_mgs, quiet=True)
-            if ret:
-                log.cl_error("failed to mount MGS of Lustre file "
-                             "system [%s]", lustrefs.lf_fsname)
-                return -1
-
-        for service_name, mdt in lustrefs.lf_mdt_dict.items():
-            ret = self.ci_service_mount(log, mdt, quiet=True)
-            if ret:
-                log.cl_error("failed to mount MDT [%s] of Lustre file "
-                             "system [%s]", service_name, lustrefs.lf_fsname)
-                return -1
-
-        for service_name, ost in lustrefs.lf_ost_dict.items():
-            ret = self.ci_service_mount(log, ost, quiet=True)
-            if ret:
-                log.cl_error("failed to mount OST [%s] of Lustre file "
-                             "system [%s]", service_name, lustrefs.lf_fsname)
-                return -1
+        scheduler = lustre.LustreOperationScheduler("mount_" + lustrefs.lf_fsname,
+                                                    workspace=self.ci_workspace)
+        for stage_name, services in lustrefs.lf_service_stages():
+            operations = []
+            for service in services:
+                operation = lustre.service_operation(service,
+                                                     self.ci_service_mount,
+                                                     args=(service,),
+                                                     kwargs={"quiet": True})
+                operations.append(operation)
+            scheduler.los_stage_add(stage_name, operations)
 
         if not only_service:
-            for client_index, client in lustrefs.lf_client_dict.items():
-                ret = client.lc_mount(log, quiet=True)
-                if ret:
-                    log.cl_error("failed to mount client [%s] of Lustre file "
-                                 "system [%s]", client_index, lustrefs.lf_fsname)
-                    return -1
-
+            operations = lustrefs.lf_client_operations("lc_mount",
+                                                       kwargs={"quiet": True})
+            scheduler.los_stage_add("client", operations)
 
+        ret = scheduler.los_run(log)
+        if ret:
+            log.cl_error("failed to mount file system [%s]",
+                         lustrefs.lf_fsname)
+            return -1
         return 0
 
     def ci_fs_umount(self, log, lustrefs, force=False):
@@ -1249,7 +1427,8 @@ class ClownfishInstance():
         if ret:
             return -1
 
-        ret = lustrefs.lf_umount(log, force_umount_mgt=force)
+        ret = lustrefs.lf_umount(log, force_umount_mgt=force,
+                                 workspace=self.ci_workspace)
         if ret:
             log.cl_error("failed to umount all services of file system [%s]",
                          lustrefs.lf_fsname)
@@ -1281,7 +1460,8 @@ class ClownfishInstance():
             if ret:
                 return -1
 
-        return lustrefs.lf_format(log, format_mgt=True, dryrun=dryrun)
+        return lustrefs.lf_format(log, format_mgt=True, dryrun=dryrun,
+                                  workspace=self.ci_workspace)
 
     def ci_lustre_name2service(self, log, service_name):
         """
@@ -1595,17 +1775,23 @@ class ClownfishInstance():
                                                          enable=False)
 
     def _ci_service_enabled_disabled_hostnames(self, log, service, enable=True,
-                                               consul_hostname=None):
+                                               consul_hostname=None,
+                                               service_config=None):
         """
         Return hostnames that enable or disable mounting of the service
+        If service_config is not None, use it instead of getting the config
+        from Consul.
         """
         service_name = service.ls_service_name
 
-        exclude_hostnames = \
-            clownf_consul.service_disabled_hostnames(log,
-                                                     self.ci_consul_cluster,
-                                                     service_name,
-                                                     consul_hostname=consul_hostname)
+        if service_config is not None:
+            exclude_hostnames = service_config.lsc_disabled_hostnames
+        else:
+            exclude_hostnames = \
+                clownf_consul.service_disabled_hostnames(log,
+                                                         self.ci_consul_cluster,
+                                                         service_name,
+                                                         consul_hostname=consul_hostname)
         if exclude_hostnames is None:
             log.cl_error("failed to get the disabled hosts of service [%s]",
                          service_name)
@@ -1624,12 +1810,13 @@ class ClownfishInstance():
             hostnames.append(hostname)
         return hostnames
 
-    def ci_service_enabled_hostnames(self, log, service):
+    def ci_service_enabled_hostnames(self, log, service, service_config=None):
         """
         Return hostnames that enable mounting of the service
         """
         return self._ci_service_enabled_disabled_hostnames(log, service,
-                                                           enable=True)
+                                                           enable=True,
+                                                           service_config=service_config)
 
     def ci_service_disabled_hostnames(self, log, service):
         """
@@ -1655,15 +1842,21 @@ class ClownfishInstance():
                                                         hostname,
                                                         consul_hostname=consul_hostname)
 
-    def ci_service_prefered_hostnames(self, log, service, consul_hostname=None):
+    def ci_service_prefered_hostnames(self, log, service, consul_hostname=None,
+                                      service_config=None):
         """
         Return hostnames that prefer to mount of the service
+        If service_config is not None, use it instead of getting the config
+        from Consul.
         """
         service_name = service.ls_service_name
-        prefered_hostnames = \
-            clownf_consul.service_prefered_hostnames(log, self.ci_consul_cluster,
-                                                     service_name,
-                                                     consul_hostname=consul_hostname)
+        if service_config is not None:
+            prefered_hostnames = service_config.lsc_prefered_hostnames
+        else:
+            prefered_hostnames = \
+                clownf_consul.service_prefered_hostnames(log, self.ci_consul_cluster,
+                                                         service_name,
+                                                         consul_hostname=consul_hostname)
         if prefered_hostnames is None:
             log.cl_error("failed to get the prefered hosts of service [%s]",
                          service_name)
@@ -1675,14 +1868,31 @@ class ClownfishInstance():
                 hostnames.append(hostname)
         return hostnames
 
-    def ci_host_check_operating(self, log, host):
+    def ci_host_operating_commands(self):
+        """
+        Return the commands that ci_host_check_operating() runs on the host
+        """
+        # pylint: disable=no-self-use
+        return ["pgrep clownf",
+                "pgrep %s" % clownf_constant.CLONWF_AGENT_SERVICE_NAME]
+
+    def ci_host_check_operating(self, log, host, results=None):
         """
         Whether the host is running operation commands (not include clownf_agent)
         If true, return 1, if false, return 0. Return negative on error.
+
+        If results is not None, it is the results of the commands from
+        ci_host_operating_commands() that the caller has run in a batch.
         """
-        # pylint: disable=no-self-use,too-many-branches
-        command = "pgrep clownf"
-        retval = host.sh_run(log, command)
+        # pylint: disable=too-many-branches
+        command, agent_command = self.ci_host_operating_commands()
+        if results is None:
+            results = host.sh_run_batch(log, [command, agent_command])
+            if results is None:
+                log.cl_error("failed to check clownf processes on host [%s]",
+                             host.sh_hostname)
+                return -1
+        retval = results[0]
         if (retval.cr_exit_status == 1 and
                 retval.cr_stdout == ""):
             return 0
@@ -1695,14 +1905,13 @@ class ClownfishInstance():
         clownf_pids = retval.cr_stdout.splitlines()
 
         clownf_agent_pids = []
-        command = "pgrep %s" % clownf_constant.CLONWF_AGENT_SERVICE_NAME
-        retval = host.sh_run(log, command)
+        retval = results[1]
         if (retval.cr_exit_status == 1 and
                 retval.cr_stdout == ""):
             pass
         elif retval.cr_exit_status:
             log.cl_error("failed to run command [%s] on host [%s]",
-                         command, host.sh_hostname)
+                         agent_command, host.sh_hostname)
             return -1
         else:
             clownf_agent_pids = retval.cr_stdout.splitlines()
@@ -1727,15 +1936,28 @@ class ClownfishInstance():
             return 1
         return 0
 
-    def ci_host_check_running_agent(self, log, host):
+    def ci_host_running_agent_commands(self):
+        """
+        Return the commands that ci_host_check_running_agent() runs on the
+        host
+        """
+        # pylint: disable=no-self-use
+        return ["ps aux | grep %s | grep -v grep" %
+                clownf_constant.CLONWF_AGENT_SERVICE_NAME]
+
+    def ci_host_check_running_agent(self, log, host, results=None):
         """
         Whether the host is running clownf_agent
         If true, return 1, if false, return 0. Return negative on error.
+
+        If results is not None, it is the results of the commands from
+        ci_host_running_agent_commands() that the caller has run in a batch.
         """
-        # pylint: disable=no-self-use
-        command = ("ps aux | grep %s | grep -v grep" %
-                   clownf_constant.CLONWF_AGENT_SERVICE_NAME)
-        retval = host.sh_run(log, command)
+        if results is None:
+            command = self.ci_host_running_agent_commands()[0]
+            retval = host.sh_run(log, command)
+        else:
+            retval = results[0]
         if (retval.cr_exit_status == 1 and
                 retval.cr_stdout == ""):
             return 0
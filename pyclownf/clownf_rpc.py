@@ -0,0 +1,83 @@
+"""
+Library for the RPC between the Clownfish server and its clients through
+a Unix domain socket. Each connection has one request and one response,
+both of which are a line of JSON.
+
+DO NOT import any library that needs extra python package,
+since this might cause failure of commands that uses this
+library to install python packages.
+"""
+import json
+import socket
+
+# Keys of request
+CLOWNF_RPC_OPERATION = "operation"
+CLOWNF_RPC_SERVICE_NAME = "service_name"
+CLOWNF_RPC_FORCE = "force"
+# Keys of response
+CLOWNF_RPC_RET = "ret"
+CLOWNF_RPC_STDOUT = "stdout"
+CLOWNF_RPC_STDERR = "stderr"
+# Hostname that the service is mounted on, None if not mounted
+CLOWNF_RPC_MOUNTED_HOSTNAME = "mounted_hostname"
+# Operations
+CLOWNF_RPC_OPERATION_MOUNT = "mount"
+CLOWNF_RPC_OPERATION_UMOUNT = "umount"
+CLOWNF_RPC_OPERATION_STATUS = "status"
+# Print the numbers of times that each path of mounting service is taken
+CLOWNF_RPC_OPERATION_MOUNT_STATS = "mount_stats"
+CLOWNF_RPC_OPERATIONS = [CLOWNF_RPC_OPERATION_MOUNT,
+                         CLOWNF_RPC_OPERATION_UMOUNT,
+                         CLOWNF_RPC_OPERATION_STATUS,
+                         CLOWNF_RPC_OPERATION_MOUNT_STATS]
+# The max size of a request or response
+CLOWNF_RPC_MAX_SIZE = 16 * 1024 * 1024
+
+
+def rpc_message_encode(message):
+    """
+    Return the bytes of a message dict
+    """
+    return (json.dumps(message) + "\n").encode()
+
+
+def rpc_message_decode(data):
+    """
+    Return the message dict of the bytes, or None if invalid.
+    """
+    try:
+        message = json.loads(data.decode())
+    except ValueError:
+        return None
+    if not isinstance(message, dict):
+        return None
+    return message
+
+
+def rpc_call(socket_path, request, timeout=None):
+    """
+    Send the request to the server and return the response. Return None if
+    the server is not running. Raise exception on other errors.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        sock.sendall(rpc_message_encode(request))
+        sock.shutdown(socket.SHUT_WR)
+        data = b""
+        while len(data) <= CLOWNF_RPC_MAX_SIZE:
+            chunk = sock.recv(65536)
+            if len(chunk) == 0:
+                break
+            data += chunk
+    finally:
+        sock.close()
+    response = rpc_message_decode(data)
+    if response is None:
+        raise ValueError("invalid response from Clownfish server: %r" %
+                         data[:1024])
+    return response
@@ -0,0 +1,290 @@
+"""
+Resident Clownfish server that serves the requests from clients through
+a Unix domain socket. The parsed Clownfish instance, SSH connections and
+cached status of hosts are kept between requests, so that periodic checks
+from HA agent do not need to start a new clownf command every time.
+"""
+import os
+import stat
+import logging
+import threading
+import traceback
+import socketserver
+from pycoral import clog
+from pycoral import cmd_general
+from pycoral import parse_cache
+from pycoral import ssh_basic
+from pyclownf import clownf_constant
+from pyclownf import clownf_consul
+from pyclownf import clownf_instance
+from pyclownf import clownf_rpc
+
+
+class ClownfRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handle a request from the socket.
+    """
+    def handle(self):
+        data = self.rfile.readline(clownf_rpc.CLOWNF_RPC_MAX_SIZE)
+        request = clownf_rpc.rpc_message_decode(data)
+        # pylint: disable=no-member
+        response = self.server.uss_clownf_server.cs_request_handle(request)
+        self.wfile.write(clownf_rpc.rpc_message_encode(response))
+
+
+class ClownfUnixSocketServer(socketserver.ThreadingMixIn,
+                             socketserver.UnixStreamServer):
+    """
+    Unix socket server that handles each request in a thread.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, clownf_server):
+        # ClownfServer to handle the requests
+        self.uss_clownf_server = clownf_server
+        super().__init__(socket_path, ClownfRequestHandler)
+
+
+class ClownfServer():
+    """
+    The server that keeps the Clownfish instance.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, log, workspace, config_fpath, logdir_is_default, iso,
+                 socket_path=clownf_constant.CLOWNF_SERVER_SOCKET):
+        # pylint: disable=too-many-arguments
+        # Log of the server
+        self.cs_log = log
+        # Workspace of the server
+        self.cs_workspace = workspace
+        # Clownfish config file
+        self.cs_config_fpath = config_fpath
+        # Whether the log dir is default
+        self.cs_logdir_is_default = logdir_is_default
+        # The Coral ISO to use for installation
+        self.cs_iso = iso
+        # Path of the Unix domain socket
+        self.cs_socket_path = socket_path
+        # ClownfishInstance, replaced when the config file is changed
+        self.cs_instance = None
+        # Key of the config file that cs_instance is inited from
+        self.cs_config_key = None
+        # Lock to protect cs_instance and cs_config_key
+        self.cs_instance_lock = threading.Lock()
+        # Key is service name, value is lock to serialize the operations
+        # on the service
+        self.cs_service_lock_dict = {}
+        # Lock to protect cs_service_lock_dict and cs_log_indexes
+        self.cs_lock = threading.Lock()
+        # Indexes of log names that are not used by any request. The names
+        # are reused since Python loggers are never freed.
+        self.cs_log_indexes = []
+        # Number of log names that have been allocated
+        self.cs_log_index_number = 0
+        # ClownfUnixSocketServer
+        self.cs_socket_server = None
+
+    def _cs_get_instance(self, log):
+        """
+        Return the Clownfish instance. Init it again if the config file
+        has been changed.
+        """
+        with self.cs_instance_lock:
+            fpaths = [os.path.realpath(self.cs_config_fpath)]
+            config_key = parse_cache.parse_cache_key(fpaths)
+            if (self.cs_instance is not None and
+                    config_key == self.cs_config_key):
+                return self.cs_instance
+            if self.cs_instance is not None:
+                log.cl_info("config file [%s] has been changed, reloading",
+                            self.cs_config_fpath)
+            config = cmd_general.load_config(log, self.cs_config_fpath)
+            if config is None:
+                log.cl_error("failed to load config file [%s]",
+                             self.cs_config_fpath)
+                return None
+            instance = \
+                clownf_instance.clownf_init_instance(log, self.cs_workspace,
+                                                     config,
+                                                     self.cs_config_fpath,
+                                                     self.cs_logdir_is_default,
+                                                     self.cs_iso)
+            if instance is None:
+                log.cl_error("failed to init Clownfish instance")
+                return None
+            # Keep the configs and watchers of hosts and services fresh
+            # locally, so the periodic checks do not query Consul each time
+            clownf_consul.watch_cache_enable(log, instance.ci_consul_cluster)
+            if self.cs_instance is not None:
+                self.cs_instance.ci_fini(log)
+            self.cs_instance = instance
+            self.cs_config_key = config_key
+            return instance
+
+    def _cs_service_lock(self, service_name):
+        """
+        Return the lock of the service.
+        """
+        with self.cs_lock:
+            if service_name not in self.cs_service_lock_dict:
+                self.cs_service_lock_dict[service_name] = threading.Lock()
+            return self.cs_service_lock_dict[service_name]
+
+    def _cs_operation_run(self, log, request):
+        """
+        Run the operation of the request. Return (ret, mounted_hostname).
+        """
+        operation = request.get(clownf_rpc.CLOWNF_RPC_OPERATION)
+        if operation not in clownf_rpc.CLOWNF_RPC_OPERATIONS:
+            log.cl_error("invalid operation [%s], expected one of %s",
+                         operation, clownf_rpc.CLOWNF_RPC_OPERATIONS)
+            return -1, None
+
+        instance = self._cs_get_instance(log)
+        if instance is None:
+            return -1, None
+
+        if operation == clownf_rpc.CLOWNF_RPC_OPERATION_MOUNT_STATS:
+            instance.ci_service_mount_counters_print(log)
+            return 0, None
+
+        service_name = request.get(clownf_rpc.CLOWNF_RPC_SERVICE_NAME)
+        if not isinstance(service_name, str):
+            log.cl_error("invalid service name [%s]", service_name)
+            return -1, None
+
+        if service_name not in instance.ci_service_dict:
+            log.cl_error("service [%s] is not configured", service_name)
+            return -1, None
+
+        with self._cs_service_lock(service_name):
+            if operation == clownf_rpc.CLOWNF_RPC_OPERATION_MOUNT:
+                return instance.ci_lustre_service_mount(log, service_name), None
+            if operation == clownf_rpc.CLOWNF_RPC_OPERATION_UMOUNT:
+                force = request.get(clownf_rpc.CLOWNF_RPC_FORCE, False)
+                if not isinstance(force, bool):
+                    log.cl_error("invalid force option [%s], should be a "
+                                 "bool type", force)
+                    return -1, None
+                ret = instance.ci_lustre_service_umount(log, service_name,
+                                                        force=force)
+                return ret, None
+
+            service = instance.ci_lustre_name2service(log, service_name)
+            if service is None:
+                return -1, None
+            mounted_instance = service.ls_mounted_instance(log)
+            if mounted_instance is None:
+                log.cl_stdout("service [%s] is not mounted", service_name)
+                return 0, None
+            hostname = mounted_instance.lsi_host.sh_hostname
+            log.cl_stdout("service [%s] is mounted on host [%s]",
+                          service_name, hostname)
+            return 0, hostname
+
+    def cs_request_handle(self, request):
+        """
+        Handle a request and return the response. The output of the
+        operation is returned in the response.
+        """
+        with self.cs_lock:
+            if len(self.cs_log_indexes) > 0:
+                index = self.cs_log_indexes.pop()
+            else:
+                index = self.cs_log_index_number
+                self.cs_log_index_number += 1
+        log = clog.get_log(name="request_%d" % index, remember_records=True)
+        try:
+            if request is None:
+                log.cl_error("invalid request")
+                ret, mounted_hostname = -1, None
+            else:
+                ret, mounted_hostname = self._cs_operation_run(log, request)
+        except:
+            log.cl_error("exception when handling request %s: %s",
+                         request, traceback.format_exc())
+            ret, mounted_hostname = -1, None
+
+        stdout = ""
+        stderr = ""
+        for record in log.cl_records:
+            if record.clr_is_stdout:
+                stdout += clog.colorless_message(record.clr_message) + "\n"
+            elif record.clr_is_raw_stderr:
+                stderr += clog.colorless_message(record.clr_message) + "\n"
+            elif record.clr_level >= logging.INFO:
+                stderr += "%s: %s\n" % (logging.getLevelName(record.clr_level),
+                                        record.clr_message)
+        log.cl_fini()
+        with self.cs_lock:
+            self.cs_log_indexes.append(index)
+        return {clownf_rpc.CLOWNF_RPC_RET: ret,
+                clownf_rpc.CLOWNF_RPC_STDOUT: stdout,
+                clownf_rpc.CLOWNF_RPC_STDERR: stderr,
+                clownf_rpc.CLOWNF_RPC_MOUNTED_HOSTNAME: mounted_hostname}
+
+    def cs_run(self):
+        """
+        Serve the requests until interrupted. Return 0 on normal exit,
+        negative on error.
+        """
+        log = self.cs_log
+        instance = self._cs_get_instance(log)
+        if instance is None:
+            return -1
+
+        try:
+            fstat = os.lstat(self.cs_socket_path)
+        except FileNotFoundError:
+            fstat = None
+        if fstat is not None:
+            if not stat.S_ISSOCK(fstat.st_mode):
+                log.cl_error("path [%s] exists and is not a socket",
+                             self.cs_socket_path)
+                return -1
+            os.unlink(self.cs_socket_path)
+
+        old_umask = os.umask(0o077)
+        try:
+            self.cs_socket_server = ClownfUnixSocketServer(self.cs_socket_path,
+                                                           self)
+        except OSError as error:
+            log.cl_error("failed to listen on socket [%s]: %s",
+                         self.cs_socket_path, error)
+            return -1
+        finally:
+            os.umask(old_umask)
+
+        log.cl_info("Clownfish server is listening on socket [%s]",
+                    self.cs_socket_path)
+        try:
+            self.cs_socket_server.serve_forever()
+        except KeyboardInterrupt:
+            log.cl_info("Clownfish server is interrupted")
+        finally:
+            self.cs_socket_server.server_close()
+            os.unlink(self.cs_socket_path)
+            with self.cs_instance_lock:
+                if self.cs_instance is not None:
+                    self.cs_instance.ci_fini(log)
+                    self.cs_instance = None
+        return 0
+
+
+def clownf_server_run(config_fpath, logdir, log_to_file, iso,
+                      socket_path=clownf_constant.CLOWNF_SERVER_SOCKET):
+    """
+    Run the Clownfish server in foreground.
+    """
+    logdir_is_default = (logdir == clownf_constant.CLOWNF_LOG_DIR)
+    # The server is long-running, keep the file writes off the request
+    # threads
+    log, workspace = cmd_general.init_env_noconfig(logdir, log_to_file,
+                                                   logdir_is_default,
+                                                   background_writer=True)
+    # Reuse SSH connections to the hosts across requests
+    ssh_basic.ssh_master_pool_enable()
+    server = ClownfServer(log, workspace, config_fpath, logdir_is_default,
+                          iso, socket_path=socket_path)
+    ret = server.cs_run()
+    cmd_general.cmd_exit(log, ret)
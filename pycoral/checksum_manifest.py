@@ -0,0 +1,187 @@
+"""
+Library for caching the checksums of the files under a dir.
+
+DO NOT import any library that needs extra python package,
+since this might cause failure of commands that uses this
+library to install python packages.
+"""
+
+# The file under a dir that caches the checksums of the files
+CHECKSUM_MANIFEST_FNAME = ".sha1sum_manifest"
+
+
+class ChecksumManifest():
+    """
+    Cache of the sha1sums of the files under a dir. The checksum
+    of a file can be trusted if the size, mtime and inode of the file are
+    not changed.
+    """
+    def __init__(self, dir_path):
+        # Path of the manifest file
+        self.cm_fpath = dir_path + "/" + CHECKSUM_MANIFEST_FNAME
+        # Key: relative fpath, value: (stat_key, sha1sum), stat_key is a
+        # string of "$size $mtime $inode".
+        self.cm_entry_dict = {}
+        # Whether the entries have been changed since loading
+        self.cm_changed = False
+
+    def cm_load(self, log, host):
+        """
+        Load the manifest from the host. Missing or broken manifest is
+        ignored since it is only a cache.
+        """
+        command = ("if [ -f %s ]; then cat %s; fi" %
+                   (self.cm_fpath, self.cm_fpath))
+        retval = host.sh_run(log, command)
+        if retval.cr_exit_status:
+            log.cl_debug("failed to run command [%s] on host [%s], "
+                         "ret = [%d], stdout = [%s], stderr = [%s]",
+                         command,
+                         host.sh_hostname,
+                         retval.cr_exit_status,
+                         retval.cr_stdout,
+                         retval.cr_stderr)
+            return
+        for line in retval.cr_stdout.splitlines():
+            # Format: "$sha1sum $size $mtime $inode $relative_fpath"
+            fields = line.split(" ", 4)
+            if len(fields) != 5:
+                log.cl_debug("ignoring invalid line [%s] of manifest [%s] "
+                             "on host [%s]", line, self.cm_fpath,
+                             host.sh_hostname)
+                continue
+            stat_key = " ".join(fields[1:4])
+            self.cm_entry_dict[fields[4]] = (stat_key, fields[0])
+
+    def cm_lookup(self, relative_fpath, stat_key):
+        """
+        Return the cached sha1sum, None if not cached or file changed
+        """
+        if relative_fpath not in self.cm_entry_dict:
+            return None
+        cached_stat_key, sha1sum = self.cm_entry_dict[relative_fpath]
+        if cached_stat_key != stat_key:
+            return None
+        return sha1sum
+
+    def cm_update(self, relative_fpath, stat_key, sha1sum):
+        """
+        Update the sha1sum of a file
+        """
+        entry = (stat_key, sha1sum)
+        if self.cm_entry_dict.get(relative_fpath) == entry:
+            return
+        self.cm_entry_dict[relative_fpath] = entry
+        self.cm_changed = True
+
+    def cm_prune(self, relative_fpaths):
+        """
+        Remove the entries of the files that no longer exist
+        """
+        for relative_fpath in list(self.cm_entry_dict.keys()):
+            if relative_fpath not in relative_fpaths:
+                del self.cm_entry_dict[relative_fpath]
+                self.cm_changed = True
+
+    def cm_save(self, log, host):
+        """
+        Save the manifest to the host if changed
+        """
+        if not self.cm_changed:
+            return 0
+        content = ""
+        for relative_fpath, entry in sorted(self.cm_entry_dict.items()):
+            stat_key, sha1sum = entry
+            content += "%s %s %s\n" % (sha1sum, stat_key, relative_fpath)
+        tmp_fpath = self.cm_fpath + ".tmp"
+        command = "cat > %s && mv %s %s" % (tmp_fpath, tmp_fpath, self.cm_fpath)
+        retval = host.sh_run(log, command, stdin=content)
+        if retval.cr_exit_status:
+            # The dir could be read-only, e.g. mounted from ISO.
+            log.cl_debug("failed to run command [%s] on host [%s], "
+                         "ret = [%d], stdout = [%s], stderr = [%s]",
+                         command,
+                         host.sh_hostname,
+                         retval.cr_exit_status,
+                         retval.cr_stdout,
+                         retval.cr_stderr)
+            return -1
+        self.cm_changed = False
+        return 0
+
+
+def _dir_stat_keys(log, host, dir_path):
+    """
+    Return a dict of the stat keys of the files under a dir. Key is the
+    relative fpath, value is the stat key. Return None on error.
+    """
+    command = "find -L %s -type f -printf '%%s %%T@ %%i %%p\\n'" % dir_path
+    retval = host.sh_run(log, command)
+    if retval.cr_exit_status:
+        log.cl_error("failed to run command [%s] on host [%s], "
+                     "ret = [%d], stdout = [%s], stderr = [%s]",
+                     command,
+                     host.sh_hostname,
+                     retval.cr_exit_status,
+                     retval.cr_stdout,
+                     retval.cr_stderr)
+        return None
+
+    manifest_fpath = dir_path + "/" + CHECKSUM_MANIFEST_FNAME
+    dir_path_length = len(dir_path) + 1
+    # Key: relative fpath, value: stat_key
+    stat_key_dict = {}
+    for line in retval.cr_stdout.splitlines():
+        fields = line.split(" ", 3)
+        if len(fields) != 4:
+            log.cl_error("unexpected line [%s] of command [%s] on "
+                         "host [%s]", line, command, host.sh_hostname)
+            return None
+        fpath = fields[3]
+        if fpath in (manifest_fpath, manifest_fpath + ".tmp"):
+            continue
+        stat_key_dict[fpath[dir_path_length:]] = " ".join(fields[:3])
+    return stat_key_dict
+
+
+def dir_checksums(log, host, dir_path, trust_cache=True):
+    """
+    Return a dict of the sha1sums of the files under a dir. Key is the
+    relative fpath, value is the sha1sum. Symbolic links are followed.
+    If trust_cache, only calculate the checksums of the files changed
+    since last time according to the manifest.
+    Return None on error.
+    """
+    stat_key_dict = _dir_stat_keys(log, host, dir_path)
+    if stat_key_dict is None:
+        return None
+
+    dir_path_length = len(dir_path) + 1
+    manifest = ChecksumManifest(dir_path)
+    manifest.cm_load(log, host)
+    checksum_dict = {}
+    hash_fpaths = []
+    for relative_fpath, stat_key in stat_key_dict.items():
+        sha1sum = None
+        if trust_cache:
+            sha1sum = manifest.cm_lookup(relative_fpath, stat_key)
+        if sha1sum is None:
+            hash_fpaths.append(dir_path + "/" + relative_fpath)
+        else:
+            checksum_dict[relative_fpath] = sha1sum
+
+    hashed_dict = host.sh_get_checksums(log, hash_fpaths,
+                                        checksum_command="sha1sum")
+    if hashed_dict is None:
+        log.cl_error("failed to calculate checksums of files under "
+                     "[%s] on host [%s]", dir_path, host.sh_hostname)
+        return None
+    for fpath, sha1sum in hashed_dict.items():
+        checksum_dict[fpath[dir_path_length:]] = sha1sum
+
+    for relative_fpath, stat_key in stat_key_dict.items():
+        manifest.cm_update(relative_fpath, stat_key,
+                           checksum_dict[relative_fpath])
+    manifest.cm_prune(stat_key_dict)
+    manifest.cm_save(log, host)
+    return checksum_dict
@@ -7,7 +7,10 @@ since this might cause failure of commands that uses this
 library to install python packages.
 """
 import logging
+import logging.handlers
 import os
+import queue
+import atexit
 import threading
 import inspect
 import sys
@@ -42,6 +45,27 @@ except NameError:
 
 # This should be different with logging.ERROR etc.
 LEVEL_STDOUT = 1048576
+# Debug messages longer than this will be truncated, e.g. huge stdout of
+# commands. None means no limit.
+LOG_DEBUG_MESSAGE_MAX_SIZE = 65536
+# Increased whenever any log is configured, so that the cached levels of
+# the logs will be recalculated.
+LOG_CONFIG_GENERATION = 0
+# Key: (src_file, co_filename), value: whether the frame should be skipped
+# when finding the caller
+FIND_CALLER_SKIP_CACHE = {}
+
+
+def _find_caller_skip(src_file, co_filename):
+    """
+    Return True if the frame with the file name belongs to src_file
+    """
+    filename = os.path.normcase(co_filename)
+    # src_file is always absolute path, but the filename might not be
+    # absolute path
+    if filename.startswith("/"):
+        return filename == src_file
+    return src_file.endswith(filename)
 
 
 def find_caller(src_file):
@@ -57,22 +81,29 @@ def find_caller(src_file):
     ret = "(unknown file)", 0, "(unknown function)"
     while hasattr(frame, "f_code"):
         code_object = frame.f_code
-        filename = os.path.normcase(code_object.co_filename)
-        # src_file is always absolute path, but the filename might not be
-        # absolute path
-        if filename.startswith("/"):
-            if filename == src_file:
-                frame = frame.f_back
-                continue
-        else:
-            if src_file.endswith(filename):
-                frame = frame.f_back
-                continue
+        key = (src_file, code_object.co_filename)
+        skip = FIND_CALLER_SKIP_CACHE.get(key)
+        if skip is None:
+            skip = _find_caller_skip(src_file, code_object.co_filename)
+            FIND_CALLER_SKIP_CACHE[key] = skip
+        if skip:
+            frame = frame.f_back
+            continue
         ret = (code_object.co_filename, frame.f_lineno, code_object.co_name)
         break
     return ret
 
 
+def truncate_message(message, max_size):
+    """
+    Truncate the message if it is longer than max_size
+    """
+    if max_size is None or len(message) <= max_size:
+        return message
+    return (message[:max_size] + "... [%d characters truncated]" %
+            (len(message) - max_size))
+
+
 class CoralLogs():
     """
     Global log object to track what logs have been allocated
@@ -307,7 +338,8 @@ class CoralLog():
     # pylint: disable=too-many-instance-attributes
     def __init__(self, name=None, resultsdir=None, console_format=FMT_FULL,
                  condition=None, stdout_color=None, stderr_color=None,
-                 remember_records=False, stdout=None, stderr=None):
+                 remember_records=False, stdout=None, stderr=None,
+                 background_writer=False):
         self.cl_name = name
         self.cl_result = utils.CommandResult()
         self.cl_resultsdir = resultsdir
@@ -341,31 +373,98 @@ class CoralLog():
             self.cl_sys_stderr = sys.stderr
         else:
             self.cl_sys_stderr = stderr
+        # Whether write the log files from a background thread
+        self.cl_background_writer = background_writer
+        # logging.handlers.QueueListener that writes the log files
+        self.cl_queue_listener = None
+        # Whether self._cl_queue_listener_stop has been registered to atexit
+        self.cl_atexit_registered = False
+        # (LOG_CONFIG_GENERATION, the lowest level that would be handled)
+        self.cl_level_cache = None
+        # Debug messages longer than this will be truncated
+        self.cl_debug_max_size = LOG_DEBUG_MESSAGE_MAX_SIZE
 
     def cl_set_propaget(self):
         """
         Whether log events to this logger to higher level loggers
         """
+        # pylint: disable=global-statement
+        global LOG_CONFIG_GENERATION
+        LOG_CONFIG_GENERATION += 1
         self.cl_logger.propagate = True
 
     def cl_clear_propaget(self):
         """
         Whether log events to this logger to higher level loggers
         """
+        # pylint: disable=global-statement
+        global LOG_CONFIG_GENERATION
+        LOG_CONFIG_GENERATION += 1
         self.cl_logger.propagate = False
 
     def cl_get_child(self, name, resultsdir=None, console_format=FMT_FULL,
-                     overwrite=False, condition=None):
+                     overwrite=False, condition=None, background_writer=None):
         """
         Get a child log
         If overwrite, the existing log will be overwritten
+        If background_writer is None, inherit it from this log
         """
         if self.cl_name is not None:
             name = self.cl_name + "." + name
+        if background_writer is None:
+            background_writer = self.cl_background_writer
         return get_log(name, resultsdir=resultsdir,
                        console_format=console_format,
                        overwrite=overwrite,
-                       condition=condition)
+                       condition=condition,
+                       background_writer=background_writer)
+
+    def _cl_queue_listener_stop(self, restore_handlers=False):
+        """
+        Stop the background writer and flush the pending records
+        If restore_handlers, write the files directly from now on.
+        """
+        listener = self.cl_queue_listener
+        if listener is None:
+            return
+        self.cl_queue_listener = None
+        listener.stop()
+        if not restore_handlers:
+            return
+        # pylint: disable=global-statement
+        global LOG_CONFIG_GENERATION
+        LOG_CONFIG_GENERATION += 1
+        self.cl_logger.handlers = [handler for handler in self.cl_logger.handlers
+                                   if not isinstance(handler,
+                                                     logging.handlers.QueueHandler)]
+        for handler in listener.handlers:
+            self.cl_logger.addHandler(handler)
+
+    def cl_enabled_for(self, level):
+        """
+        Return True if a message of the level would be handled by any
+        handler or remembered in the records.
+        """
+        if self.cl_records is not None:
+            return True
+        cache = self.cl_level_cache
+        if cache is None or cache[0] != LOG_CONFIG_GENERATION:
+            generation = LOG_CONFIG_GENERATION
+            min_level = None
+            logger = self.cl_logger
+            while logger is not None:
+                for handler in logger.handlers:
+                    if min_level is None or handler.level < min_level:
+                        min_level = handler.level
+                if not logger.propagate:
+                    break
+                logger = logger.parent
+            if min_level is None:
+                # logging.lastResort will be used
+                min_level = logging.WARNING
+            cache = (generation, min_level)
+            self.cl_level_cache = cache
+        return level >= cache[1]
 
     def cl_config(self, console_level=logging.INFO):
         """
@@ -373,6 +472,10 @@ class CoralLog():
         """
         # pylint: disable=too-many-locals,too-many-statements
         # pylint: disable=too-many-branches,bad-option-value,redefined-variable-type
+        # pylint: disable=global-statement
+        global LOG_CONFIG_GENERATION
+        LOG_CONFIG_GENERATION += 1
+        self._cl_queue_listener_stop()
         resultsdir = self.cl_resultsdir
         name = self.cl_name
         console_format = self.cl_console_format
@@ -443,10 +546,30 @@ class CoralLog():
             self.cl_console_handler.addFilter(console_filter)
 
         if resultsdir is not None:
-            logger.addHandler(debug_handler)
-            logger.addHandler(info_handler)
-            logger.addHandler(warning_handler)
-            logger.addHandler(error_handler)
+            if self.cl_background_writer:
+                # The records are still formatted by the callers, but the
+                # writes of the files are deferred to a background thread
+                # so that the callers do not wait for the file I/O.
+                record_queue = queue.Queue()
+                queue_handler = logging.handlers.QueueHandler(record_queue)
+                queue_handler.setLevel(logging.DEBUG)
+                logger.addHandler(queue_handler)
+                listener = logging.handlers.QueueListener(record_queue,
+                                                          debug_handler,
+                                                          info_handler,
+                                                          warning_handler,
+                                                          error_handler,
+                                                          respect_handler_level=True)
+                listener.start()
+                self.cl_queue_listener = listener
+                if not self.cl_atexit_registered:
+                    atexit.register(self._cl_queue_listener_stop)
+                    self.cl_atexit_registered = True
+            else:
+                logger.addHandler(debug_handler)
+                logger.addHandler(info_handler)
+                logger.addHandler(warning_handler)
+                logger.addHandler(error_handler)
             self.cl_debug_handler = debug_handler
             self.cl_info_handler = info_handler
             self.cl_warning_handler = warning_handler
@@ -505,8 +628,13 @@ class CoralLog():
     def cl_log(self, level, msg, *args):
         """
         Emit the log and hande the records
+        The message is not formatted if no handler needs it.
         """
+        if not self.cl_enabled_for(level):
+            return
         message = get_message(msg, args)
+        if level <= logging.DEBUG:
+            message = truncate_message(message, self.cl_debug_max_size)
         self._cl_append_record(level, message)
         self._cl_log_raw(level, message)
 
@@ -538,6 +666,7 @@ class CoralLog():
         """
         Cleanup this log
         """
+        self._cl_queue_listener_stop(restore_handlers=True)
         return fini_log(self)
 
     def cl_stdout(self, msg, *args):
@@ -574,17 +703,21 @@ class CoralLog():
 
 def get_log(name=None, resultsdir=None, console_format=FMT_FULL,
             overwrite=False, condition=None, console_level=logging.INFO,
-            stdout_color=None, stderr_color=None, remember_records=False):
+            stdout_color=None, stderr_color=None, remember_records=False,
+            background_writer=False):
     """
     Get the log.
     If overwrite, the existing log will be overwritten.
+    If background_writer, the writes of the log files are deferred to a
+    background thread.
     """
     log = CoralLog(name=name, resultsdir=resultsdir,
                    console_format=console_format,
                    condition=condition,
                    stdout_color=stdout_color,
                    stderr_color=stderr_color,
-                   remember_records=remember_records)
+                   remember_records=remember_records,
+                   background_writer=background_writer)
     old_log = GLOBAL_LOGS.cls_log_add_or_get(log)
     if old_log is log:
         # Newly added, config it
@@ -7,13 +7,21 @@ import logging
 import traceback
 import os
 import socket
+import threading
+import time
+import json
+import csv
+import io
 
-import prettytable
-import toml
-import yaml
 from pycoral import clog
 from pycoral import time_util
 from pycoral import utils
+from pycoral import parse_cache
+from pycoral import lazy_import
+
+prettytable = lazy_import.lazy_module("prettytable")  # pylint: disable=invalid-name
+toml = lazy_import.lazy_module("toml")  # pylint: disable=invalid-name
+yaml = lazy_import.lazy_module("yaml")  # pylint: disable=invalid-name
 
 # The pattern of identity generateed by get_identity()
 IDENTITY_PATTERN = "20*"
@@ -41,6 +49,12 @@ def load_config(log, config_fpath):
                      config_fpath, hostname)
         return None
 
+    fpaths = [os.path.realpath(config_fpath)]
+    cache_key = parse_cache.parse_cache_key(fpaths)
+    config = parse_cache.parse_cache_load(log, "config", fpaths, cache_key)
+    if config is not None:
+        return config
+
     try:
         config = toml.load(config_fpath)
     except:
@@ -53,7 +67,8 @@ def load_config(log, config_fpath):
                          config_fpath, error)
             log.cl_error("failed to load file [%s] using YAML format: %s",
                          config_fpath, traceback.format_exc())
-            config = None
+            return None
+    parse_cache.parse_cache_save(log, "config", fpaths, cache_key, config)
     return config
 
 
@@ -83,9 +98,12 @@ def check_argument_fpath(log, local_host, fpath):
 def init_env_noconfig(logdir, log_to_file, logdir_is_default,
                       identity=None, force_stdout_color=False,
                       force_stderr_color=False,
-                      console_format=clog.FMT_NORMAL):
+                      console_format=clog.FMT_NORMAL,
+                      background_writer=False):
     """
     Init log and workspace for commands that needs it
+    If background_writer, the writes of the log files are deferred to a
+    background thread, which is useful for long-running daemons.
     """
     # pylint: disable=too-many-branches
     if identity is None:
@@ -149,19 +167,23 @@ def init_env_noconfig(logdir, log_to_file, logdir_is_default,
                        console_level=logging.INFO,
                        console_format=console_format,
                        stdout_color=stdout_color,
-                       stderr_color=stderr_color)
+                       stderr_color=stderr_color,
+                       background_writer=background_writer)
 
     return log, workspace
 
 
 def init_env(config_fpath, logdir, log_to_file, logdir_is_default,
-             identity=None, console_format=clog.FMT_NORMAL):
+             identity=None, console_format=clog.FMT_NORMAL,
+             background_writer=False):
     """
     Init log, workspace and config for commands that needs it
     """
+    # pylint: disable=too-many-arguments
     log, workspace = init_env_noconfig(logdir, log_to_file, logdir_is_default,
                                        identity=identity,
-                                       console_format=console_format)
+                                       console_format=console_format,
+                                       background_writer=background_writer)
     if (not isinstance(config_fpath, bool)) and isinstance(config_fpath, int):
         config_fpath = str(config_fpath)
     if not isinstance(config_fpath, str):
@@ -689,9 +711,150 @@ def print_all_fields(log, all_fields):
     log.cl_stdout(utils.list2string(all_fields))
 
 
+# Print a table after all items are ready
+OUTPUT_FORMAT_TABLE = "table"
+# Print a JSON object per line for each item as soon as it is ready
+OUTPUT_FORMAT_JSONL = "jsonl"
+# Print a CSV row for each item as soon as it is ready
+OUTPUT_FORMAT_CSV = "csv"
+OUTPUT_FORMATS = [OUTPUT_FORMAT_TABLE, OUTPUT_FORMAT_JSONL, OUTPUT_FORMAT_CSV]
+# The key of the summary line in JSON lines output
+OUTPUT_SUMMARY_KEY = "_summary"
+
+
+def check_argument_output_format(log, name, value):
+    """
+    Check the argument is a supported output format. If not, exit.
+    """
+    value = check_argument_str(log, name, value)
+    if value not in OUTPUT_FORMATS:
+        log.cl_error("unsupported value [%s] of argument [--%s], expected "
+                     "one of %s", value, name, OUTPUT_FORMATS)
+        cmd_exit(log, -1)
+    return value
+
+
+class ListStreamPrinter():
+    """
+    Print the items of a list in machine readable format, one line per
+    item. The line of an item can be printed as soon as the item is ready,
+    in any thread.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, log, field_names, field_result_funct, output_format):
+        # The log to print the lines to
+        self.lsp_log = log
+        # The names of the fields to print
+        self.lsp_field_names = field_names
+        # The function to get (ret, result) of a field of an item
+        self.lsp_field_result_funct = field_result_funct
+        # OUTPUT_FORMAT_JSONL or OUTPUT_FORMAT_CSV
+        self.lsp_output_format = output_format
+        # Lock to keep the lines from mixing up
+        self.lsp_lock = threading.Lock()
+        # Number of printed items
+        self.lsp_items = 0
+        # Number of printed items that have any failure
+        self.lsp_failed_items = 0
+        # Return value, negative if any failure
+        self.lsp_rc = 0
+        # Time of starting
+        self.lsp_time_start = time.time()
+
+    def _lsp_line_print(self, line):
+        """
+        Print a line and flush so that readers can get it immediately.
+        """
+        log = self.lsp_log
+        log.cl_stdout(line)
+        log.cl_sys_stdout.flush()
+
+    def _lsp_csv_line(self, values):
+        """
+        Return a line of CSV
+        """
+        # pylint: disable=no-self-use
+        output = io.StringIO()
+        writer = csv.writer(output, lineterminator="")
+        writer.writerow(values)
+        return output.getvalue()
+
+    def lsp_start(self):
+        """
+        Print the header if any.
+        """
+        if self.lsp_output_format == OUTPUT_FORMAT_CSV:
+            self._lsp_line_print(self._lsp_csv_line(self.lsp_field_names))
+
+    def lsp_item_print(self, log, item):
+        """
+        Print the line of an item.
+        """
+        rc = 0
+        result_dict = {}
+        for field_name in self.lsp_field_names:
+            ret, result = self.lsp_field_result_funct(log, item, field_name)
+            if ret:
+                rc = ret
+            if isinstance(result, str):
+                result = clog.colorless_message(result)
+            elif not isinstance(result, (int, float, bool, type(None))):
+                result = clog.colorless_message(str(result))
+            result_dict[field_name] = result
+
+        if self.lsp_output_format == OUTPUT_FORMAT_CSV:
+            values = []
+            for field_name in self.lsp_field_names:
+                values.append(result_dict[field_name])
+            line = self._lsp_csv_line(values)
+        else:
+            line = json.dumps(result_dict)
+
+        with self.lsp_lock:
+            self._lsp_line_print(line)
+            self.lsp_items += 1
+            if rc:
+                self.lsp_failed_items += 1
+                self.lsp_rc = rc
+
+    def lsp_finish(self, log, rc=0):
+        """
+        Print the summary and return the return value of printing.
+        The summary is the last line of JSON lines output. For CSV
+        output, the summary is printed to stderr to keep the output valid.
+        """
+        if rc:
+            self.lsp_rc = rc
+        summary = {"items": self.lsp_items,
+                   "failed_items": self.lsp_failed_items,
+                   "seconds": round(time.time() - self.lsp_time_start, 3),
+                   "ret": self.lsp_rc}
+        if self.lsp_output_format == OUTPUT_FORMAT_CSV:
+            log.cl_info("printed [%d] items, [%d] failed, in [%s] seconds",
+                        summary["items"], summary["failed_items"],
+                        summary["seconds"])
+        else:
+            self._lsp_line_print(json.dumps({OUTPUT_SUMMARY_KEY: summary}))
+        return self.lsp_rc
+
+
+def list_stream_printer(log, field_names, field_result_funct, output_format):
+    """
+    Return a started ListStreamPrinter. Return None if output_format is
+    table.
+    """
+    if output_format == OUTPUT_FORMAT_TABLE:
+        return None
+    printer = ListStreamPrinter(log, field_names, field_result_funct,
+                                output_format)
+    printer.lsp_start()
+    return printer
+
+
 def print_list(log, item_list, quick_fields, slow_fields, none_table_fields,
                field_result_funct, print_status=False, print_table=True,
-               field_string=None, sortby=None, reversesort=False):
+               field_string=None, sortby=None, reversesort=False,
+               output_format=OUTPUT_FORMAT_TABLE):
     """
     Print table of a list
     """
@@ -721,6 +884,13 @@ def print_list(log, item_list, quick_fields, slow_fields, none_table_fields,
                      field_string)
         return -1
 
+    printer = list_stream_printer(log, field_names, field_result_funct,
+                                  output_format)
+    if printer is not None:
+        for item in item_list:
+            printer.lsp_item_print(log, item)
+        return printer.lsp_finish(log)
+
     if print_table:
         table = prettytable.PrettyTable()
         table.set_style(prettytable.PLAIN_COLUMNS)
@@ -0,0 +1,288 @@
+"""
+Capture the outputs of commands and run many commands from a single
+thread.
+
+DO NOT import any library that needs extra python package,
+since this might cause failure of commands that uses this
+library to install python packages.
+"""
+import os
+import time
+import logging
+import selectors
+
+
+# Size of each read from the stdout/stderr pipes of commands. Linux pipe
+# buffer is 64 KiB by default, so a single read could drain it.
+COMMAND_READ_SIZE = 65536
+
+
+class CommandOutputStream():
+    """
+    Captured output of stdout or stderr of a command
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, return_output=True, tee=None, line_func=None,
+                 max_bytes=None):
+        # Whether to keep the output and return it in the result
+        self.cos_return_output = return_output
+        # Buffer to save the output
+        self.cos_buffer = bytearray()
+        # File to write the output to
+        self.cos_tee = tee
+        # If not None, will be called for each line of the output with the
+        # line (without the ending "\n") as the argument.
+        self.cos_line_func = line_func
+        # Partial line that has not been passed to cos_line_func yet
+        self.cos_partial_line = bytearray()
+        # Max bytes to keep in cos_buffer. Output beyond it will still be
+        # passed to the tee and line_func, but not kept.
+        self.cos_max_bytes = max_bytes
+        # Whether some output has been dropped because of cos_max_bytes
+        self.cos_truncated = False
+
+    def cos_feed(self, data):
+        """
+        Process a chunk of the output
+        """
+        if len(data) == 0:
+            return
+        if self.cos_return_output:
+            if self.cos_max_bytes is None:
+                self.cos_buffer += data
+            else:
+                room = self.cos_max_bytes - len(self.cos_buffer)
+                if room >= len(data):
+                    self.cos_buffer += data
+                else:
+                    if room > 0:
+                        self.cos_buffer += memoryview(data)[:room]
+                    self.cos_truncated = True
+        if self.cos_tee:
+            self.cos_tee.write(data)
+        if self.cos_line_func is not None:
+            self._cos_feed_lines(data)
+
+    def _cos_feed_lines(self, data):
+        """
+        Pass the complete lines in the chunk to cos_line_func, and save the
+        unterminated line for the next chunk
+        """
+        start = 0
+        while True:
+            end = data.find(b"\n", start)
+            if end < 0:
+                break
+            if len(self.cos_partial_line) > 0:
+                self.cos_partial_line += memoryview(data)[start:end]
+                line = bytes(self.cos_partial_line)
+                self.cos_partial_line = bytearray()
+            else:
+                line = data[start:end]
+            self.cos_line_func(line.decode(errors="replace"))
+            start = end + 1
+        if start < len(data):
+            self.cos_partial_line += memoryview(data)[start:]
+
+    def cos_finish(self):
+        """
+        The output ends, pass the last unterminated line to line_func
+        """
+        if (self.cos_line_func is not None and
+                len(self.cos_partial_line) > 0):
+            line = bytes(self.cos_partial_line)
+            self.cos_partial_line = bytearray()
+            self.cos_line_func(line.decode(errors="replace"))
+
+    def cos_getvalue(self):
+        """
+        Return the decoded output
+        """
+        if self.cos_truncated:
+            # The truncation could split a multi-byte character
+            return self.cos_buffer.decode(errors="ignore")
+        return self.cos_buffer.decode()
+
+
+class CommandReactor():
+    """
+    Run many CommandJobs from a single thread. The outputs of all jobs are
+    multiplexed with selectors (epoll on Linux), so no thread is needed for
+    each job.
+    """
+    # pylint: disable=too-many-instance-attributes
+    # Max seconds to wait in select, so that processes which exit without
+    # closing the pipes and quit functions are checked from time to time
+    MAX_WAIT_TIME = 1
+    # Seconds to wait in select when some job has closed its pipes but not
+    # been reaped yet
+    EXIT_WAIT_TIME = 0.01
+
+    def __init__(self, parallelism=None, quit_func=None):
+        # Max number of jobs running at the same time, None means no limit
+        self.cre_parallelism = parallelism
+        # If this function is not None, then it will be called from time to
+        # time. Any time it returns True, all running jobs will be killed.
+        self.cre_quit_func = quit_func
+        self.cre_selector = selectors.DefaultSelector()
+        # Jobs that have not been started
+        self.cre_pending_jobs = []
+        # Jobs that are running
+        self.cre_running_jobs = []
+        # All the jobs added
+        self.cre_jobs = []
+        # Number of open pipes of each running job
+        self.cre_open_pipes = {}
+        # Called with the job as the argument when a job finishes
+        self.cre_done_funcs = {}
+
+    def cre_add_job(self, job, done_func=None):
+        """
+        Add a job to run. The job will be started by cre_run().
+        """
+        self.cre_jobs.append(job)
+        self.cre_pending_jobs.append(job)
+        if done_func is not None:
+            self.cre_done_funcs[job] = done_func
+
+    def _cre_start_job(self, job):
+        """
+        Start a job and register its pipes
+        """
+        try:
+            ret = job.cj_run_start()
+        except OSError as error:
+            job.cj_result.cr_stderr = str(error)
+            ret = -1
+        if ret:
+            job.cj_result.cr_exit_status = ret
+            logging.debug("command [%s] failed to start", job.cj_command)
+            self._cre_job_done(job, post_exit=False)
+            return
+        subproc = job.cj_subprocess
+        self.cre_selector.register(subproc.stdout, selectors.EVENT_READ,
+                                   (job, True))
+        self.cre_selector.register(subproc.stderr, selectors.EVENT_READ,
+                                   (job, False))
+        self.cre_open_pipes[job] = 2
+        if job.cj_string_stdin is not None:
+            self.cre_selector.register(subproc.stdin, selectors.EVENT_WRITE,
+                                       (job, None))
+        self.cre_running_jobs.append(job)
+
+    def _cre_unregister_job(self, job):
+        """
+        Unregister all pipes of a job
+        """
+        subproc = job.cj_subprocess
+        for pipe in [subproc.stdout, subproc.stderr, subproc.stdin]:
+            if pipe is None:
+                continue
+            try:
+                self.cre_selector.unregister(pipe)
+            except (KeyError, ValueError):
+                pass
+        if job in self.cre_open_pipes:
+            del self.cre_open_pipes[job]
+        self.cre_running_jobs.remove(job)
+
+    def _cre_job_done(self, job, post_exit=True):
+        """
+        The job finished
+        """
+        if post_exit:
+            job.cj_post_exit()
+        if job in self.cre_done_funcs:
+            self.cre_done_funcs[job](job)
+
+    def _cre_finish_job(self, job, kill=False):
+        """
+        Reap or kill the job
+        """
+        self._cre_unregister_job(job)
+        if kill:
+            job.cj_kill()
+        self._cre_job_done(job)
+
+    def _cre_handle_event(self, key):
+        """
+        Handle the ready pipe
+        """
+        job, is_stdout = key.data
+        if is_stdout is None:
+            # we can write PIPE_BUF bytes without blocking
+            # POSIX requires PIPE_BUF is >= 512
+            file_obj = key.fileobj
+            file_obj.write(job.cj_string_stdin[:512].encode('utf-8'))
+            file_obj.flush()
+            job.cj_string_stdin = job.cj_string_stdin[512:]
+            if not job.cj_string_stdin:
+                self.cre_selector.unregister(file_obj)
+                file_obj.close()
+            return
+
+        data = os.read(key.fileobj.fileno(), COMMAND_READ_SIZE)
+        if is_stdout:
+            stream = job.cj_stdout_stream
+            tee = job.cj_stdout_tee
+        else:
+            stream = job.cj_stderr_stream
+            tee = job.cj_stderr_tee
+        if len(data) == 0:
+            # EOF
+            self.cre_selector.unregister(key.fileobj)
+            self.cre_open_pipes[job] -= 1
+            return
+        stream.cos_feed(data)
+        if job.cj_flush_tee and tee:
+            tee.flush()
+
+    def cre_run(self):
+        """
+        Run all the jobs until they finish. Return the list of
+        CommandResult in the same order that jobs are added.
+        """
+        # pylint: disable=too-many-branches
+        while len(self.cre_pending_jobs) > 0 or len(self.cre_running_jobs) > 0:
+            while (len(self.cre_pending_jobs) > 0 and
+                   (self.cre_parallelism is None or
+                    len(self.cre_running_jobs) < self.cre_parallelism)):
+                job = self.cre_pending_jobs.pop(0)
+                self._cre_start_job(job)
+
+            if len(self.cre_running_jobs) == 0:
+                continue
+
+            now = time.time()
+            wait_time = CommandReactor.MAX_WAIT_TIME
+            for job in self.cre_running_jobs:
+                if self.cre_open_pipes[job] == 0:
+                    wait_time = min(wait_time, CommandReactor.EXIT_WAIT_TIME)
+                if job.cj_max_stop_time is not None:
+                    wait_time = min(wait_time, job.cj_max_stop_time - now)
+            wait_time = max(wait_time, 0)
+
+            for key, _ in self.cre_selector.select(wait_time):
+                self._cre_handle_event(key)
+
+            quit_all = (self.cre_quit_func is not None and
+                        self.cre_quit_func())
+            now = time.time()
+            for job in self.cre_running_jobs[:]:
+                job.cj_result.cr_exit_status = job.cj_subprocess.poll()
+                if job.cj_result.cr_exit_status is not None:
+                    self._cre_finish_job(job)
+                elif (quit_all or
+                      (job.cj_max_stop_time is not None and
+                       now >= job.cj_max_stop_time) or
+                      (job.cj_quit_func is not None and job.cj_quit_func())):
+                    self._cre_finish_job(job, kill=True)
+
+            if quit_all:
+                for job in self.cre_pending_jobs:
+                    job.cj_result.cr_exit_status = -1
+                    job.cj_result.cr_stderr = "quit before starting"
+                self.cre_pending_jobs = []
+
+        self.cre_selector.close()
+        return [job.cj_result for job in self.cre_jobs]
@@ -25,6 +25,9 @@ SOURCE_ISO_FNAME = "ISO"
 BUILD_PACKAGES = "Packages"
 SOURCE_ISO_PACKAGES_PATH = SOURCE_ISO_FNAME + "/" + BUILD_PACKAGES
 CORAL_DIR = "/var/lib/coral"
+# Dir to save the parsed config files and Lustre version database, so
+# that commands do not need to parse them again.
+CORAL_PARSE_CACHE_DIR = CORAL_DIR + "/parse_cache"
 
 CORAL_LOG_DIR = "/var/log/coral"
 # Dir to save build cache. It includes subdirs for devel and release.
@@ -7,9 +7,13 @@ import base64
 import time
 import traceback
 import json
+import copy
+import threading
 from http import HTTPStatus
 import yaml
-import requests
+from pycoral import lazy_import
+
+requests = lazy_import.lazy_module("requests")  # pylint: disable=invalid-name
 
 CONSUL_BIN_NAME = "consul"
 CONSUL_BIN_DIR = "/usr/bin"
@@ -25,6 +29,10 @@ CONSUL_KV_STR_VALUE = "Value"
 CONSUL_KV_STR_SESSION = "Session"
 CONSUL_KV_STR_CREATE_INDEX = "CreateIndex"
 CONSUL_KV_STR_MODIFY_INDEX = "ModifyIndex"
+# Max seconds of each blocking query when watching Consul paths
+CONSUL_WATCH_WAIT = 60
+# Max number of operations in a single Consul transaction
+CONSUL_TXN_MAX_OPERATIONS = 64
 CONSUL_KV_FIELDS = [CONSUL_KV_STR_LOCK_INDEX,
                     CONSUL_KV_STR_KEY,
                     CONSUL_KV_STR_FLAGS,
@@ -68,11 +76,28 @@ def consul_session_info_path(session_uuid):
     return "session/info/" + session_uuid
 
 
+def consul_kv_decode_value(log, key, encoded_value):
+    """
+    Decode the value of a KV out of base64-encoded blob.
+    Return (0, value_string). (negative, None) on error.
+    """
+    if encoded_value is None:
+        return 0, ""
+    try:
+        value_bytes = base64.b64decode(encoded_value)
+        value_string = value_bytes.decode('ascii')
+    except:
+        log.cl_error("failed to decode value of key [%s]: %s",
+                     key, traceback.format_exc())
+        return -1, None
+    return 0, value_string
+
+
 class ConsulAgent():
     """
     Each Consul server/client has an object of this type
     """
-    # pylint: disable=too-few-public-methods
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
     def __init__(self, host, bind_addr, is_server=True):
         # The SSHHost
         self.csa_host = host
@@ -90,6 +115,20 @@ class ConsulAgent():
         self.csa_url_v1 = "http://" + bind_addr + ":" + self.csa_port + "/v1/"
         # Example: "http://10.0.0.1:8500/v1/kv/"
         self.csa_url_kv = self.csa_url_v1 + CONSUL_KV + "/"
+        # Thread local data that saves the requests.Session of each thread,
+        # so that the HTTP connections to the agent are kept alive and
+        # reused by the requests of the same thread.
+        self._csa_thread_local = threading.local()
+
+    def _csa_session(self):
+        """
+        Return the HTTP session of this thread.
+        """
+        session = getattr(self._csa_thread_local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._csa_thread_local.session = session
+        return session
 
     def _csa_url(self, path):
         """
@@ -97,14 +136,16 @@ class ConsulAgent():
         """
         return self.csa_url_v1 + path
 
-    def _csa_get_raw(self, log, path, quiet=False):
+    def _csa_get_raw(self, log, path, quiet=False, params=None,
+                     timeout=None):
         """
         Key is something like "status/leader".
         Return the response, including the status.
         """
         url = self._csa_url(path)
         try:
-            response = requests.get(url)
+            response = self._csa_session().get(url, params=params,
+                                               timeout=timeout)
         except:
             if not quiet:
                 log.cl_error("failed to get reply from URL [%s]: %s",
@@ -127,6 +168,42 @@ class ConsulAgent():
             return None
         return response.json()
 
+    def csa_blocking_get(self, log, path, index=0, wait=None, params=None):
+        """
+        Get the json result of a path with Consul blocking query. If index
+        is not 0, the request will wait until the index of the path
+        changes or the wait seconds passes.
+        Return (0, index, result). If path does not exist, result is None.
+        Return (negative, None, None) on error.
+        """
+        query = {}
+        if params is not None:
+            query.update(params)
+        timeout = None
+        if index > 0:
+            query["index"] = str(index)
+            if wait is not None:
+                query["wait"] = "%ds" % wait
+                # Consul adds a random jitter up to wait / 16
+                timeout = wait + wait / 16 + 10
+        response = self._csa_get_raw(log, path, params=query, timeout=timeout)
+        if response is None:
+            return -1, None, None
+        index_string = response.headers.get("X-Consul-Index")
+        try:
+            new_index = int(index_string)
+        except (TypeError, ValueError):
+            log.cl_error("invalid index [%s] in reply of Consul path [%s]",
+                         index_string, path)
+            return -1, None, None
+        if response.status_code == HTTPStatus.NOT_FOUND:
+            return 0, new_index, None
+        if response.status_code != HTTPStatus.OK:
+            log.cl_error("got status [%s] of Consul path [%s]",
+                         response.status_code, path)
+            return -1, None, None
+        return 0, new_index, response.json()
+
     def csa_put_kv(self, log, key, value):
         """
         Key is something like "kv/path2key".
@@ -134,7 +211,7 @@ class ConsulAgent():
         """
         url = self._csa_url(consul_kv_path(key))
         try:
-            response = requests.put(url, data=value)
+            response = self._csa_session().put(url, data=value)
         except:
             log.cl_error("failed to put data to URL [%s]: %s",
                          url, traceback.format_exc())
@@ -207,14 +284,135 @@ class ConsulAgent():
         if reply_dict is None:
             return 0, None
         encoded_value = reply_dict[CONSUL_KV_STR_VALUE]
+        return consul_kv_decode_value(log, key, encoded_value)
+
+    def csa_get_kv_tree(self, log, prefix):
+        """
+        Get all the KVs under a prefix with a single request.
+        Return (0, dict). Key of the dict is the key of KV, value is the
+        reply dict of the key, the same with _csa_get_kv_dict().
+        Return (negative, None) on error.
+        """
+        response = self._csa_get_raw(log, consul_kv_path(prefix),
+                                     params={"recurse": "true"})
+        if response is None:
+            return -1, None
+
+        if response.status_code == HTTPStatus.NOT_FOUND:
+            return 0, {}
+
+        if response.status_code != HTTPStatus.OK:
+            log.cl_error("got status [%s] from Consul prefix [%s]",
+                         response.status_code, prefix)
+            return -1, None
+
+        result = response.json()
+        if not isinstance(result, list):
+            log.cl_error("unexpected type for response of prefix [%s]",
+                         prefix)
+            return -1, None
+        kv_dict = {}
+        for reply_dict in result:
+            if (not isinstance(reply_dict, dict) or
+                    CONSUL_KV_STR_KEY not in reply_dict):
+                log.cl_error("unexpected item in response of prefix [%s]",
+                             prefix)
+                return -1, None
+            kv_dict[reply_dict[CONSUL_KV_STR_KEY]] = reply_dict
+        return 0, kv_dict
+
+    def csa_txn(self, log, operations):
+        """
+        Run a list of operations in a single Consul transaction. Each
+        operation is a dict like {"KV": {"Verb": "get-tree", "Key": "key"}}.
+        Return (0, results) where results is the list of the "Results" in
+        the reply. Return (negative, None) on error.
+        """
+        if len(operations) > CONSUL_TXN_MAX_OPERATIONS:
+            log.cl_error("too many operations [%d] in a Consul transaction, "
+                         "max [%d]", len(operations),
+                         CONSUL_TXN_MAX_OPERATIONS)
+            return -1, None
+        url = self._csa_url("txn")
         try:
-            value_bytes = base64.b64decode(encoded_value)
-            value_string = value_bytes.decode('ascii')
+            response = self._csa_session().put(url, data=json.dumps(operations))
         except:
-            log.cl_error("failed to decode value of key [%s]: %s",
-                         key, traceback.format_exc())
+            log.cl_error("failed to put transaction to URL [%s]: %s",
+                         url, traceback.format_exc())
             return -1, None
-        return 0, value_string
+        if response.status_code != HTTPStatus.OK:
+            log.cl_error("failed to run transaction on URL [%s], "
+                         "status [%s], reply [%s]",
+                         url, response.status_code, response.text)
+            return -1, None
+        result = response.json()
+        if not isinstance(result, dict):
+            log.cl_error("unexpected type for response of transaction")
+            return -1, None
+        results = result.get("Results")
+        if results is None:
+            results = []
+        if not isinstance(results, list):
+            log.cl_error("unexpected type for results of transaction")
+            return -1, None
+        return 0, results
+
+    def csa_get_kv_dicts(self, log, keys):
+        """
+        Get the KVs of a list of keys with Consul transactions. Missing
+        keys will not be included in the result.
+        Return (0, dict). Key of the dict is the key of KV, value is the
+        reply dict of the key, the same with _csa_get_kv_dict().
+        Return (negative, None) on error.
+        """
+        kv_dict = {}
+        wanted_keys = set(keys)
+        for start in range(0, len(keys), CONSUL_TXN_MAX_OPERATIONS):
+            operations = []
+            for key in keys[start:start + CONSUL_TXN_MAX_OPERATIONS]:
+                # Verb "get" fails the whole transaction if the key does not
+                # exist, so use "get-tree" and filter the extra keys.
+                operations.append({"KV": {"Verb": "get-tree", "Key": key}})
+            ret, results = self.csa_txn(log, operations)
+            if ret:
+                return -1, None
+            for result in results:
+                if not isinstance(result, dict) or "KV" not in result:
+                    log.cl_error("unexpected result of transaction")
+                    return -1, None
+                reply_dict = result["KV"]
+                if (not isinstance(reply_dict, dict) or
+                        CONSUL_KV_STR_KEY not in reply_dict):
+                    log.cl_error("unexpected KV in result of transaction")
+                    return -1, None
+                key = reply_dict[CONSUL_KV_STR_KEY]
+                if key in wanted_keys:
+                    kv_dict[key] = reply_dict
+        return 0, kv_dict
+
+    def csa_get_session_nodes(self, log):
+        """
+        Get the nodes of all the sessions with a single request.
+        Return a dict. Key is the session UUID, value is the node name.
+        Return None on error.
+        """
+        result = self._csa_get(log, "session/list")
+        if result is None:
+            log.cl_error("failed to get the list of sessions")
+            return None
+        if not isinstance(result, list):
+            log.cl_error("unexpected type for the list of sessions")
+            return None
+        session_dict = {}
+        for reply_dict in result:
+            if (not isinstance(reply_dict, dict) or
+                    CONSUL_SESSION_INFO_ID not in reply_dict or
+                    CONSUL_SESSION_INFO_NODE not in reply_dict):
+                log.cl_error("unexpected item in the list of sessions")
+                return None
+            session_uuid = reply_dict[CONSUL_SESSION_INFO_ID]
+            session_dict[session_uuid] = reply_dict[CONSUL_SESSION_INFO_NODE]
+        return session_dict
 
     def csa_get_agent_self_status(self, log, quiet=False):
         """
@@ -562,6 +760,378 @@ def get_zip_fpath(log, host, iso_dir):
     return paths[0]
 
 
+class ConsulWatchedPath():
+    """
+    The cached result of a Consul path. The result could be kept fresh by
+    Consul blocking queries.
+    """
+    def __init__(self, path, is_kv=False):
+        # Path to query, e.g. "kv/clownf_host/" or "session/list"
+        self.cwp_path = path
+        # Whether the path is a KV prefix. If so, cwp_result is a dict with
+        # KV key as key and reply dict as value. If not, cwp_result is a dict
+        # with session UUID as key and node name as value.
+        self.cwp_is_kv = is_kv
+        # The X-Consul-Index of the result
+        self.cwp_index = 0
+        # The parsed result, None if never updated
+        self.cwp_result = None
+        # Whether the result needs update before using it, e.g. after a
+        # change of the path by this process
+        self.cwp_stale = True
+        # Whether the path is being watched by blocking queries successfully
+        self.cwp_watched = False
+        # Lock to protect the fields above
+        self.cwp_lock = threading.Lock()
+
+    def _cwp_parse(self, log, result):
+        """
+        Parse the result of the query. Return None on error.
+        """
+        if result is None:
+            result = []
+        if not isinstance(result, list):
+            log.cl_error("unexpected type for result of Consul path [%s]",
+                         self.cwp_path)
+            return None
+
+        parsed = {}
+        for reply_dict in result:
+            if not isinstance(reply_dict, dict):
+                log.cl_error("unexpected item in result of Consul path [%s]",
+                             self.cwp_path)
+                return None
+            if self.cwp_is_kv:
+                if CONSUL_KV_STR_KEY not in reply_dict:
+                    log.cl_error("missing [%s] in result of Consul path [%s]",
+                                 CONSUL_KV_STR_KEY, self.cwp_path)
+                    return None
+                parsed[reply_dict[CONSUL_KV_STR_KEY]] = reply_dict
+            else:
+                if (CONSUL_SESSION_INFO_ID not in reply_dict or
+                        CONSUL_SESSION_INFO_NODE not in reply_dict):
+                    log.cl_error("unexpected session in result of Consul "
+                                 "path [%s]", self.cwp_path)
+                    return None
+                parsed[reply_dict[CONSUL_SESSION_INFO_ID]] = \
+                    reply_dict[CONSUL_SESSION_INFO_NODE]
+        return parsed
+
+    def cwp_update(self, log, agent, wait=None):
+        """
+        Update the result. If wait is not None, block until the index
+        changes or wait seconds passes.
+        """
+        if wait is None:
+            index = 0
+        else:
+            with self.cwp_lock:
+                index = self.cwp_index
+        if self.cwp_is_kv:
+            params = {"recurse": "true"}
+        else:
+            params = None
+        ret, new_index, result = agent.csa_blocking_get(log, self.cwp_path,
+                                                        index=index,
+                                                        wait=wait,
+                                                        params=params)
+        if ret:
+            log.cl_error("failed to query Consul path [%s]", self.cwp_path)
+            return -1
+        parsed = self._cwp_parse(log, result)
+        if parsed is None:
+            return -1
+
+        with self.cwp_lock:
+            if new_index < index:
+                # Index going backwards means the state of Consul has been
+                # reset, start over the blocking queries.
+                new_index = 0
+            elif new_index < self.cwp_index:
+                # Another thread has got a newer result meanwhile
+                return 0
+            self.cwp_result = parsed
+            self.cwp_index = new_index
+            self.cwp_stale = False
+        return 0
+
+    def cwp_get_result(self, fresh=True):
+        """
+        Return the result. If fresh is True, return None unless the result
+        is kept fresh by watching.
+        """
+        with self.cwp_lock:
+            if fresh and (self.cwp_stale or not self.cwp_watched):
+                return None
+            return self.cwp_result
+
+    def cwp_set_stale(self):
+        """
+        Update the result before next use.
+        """
+        with self.cwp_lock:
+            self.cwp_stale = True
+
+    def cwp_set_watched(self, watched):
+        """
+        Set whether the path is being watched.
+        """
+        with self.cwp_lock:
+            self.cwp_watched = watched
+
+    def cwp_is_watched(self):
+        """
+        Whether the path is being watched.
+        """
+        with self.cwp_lock:
+            return self.cwp_watched
+
+
+class ConsulWatchCache():
+    """
+    Local cache of the KVs under some prefixes and the sessions of a Consul
+    cluster. The parsed yaml configs are cached by the ModifyIndex of the
+    keys, so they are parsed only when changed.
+
+    Background threads keep the cache fresh with Consul blocking queries,
+    so reads only pay for actual changes. The cache is only used for paths
+    that are being watched. Reads of other paths go to Consul directly.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, consul_cluster, kv_prefixes):
+        # ConsulCluster
+        self.cwc_consul_cluster = consul_cluster
+        # Key is KV prefix, value is ConsulWatchedPath
+        self.cwc_kv_paths = {}
+        for prefix in kv_prefixes:
+            self.cwc_kv_paths[prefix] = \
+                ConsulWatchedPath(consul_kv_path(prefix), is_kv=True)
+        # Sessions
+        self.cwc_session_path = ConsulWatchedPath("session/list")
+        # Lock to serialize the refreshing of stale paths when reading
+        self.cwc_refresh_lock = threading.Lock()
+        # Key is KV key, value is (ModifyIndex, config)
+        self.cwc_config_cache = {}
+        # Lock to protect cwc_config_cache
+        self.cwc_config_lock = threading.Lock()
+        # The threads watching the paths
+        self.cwc_threads = []
+        # Whether to stop watching
+        self.cwc_stopping = False
+
+    def _cwc_prefix(self, key):
+        """
+        Return the cached prefix of the key, None if not cached.
+        """
+        matched = None
+        for prefix in self.cwc_kv_paths:
+            if not key.startswith(prefix):
+                continue
+            if matched is None or len(prefix) > len(matched):
+                matched = prefix
+        return matched
+
+    def cwc_covers(self, key):
+        """
+        Whether the key is covered by a path being watched.
+        """
+        prefix = self._cwc_prefix(key)
+        if prefix is None:
+            return False
+        return self.cwc_kv_paths[prefix].cwp_is_watched()
+
+    def _cwc_path_result(self, log, watched_path):
+        """
+        Return the result of the path, refresh it if stale.
+        """
+        result = watched_path.cwp_get_result()
+        if result is not None:
+            return result
+        with self.cwc_refresh_lock:
+            # Other threads might have refreshed it
+            result = watched_path.cwp_get_result()
+            if result is not None:
+                return result
+            agent = self.cwc_consul_cluster.cclr_alive_agent(log)
+            if agent is None:
+                log.cl_error("no Consul agent is up in the system")
+                return None
+            ret = watched_path.cwp_update(log, agent)
+            if ret:
+                return None
+            return watched_path.cwp_get_result(fresh=False)
+
+    def cwc_get_kv_dicts(self, log, prefix):
+        """
+        Return a dict of all the KVs under a cached prefix. Key is the KV
+        key, value is the reply dict. All the KVs are from the same
+        snapshot. Return None on error.
+        """
+        return self._cwc_path_result(log, self.cwc_kv_paths[prefix])
+
+    def cwc_get_config(self, log, key):
+        """
+        Get the yaml config of a key.
+        If not exist, return (0, None). Return (negative, None) on error.
+        """
+        prefix = self._cwc_prefix(key)
+        kv_dict = self.cwc_get_kv_dicts(log, prefix)
+        if kv_dict is None:
+            return -1, None
+        return self._cwc_config(log, kv_dict, key)
+
+    def _cwc_config(self, log, kv_dict, key):
+        """
+        Get the yaml config of a key from the KVs.
+        If not exist, return (0, None). Return (negative, None) on error.
+        """
+        if key not in kv_dict:
+            return 0, None
+        reply_dict = kv_dict[key]
+        modify_index = reply_dict.get(CONSUL_KV_STR_MODIFY_INDEX)
+        with self.cwc_config_lock:
+            cached = self.cwc_config_cache.get(key)
+        if cached is not None and cached[0] == modify_index:
+            # Callers might change the config
+            return 0, copy.deepcopy(cached[1])
+
+        encoded_value = reply_dict.get(CONSUL_KV_STR_VALUE)
+        ret, value = consul_kv_decode_value(log, key, encoded_value)
+        if ret:
+            return -1, None
+        ret, config = consul_load_config(log, key, value)
+        if ret:
+            return -1, None
+        with self.cwc_config_lock:
+            self.cwc_config_cache[key] = (modify_index, config)
+        return 0, copy.deepcopy(config)
+
+    def cwc_get_watcher(self, log, lock_key):
+        """
+        Get the node holding the lock key.
+        If no holder, return (0, None). Return (negative, None) on error.
+        """
+        prefix = self._cwc_prefix(lock_key)
+        kv_dict = self.cwc_get_kv_dicts(log, prefix)
+        if kv_dict is None:
+            return -1, None
+        return self._cwc_watcher(log, kv_dict, lock_key)
+
+    def _cwc_watcher(self, log, kv_dict, lock_key):
+        """
+        Get the node holding the lock key from the KVs.
+        If no holder, return (0, None). Return (negative, None) on error.
+        """
+        if lock_key not in kv_dict:
+            return 0, None
+        reply_dict = kv_dict[lock_key]
+        if CONSUL_KV_STR_SESSION not in reply_dict:
+            return 0, None
+        session = reply_dict[CONSUL_KV_STR_SESSION]
+        session_dict = self._cwc_path_result(log, self.cwc_session_path)
+        if session_dict is None:
+            return -1, None
+        if session not in session_dict:
+            # The cached sessions might be older than the KVs
+            self.cwc_session_path.cwp_set_stale()
+            session_dict = self._cwc_path_result(log, self.cwc_session_path)
+            if session_dict is None:
+                return -1, None
+            if session not in session_dict:
+                # The session has been destroyed after the KV request
+                return 0, None
+        return 0, session_dict[session]
+
+    def cwc_get_configs_and_watchers(self, log, config_key_paths,
+                                     lock_key_paths):
+        """
+        The same as ConsulCluster.cclr_get_configs_and_watchers(), but from
+        the cache.
+        """
+        snapshots = {}
+        for key_path in config_key_paths + lock_key_paths:
+            prefix = self._cwc_prefix(key_path)
+            if prefix in snapshots:
+                continue
+            kv_dict = self.cwc_get_kv_dicts(log, prefix)
+            if kv_dict is None:
+                return -1, None, None
+            snapshots[prefix] = kv_dict
+
+        config_dict = {}
+        for key_path in config_key_paths:
+            kv_dict = snapshots[self._cwc_prefix(key_path)]
+            ret, config = self._cwc_config(log, kv_dict, key_path)
+            if ret:
+                continue
+            config_dict[key_path] = config
+
+        watcher_dict = {}
+        for key_path in lock_key_paths:
+            kv_dict = snapshots[self._cwc_prefix(key_path)]
+            ret, watcher = self._cwc_watcher(log, kv_dict, key_path)
+            if ret:
+                continue
+            watcher_dict[key_path] = watcher
+        return 0, config_dict, watcher_dict
+
+    def cwc_invalidate(self):
+        """
+        Refresh the cache before next read, e.g. after changing the KVs.
+        """
+        for watched_path in self.cwc_kv_paths.values():
+            watched_path.cwp_set_stale()
+        self.cwc_session_path.cwp_set_stale()
+
+    def _cwc_watch_thread(self, log, watched_path):
+        """
+        Keep the path fresh with blocking queries.
+        """
+        while not self.cwc_stopping:
+            agent = self.cwc_consul_cluster.cclr_alive_agent(log)
+            if agent is None:
+                ret = -1
+            else:
+                ret = watched_path.cwp_update(log, agent,
+                                              wait=CONSUL_WATCH_WAIT)
+            if self.cwc_stopping:
+                break
+            if ret:
+                # Reads go to Consul directly until the watch recovers
+                watched_path.cwp_set_watched(False)
+                time.sleep(1)
+                continue
+            watched_path.cwp_set_watched(True)
+        watched_path.cwp_set_watched(False)
+
+    def cwc_start_watching(self, log):
+        """
+        Start threads to keep the cache fresh with blocking queries.
+        """
+        if len(self.cwc_threads) > 0:
+            return
+        self.cwc_stopping = False
+        watched_paths = (list(self.cwc_kv_paths.values()) +
+                         [self.cwc_session_path])
+        for watched_path in watched_paths:
+            thread = threading.Thread(target=self._cwc_watch_thread,
+                                      args=(log, watched_path))
+            thread.daemon = True
+            thread.start()
+            self.cwc_threads.append(thread)
+
+    def cwc_stop_watching(self):
+        """
+        Stop the watching threads. The threads might be blocked in queries,
+        so they are not joined.
+        """
+        self.cwc_stopping = True
+        self.cwc_threads = []
+        for watched_path in self.cwc_kv_paths.values():
+            watched_path.cwp_set_watched(False)
+        self.cwc_session_path.cwp_set_watched(False)
+
+
 class ConsulCluster():
     """
     Console cluster with all servers and clients
@@ -590,6 +1160,40 @@ class ConsulCluster():
         self.cclr_client_only = (len(server_dict) == 0)
         # The encrypt key
         self.cclr_encrypt_key = encrypt_key
+        # ConsulWatchCache, None if not enabled
+        self.cclr_watch_cache = None
+
+    def cclr_watch_cache_enable(self, log, kv_prefixes):
+        """
+        Cache the KVs under the prefixes and the sessions locally, and keep
+        the cache fresh with blocking queries in background threads. This
+        is meant for long-running processes.
+        """
+        self.cclr_watch_cache_disable()
+        self.cclr_watch_cache = ConsulWatchCache(self, kv_prefixes)
+        self.cclr_watch_cache.cwc_start_watching(log)
+
+    def cclr_watch_cache_disable(self):
+        """
+        Disable the local cache.
+        """
+        if self.cclr_watch_cache is not None:
+            self.cclr_watch_cache.cwc_stop_watching()
+            self.cclr_watch_cache = None
+
+    def _cclr_watch_cache(self, key_paths, consul_hostname=None):
+        """
+        Return the watch cache if all the keys could be read from it,
+        otherwise None. The cache reflects the view of any alive agent, so
+        it is not used when a specific agent is asked for.
+        """
+        watch_cache = self.cclr_watch_cache
+        if watch_cache is None or consul_hostname is not None:
+            return None
+        for key_path in key_paths:
+            if not watch_cache.cwc_covers(key_path):
+                return None
+        return watch_cache
 
     def cclr_leader(self, log, quiet=False):
         """
@@ -819,27 +1423,44 @@ class ConsulCluster():
             return -1
 
         ret = agent.csa_put_kv(log, key, config_string)
+        watch_cache = self.cclr_watch_cache
+        if watch_cache is not None:
+            watch_cache.cwc_invalidate()
         if ret:
             log.cl_error("failed to put value of key [%s]", key)
             return -1
         return 0
 
-    def cclr_get_config(self, log, key_path, consul_hostname=None):
+    def _cclr_get_agent(self, log, consul_hostname=None):
         """
-        Get the yaml config from a key path.
-        If not exist, return (0, None). Return (negative, None) on error.
+        Return the agent to send requests to. If consul_hostname is None,
+        return an alive agent.
         """
         if consul_hostname is None:
             agent = self.cclr_alive_agent(log)
             if agent is None:
                 log.cl_error("no Consul agent is up in the system")
-                return -1, None
-        else:
-            if consul_hostname not in self.cclr_agent_dict:
-                log.cl_error("host [%s] is not Consul server/client",
-                             consul_hostname)
-                return -1, None
-            agent = self.cclr_agent_dict[consul_hostname]
+                return None
+            return agent
+        if consul_hostname not in self.cclr_agent_dict:
+            log.cl_error("host [%s] is not Consul server/client",
+                         consul_hostname)
+            return None
+        return self.cclr_agent_dict[consul_hostname]
+
+    def cclr_get_config(self, log, key_path, consul_hostname=None):
+        """
+        Get the yaml config from a key path.
+        If not exist, return (0, None). Return (negative, None) on error.
+        """
+        watch_cache = self._cclr_watch_cache([key_path],
+                                             consul_hostname=consul_hostname)
+        if watch_cache is not None:
+            return watch_cache.cwc_get_config(log, key_path)
+
+        agent = self._cclr_get_agent(log, consul_hostname=consul_hostname)
+        if agent is None:
+            return -1, None
 
         ret, value = agent.csa_get_kv_value(log, key_path)
         if ret:
@@ -847,16 +1468,7 @@ class ConsulCluster():
             return -1, None
         if value is None:
             return 0, None
-
-        try:
-            config = yaml.load(value, Loader=yaml.FullLoader)
-        except:
-            log.cl_error("failed to load [%s] of key [%s] on as yaml file: %s",
-                         value, key_path,
-                         traceback.format_exc())
-            return -1, None
-
-        return 0, config
+        return consul_load_config(log, key_path, value)
 
     def cclr_get_watcher(self, log, lock_key_path, consul_hostname=None):
         """
@@ -865,17 +1477,14 @@ class ConsulCluster():
         If not exist, return (0, None). Return (negative, None) on error.
         """
         # pylint: disable=too-many-branches,too-many-locals
-        if consul_hostname is None:
-            agent = self.cclr_alive_agent(log)
-            if agent is None:
-                log.cl_error("no Consul agent is up in the system")
-                return -1, None
-        else:
-            if consul_hostname not in self.cclr_agent_dict:
-                log.cl_error("host [%s] is not Consul server",
-                             consul_hostname)
-                return -1, None
-            agent = self.cclr_agent_dict[consul_hostname]
+        watch_cache = self._cclr_watch_cache([lock_key_path],
+                                             consul_hostname=consul_hostname)
+        if watch_cache is not None:
+            return watch_cache.cwc_get_watcher(log, lock_key_path)
+
+        agent = self._cclr_get_agent(log, consul_hostname=consul_hostname)
+        if agent is None:
+            return -1, None
 
         ret, session = agent.csa_get_lock_session(log, lock_key_path)
         if ret is None:
@@ -892,6 +1501,99 @@ class ConsulCluster():
             return -1, None
         return 0, node
 
+    def cclr_get_configs_and_watchers(self, log, config_key_paths,
+                                      lock_key_paths, prefix=None,
+                                      consul_hostname=None):
+        """
+        Get the yaml configs and the watchers of lock keys with a few
+        requests instead of requests for each key.
+
+        If prefix is specified, all keys should be under the prefix and a
+        single recursive request of the prefix will be sent. Otherwise,
+        transactions will be used to get the keys.
+
+        Return (0, config_dict, watcher_dict). Key of config_dict is the
+        config key path, value is the config (None if not exist). Key of
+        watcher_dict is the lock key path, value is the watcher hostname
+        (None if no watcher). A key that failed to be parsed or resolved is
+        left out of the dicts, so the caller can report it as an error and
+        still use the other keys. Return (negative, None, None) if the
+        request failed.
+        """
+        # pylint: disable=too-many-locals,too-many-branches
+        watch_cache = self._cclr_watch_cache(config_key_paths + lock_key_paths,
+                                             consul_hostname=consul_hostname)
+        if watch_cache is not None:
+            return watch_cache.cwc_get_configs_and_watchers(log,
+                                                            config_key_paths,
+                                                            lock_key_paths)
+
+        agent = self._cclr_get_agent(log, consul_hostname=consul_hostname)
+        if agent is None:
+            return -1, None, None
+
+        if prefix is not None:
+            ret, kv_dict = agent.csa_get_kv_tree(log, prefix)
+        else:
+            ret, kv_dict = agent.csa_get_kv_dicts(log, config_key_paths +
+                                                  lock_key_paths)
+        if ret:
+            log.cl_error("failed to get KVs from Consul")
+            return -1, None, None
+
+        config_dict = {}
+        for key_path in config_key_paths:
+            if key_path not in kv_dict:
+                config_dict[key_path] = None
+                continue
+            encoded_value = kv_dict[key_path].get(CONSUL_KV_STR_VALUE)
+            ret, value = consul_kv_decode_value(log, key_path, encoded_value)
+            if ret:
+                continue
+            ret, config = consul_load_config(log, key_path, value)
+            if ret:
+                continue
+            config_dict[key_path] = config
+
+        session_nodes = None
+        watcher_dict = {}
+        for key_path in lock_key_paths:
+            if key_path not in kv_dict:
+                watcher_dict[key_path] = None
+                continue
+            reply_dict = kv_dict[key_path]
+            if CONSUL_KV_STR_SESSION not in reply_dict:
+                watcher_dict[key_path] = None
+                continue
+            session = reply_dict[CONSUL_KV_STR_SESSION]
+            if session_nodes is None:
+                session_nodes = agent.csa_get_session_nodes(log)
+                if session_nodes is None:
+                    log.cl_error("failed to get nodes of sessions, unable "
+                                 "to get the holder of key [%s]", key_path)
+                    # Do not retry for each key
+                    session_nodes = False
+            if session_nodes is False:
+                continue
+            # The session might be destroyed after the KV request.
+            watcher_dict[key_path] = session_nodes.get(session)
+        return 0, config_dict, watcher_dict
+
+
+def consul_load_config(log, key_path, value):
+    """
+    Load the yaml config from the value of a key.
+    Return (0, config), (negative, None) on error.
+    """
+    try:
+        config = yaml.load(value, Loader=yaml.FullLoader)
+    except:
+        log.cl_error("failed to load [%s] of key [%s] on as yaml file: %s",
+                     value, key_path,
+                     traceback.format_exc())
+        return -1, None
+    return 0, config
+
 
 # Consul is alive
 CONSUL_STATUS_ALIVE = "alive"
@@ -907,20 +1609,36 @@ CONSUL_STATUS_INVALID = "invalid"
 CONSUL_STATUS_HOST_DOWN = "down"
 
 
-def host_consul_status(log, host):
+def host_consul_status_commands():
+    """
+    Return the commands that host_consul_status() runs on the host
+    """
+    return ["systemctl status consul", "consul members"]
+
+
+def host_consul_status(log, host, results=None):
     """
     Return status of Consul
+
+    If results is not None, it is the results of the commands from
+    host_consul_status_commands() that the caller has run in a batch.
     """
     # pylint: disable=no-self-use
-    command = ("systemctl status consul")
-    retval = host.sh_run(log, command)
+    commands = host_consul_status_commands()
+    if results is None:
+        results = host.sh_run_batch(log, commands)
+        if results is None:
+            log.cl_error("failed to check Consul on host [%s]",
+                         host.sh_hostname)
+            return CONSUL_STATUS_ERROR
+
+    retval = results[0]
     if retval.cr_exit_status:
         log.cl_error("Consul service is not up on host [%s]",
                      host.sh_hostname)
         return CONSUL_STATUS_INACVITE
 
-    command = ("consul members")
-    retval = host.sh_run(log, command)
+    retval = results[1]
     if retval.cr_exit_status:
         log.cl_error("cannot connect to Consul cluster on host [%s]",
                      host.sh_hostname)
@@ -7,6 +7,7 @@ from pycoral import constant
 from pycoral import os_distro
 from pycoral import release_info
 from pycoral import parallel
+from pycoral import fanout
 
 
 def _generate_version_dir(group_dir, version):
@@ -791,9 +792,11 @@ class CoralArtifact():
             return None
         return rinfo
 
-    def _cra_artifact_send(self, log, local_host, host):
+    def _cra_artifact_send(self, log, local_host, host, source_host=None):
         """
         Send this artifact from local host to a remote host.
+        If source_host is not None, send from that host which already has
+        this artifact.
         """
         group = self.cra_group
         artifact_name = self.cra_artifact_name
@@ -812,52 +815,45 @@ class CoralArtifact():
         if rinfo is None:
             return -1
 
+        if source_host is None:
+            source_host = local_host
         ret = rinfo.rli_files_send(log, local_host, self.cra_artifact_dir,
-                                   host, self.cra_artifact_dir)
+                                   host, self.cra_artifact_dir,
+                                   source_host=source_host)
         if ret:
-            log.cl_error("failed to send artifact [%s] from local host [%s] "
+            log.cl_error("failed to send artifact [%s] from host [%s] "
                          "to host [%s]",
                          self.cra_artifact_dir,
-                         local_host.sh_hostname,
+                         source_host.sh_hostname,
                          host.sh_hostname)
             return -1
         return 0
 
-    def _cra_artifact_send_in_thread(self, log, workspace, local_host, host):
-        """
-        Send the artifact in a parallel thread
-        """
-        # pylint: disable=unused-argument
-        return self._cra_artifact_send(log, local_host, host)
-
     def cra_artifact_spread(self, log, local_host, workspace, remote_hosts,
-                            parallelism=8):
-        """
-        Spread this artifact from local host to remote hosts.
-        """
-        args_array = []
-        thread_ids = []
-        for remote_host in remote_hosts:
-            args = (local_host, remote_host)
-            args_array.append(args)
-            hostname = remote_host.sh_hostname
-            thread_id = "artifact_spread_%s" % hostname
-            thread_ids.append(thread_id)
-
-        parallel_execute = parallel.ParallelExecute(workspace,
-                                                    "artifact_spread",
-                                                    self._cra_artifact_send_in_thread,
-                                                    args_array,
-                                                    thread_ids=thread_ids)
-
-        ret = parallel_execute.pe_run(log, parallelism=parallelism)
+                            parallelism=8,
+                            source_parallelism=fanout.FANOUT_SOURCE_PARALLELISM):
+        """
+        Spread this artifact from local host to remote hosts. The hosts
+        that got the artifact send it to the other hosts.
+        """
+        def send_funct(log, source_host, host):
+            """
+            Send the artifact from the source host to the host.
+            """
+            return self._cra_artifact_send(log, local_host, host,
+                                           source_host=source_host)
+
+        artifact_fanout = fanout.Fanout("artifact_spread", local_host,
+                                        send_funct,
+                                        source_parallelism=source_parallelism)
+        ret = artifact_fanout.fo_run(log, workspace, remote_hosts,
+                                     parallelism=parallelism)
         if ret:
             log.cl_error("failed to spread artifact [%s] to hosts",
                          self.cra_artifact_name)
             return -1
         return 0
 
-
 def generate_artifact_name(log, group_name, release_name, distro_short,
                            target_cpu, tag=constant.CORAL_TAG_PLAIN):
     """
@@ -0,0 +1,288 @@
+"""
+Library to spread files from local host to many hosts. The hosts that
+have received the files serve as sources of the other hosts, so the
+bandwidth of local host does not limit the speed of spreading.
+
+DO NOT import any library that needs extra python package,
+since this might cause failure of commands that uses this
+library to install python packages.
+"""
+import threading
+from pycoral import parallel
+from pycoral import checksum_manifest
+
+# The max number of hosts a source sends files to at the same time
+FANOUT_SOURCE_PARALLELISM = 4
+# The max number of hosts receiving files at the same time
+FANOUT_PARALLELISM = 32
+
+
+class FanoutSource():
+    """
+    A host that files can be sent from.
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, host):
+        # The host has the files
+        self.fs_host = host
+        # Number of hosts that files are being sent to from this host
+        self.fs_sending = 0
+
+
+class FanoutTarget():
+    """
+    A host that files will be sent to.
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, host):
+        # The host to send files to
+        self.ft_host = host
+        # FanoutSource chosen before starting to send
+        self.ft_source = None
+
+
+class Fanout():
+    """
+    Spread files from local host to many hosts through a tree.
+
+    If sending from a host that has received the files fails, e.g. because
+    the hosts do not trust each other, the rest of the hosts get the files
+    from local host directly.
+    """
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    def __init__(self, name, local_host, send_funct,
+                 source_parallelism=FANOUT_SOURCE_PARALLELISM,
+                 peer=True):
+        # Name of the fanout, used as the name of the ParallelExecute
+        self.fo_name = name
+        # Local host that has the files at the beginning
+        self.fo_local_host = local_host
+        # Function to send the files, the arguments are
+        # (log, source_host, host). Return 0 on success, negative on error.
+        self.fo_send_funct = send_funct
+        # The max number of hosts a source sends files to at the same time
+        self.fo_source_parallelism = source_parallelism
+        # Whether the hosts that received the files serve as sources
+        self.fo_peer = peer
+        # Source of the local host
+        self.fo_local_source = FanoutSource(local_host)
+        # List of FanoutSource
+        self.fo_sources = [self.fo_local_source]
+        # Lock to protect fo_sources and fs_sending
+        self.fo_lock = threading.Lock()
+
+    def _fo_start_check(self, parallel_thread, running_threads):
+        """
+        Choose the least busy source for the target. Return False if all
+        sources are busy.
+        """
+        # pylint: disable=unused-argument
+        target = parallel_thread.pt_args[0]
+        with self.fo_lock:
+            chosen = None
+            for source in self.fo_sources:
+                if source.fs_sending >= self.fo_source_parallelism:
+                    continue
+                if chosen is None or source.fs_sending < chosen.fs_sending:
+                    chosen = source
+            if chosen is None:
+                return False
+            chosen.fs_sending += 1
+            target.ft_source = chosen
+        return True
+
+    def _fo_send(self, log, workspace, target):
+        """
+        Send the files to the target in a parallel thread.
+        """
+        # pylint: disable=unused-argument
+        host = target.ft_host
+        with self.fo_lock:
+            source = target.ft_source
+            if source is None:
+                source = self.fo_local_source
+                source.fs_sending += 1
+        source_host = source.fs_host
+        log.cl_debug("sending [%s] from host [%s] to host [%s]",
+                     self.fo_name, source_host.sh_hostname,
+                     host.sh_hostname)
+        ret = self.fo_send_funct(log, source_host, host)
+        with self.fo_lock:
+            source.fs_sending -= 1
+        if ret and source is not self.fo_local_source:
+            log.cl_warning("failed to send [%s] from host [%s] to host [%s], "
+                           "sending from local host [%s] from now on",
+                           self.fo_name, source_host.sh_hostname,
+                           host.sh_hostname, self.fo_local_host.sh_hostname)
+            with self.fo_lock:
+                self.fo_peer = False
+                self.fo_sources = [self.fo_local_source]
+            ret = self.fo_send_funct(log, self.fo_local_host, host)
+        if ret:
+            log.cl_error("failed to send [%s] to host [%s]",
+                         self.fo_name, host.sh_hostname)
+            return -1
+
+        with self.fo_lock:
+            if self.fo_peer:
+                self.fo_sources.append(FanoutSource(host))
+        return 0
+
+    def fo_run(self, log, workspace, hosts, parallelism=FANOUT_PARALLELISM):
+        """
+        Send the files to the hosts.
+        """
+        args_array = []
+        thread_ids = []
+        hostnames = [self.fo_local_host.sh_hostname]
+        for host in hosts:
+            if host.sh_hostname in hostnames:
+                continue
+            hostnames.append(host.sh_hostname)
+            args_array.append((FanoutTarget(host),))
+            thread_ids.append("fanout_%s" % host.sh_hostname)
+        if len(args_array) == 0:
+            return 0
+
+        parallel_execute = parallel.ParallelExecute(workspace,
+                                                    self.fo_name,
+                                                    self._fo_send,
+                                                    args_array,
+                                                    thread_ids=thread_ids)
+        ret = parallel_execute.pe_run(log, parallelism=parallelism,
+                                      start_check_func=self._fo_start_check)
+        if ret:
+            log.cl_error("failed to send [%s] to hosts", self.fo_name)
+            return -1
+        return 0
+
+
+def _dir_delta_fpaths(source_checksums, dest_checksums):
+    """
+    Return (changed_fpaths, removed_fpaths) of the dest dir compared to the
+    source dir.
+    """
+    changed_fpaths = []
+    for relative_fpath, sha1sum in source_checksums.items():
+        if dest_checksums.get(relative_fpath) != sha1sum:
+            changed_fpaths.append(relative_fpath)
+    removed_fpaths = []
+    for relative_fpath in dest_checksums:
+        if relative_fpath not in source_checksums:
+            removed_fpaths.append(relative_fpath)
+    return changed_fpaths, removed_fpaths
+
+
+def _host_run(log, host, command, stdin=None):
+    """
+    Run a command on the host. Return 0 on success, negative on error.
+    """
+    retval = host.sh_run(log, command, stdin=stdin)
+    if retval.cr_exit_status:
+        log.cl_error("failed to run command [%s] on host [%s], "
+                     "ret = [%d], stdout = [%s], stderr = [%s]",
+                     command,
+                     host.sh_hostname,
+                     retval.cr_exit_status,
+                     retval.cr_stdout,
+                     retval.cr_stderr)
+        return -1
+    return 0
+
+
+def dir_send_delta(log, source_host, source_dir, host, dest_dir,
+                   source_checksums, from_local=False, bwlimit=None):
+    """
+    Sync a dir from the source host to the host. Only the files that differ
+    from the sha1sums of the source are sent, the files that do not exist
+    in source are removed.
+    """
+    # pylint: disable=too-many-arguments
+    if not from_local and not source_host.sh_peer_trusted(log, host):
+        log.cl_warning("host [%s] is not able to SSH to host [%s] without "
+                       "password", source_host.sh_hostname, host.sh_hostname)
+        return -1
+
+    ret = _host_run(log, host, "mkdir -p %s" % dest_dir)
+    if ret:
+        return -1
+
+    dest_checksums = checksum_manifest.dir_checksums(log, host, dest_dir)
+    if dest_checksums is None:
+        log.cl_error("failed to get checksums of dir [%s] on host [%s]",
+                     dest_dir, host.sh_hostname)
+        return -1
+
+    changed_fpaths, removed_fpaths = _dir_delta_fpaths(source_checksums,
+                                                       dest_checksums)
+    if len(changed_fpaths) == 0 and len(removed_fpaths) == 0:
+        log.cl_info("dir [%s] on host [%s] is up to date",
+                    dest_dir, host.sh_hostname)
+        return 0
+
+    if len(removed_fpaths) > 0:
+        ret = _host_run(log, host, "cd %s && xargs -0 rm -f --" % dest_dir,
+                        stdin="\0".join(removed_fpaths) + "\0")
+        if ret:
+            return -1
+
+    if len(changed_fpaths) == 0:
+        return 0
+
+    log.cl_info("sending [%d/%d] changed files of dir [%s] from host [%s] "
+                "to host [%s]", len(changed_fpaths), len(source_checksums),
+                source_dir, source_host.sh_hostname, host.sh_hostname)
+    if from_local:
+        ret = host.sh_send_file(log, source_dir + "/", dest_dir,
+                                bwlimit=bwlimit,
+                                relative_fpaths=changed_fpaths)
+    else:
+        ret = source_host.sh_send_file(log, source_dir + "/", dest_dir,
+                                       from_local=False, remote_host=host,
+                                       bwlimit=bwlimit,
+                                       relative_fpaths=changed_fpaths)
+    if ret:
+        log.cl_error("failed to send dir [%s] on host [%s] to dir [%s] on "
+                     "host [%s]", source_dir, source_host.sh_hostname,
+                     dest_dir, host.sh_hostname)
+        return -1
+    return 0
+
+
+def dir_fanout(log, local_host, workspace, source_dir, hosts, dest_dir=None,
+               source_parallelism=FANOUT_SOURCE_PARALLELISM,
+               parallelism=FANOUT_PARALLELISM, bwlimit=None, peer=True):
+    """
+    Spread a dir on local host to the hosts. Unchanged files are skipped
+    according to the sha1sums. If dest_dir is None, the dir will be synced
+    to the same path on the hosts.
+    If bwlimit is not None, every sending is limited to bwlimit KiB/s.
+    """
+    # pylint: disable=too-many-arguments
+    if dest_dir is None:
+        dest_dir = source_dir
+    source_checksums = checksum_manifest.dir_checksums(log, local_host,
+                                                  source_dir)
+    if source_checksums is None:
+        log.cl_error("failed to get checksums of dir [%s] on local host [%s]",
+                     source_dir, local_host.sh_hostname)
+        return -1
+
+    def send_funct(log, source_host, host):
+        """
+        Send the dir from the source host, which is either local host or
+        a host that has already got the dir.
+        """
+        from_local = source_host is local_host
+        if from_local:
+            sending_dir = source_dir
+        else:
+            sending_dir = dest_dir
+        return dir_send_delta(log, source_host, sending_dir, host, dest_dir,
+                              source_checksums, from_local=from_local,
+                              bwlimit=bwlimit)
+
+    fanout = Fanout("fanout_%s" % source_dir.strip("/").replace("/", "_"),
+                    local_host, send_funct,
+                    source_parallelism=source_parallelism, peer=peer)
+    return fanout.fo_run(log, workspace, hosts, parallelism=parallelism)
@@ -14,6 +14,7 @@ from pycoral import ssh_host
 from pycoral import os_distro
 from pycoral import constant
 from pycoral import parallel
+from pycoral import fanout
 from pycoral import yum_mirror
 from pycoral import apt_mirror
 from pycoral import pip_mirror
@@ -308,6 +309,8 @@ class CoralInstallHost():
         self.cih_config_rsyslog = config_rsyslog
         # Whether to send ISO dir from local host
         self.cih_send_iso_dir = send_iso_dir
+        # Whether ISO dir has been sent by the cluster through fanout
+        self.cih_iso_dir_sent = False
         # The relative file path patterns to send from ISO dir of local host. None if not send.
         self.cih_send_relative_path_patterns = send_relative_path_patterns
         # The RPM names to uninstall first. By putting a same RPM in
@@ -325,7 +328,7 @@ class CoralInstallHost():
         iso_dir = cluster.cic_iso_dir
         host = self.cih_host
         local_host = self.cih_cluster.cic_local_host
-        if self.cih_is_local:
+        if self.cih_is_local or self.cih_iso_dir_sent:
             return 0
 
         log.cl_info("syncing ISO dir from local host [%s] "
@@ -784,31 +787,14 @@ class CoralInstallHost():
         log.cl_error("package packages install not implemented")
         return -1
 
-    def cih_install(self, log):
+    def cih_prepare(self, log):
         """
-        Install the RPMs and pip packages on a host, and send the files
-        :param send_fpath_dict: key is the fpath on localhost, value is the
-        fpath on remote host.
+        Check the distro of the host and prepare the system settings before
+        sending the ISO dir and installing.
         """
-        # pylint: disable=too-many-statements,too-many-branches,too-many-locals
         cluster = self.cih_cluster
-        disable_selinux = self.cih_disable_selinux
-        disable_firewalld = self.cih_disable_firewalld
-        change_sshd_max_startups = self.cih_change_sshd_max_startups
-        pip_names = self.cih_pip_names
-        package_names = self.cih_package_names
-        send_fpath_dict = self.cih_send_fpath_dict
-        fpaths_need_backup = self.cih_fpaths_need_backup
-        coral_reinstall = self.cih_coral_reinstall
-        config_rsyslog = self.cih_config_rsyslog
-        send_iso_dir = self.cih_send_iso_dir
-        send_relative_path_patterns = self.cih_send_relative_path_patterns
-        uninstall_package_names = self.cih_uninstall_package_names
-        install_iso_package_patterns = self.cih_install_iso_package_patterns
         host = self.cih_host
         hostname = host.sh_hostname
-        cluster = self.cih_cluster
-        workspace = cluster.cic_workspace
         distro = host.sh_distro(log)
         local_host = cluster.cic_local_host
         if distro is None:
@@ -828,34 +814,57 @@ class CoralInstallHost():
                          distro, hostname)
             return -1
 
-        if config_rsyslog:
+        if self.cih_config_rsyslog:
             ret = self._cih_config_rsyslog(log)
             if ret:
                 log.cl_error("failed to configure rsyslog on host [%s]",
                              hostname)
                 return -1
 
-        if disable_selinux:
+        if self.cih_disable_selinux:
             ret = self._cih_disable_selinux(log)
             if ret:
                 log.cl_error("failed to disable SELinux on host [%s]",
                              hostname)
                 return -1
 
-        if disable_firewalld:
+        if self.cih_disable_firewalld:
             ret = self._cih_disable_firewalld(log)
             if ret:
                 log.cl_error("failed to disable firewalld on host [%s]",
                              hostname)
                 return -1
 
-        if change_sshd_max_startups:
+        if self.cih_change_sshd_max_startups:
             ret = self._cih_change_sshd_max_startups(log)
             if ret:
                 log.cl_error("failed to change MaxStartups of sshd on host [%s]",
                              hostname)
                 return -1
+        return 0
 
+    def cih_install(self, log):
+        """
+        Install the RPMs and pip packages on a host, and send the files.
+        cih_prepare() should have been called before.
+        :param send_fpath_dict: key is the fpath on localhost, value is the
+        fpath on remote host.
+        """
+        # pylint: disable=too-many-statements,too-many-branches,too-many-locals
+        pip_names = self.cih_pip_names
+        package_names = self.cih_package_names
+        send_fpath_dict = self.cih_send_fpath_dict
+        fpaths_need_backup = self.cih_fpaths_need_backup
+        coral_reinstall = self.cih_coral_reinstall
+        send_iso_dir = self.cih_send_iso_dir
+        send_relative_path_patterns = self.cih_send_relative_path_patterns
+        uninstall_package_names = self.cih_uninstall_package_names
+        install_iso_package_patterns = self.cih_install_iso_package_patterns
+        host = self.cih_host
+        hostname = host.sh_hostname
+        cluster = self.cih_cluster
+        workspace = cluster.cic_workspace
+        local_host = cluster.cic_local_host
         if send_iso_dir:
             ret = self._cih_send_iso_dir(log)
             if ret:
@@ -1274,6 +1283,19 @@ class CoralInstallHostDeb(CoralInstallHost):
         return 0
 
 
+def cluster_host_prepare(log, workspace, install_host):
+    """
+    Prepare a host of CoralInstallCluster before installing
+    """
+    # pylint: disable=unused-argument
+    ret = install_host.cih_prepare(log)
+    if ret:
+        log.cl_error("failed to prepare host [%s]",
+                     install_host.cih_host.sh_hostname)
+        return -1
+    return 0
+
+
 def cluster_host_install(log, workspace, install_host):
     """
     Install on a host of CoralInstallCluster
@@ -1288,7 +1310,7 @@ def cluster_host_install(log, workspace, install_host):
 
 
 class CoralInstallCluster():
-    # pylint: disable=too-few-public-methods
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
     """
     Install cluster config.
     :param workspace: The workspace on local and remote host
@@ -1311,6 +1333,11 @@ class CoralInstallCluster():
         self.cic_local_host = local_host
         # The type of CoralInstallHost
         self.cic_host_type = host_type
+        # The max number of hosts a host sends ISO dir to at the same time
+        self.cic_fanout_source_parallelism = fanout.FANOUT_SOURCE_PARALLELISM
+        # The bandwidth limit in KiB/s of each sending of ISO dir, None if
+        # no limit
+        self.cic_fanout_bwlimit = None
 
     def cic_hosts_add(self, log, hosts,
                       pip_names=None,
@@ -1365,6 +1392,33 @@ class CoralInstallCluster():
             return -1
         return 0
 
+    def _cic_send_iso_dir(self, log, parallelism):
+        """
+        Send ISO dir to the hosts. The hosts that got ISO dir send it to
+        other hosts, and only the changed files are sent.
+        """
+        install_hosts = []
+        for install_host in self.cic_install_hosts:
+            if not install_host.cih_send_iso_dir or install_host.cih_is_local:
+                continue
+            install_hosts.append(install_host)
+        if len(install_hosts) == 0:
+            return 0
+
+        hosts = [install_host.cih_host for install_host in install_hosts]
+        ret = fanout.dir_fanout(log, self.cic_local_host, self.cic_workspace,
+                                self.cic_iso_dir, hosts,
+                                source_parallelism=self.cic_fanout_source_parallelism,
+                                parallelism=parallelism,
+                                bwlimit=self.cic_fanout_bwlimit)
+        if ret:
+            log.cl_error("failed to send ISO dir [%s] to hosts",
+                         self.cic_iso_dir)
+            return -1
+        for install_host in install_hosts:
+            install_host.cih_iso_dir_sent = True
+        return 0
+
     def cic_install(self, log, parallelism=10):
         """
         Install packages, PIP libs and send files
@@ -1390,12 +1444,31 @@ class CoralInstallCluster():
             return -1
 
         args_array = []
+        prepare_thread_ids = []
         thread_ids = []
         for install_host in self.cic_install_hosts:
             args = (install_host,)
             args_array.append(args)
-            thread_id = "host_install_%s" % install_host.cih_host.sh_hostname
-            thread_ids.append(thread_id)
+            hostname = install_host.cih_host.sh_hostname
+            prepare_thread_ids.append("host_prepare_%s" % hostname)
+            thread_ids.append("host_install_%s" % hostname)
+
+        # Check the distros and fix sshd before the hosts send ISO dir to
+        # each other
+        parallel_execute = parallel.ParallelExecute(self.cic_workspace,
+                                                    "prepare",
+                                                    cluster_host_prepare,
+                                                    args_array,
+                                                    thread_ids=prepare_thread_ids)
+        ret = parallel_execute.pe_run(log, parallelism=parallelism)
+        if ret:
+            log.cl_error("failed to prepare hosts in parallel")
+            return -1
+
+        ret = self._cic_send_iso_dir(log, parallelism)
+        if ret:
+            log.cl_error("failed to send ISO dir to hosts")
+            return -1
 
         parallel_execute = parallel.ParallelExecute(self.cic_workspace,
                                                     "install",
@@ -0,0 +1,83 @@
+"""
+Library for importing modules on demand, so that commands do not spend
+time on importing the modules that they do not use.
+
+DO NOT import any library that needs extra python package,
+since this might cause failure of commands that uses this
+library to install python packages.
+"""
+import types
+import threading
+import importlib
+import importlib.util
+
+
+class LazyModule():
+    """
+    A module that is imported when one of its attributes is first used.
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, name):
+        # Name of the module
+        self._lm_name = name
+        # The imported module
+        self._lm_module = None
+        # Lock to protect _lm_module
+        self._lm_lock = threading.Lock()
+
+    def __getattr__(self, attr_name):
+        module = self._lm_module
+        if module is None:
+            with self._lm_lock:
+                if self._lm_module is None:
+                    self._lm_module = importlib.import_module(self._lm_name)
+                module = self._lm_module
+        return getattr(module, attr_name)
+
+
+def lazy_module(name):
+    """
+    Return a LazyModule of the module name. ImportError is still raised
+    here if the module does not exist, so missing packages are found as
+    early as usual.
+    """
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError("No module named '%s'" % name, name=name)
+    return LazyModule(name)
+
+
+class LazyCommand():
+    """
+    A sub-command of Fire whose module is imported only when the sub-command
+    is used. The attribute could be a command class or a function that has
+    the command as the first argument. The owner of command classes should
+    define _lazy_command_init(command) to init the command.
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, module_name, attr_name):
+        # Name of the module that defines the sub-command
+        self.lc_module_name = module_name
+        # Name of the class or function in the module
+        self.lc_attr_name = attr_name
+        # Name of the sub-command in the owner
+        self.lc_name = None
+
+    def __set_name__(self, owner, name):
+        self.lc_name = name
+
+    def __get__(self, instance, owner):
+        module = importlib.import_module(self.lc_module_name)
+        attr = getattr(module, self.lc_attr_name)
+        if isinstance(attr, type):
+            command = attr()
+            if instance is None:
+                return command
+            # pylint: disable=protected-access
+            instance._lazy_command_init(command)
+        elif instance is None:
+            return attr
+        else:
+            command = types.MethodType(attr, instance)
+        # Cache the command in the instance so that it is inited only once
+        instance.__dict__[self.lc_name] = command
+        return command
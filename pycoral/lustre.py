@@ -4,9 +4,13 @@ Library for Lustre file system management
 # pylint: disable=too-many-lines
 import re
 import os
+import time
+import threading
+import traceback
 
 # Local libs
 from pycoral import utils
+from pycoral import parallel
 from pycoral import os_distro
 from pycoral import ssh_host
 from pycoral import constant
@@ -23,6 +27,14 @@ BACKFSTYPE_ZFS = "zfs"
 BACKFSTYPE_LDISKFS = "ldiskfs"
 
 LUSTRE_SERVICE_STATUS_CHECK_INTERVAL = 10
+# Seconds that a snapshot of mounts/labels/zpools on a host is valid
+LUSTRE_HOST_SNAPSHOT_TTL = 3
+# Max number of services/clients operated at the same time
+LUSTRE_OPERATION_PARALLELISM = 32
+# Max number of services/clients operated on a host at the same time
+LUSTRE_HOST_OPERATION_PARALLELISM = 4
+# Number of the slowest operations to report
+LUSTRE_OPERATION_REPORT_SLOWEST = 5
 
 # The dir path of Lustre test scripts
 LUSTRE_TEST_SCRIPT_DIR = "/usr/lib64/lustre/tests"
@@ -158,6 +170,43 @@ def lustre_mdt_index2string(index_number):
     return "MDT%04x" % index_number
 
 
+def lustre_local_server_mounts(log, mounts_fpath="/proc/mounts"):
+    """
+    Return the Lustre server mounts on local host by reading /proc/mounts
+    directly. Key is mount point, value is a tuple of (device, options).
+    Return None on error.
+    """
+    try:
+        with open(mounts_fpath, encoding="utf-8") as mounts_file:
+            lines = mounts_file.readlines()
+    except OSError as error:
+        log.cl_error("failed to read file [%s]: %s", mounts_fpath, error)
+        return None
+
+    mounts = {}
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 4 or fields[2] != "lustre":
+            continue
+        device = fields[0]
+        # Skip the clients
+        if ":/" in device:
+            continue
+        mounts[fields[1]] = (device, fields[3])
+    return mounts
+
+
+def lustre_mount_option_svname(options):
+    """
+    Return the service name in the options of Lustre server mount, e.g.
+    "svname=lustre-OST000e". Return None if not found.
+    """
+    for option in options.split(","):
+        if option.startswith("svname="):
+            return option[len("svname="):].replace(":", "-")
+    return None
+
+
 def check_service_name(log, service_name, is_ost=False):
     """
     Return 0 if the service name is valid
@@ -303,6 +352,7 @@ class LustreServiceInstance():
                             command, hostname)
             else:
                 retval = host.sh_run(log, command, timeout=10)
+                host.lsh_snapshot_invalidate()
                 if retval.cr_exit_status:
                     log.cl_error("failed to run command [%s] on host [%s], "
                                  "ret = [%d], stdout = [%s], stderr = [%s]",
@@ -346,6 +396,7 @@ class LustreServiceInstance():
                         zpool_create, hostname)
         else:
             retval = host.sh_run(log, zpool_create)
+            host.lsh_snapshot_invalidate()
             if retval.cr_exit_status:
                 log.cl_error("failed to run command [%s] on host [%s], "
                              "ret = [%d], stdout = [%s], stderr = [%s]",
@@ -432,6 +483,7 @@ class LustreServiceInstance():
             return 0
 
         retval = host.sh_run(log, command, timeout=None)
+        host.lsh_snapshot_invalidate()
         if retval.cr_exit_status:
             log.cl_error("failed to run command [%s] on host [%s], "
                          "ret = [%d], stdout = [%s], stderr = [%s]",
@@ -524,6 +576,7 @@ class LustreServiceInstance():
 
         command = ("zpool %s %s%s" % (operate, service.ls_zpool_name, force))
         retval = host.sh_run(log, command)
+        host.lsh_snapshot_invalidate()
         if retval.cr_exit_status:
             log.cl_error("failed to run command [%s] on host [%s], "
                          "ret = [%d], stdout = [%s], stderr = [%s]",
@@ -587,6 +640,7 @@ class LustreServiceInstance():
         command = ("mount -t lustre%s %s %s" %
                    (option, self.lsi_device, self.lsi_mnt))
         retval = host.sh_run(log, command)
+        host.lsh_snapshot_invalidate()
         if retval.cr_exit_status:
             log.cl_error("failed to run command [%s] on host [%s], "
                          "ret = [%d], stdout = [%s], stderr = [%s]",
@@ -614,6 +668,7 @@ class LustreServiceInstance():
 
         command = ("umount %s" % (self.lsi_mnt))
         retval = host.sh_run(log, command)
+        host.lsh_snapshot_invalidate()
         if retval.cr_exit_status:
             log.cl_error("failed to run command [%s] on host [%s], "
                          "ret = [%d], stdout = [%s], stderr = [%s]",
@@ -667,26 +722,25 @@ class LustreServiceInstance():
         mgs_regular = re.compile(mgs_pattern)
 
         # Detect Lustre services
-        command = ("cat /proc/mounts")
-        retval = host.sh_run(log, command)
-        if retval.cr_exit_status != 0:
-            log.cl_error("failed to run command [%s] on host [%s], "
-                         "ret = [%d], stdout = [%s], stderr = [%s]",
-                         command, hostname,
-                         retval.cr_exit_status,
-                         retval.cr_stdout,
-                         retval.cr_stderr)
+        snapshot = host.lsh_get_snapshot(log)
+        if snapshot is None:
+            log.cl_error("failed to get snapshot of host [%s]",
+                         hostname)
             return -1
 
-        ret, real_device = self._lsi_real_device(log)
-        if ret:
-            log.cl_error("failed to get the real service device of service "
-                         "[%s] on host [%s]",
-                         service_name, hostname)
-            return -1
+        if (service.ls_backfstype != BACKFSTYPE_ZFS and
+                self.lsi_device in snapshot.lhs_realpath_dict):
+            real_device = snapshot.lhs_realpath_dict[self.lsi_device]
+        else:
+            ret, real_device = self._lsi_real_device(log)
+            if ret:
+                log.cl_error("failed to get the real service device of service "
+                             "[%s] on host [%s]",
+                             service_name, hostname)
+                return -1
 
         ret = 0
-        for line in retval.cr_stdout.splitlines():
+        for line in snapshot.lhs_mount_lines:
             # log.cl_debug("checking line [%s]", line)
             match = server_regular.match(line)
             if not match:
@@ -717,8 +771,8 @@ class LustreServiceInstance():
                     return -1
                 continue
 
-            label = host.lsh_lustre_device_service_name(log, device,
-                                                        backfstype=self.lsi_service.ls_backfstype)
+            label = host.lsh_snapshot_service_name(log, snapshot, device,
+                                                   backfstype=self.lsi_service.ls_backfstype)
             if label is None:
                 log.cl_error("failed to get the label of device [%s] on "
                              "host [%s]", device, hostname)
@@ -778,6 +832,16 @@ class LustreServiceInstance():
         hostname = host.sh_hostname
         service = self.lsi_service
         zpool_name = service.ls_zpool_name
+        snapshot = host.lsh_get_snapshot(log)
+        if snapshot is None:
+            log.cl_error("failed to get snapshot of host [%s]",
+                         hostname)
+            return -1
+        if snapshot.lhs_zpool_names is not None:
+            if zpool_name in snapshot.lhs_zpool_names:
+                return 1
+            return 0
+
         command = "zpool list %s" % zpool_name
         retval = host.sh_run(log, command)
         output = retval.cr_stderr.strip()
@@ -1101,11 +1165,15 @@ class LustreService():
         assert len(mounted_instances) == 1
         return mounted_instances[0]
 
-    def ls_mounted_instance(self, log):
+    def ls_mounted_instance(self, log, down_hostnames=None):
         """
         Return the instance that has been mounted
         If no instance is mounted, return None
+        If down_hostnames is None, check whether the hosts are up first.
         """
+        if down_hostnames is not None:
+            return self._ls_mounted_instance(log,
+                                             down_hostnames=down_hostnames)
         down_hostnames = []
         for instance in self.ls_instance_dict.values():
             host = instance.lsi_host
@@ -1266,6 +1334,218 @@ def init_mgs_instance(log, mgs, host, device, mnt, nid,
     return mgsi
 
 
+class LustreOperation():
+    """
+    An operation (mount/umount/format) on a Lustre service or client that
+    is run by LustreOperationScheduler.
+    """
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    def __init__(self, name, hosts, funct, args=(), kwargs=None):
+        # Name of the service or client
+        self.lo_name = name
+        # The hosts that the operation might run commands on
+        self.lo_hosts = hosts
+        # The first argument of funct should be log, the return value
+        # should be an integer
+        self.lo_funct = funct
+        # The other arguments of funct
+        self.lo_args = args
+        if kwargs is None:
+            kwargs = {}
+        # The keyword arguments of funct
+        self.lo_kwargs = kwargs
+        # Time when the operation started
+        self.lo_time_start = None
+        # Time when the operation finished
+        self.lo_time_finish = None
+        # Return value of the operation, None if not finished
+        self.lo_ret = None
+
+    def lo_elapsed(self):
+        """
+        Return the seconds that the operation took
+        """
+        if self.lo_time_start is None or self.lo_time_finish is None:
+            return None
+        return self.lo_time_finish - self.lo_time_start
+
+
+def lustre_operation_run(log, workspace, operation):
+    """
+    Thread function to run a LustreOperation
+    """
+    # pylint: disable=unused-argument,bare-except
+    operation.lo_time_start = time.time()
+    try:
+        ret = operation.lo_funct(log, *operation.lo_args,
+                                 **operation.lo_kwargs)
+    except:
+        log.cl_error("exception when running operation [%s]: [%s]",
+                     operation.lo_name, traceback.format_exc())
+        ret = -1
+    operation.lo_time_finish = time.time()
+    operation.lo_ret = ret
+    return ret
+
+
+class LustreOperationScheduler():
+    """
+    Run operations on Lustre services and clients stage by stage. The
+    operations in the same stage are independent with each other and are
+    run in parallel, with a limit on the number of operations running on
+    the same host. A stage starts only when all operations of the former
+    stage succeed.
+    """
+    def __init__(self, name, workspace=None,
+                 parallelism=LUSTRE_OPERATION_PARALLELISM,
+                 host_parallelism=LUSTRE_HOST_OPERATION_PARALLELISM):
+        # Name of the scheduler, e.g. mount_lustre0
+        self.los_name = name
+        # Workspace to save logs of threads, default to the results
+        # directory of the log
+        self.los_workspace = workspace
+        # Directory under the workspace to save logs of this scheduler
+        self.los_directory = None
+        self.los_parallelism = parallelism
+        self.los_host_parallelism = host_parallelism
+        # List of (stage name, list of LustreOperation)
+        self.los_stages = []
+
+    def los_stage_add(self, stage_name, operations):
+        """
+        Add a stage of operations
+        """
+        if len(operations) == 0:
+            return
+        self.los_stages.append((stage_name, operations))
+
+    def _los_start_check(self, parallel_thread, running_threads):
+        """
+        Check whether the operation would exceed the limit of its hosts
+        """
+        operation = parallel_thread.pt_args[0]
+        for host in operation.lo_hosts:
+            running = 0
+            for running_thread in running_threads:
+                running_operation = running_thread.pt_args[0]
+                if host in running_operation.lo_hosts:
+                    running += 1
+            if running >= self.los_host_parallelism:
+                return False
+        return True
+
+    def _los_stage_run(self, log, stage_name, operations):
+        """
+        Run the operations of a stage in parallel
+        """
+        if len(operations) == 1:
+            # No need to start a thread for a single operation.
+            return lustre_operation_run(log, None, operations[0])
+
+        if self.los_directory is None:
+            workspace = None
+        else:
+            workspace = self.los_directory + "/" + stage_name
+            ret = utils.mkdir(workspace)
+            if ret:
+                log.cl_error("failed to create directory [%s], errno=[%s]",
+                             workspace, ret)
+                return -1
+
+        args_array = []
+        thread_ids = []
+        for operation in operations:
+            args_array.append((operation,))
+            thread_ids.append(operation.lo_name.replace("/", "_"))
+
+        parallel_execute = parallel.ParallelExecute(workspace,
+                                                    self.los_name + "_" + stage_name,
+                                                    lustre_operation_run,
+                                                    args_array,
+                                                    thread_ids=thread_ids)
+        return parallel_execute.pe_run(log, parallelism=self.los_parallelism,
+                                       start_check_func=self._los_start_check)
+
+    def los_run(self, log):
+        """
+        Run all the stages
+        """
+        workspace = self.los_workspace
+        if workspace is None:
+            workspace = log.cl_resultsdir
+        if workspace is None:
+            self.los_directory = None
+        else:
+            self.los_directory = workspace + "/" + self.los_name
+            ret = utils.mkdir(self.los_directory)
+            if ret:
+                log.cl_error("failed to create directory [%s], errno=[%s]",
+                             self.los_directory, ret)
+                return -1
+
+        time_start = time.time()
+        ret = 0
+        for stage_name, operations in self.los_stages:
+            log.cl_debug("running stage [%s] of [%s] with [%d] operations",
+                         stage_name, self.los_name, len(operations))
+            ret = self._los_stage_run(log, stage_name, operations)
+            if ret:
+                log.cl_error("stage [%s] of [%s] failed, skipping the "
+                             "later stages", stage_name, self.los_name)
+                break
+        self.los_report(log, time.time() - time_start)
+        return ret
+
+    def los_report(self, log, elapsed):
+        """
+        Report the time and failures of the operations
+        """
+        finished = []
+        failed = []
+        not_run = []
+        for _, operations in self.los_stages:
+            for operation in operations:
+                if operation.lo_ret is None:
+                    not_run.append(operation.lo_name)
+                    continue
+                log.cl_debug("[%s] of [%s] returned [%s] after [%.2f] "
+                             "seconds", operation.lo_name, self.los_name,
+                             operation.lo_ret, operation.lo_elapsed())
+                finished.append(operation)
+                if operation.lo_ret:
+                    failed.append(operation.lo_name)
+
+        finished.sort(key=lambda operation: operation.lo_elapsed(),
+                      reverse=True)
+        slowest = []
+        for operation in finished[:LUSTRE_OPERATION_REPORT_SLOWEST]:
+            slowest.append("%s (%.2fs)" % (operation.lo_name,
+                                           operation.lo_elapsed()))
+        log.cl_info("[%s] finished [%d] operations in [%.2f] seconds, "
+                    "slowest: %s", self.los_name, len(finished), elapsed,
+                    ", ".join(slowest))
+        if len(failed) > 0:
+            log.cl_error("[%s] failed on %s", self.los_name, failed)
+        if len(not_run) > 0:
+            log.cl_error("[%s] skipped %s", self.los_name, not_run)
+
+
+def service_operation(service, funct, args=(), kwargs=None):
+    """
+    Return a LustreOperation of a Lustre service
+    """
+    return LustreOperation(service.ls_service_name, service.ls_hosts(),
+                           funct, args=args, kwargs=kwargs)
+
+
+def client_operation(client_index, client, funct, args=(), kwargs=None):
+    """
+    Return a LustreOperation of a Lustre client
+    """
+    return LustreOperation(client_index, [client.lc_host], funct,
+                           args=args, kwargs=kwargs)
+
+
 class LustreFilesystem():
     """
     Each Lustre file system has an object of this type.
@@ -1406,7 +1686,42 @@ class LustreFilesystem():
                     hosts.append(ost_host)
         return hosts
 
-    def lf_format(self, log, format_mgt=False, dryrun=False):
+    def lf_service_stages(self):
+        """
+        Return the list of (stage name, services) in the order of mounting,
+        i.e. MGS -> MDT0 -> other MDTs -> OSTs. Services in the same stage
+        can be operated at the same time.
+        """
+        mdt0s = []
+        mdts = []
+        for mdt in self.lf_mdt_dict.values():
+            if mdt.ls_index == 0 or mdt.lmdt_is_mgs:
+                mdt0s.append(mdt)
+            else:
+                mdts.append(mdt)
+        stages = []
+        if self.lf_mgs is not None:
+            stages.append(("mgs", [self.lf_mgs]))
+        stages.append(("mdt0", mdt0s))
+        stages.append(("mdt", mdts))
+        stages.append(("ost", list(self.lf_ost_dict.values())))
+        return stages
+
+    def lf_client_operations(self, method_name, kwargs=None):
+        """
+        Return the operations that call the method of all clients
+        """
+        operations = []
+        for client_index, client in self.lf_client_dict.items():
+            operation = client_operation(client_index, client,
+                                         getattr(client, method_name),
+                                         kwargs=kwargs)
+            operations.append(operation)
+        return operations
+
+    def lf_format(self, log, format_mgt=False, dryrun=False, workspace=None,
+                  parallelism=LUSTRE_OPERATION_PARALLELISM,
+                  host_parallelism=LUSTRE_HOST_OPERATION_PARALLELISM):
         """
         Format the whole file system.
         :param format_mgt: format the standalone MGT.
@@ -1420,100 +1735,89 @@ class LustreFilesystem():
                          "configured, not able to format", self.lf_fsname)
             return -1
 
-        for service_name, mdt in self.lf_mdt_dict.items():
-            ret = mdt.ls_format(log, dryrun=dryrun)
-            if ret:
-                log.cl_error("failed to format MDT [%s]", service_name)
-                return -1
-
-        for service_name, ost in self.lf_ost_dict.items():
-            ret = ost.ls_format(log, dryrun=dryrun)
-            if ret:
-                log.cl_error("failed to format OST [%s]", service_name)
-                return -1
-
-        if self.lf_mgs is not None and format_mgt:
-            service_name = self.lf_mgs.ls_service_name
-            ret = self.lf_mgs.ls_format(log, dryrun=dryrun)
-            if ret:
-                log.cl_error("failed to format MGT [%s]", service_name)
-                return -1
+        # Formatting does not need any other service, so all services are
+        # formatted in the same stage.
+        operations = []
+        for _, services in self.lf_service_stages():
+            for service in services:
+                if service is self.lf_mgs and not format_mgt:
+                    continue
+                operation = service_operation(service, service.ls_format,
+                                              kwargs={"dryrun": dryrun})
+                operations.append(operation)
+
+        scheduler = LustreOperationScheduler("format_" + self.lf_fsname,
+                                             workspace=workspace,
+                                             parallelism=parallelism,
+                                             host_parallelism=host_parallelism)
+        scheduler.los_stage_add("service", operations)
+        ret = scheduler.los_run(log)
+        if ret:
+            log.cl_error("failed to format file system [%s]",
+                         self.lf_fsname)
+            return -1
         log.cl_debug("formatted file system [%s]", self.lf_fsname)
         return 0
 
-
-    def lf_mount(self, log):
+    def lf_mount(self, log, workspace=None,
+                 parallelism=LUSTRE_OPERATION_PARALLELISM,
+                 host_parallelism=LUSTRE_HOST_OPERATION_PARALLELISM):
         """
         Mount the whole file system
         """
-        # pylint: disable=too-many-branches
         log.cl_info("mounting file system [%s]", self.lf_fsname)
-        if self.lf_mgs is not None:
-            ret = self.lf_mgs.ls_mount(log, quiet=True)
-            if ret:
-                log.cl_error("failed to mount MGS of Lustre file "
-                             "system [%s]", self.lf_fsname)
-                return -1
-
-        for service_name, mdt in self.lf_mdt_dict.items():
-            ret = mdt.ls_mount(log, quiet=True)
-            if ret:
-                log.cl_error("failed to mount MDT [%s] of Lustre file "
-                             "system [%s]", service_name, self.lf_fsname)
-                return -1
-
-        for service_name, ost in self.lf_ost_dict.items():
-            ret = ost.ls_mount(log, quiet=True)
-            if ret:
-                log.cl_error("failed to mount OST [%s] of Lustre file "
-                             "system [%s]", service_name, self.lf_fsname)
-                return -1
-
-        for client_index, client in self.lf_client_dict.items():
-            ret = client.lc_mount(log, quiet=True)
-            if ret:
-                log.cl_error("failed to mount client [%s] of Lustre file "
-                             "system [%s]", client_index, self.lf_fsname)
-                return -1
+        scheduler = LustreOperationScheduler("mount_" + self.lf_fsname,
+                                             workspace=workspace,
+                                             parallelism=parallelism,
+                                             host_parallelism=host_parallelism)
+        for stage_name, services in self.lf_service_stages():
+            operations = []
+            for service in services:
+                operation = service_operation(service, service.ls_mount,
+                                              kwargs={"quiet": True})
+                operations.append(operation)
+            scheduler.los_stage_add(stage_name, operations)
+        scheduler.los_stage_add("client",
+                                self.lf_client_operations("lc_mount",
+                                                          kwargs={"quiet": True}))
+        ret = scheduler.los_run(log)
+        if ret:
+            log.cl_error("failed to mount file system [%s]", self.lf_fsname)
+            return -1
 
         log.cl_debug("mounted file system [%s]", self.lf_fsname)
         return 0
 
-    def lf_umount(self, log, force_umount_mgt=False):
+    def lf_umount(self, log, force_umount_mgt=False, workspace=None,
+                  parallelism=LUSTRE_OPERATION_PARALLELISM,
+                  host_parallelism=LUSTRE_HOST_OPERATION_PARALLELISM):
         """
         Umount the whole file system
         :param force_umount_mgt: umount the standalone MGT.
         """
-        # pylint: disable=too-many-branches
-        for client_index, client in self.lf_client_dict.items():
-            ret = client.lc_umount(log)
-            if ret:
-                log.cl_error("failed to umount client [%s]", client_index)
-                return -1
-
-        for service_name, ost in self.lf_ost_dict.items():
-            ret = ost.ls_umount(log)
-            if ret:
-                log.cl_error("failed to umount OST [%s]", service_name)
-                return -1
-
-        for service_name, mdt in self.lf_mdt_dict.items():
-            ret = mdt.ls_umount(log)
-            if ret:
-                log.cl_error("failed to umount MDT [%s]", service_name)
-                return -1
-
-        if self.lf_mgs is not None:
-            service_name = self.lf_mgs.ls_service_name
-            if ((not force_umount_mgt) and
-                    len(self.lf_mgs.lmgs_filesystems) > 1):
-                log.cl_info("skip umounting MGS [%s] it is shared by "
-                            "another file system", service_name)
-                return 0
-            ret = self.lf_mgs.ls_umount(log)
-            if ret:
-                log.cl_error("failed to umount MGS [%s]", service_name)
-                return -1
+        scheduler = LustreOperationScheduler("umount_" + self.lf_fsname,
+                                             workspace=workspace,
+                                             parallelism=parallelism,
+                                             host_parallelism=host_parallelism)
+        scheduler.los_stage_add("client",
+                                self.lf_client_operations("lc_umount"))
+        for stage_name, services in reversed(self.lf_service_stages()):
+            if stage_name == "mgs":
+                if ((not force_umount_mgt) and
+                        len(self.lf_mgs.lmgs_filesystems) > 1):
+                    log.cl_info("skip umounting MGS [%s] it is shared by "
+                                "another file system",
+                                self.lf_mgs.ls_service_name)
+                    continue
+            operations = []
+            for service in services:
+                operations.append(service_operation(service,
+                                                    service.ls_umount))
+            scheduler.los_stage_add(stage_name, operations)
+        ret = scheduler.los_run(log)
+        if ret:
+            log.cl_error("failed to umount file system [%s]", self.lf_fsname)
+            return -1
         return 0
 
 
@@ -1709,19 +2013,14 @@ class LustreClient():
         client_regular = re.compile(client_pattern)
 
         # Detect Lustre services
-        command = ("cat /proc/mounts")
-        retval = host.sh_run(log, command)
-        if retval.cr_exit_status != 0:
-            log.cl_error("failed to run command [%s] on host [%s], "
-                         "ret = [%d], stdout = [%s], stderr = [%s]",
-                         command, hostname,
-                         retval.cr_exit_status,
-                         retval.cr_stdout,
-                         retval.cr_stderr)
+        snapshot = host.lsh_get_snapshot(log)
+        if snapshot is None:
+            log.cl_error("failed to get snapshot of host [%s]",
+                         hostname)
             return -1
 
         ret = 0
-        for line in retval.cr_stdout.splitlines():
+        for line in snapshot.lhs_mount_lines:
             log.cl_debug("checking line [%s]", line)
             # Skip the Clients
             match = client_regular.match(line)
@@ -1800,6 +2099,7 @@ class LustreClient():
                    (option, nid_string,
                     fsname, self.lc_mnt))
         retval = host.sh_run(log, command)
+        host.lsh_snapshot_invalidate()
         if retval.cr_exit_status:
             log.cl_error("failed to run command [%s] on host [%s], "
                          "ret = [%d], stdout = [%s], stderr = [%s]",
@@ -1839,6 +2139,7 @@ class LustreClient():
 
         command = ("umount %s" % (self.lc_mnt))
         retval = host.sh_run(log, command)
+        host.lsh_snapshot_invalidate()
         if retval.cr_exit_status:
             log.cl_error("failed to run command [%s] on host [%s], "
                          "ret = [%d], stdout = [%s], stderr = [%s]",
@@ -2783,6 +3084,70 @@ def obd_line2device(log, line):
                            obd_name, obd_uuid, refcount)
 
 
+class LustreHostSnapshot():
+    """
+    Snapshot of the Lustre mounts, device labels and imported zpools of a
+    host. All of them are collected by a single command so that checking
+    many services on the same host does not need many round trips.
+    """
+    def __init__(self, host):
+        # LustreHost
+        self.lhs_host = host
+        # Time when the snapshot is collected
+        self.lhs_time = time.time()
+        # Lines of Lustre mounts in /proc/mounts
+        self.lhs_mount_lines = []
+        # Key: device of Lustre server mount, value: label
+        self.lhs_label_dict = {}
+        # Key: configured device, value: "readlink -f" of the device
+        self.lhs_realpath_dict = {}
+        # Names of imported zpools, None if failed to list
+        self.lhs_zpool_names = None
+
+    def lhs_parse(self, log, output):
+        """
+        Parse the output of the snapshot command
+        """
+        for line in output.splitlines():
+            fields = line.split(" ", 1)
+            if len(fields) != 2:
+                if line == "zpools":
+                    self.lhs_zpool_names = []
+                    continue
+                log.cl_error("unexpected line [%s] of snapshot output on "
+                             "host [%s]", line, self.lhs_host.sh_hostname)
+                return -1
+            key, value = fields
+            if key == "mount":
+                self.lhs_mount_lines.append(value)
+                continue
+            if key == "zpool":
+                if self.lhs_zpool_names is not None:
+                    self.lhs_zpool_names.append(value)
+                continue
+            fields = value.split(" ", 1)
+            if len(fields) != 2:
+                log.cl_error("unexpected line [%s] of snapshot output on "
+                             "host [%s]", line, self.lhs_host.sh_hostname)
+                return -1
+            if key == "label":
+                self.lhs_label_dict[fields[0]] = fields[1]
+            elif key == "realpath":
+                self.lhs_realpath_dict[fields[0]] = fields[1]
+            else:
+                log.cl_error("unexpected line [%s] of snapshot output on "
+                             "host [%s]", line, self.lhs_host.sh_hostname)
+                return -1
+        return 0
+
+    def lhs_is_expired(self, ttl):
+        """
+        Return True if the snapshot is too old
+        """
+        now = time.time()
+        return now < self.lhs_time or now - self.lhs_time > ttl
+
+
 class LustreHost(ssh_host.SSHHost):
     # pylint: disable=too-many-instance-attributes,too-many-public-methods
     """
@@ -2811,6 +3176,159 @@ class LustreHost(ssh_host.SSHHost):
         self.lsh_version_value = None
         self.lsh_is_server = is_server
         self.lsh_is_client = is_client
+        # LustreHostSnapshot, None if not collected or invalidated
+        self.lsh_snapshot = None
+        self.lsh_snapshot_lock = threading.Lock()
+        self.lsh_snapshot_ttl = LUSTRE_HOST_SNAPSHOT_TTL
+        # Number of users that pinned the snapshot. A pinned snapshot does
+        # not expire until invalidated.
+        self.lsh_snapshot_pin_count = 0
+
+    def lsh_snapshot_command(self):
+        """
+        Return the command to collect the snapshot of the host
+        """
+        devices = []
+        for instance in self.lsh_instance_dict.values():
+            if instance.lsi_service.ls_backfstype == BACKFSTYPE_ZFS:
+                continue
+            if instance.lsi_device not in devices:
+                devices.append(instance.lsi_device)
+
+        command = ("mounts=$(cat /proc/mounts) || exit 1; "
+                   "echo \"$mounts\" | awk '$3 == \"lustre\" {print \"mount \" $0}'; "
+                   "echo \"$mounts\" | awk '$3 == \"lustre\" {print $1, $4}' | "
+                   "while read device options; do "
+                   "case \",$options,\" in "
+                   "*,osd=osd-zfs,*) "
+                   "label=$(zfs get -H -o value lustre:svname $device) || continue;; "
+                   "*,osd=osd-ldiskfs,*) "
+                   "label=$(e2label $device) || continue;; "
+                   "*) continue;; "
+                   "esac; "
+                   "echo \"label $device $label\"; "
+                   "done; ")
+        if len(devices) > 0:
+            command += ("for device in %s; do "
+                        "real=$(readlink -f $device) && "
+                        "echo \"realpath $device $real\"; "
+                        "done; " % " ".join(devices))
+        command += ("pools=$(zpool list -H -o name 2>/dev/null) && "
+                    "{ echo zpools; for pool in $pools; do "
+                    "echo \"zpool $pool\"; done; }; exit 0")
+        return command
+
+    def _lsh_snapshot_usable(self):
+        """
+        Return True if the cached snapshot can be used.
+        Caller should hold lsh_snapshot_lock.
+        """
+        snapshot = self.lsh_snapshot
+        return (snapshot is not None and
+                (self.lsh_snapshot_pin_count > 0 or
+                 not snapshot.lhs_is_expired(self.lsh_snapshot_ttl)))
+
+    def lsh_snapshot_usable(self):
+        """
+        Return True if the cached snapshot can be used, i.e. the snapshot
+        command does not need to run.
+        """
+        with self.lsh_snapshot_lock:
+            return self._lsh_snapshot_usable()
+
+    def _lsh_snapshot_parse(self, log, command, retval):
+        """
+        Return the snapshot parsed from the result of the snapshot command.
+        Return None on error.
+        """
+        if retval.cr_exit_status:
+            log.cl_error("failed to run command [%s] on host [%s], "
+                         "ret = [%d], stdout = [%s], stderr = [%s]",
+                         command, self.sh_hostname,
+                         retval.cr_exit_status,
+                         retval.cr_stdout,
+                         retval.cr_stderr)
+            return None
+
+        snapshot = LustreHostSnapshot(self)
+        ret = snapshot.lhs_parse(log, retval.cr_stdout)
+        if ret:
+            log.cl_error("failed to parse snapshot of host [%s]",
+                         self.sh_hostname)
+            return None
+        return snapshot
+
+    def lsh_snapshot_feed(self, log, retval):
+        """
+        Save the snapshot from the result of lsh_snapshot_command() that
+        was run by the caller, e.g. in a batch with other commands.
+        """
+        snapshot = self._lsh_snapshot_parse(log, self.lsh_snapshot_command(),
+                                            retval)
+        if snapshot is None:
+            return -1
+        with self.lsh_snapshot_lock:
+            if not self._lsh_snapshot_usable():
+                self.lsh_snapshot = snapshot
+        return 0
+
+    def lsh_get_snapshot(self, log):
+        """
+        Return the snapshot of Lustre mounts, labels and zpools of the
+        host. The snapshot is cached for a short time.
+        """
+        with self.lsh_snapshot_lock:
+            if self._lsh_snapshot_usable():
+                return self.lsh_snapshot
+
+            command = self.lsh_snapshot_command()
+            retval = self.sh_run(log, command)
+            snapshot = self._lsh_snapshot_parse(log, command, retval)
+            if snapshot is None:
+                return None
+            self.lsh_snapshot = snapshot
+            return snapshot
+
+    def lsh_snapshot_pin(self, log):
+        """
+        Collect the snapshot and keep using it until unpinned, so that
+        the status of many services/clients on this host can be got from a
+        single snapshot.
+        """
+        snapshot = self.lsh_get_snapshot(log)
+        if snapshot is None:
+            return -1
+        with self.lsh_snapshot_lock:
+            self.lsh_snapshot_pin_count += 1
+        return 0
+
+    def lsh_snapshot_unpin(self):
+        """
+        Unpin the snapshot pinned by lsh_snapshot_pin()
+        """
+        with self.lsh_snapshot_lock:
+            if self.lsh_snapshot_pin_count > 0:
+                self.lsh_snapshot_pin_count -= 1
+
+    def lsh_snapshot_invalidate(self):
+        """
+        Invalidate the snapshot after mounting, umounting, formatting or
+        importing/exporting zpool
+        """
+        with self.lsh_snapshot_lock:
+            self.lsh_snapshot = None
+
+    def lsh_snapshot_service_name(self, log, snapshot, device,
+                                  backfstype=BACKFSTYPE_LDISKFS):
+        """
+        Return the service name of a mounted device from the snapshot.
+        Fall back to reading the label from the device if it is not in the
+        snapshot.
+        """
+        if device not in snapshot.lhs_label_dict:
+            return self.lsh_lustre_device_service_name(log, device,
+                                                       backfstype=backfstype)
+        return snapshot.lhs_label_dict[device].replace(":", "-")
 
     def lsh_detect_lustre_version(self, log):
         """
@@ -2949,18 +3467,13 @@ class LustreHost(ssh_host.SSHHost):
         client_regular = re.compile(client_pattern)
 
         # Detect Lustre services
-        command = ("cat /proc/mounts")
-        retval = self.sh_run(log, command)
-        if retval.cr_exit_status != 0:
-            log.cl_error("failed to run command [%s] on host [%s], "
-                         "ret = [%d], stdout = [%s], stderr = [%s]",
-                         command, self.sh_hostname,
-                         retval.cr_exit_status,
-                         retval.cr_stdout,
-                         retval.cr_stderr)
+        snapshot = self.lsh_get_snapshot(log)
+        if snapshot is None:
+            log.cl_error("failed to get snapshot of host [%s]",
+                         self.sh_hostname)
             return -1
 
-        for line in retval.cr_stdout.splitlines():
+        for line in snapshot.lhs_mount_lines:
             log.cl_debug("checking line [%s]", line)
             match = server_regular.match(line)
             if not match:
@@ -3006,8 +3519,8 @@ class LustreHost(ssh_host.SSHHost):
                              "host [%s]", device, self.sh_hostname)
                 return -1
 
-            label = self.lsh_lustre_device_service_name(log, device,
-                                                        backfstype=backfstype)
+            label = self.lsh_snapshot_service_name(log, snapshot, device,
+                                                   backfstype=backfstype)
             if label is None:
                 log.cl_error("failed to get the label of device [%s] on "
                              "host [%s]", device, self.sh_hostname)
@@ -3118,6 +3631,7 @@ class LustreHost(ssh_host.SSHHost):
         for client in client_dict.values():
             command = ("umount -f %s" % client.lc_mnt)
             retval = self.sh_run(log, command)
+            self.lsh_snapshot_invalidate()
             if retval.cr_exit_status:
                 log.cl_debug("failed to run command [%s] on host [%s], "
                              "ret = [%d], stdout = [%s], stderr = [%s]",
@@ -3138,6 +3652,7 @@ class LustreHost(ssh_host.SSHHost):
 
             command = ("umount -f %s" % client.lc_mnt)
             retval = self.sh_run(log, command)
+            self.lsh_snapshot_invalidate()
             if retval.cr_exit_status:
                 log.cl_error("failed to run command [%s] on host [%s], "
                              "ret = [%d], stdout = [%s], stderr = [%s]",
@@ -3158,6 +3673,7 @@ class LustreHost(ssh_host.SSHHost):
                     continue
                 command = ("umount %s" % instance.lsi_mnt)
                 retval = self.sh_run(log, command)
+                self.lsh_snapshot_invalidate()
                 if retval.cr_exit_status:
                     log.cl_error("failed to run command [%s] on host [%s], "
                                  "ret = [%d], stdout = [%s], stderr = [%s]",
@@ -3649,22 +4165,41 @@ class LustreHost(ssh_host.SSHHost):
                 return -1
         return 0
 
-    def lsh_healty_check(self, log):
+    def lsh_healty_check_commands(self):
         """
-        Return the healthy check result. Return LUSTRE_STR_ERROR on failure
+        Return the commands that lsh_healty_check() runs on the host
         """
         if (not self.lsh_is_server) and (not self.lsh_is_client):
+            return []
+        return ["lsmod", "lctl get_param -n health_check"]
+
+    def lsh_healty_check(self, log, results=None):
+        """
+        Return the healthy check result. Return LUSTRE_STR_ERROR on failure
+
+        If results is not None, it is the results of the commands from
+        lsh_healty_check_commands() that the caller has run in a batch.
+        """
+        commands = self.lsh_healty_check_commands()
+        if len(commands) == 0:
             return constant.LUSTRE_STR_HEALTHY
 
-        modules = self.sh_lsmod(log)
+        # Get the modules and health status in a single round trip. The
+        # health status is ignored if Lustre is not loaded.
+        lsmod_command, command = commands
+        if results is None:
+            results = self.sh_run_batch(log, commands)
+            if results is None:
+                return constant.LUSTRE_STR_ERROR
+
+        modules = self.sh_lsmod_parse(log, lsmod_command, results[0])
         if modules is None:
             return constant.LUSTRE_STR_ERROR
 
         if "lustre" not in modules:
             return constant.LUSTRE_STR_HEALTHY
 
-        command = 'lctl get_param -n health_check'
-        retval = self.sh_run(log, command)
+        retval = results[1]
         if retval.cr_exit_status != 0:
             log.cl_error("failed to run command [%s] on host [%s], "
                          "ret = [%d], stdout = [%s], stderr = [%s]",
@@ -1,11 +1,15 @@
 """
 Library for Lustre version
 """
+import os
 import re
 import traceback
-import yaml
 from pycoral import utils
 from pycoral import cmd_general
+from pycoral import parse_cache
+from pycoral import lazy_import
+
+yaml = lazy_import.lazy_module("yaml")  # pylint: disable=invalid-name
 
 # LVD: Lustre Version Definition
 LVD_RPM_PATTERNS = "rpm_patterns"
@@ -81,6 +85,115 @@ LUSTRE_REQUIRED_RPM_TYPES = (LUSTRE_VERSION_DETECTION_RPM_TYPES +
 LUSTRE_CLIENT_REQUIRED_RPM_TYPES = (LVD_LUSTRE_CLIENT,
                                     LVD_LUSTRE_KMOD_LUSTRE_CLENT)
 
+# The name stem of RPM fname, e.g. "kmod-lustre-osd-ldiskfs" of
+# "kmod-lustre-osd-ldiskfs-2.14.0_ddn4-1.el7.x86_64.rpm".
+RPM_NAME_STEM_REGEX = re.compile(r"^(.+?)-[0-9]")
+# Characters that have special meaning in regular expression
+REGEX_SPECIAL_CHARACTERS = "^$()[]{}.*+?|\\"
+# Characters that make the previous character optional
+REGEX_OPTIONAL_QUANTIFIERS = ("?", "*", "{")
+
+
+def rpm_name_stem(rpm_fname):
+    """
+    Return the name stem of the RPM fname. Return None if not able to
+    find one.
+    """
+    match = RPM_NAME_STEM_REGEX.match(rpm_fname)
+    if match is None:
+        return None
+    return match.group(1)
+
+
+def _regex_class_end(pattern, index):
+    """
+    Return the index after the character class whose "[" is right before
+    pattern[index]. Return None if the class is not closed.
+    """
+    if index < len(pattern) and pattern[index] == "^":
+        index += 1
+    if index < len(pattern) and pattern[index] == "]":
+        index += 1
+    while index < len(pattern) and pattern[index] != "]":
+        if pattern[index] == "\\":
+            index += 1
+        index += 1
+    if index >= len(pattern):
+        return None
+    return index + 1
+
+
+def _regex_alternation_after(pattern, index, depth):
+    """
+    Check whether the groups enclosing the position of pattern[index] have
+    alternation or optional quantifier after the position. Return True if
+    so, or the pattern can not be parsed.
+    """
+    enclosing_depth = depth
+    while index < len(pattern):
+        char = pattern[index]
+        index += 1
+        if char == "\\":
+            index += 1
+        elif char == "[":
+            index = _regex_class_end(pattern, index)
+            if index is None:
+                return True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            if depth <= enclosing_depth:
+                enclosing_depth = depth - 1
+                if pattern[index:index + 1] in REGEX_OPTIONAL_QUANTIFIERS:
+                    return True
+            depth -= 1
+            if depth < 0:
+                return True
+        elif char == "|":
+            if depth <= enclosing_depth:
+                return True
+    return False
+
+
+def rpm_pattern_literal_prefix(pattern):
+    """
+    Return the literal prefix that all the strings matched by the pattern
+    start with. Return None if the pattern is not anchored with "^" or the
+    prefix can not be determined safely.
+    """
+    if not pattern.startswith("^"):
+        return None
+    index = 1
+    depth = 0
+    prefix = ""
+    while index < len(pattern):
+        char = pattern[index]
+        if char == "(":
+            if pattern[index + 1:index + 2] == "?":
+                break
+            depth += 1
+            index += 1
+            continue
+        if char == "\\":
+            escaped = pattern[index + 1:index + 2]
+            if escaped == "" or escaped.isalnum():
+                break
+            literal = escaped
+            next_index = index + 2
+        elif char in REGEX_SPECIAL_CHARACTERS:
+            break
+        else:
+            literal = char
+            next_index = index + 1
+        if pattern[next_index:next_index + 1] in REGEX_OPTIONAL_QUANTIFIERS:
+            break
+        prefix += literal
+        index = next_index
+
+    if _regex_alternation_after(pattern, index, depth):
+        return None
+    return prefix
+
 
 class LustreVersion():
     """
@@ -100,6 +213,68 @@ class LustreVersion():
         self.lv_deb_pattern = deb_pattern
         # The file name of Collectd definition
         self.lv_collectd_definition_file = collectd_definition_file
+        # Key: RPM_*, value: compiled regular expression of the RPM fname.
+        self.lv_rpm_regex_dict = {}
+        for rpm_type, pattern in rpm_patterns.items():
+            self.lv_rpm_regex_dict[rpm_type] = re.compile(pattern)
+
+
+class LustreRPMIndex():
+    """
+    Index of the RPM patterns of all Lustre versions. The patterns are
+    grouped by the name stem of the RPMs they could match, so a RPM fname
+    only needs to be matched with the patterns that have the same stem.
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, versions):
+        # The list of LustreVersion that this index is built from
+        self.lri_versions = versions
+        # Key is RPM name stem, value is a list of
+        # (prefix, regex, version_name, rpm_type)
+        self.lri_stem_dict = {}
+        # The patterns that the RPM name stem can not be determined.
+        # A list of (prefix, regex, version_name, rpm_type)
+        self.lri_unstemmed = []
+        for version in versions:
+            for rpm_type, regex in version.lv_rpm_regex_dict.items():
+                prefix = rpm_pattern_literal_prefix(regex.pattern)
+                stem = None
+                if prefix is not None:
+                    stem = rpm_name_stem(prefix)
+                else:
+                    prefix = ""
+                entry = (prefix, regex, version.lv_version_name, rpm_type)
+                if stem is None:
+                    self.lri_unstemmed.append(entry)
+                elif stem in self.lri_stem_dict:
+                    self.lri_stem_dict[stem].append(entry)
+                else:
+                    self.lri_stem_dict[stem] = [entry]
+
+    def lri_match(self, rpm_fnames):
+        """
+        Match the RPM fnames with the patterns of all versions. Return a
+        dict, key is version name, value is a dict whose key is RPM type and
+        value is the list of matched RPM fnames.
+        """
+        matched_dict = {}
+        for rpm_fname in rpm_fnames:
+            entries = self.lri_unstemmed
+            stem = rpm_name_stem(rpm_fname)
+            if stem is not None and stem in self.lri_stem_dict:
+                entries = self.lri_stem_dict[stem] + entries
+            for prefix, regex, version_name, rpm_type in entries:
+                if not rpm_fname.startswith(prefix):
+                    continue
+                if regex.search(rpm_fname) is None:
+                    continue
+                if version_name not in matched_dict:
+                    matched_dict[version_name] = {}
+                rpm_type_dict = matched_dict[version_name]
+                if rpm_type not in rpm_type_dict:
+                    rpm_type_dict[rpm_type] = []
+                rpm_type_dict[rpm_type].append(rpm_fname)
+        return matched_dict
 
 
 class LustreVersionDatabase():
@@ -110,9 +285,23 @@ class LustreVersionDatabase():
     def __init__(self):
         # Key is version name, value is LustreVersion
         self.lvd_version_dict = {}
+        # LustreRPMIndex of the versions, built when first used
+        self.lvd_rpm_index = None
+
+    def lvd_get_rpm_index(self):
+        """
+        Return the index of RPM patterns. Rebuild it if the versions have
+        been changed.
+        """
+        versions = list(self.lvd_version_dict.values())
+        if (self.lvd_rpm_index is None or
+                self.lvd_rpm_index.lri_versions != versions):
+            self.lvd_rpm_index = LustreRPMIndex(versions)
+        return self.lvd_rpm_index
 
     def _lvd_match_version_from_rpms(self, log, rpm_fnames, skip_kernel=False,
-                                     skip_test=False, client=False):
+                                     skip_test=False, client=False,
+                                     rpm_matched_dict=None):
         """
         Match the Lustre version from RPM fnames
         """
@@ -123,9 +312,14 @@ class LustreVersionDatabase():
         if client:
             rpm_types = LUSTRE_CLIENT_REQUIRED_RPM_TYPES
             definition_message = "client "
+        if rpm_matched_dict is None:
+            rpm_matched_dict = self.lvd_get_rpm_index().lri_match(rpm_fnames)
         # Key is version name, type is matched_rpm_type_dict
         matched_version_dict = {}
         for version in self.lvd_version_dict.values():
+            # Key is RPM type, value is list of RPM fnames matched
+            version_rpm_fnames_dict = rpm_matched_dict.get(version.lv_version_name,
+                                                           {})
             # Key is RPM type, value is RPM fname
             matched_rpm_type_dict = {}
             # Key is RPM fname, value is RPM type
@@ -153,14 +347,9 @@ class LustreVersionDatabase():
                                  definition_message, version.lv_version_name,
                                  rpm_type)
                     return None, None
-                pattern = version.lv_rpm_pattern_dict[rpm_type]
 
                 matched = False
-                for rpm_fname in rpm_fnames:
-                    match = re.search(pattern, rpm_fname)
-                    if match is None:
-                        continue
-
+                for rpm_fname in version_rpm_fnames_dict.get(rpm_type, []):
                     matched = True
                     if rpm_type in matched_rpm_type_dict:
                         log.cl_error("both RPM [%s] and [%s] can be matched to "
@@ -233,22 +422,22 @@ class LustreVersionDatabase():
         if client:
             definition_message = "client "
 
+        rpm_matched_dict = self.lvd_get_rpm_index().lri_match(rpm_fnames)
         matched_version, matched_rpm_type_dict = \
             self._lvd_match_version_from_rpms(log, rpm_fnames, skip_kernel=skip_kernel,
-                                              skip_test=skip_test, client=client)
+                                              skip_test=skip_test, client=client,
+                                              rpm_matched_dict=rpm_matched_dict)
         if matched_version is None or matched_rpm_type_dict is None:
             return None, None
 
+        version_rpm_fnames_dict = \
+            rpm_matched_dict.get(matched_version.lv_version_name, {})
         # Try to find all RPMs that is not in LUSTRE_REQUIRED_RPM_TYPES or
         # LUSTRE_CLIENT_REQUIRED_RPM_TYPES
         for rpm_type in matched_version.lv_rpm_pattern_dict:
             if rpm_type in matched_rpm_type_dict:
                 continue
-            pattern = matched_version.lv_rpm_pattern_dict[rpm_type]
-            for rpm_fname in rpm_fnames:
-                match = re.search(pattern, rpm_fname)
-                if match is None:
-                    continue
+            for rpm_fname in version_rpm_fnames_dict.get(rpm_type, []):
                 for tmp_rpm_type, tmp_rpm_fname in matched_rpm_type_dict.items():
                     if rpm_fname == tmp_rpm_fname:
                         log.cl_error("RPM [%s] can be matched to both type [%s] "
@@ -369,6 +558,19 @@ def load_lustre_version_definition(log, fpath):
                          required_rpm, fpath)
             return None
 
+    for rpm_type, pattern in rpm_patterns.items():
+        if not isinstance(pattern, str):
+            log.cl_error("invalid RPM pattern [%s] for [%s] in Lustre "
+                         "version [%s]", pattern, rpm_type, fpath)
+            return None
+        try:
+            re.compile(pattern)
+        except re.error:
+            log.cl_error("invalid RPM pattern [%s] for [%s] in Lustre "
+                         "version [%s]: %s", pattern, rpm_type, fpath,
+                         traceback.format_exc())
+            return None
+
     if LVD_DEB_PATTERN not in data:
         log.cl_debug("missing [%s] in defintion of Lustre version [%s]",
                      LVD_DEB_PATTERN, fpath)
@@ -390,6 +592,15 @@ def load_lustre_version_database(log, local_host, directory):
     """
     Load the database files under a directory and return LustreVersionDatabase
     """
+    # This file is included so that the cache is invalidated when the
+    # definition of the classes is changed.
+    fpaths = [os.path.realpath(directory), os.path.realpath(__file__)]
+    cache_key = parse_cache.parse_cache_key(fpaths)
+    database = parse_cache.parse_cache_load(log, "lustre_version_database",
+                                            fpaths, cache_key)
+    if database is not None:
+        return database
+
     fnames = local_host.sh_get_dir_fnames(log, directory)
     if fnames is None:
         log.cl_error("failed to list dir [%s] on host [%s]",
@@ -411,4 +622,7 @@ def load_lustre_version_database(log, local_host, directory):
 
         database.lvd_version_dict[version.lv_version_name] = version
 
+    database.lvd_get_rpm_index()
+    parse_cache.parse_cache_save(log, "lustre_version_database", fpaths,
+                                 cache_key, database)
     return database
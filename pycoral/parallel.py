@@ -7,6 +7,7 @@ library to install python packages.
 """
 import traceback
 import time
+import threading
 from pycoral import utils
 
 
@@ -71,6 +72,7 @@ class ParallelThread():
         ret = target_wrap(log, self.pt_workspace, *self.pt_args)
         log.cl_debug("thread [%s] returned [%s]", self.pt_thread_id, ret)
         log.cl_result.cr_exit_status = ret
+        self.pt_parallel_execute.pe_thread_finished(self)
 
     def pt_thread_start(self, parent_log):
         """
@@ -130,6 +132,11 @@ class ParallelExecute():
         self.pe_name = name
         # List of all ParallelThread
         self.pe_threads = []
+        # Condition to protect pe_finished_threads and notify the
+        # finishing of threads.
+        self.pe_condition = threading.Condition()
+        # ParallelThreads that have finished but not been reaped by pe_run
+        self.pe_finished_threads = []
         thread_index = 0
         if thread_ids is not None:
             if len(thread_ids) != len(args_array):
@@ -138,12 +145,37 @@ class ParallelExecute():
                           (len(thread_ids), len(args_array)))
                 raise Exception(reason)
         for args in args_array:
-            thread_id = thread_ids[thread_index]
+            if thread_ids is None:
+                thread_id = None
+            else:
+                thread_id = thread_ids[thread_index]
             parallel_thread = ParallelThread(self, thread_index, main, args,
                                              thread_id=thread_id)
             self.pe_threads.append(parallel_thread)
             thread_index += 1
 
+    def pe_thread_finished(self, parallel_thread):
+        """
+        Called by the thread when it finishes, wakes up pe_run()
+        """
+        self.pe_condition.acquire()
+        self.pe_finished_threads.append(parallel_thread)
+        self.pe_condition.notify_all()
+        self.pe_condition.release()
+
+    def _pe_wait_finished(self, timeout):
+        """
+        Wait until some threads finish or timeout. Return the list of
+        finished threads.
+        """
+        self.pe_condition.acquire()
+        if len(self.pe_finished_threads) == 0:
+            self.pe_condition.wait(timeout)
+        finished_threads = self.pe_finished_threads
+        self.pe_finished_threads = []
+        self.pe_condition.release()
+        return finished_threads
+
     def pe_start_threads(self, log):
         """
         Start to run the threads. pe_join_threads() needs to be run latter
@@ -190,25 +222,48 @@ class ParallelExecute():
         return ret
 
     def pe_run(self, log, quiet=True, sleep_interval=1, timeout=None,
-               quit_on_error=True, parallelism=-1):
+               quit_on_error=True, parallelism=-1, start_check_func=None):
         """
         Start to run the threads
         If timeout is None, threads will be aborted after the timeout
+
+        A new thread is started as soon as a running thread finishes,
+        so there is no polling delay. sleep_interval is kept for
+        compatibility and is not used.
+
+        If start_check_func is not None, it will be called with arguments
+        (parallel_thread, running_threads) to check whether the thread can
+        be started now. Threads that can not be started are skipped until
+        some running threads finish.
         """
         # pylint: disable=too-many-branches,too-many-locals,too-many-statements
+        # pylint: disable=unused-argument
         time_start = time.time()
         ret = 0
         not_started_threads = list(self.pe_threads)
         running_threads = []
-        finished_threads = []
         while True:
             # Start threads
             while (len(not_started_threads) > 0 and
                    (parallelism == -1 or
                     parallelism > len(running_threads))):
-                parallel_thread = not_started_threads[0]
+                parallel_thread = None
+                for not_started_thread in not_started_threads:
+                    # Always start a thread if none is running, otherwise
+                    # no thread will ever finish to wake us up. The check
+                    # function is still called first since it might
+                    # reserve resources for the thread.
+                    if (start_check_func is None or
+                            start_check_func(not_started_thread,
+                                             running_threads) or
+                            len(running_threads) == 0):
+                        parallel_thread = not_started_thread
+                        break
+                if parallel_thread is None:
+                    break
                 log.cl_debug("starting thread [%s] of [%s]",
                              parallel_thread.pt_thread_id, self.pe_name)
+                not_started_threads.remove(parallel_thread)
                 rc = parallel_thread.pt_thread_start(log)
                 if rc:
                     log.cl_error("failed to start thread [%s] of [%s]",
@@ -216,41 +271,43 @@ class ParallelExecute():
                     ret = -1
                     if quit_on_error:
                         break
+                    continue
                 running_threads.append(parallel_thread)
-                not_started_threads.remove(parallel_thread)
 
             if ret and quit_on_error:
                 break
 
-            for parallel_thread in running_threads[:]:
-                if not parallel_thread.pt_thread.is_alive():
-                    running_threads.remove(parallel_thread)
-                    finished_threads.append(parallel_thread)
-                    log.cl_debug("thread [%s] of [%s] finished",
-                                 parallel_thread.pt_thread_id, self.pe_name)
-
             if len(running_threads) == 0 and len(not_started_threads) == 0:
                 log.cl_debug("all threads of [%s] finished",
                              self.pe_name)
                 break
 
-            time_now = time.time()
-            elapsed = time_now - time_start
-            if timeout is not None and elapsed > timeout:
-                ret = -1
-                log.cl_error("parallel execute [%s] timeout after [%d] "
-                             "seconds, aborting", self.pe_name, elapsed)
-                break
-            time.sleep(sleep_interval)
+            if timeout is None:
+                wait_time = None
+            else:
+                wait_time = time_start + timeout - time.time()
+                if wait_time <= 0:
+                    ret = -1
+                    log.cl_error("parallel execute [%s] timeout after [%d] "
+                                 "seconds, aborting", self.pe_name,
+                                 time.time() - time_start)
+                    break
+
+            finished_threads = self._pe_wait_finished(wait_time)
+            for parallel_thread in finished_threads:
+                parallel_thread.pt_thread_join()
+                running_threads.remove(parallel_thread)
+                log.cl_debug("thread [%s] of [%s] finished",
+                             parallel_thread.pt_thread_id, self.pe_name)
 
         for parallel_thread in running_threads:
-            log.cl_debug("aborting thread [%s] of [%s] finished",
+            log.cl_debug("aborting thread [%s] of [%s]",
                          parallel_thread.pt_thread_id, self.pe_name)
             parallel_thread.pt_thread_abort()
 
         for parallel_thread in running_threads:
-            log.cl_debbug("joining thread [%s] of [%s] finished",
-                          parallel_thread.pt_thread_id, self.pe_name)
+            log.cl_debug("joining thread [%s] of [%s]",
+                         parallel_thread.pt_thread_id, self.pe_name)
             parallel_thread.pt_thread_join()
 
         for parallel_thread in self.pe_threads:
@@ -266,7 +323,7 @@ class ParallelExecute():
 
         time_now = time.time()
         elapsed = time_now - time_start
-        log.cl_debug("parallel execute [%s] finished after [%d] seconds "
+        log.cl_debug("parallel execute [%s] finished after [%f] seconds "
                      "with retval [%d]",
                      self.pe_name, elapsed, ret)
         return ret
@@ -0,0 +1,106 @@
+"""
+Library for caching the parsed results of files. The cache is invalidated
+automatically when any of the files is changed.
+
+DO NOT import any library that needs extra python package,
+since this might cause failure of commands that uses this
+library to install python packages.
+"""
+import os
+import sys
+import stat
+import pickle
+import hashlib
+import traceback
+from pycoral import constant
+
+# Increase this when the format of cache file is changed
+PARSE_CACHE_FORMAT = 1
+
+
+def _parse_cache_fpath(name, fpaths):
+    """
+    Return the path of the cache file.
+    """
+    digest = hashlib.sha1("\0".join(fpaths).encode()).hexdigest()
+    return constant.CORAL_PARSE_CACHE_DIR + "/" + name + "_" + digest
+
+
+def parse_cache_key(fpaths):
+    """
+    Return the key of the files, or None if any of the files can not be
+    accessed. If a fpath is a dir, the files under it are included too.
+    The key should be got before parsing the files, so that changes during
+    parsing invalidate the cache.
+    """
+    key = [PARSE_CACHE_FORMAT, sys.version_info[:2]]
+    for fpath in fpaths:
+        try:
+            fstat = os.stat(fpath)
+            key.append((fpath, fstat.st_ino, fstat.st_size,
+                        fstat.st_mtime_ns, fstat.st_ctime_ns))
+            if not stat.S_ISDIR(fstat.st_mode):
+                continue
+            for fname in sorted(os.listdir(fpath)):
+                fstat = os.stat(fpath + "/" + fname)
+                key.append((fname, fstat.st_ino, fstat.st_size,
+                            fstat.st_mtime_ns, fstat.st_ctime_ns))
+        except OSError:
+            return None
+    return key
+
+
+def parse_cache_load(log, name, fpaths, key):
+    """
+    Return the cached result of parsing the files, or None if no valid
+    cache.
+    """
+    if key is None:
+        return None
+    cache_fpath = _parse_cache_fpath(name, fpaths)
+    try:
+        with open(cache_fpath, "rb") as cache_fd:
+            fstat = os.fstat(cache_fd.fileno())
+            # Do not unpickle a file that could be written by others
+            if (fstat.st_uid != os.getuid() or
+                    fstat.st_mode & (stat.S_IWGRP | stat.S_IWOTH)):
+                log.cl_debug("ignoring parse cache [%s] with unsafe "
+                             "permission", cache_fpath)
+                return None
+            cache_key, result = pickle.load(cache_fd)
+    except FileNotFoundError:
+        return None
+    except:
+        log.cl_debug("failed to load parse cache [%s]: %s",
+                     cache_fpath, traceback.format_exc())
+        return None
+    if cache_key != key:
+        return None
+    return result
+
+
+def parse_cache_save(log, name, fpaths, key, result):
+    """
+    Save the result of parsing the files. Failure is ignored since it is
+    only a cache.
+    """
+    if key is None:
+        return
+    cache_fpath = _parse_cache_fpath(name, fpaths)
+    tmp_fpath = cache_fpath + ".%d.tmp" % os.getpid()
+    try:
+        os.makedirs(constant.CORAL_PARSE_CACHE_DIR, mode=0o700,
+                    exist_ok=True)
+        fd = os.open(tmp_fpath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                     0o600)
+        with os.fdopen(fd, "wb") as cache_fd:
+            pickle.dump((key, result), cache_fd,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_fpath, cache_fpath)
+    except:
+        log.cl_debug("failed to save parse cache [%s]: %s",
+                     cache_fpath, traceback.format_exc())
+        try:
+            os.unlink(tmp_fpath)
+        except OSError:
+            pass
@@ -7,6 +7,7 @@ import socket
 from pycoral import coral_yaml
 from pycoral import constant
 from pycoral import cmd_general
+from pycoral import checksum_manifest
 
 RELEASE_INFO_DISTRO_SHORT = "distro_short"
 RELEASE_INFO_FILES = "files"
@@ -15,6 +16,9 @@ RELEASE_INFO_SHA1SUM = "sha1sum"
 RELEASE_INFO_TARGET_CPU = "target_cpu"
 RELEASE_INFO_DOWNLOAD_URL = "download_url"
 RELEASE_INFO_VERSION = "version"
+# The file under release dir that caches the checksums of the files. It is
+# not part of the release.
+RELEASE_INFO_MANIFEST_FNAME = checksum_manifest.CHECKSUM_MANIFEST_FNAME
 
 
 class CoralDownloadFile():
@@ -207,6 +211,7 @@ ACTION_IGNORE = "ignore"
 ACTION_REMOVE = "remove"
 ACTION_REPORT = "report"
 
+
 class ReleaseInfo():
     """
     This instance saves the release information of Lustre/Coral/E2fsprogs/Other
@@ -325,14 +330,88 @@ class ReleaseInfo():
         return 0
 
     def rli_files_send(self, log, local_host, source_dir,
-                       host, dest_dir):
+                       host, dest_dir, source_host=None):
         """
         Send the files of the release from local host to remote host.
+        If source_host is not None, the files will be sent from that host,
+        which should already have a complete release under source_dir.
         """
         if self.rli_file_dict is None:
             log.cl_error("release files not specified")
             return -1
 
+        if (source_host is not None and
+                source_host.sh_hostname != local_host.sh_hostname):
+            ret = self._rli_files_send_from_peer(log, source_host, source_dir,
+                                                 host, dest_dir)
+            if ret:
+                log.cl_error("failed to send files of release from host [%s] "
+                             "to host [%s]",
+                             source_host.sh_hostname, host.sh_hostname)
+                return -1
+        else:
+            ret = self._rli_files_send_from_local(log, local_host, source_dir,
+                                                  host, dest_dir)
+            if ret:
+                log.cl_error("failed to send files of release from local "
+                             "host [%s] to host [%s]",
+                             local_host.sh_hostname, host.sh_hostname)
+                return -1
+
+        ret = self._rli_files_check(log, host, dest_dir,
+                                    unncessary_files_action=ACTION_REMOVE)
+        if ret < 0:
+            log.cl_error("failed to check the files of release")
+            return -1
+        if ret == 0:
+            log.cl_error("incomplete files of release")
+            return -1
+        return 0
+
+    def _rli_files_send_from_peer(self, log, source_host, source_dir,
+                                  host, dest_dir):
+        """
+        Send the files of the release from a host to another host with a
+        single rsync command.
+        """
+        if not source_host.sh_peer_trusted(log, host):
+            log.cl_warning("host [%s] is not able to SSH to host [%s] "
+                           "without password", source_host.sh_hostname,
+                           host.sh_hostname)
+            return -1
+
+        relative_fpaths = list(self.rli_file_dict.keys())
+        relative_fpaths += self.rli_extra_relative_fpaths
+        command = "mkdir -p %s" % dest_dir
+        retval = host.sh_run(log, command)
+        if retval.cr_exit_status:
+            log.cl_error("failed to run command [%s] on host [%s], "
+                         "ret = [%d], stdout = [%s], stderr = [%s]",
+                         command,
+                         host.sh_hostname,
+                         retval.cr_exit_status,
+                         retval.cr_stdout,
+                         retval.cr_stderr)
+            return -1
+
+        log.cl_info("sending [%d] files under dir [%s] on host [%s] to dir "
+                    "[%s] on host [%s]", len(relative_fpaths), source_dir,
+                    source_host.sh_hostname, dest_dir, host.sh_hostname)
+        ret = source_host.sh_send_file(log, source_dir + "/", dest_dir,
+                                       from_local=False, remote_host=host,
+                                       relative_fpaths=relative_fpaths)
+        if ret:
+            log.cl_error("failed to send dir [%s] on host [%s] to dir [%s] "
+                         "on host [%s]", source_dir, source_host.sh_hostname,
+                         dest_dir, host.sh_hostname)
+            return -1
+        return 0
+
+    def _rli_files_send_from_local(self, log, local_host, source_dir,
+                                   host, dest_dir):
+        """
+        Send the files of the release from local host to remote host.
+        """
         complete = self.rli_files_are_complete(log, local_host, source_dir,
                                                ignore_unncessary_files=True)
         if complete < 0:
@@ -368,15 +447,6 @@ class ReleaseInfo():
                              local_host.sh_hostname,
                              host.sh_hostname)
                 return -1
-
-        ret = self._rli_files_check(log, host, dest_dir,
-                                    unncessary_files_action=ACTION_REMOVE)
-        if ret < 0:
-            log.cl_error("failed to check the files of release")
-            return -1
-        if ret == 0:
-            log.cl_error("incomplete files of release")
-            return -1
         return 0
 
     def rli_files_scan(self, log, host, release_dir):
@@ -413,9 +483,11 @@ class ReleaseInfo():
 
     def _rli_files_check(self, log, host, release_dir, update_files=False,
                          unncessary_files_action=ACTION_REPORT,
-                         check_file_content=True):
+                         check_file_content=True, trust_cache=False):
         """
         Check whether the files are complete under the dir.
+        If trust_cache, only calculate the checksums of the files changed
+        since last check according to the manifest.
         Return 1 if true, return 0 if false.
         Return -1 on error.
         """
@@ -455,7 +527,9 @@ class ReleaseInfo():
                 expected_fpaths.append(fpath)
                 demanded_fpath_dict[fpath] = False
 
-        command = "find %s -type f" % release_dir
+        # Print "$size $mtime $inode $fpath" so that the checksums cached
+        # in the manifest can be validated.
+        command = "find %s -type f -printf '%%s %%T@ %%i %%p\\n'" % release_dir
         retval = host.sh_run(log, command)
         if retval.cr_exit_status:
             log.cl_error("failed to run command [%s] on local host [%s], "
@@ -472,9 +546,21 @@ class ReleaseInfo():
 
         ret = 1
         release_dir_length = len(release_dir) + 1
-        fpaths = retval.cr_stdout.splitlines()
+        manifest_fpath = release_dir + "/" + RELEASE_INFO_MANIFEST_FNAME
+        # Key: relative fpath, value: stat_key
+        stat_key_dict = {}
+        # List of (fpath, relative_fpath) that needs checksum
+        checksum_files = []
         unexpected_fpaths = []
-        for fpath in fpaths:
+        for line in retval.cr_stdout.splitlines():
+            fields = line.split(" ", 3)
+            if len(fields) != 4:
+                log.cl_error("unexpected line [%s] of command [%s] on "
+                             "host [%s]", line, command, host.sh_hostname)
+                return -1
+            fpath = fields[3]
+            if fpath in (manifest_fpath, manifest_fpath + ".tmp"):
+                continue
             under_nondist_dir = False
             for dir_path in nondist_dir_paths:
                 dir_path += "/"
@@ -499,12 +585,45 @@ class ReleaseInfo():
                 continue
 
             relative_fpath = fpath[release_dir_length:]
-            sha1sum = host.sh_get_checksum(log, fpath,
-                                           checksum_command="sha1sum")
-            if sha1sum is None:
-                log.cl_error("failed to calculate checksum of file [%s]",
-                             fpath)
+            stat_key_dict[relative_fpath] = " ".join(fields[:3])
+            checksum_files.append((fpath, relative_fpath))
+
+        if len(checksum_files) > 0:
+            manifest = checksum_manifest.ChecksumManifest(release_dir)
+            manifest.cm_load(log, host)
+            checksum_dict = {}
+            hash_fpaths = []
+            for fpath, relative_fpath in checksum_files:
+                sha1sum = None
+                if trust_cache:
+                    sha1sum = manifest.cm_lookup(relative_fpath,
+                                                 stat_key_dict[relative_fpath])
+                if sha1sum is None:
+                    hash_fpaths.append(fpath)
+                else:
+                    checksum_dict[fpath] = sha1sum
+            log.cl_debug("calculating checksums of [%d] files under [%s] on "
+                         "host [%s], [%d] files trusted from manifest",
+                         len(hash_fpaths), release_dir, host.sh_hostname,
+                         len(checksum_dict))
+            hashed_dict = host.sh_get_checksums(log, hash_fpaths,
+                                                checksum_command="sha1sum")
+            if hashed_dict is None:
+                log.cl_error("failed to calculate checksums of files under "
+                             "[%s] on host [%s]", release_dir,
+                             host.sh_hostname)
                 return -1
+            checksum_dict.update(hashed_dict)
+            for fpath, relative_fpath in checksum_files:
+                manifest.cm_update(relative_fpath,
+                                   stat_key_dict[relative_fpath],
+                                   checksum_dict[fpath])
+            if check_file_content or update_files:
+                manifest.cm_prune(stat_key_dict)
+            manifest.cm_save(log, host)
+
+        for fpath, relative_fpath in checksum_files:
+            sha1sum = checksum_dict[fpath]
             if update_files:
                 download_file = CoralDownloadFile(relative_fpath,
                                                   sha1sum)
@@ -568,9 +687,10 @@ class ReleaseInfo():
 
     def rli_files_are_complete(self, log, host, release_dir,
                                ignore_unncessary_files=False,
-                               check_file_content=True):
+                               check_file_content=True, trust_cache=False):
         """
         Check the files are complete.
+        If trust_cache, only check the checksums of changed files.
         Return 1 if true, return 0 if false.
         Return -1 on error.
         """
@@ -583,7 +703,8 @@ class ReleaseInfo():
             action = ACTION_REPORT
         ret = self._rli_files_check(log, host, release_dir,
                                     unncessary_files_action=action,
-                                    check_file_content=check_file_content)
+                                    check_file_content=check_file_content,
+                                    trust_cache=trust_cache)
         return ret
 
     def rli_release_remove(self, log, host, release_dir):
@@ -637,7 +758,8 @@ class ReleaseInfo():
                              retval.cr_stderr)
                 return -1
 
-        command = "rmdir %s" % (release_dir)
+        command = ("rm -f %s/%s && rmdir %s" %
+                   (release_dir, RELEASE_INFO_MANIFEST_FNAME, release_dir))
         retval = host.sh_run(log, command)
         if retval.cr_exit_status:
             log.cl_error("failed to run command [%s] on host [%s], "
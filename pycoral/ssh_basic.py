@@ -6,12 +6,22 @@ DO NOT import any library that needs extra python package,
 since this might cause failure of commands that uses this
 library to install python packages.
 """
+import os
+import stat
 import time
 import socket
+import threading
+import hashlib
+import functools
 from pycoral import clog
 from pycoral import watched_io
 from pycoral import utils
+from pycoral import command_reactor
 from pycoral import constant
+from pycoral import lazy_import
+
+asyncio = lazy_import.lazy_module("asyncio")  # pylint: disable=invalid-name
+
 
 def sh_escape(command):
     """
@@ -67,6 +77,357 @@ def retval_check_expected(retval, args):
     return 0
 
 
+# Name of the dir to save the control sockets of SSH master connections
+SSH_MASTER_CONTROL_DIRNAME = "coral_ssh_masters"
+# Default max number of master connections opened by a process
+SSH_MASTER_MAX_NUMBER = 256
+# Default seconds that an idle master connection keeps alive
+SSH_MASTER_IDLE_TIMEOUT = 300
+# Default seconds between two health checks of a master connection
+SSH_MASTER_CHECK_INTERVAL = 30
+# Max seconds to wait for the startup of a master connection
+SSH_MASTER_START_TIMEOUT = 60
+# Seconds to skip the master of a host after failing to start it
+SSH_MASTER_START_BACKOFF = 30
+
+
+def ssh_master_control_dir():
+    """
+    Return the default dir to save the control sockets. The dir is per
+    user so that other local users are not able to own the sockets.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return runtime_dir + "/" + SSH_MASTER_CONTROL_DIRNAME
+    return os.path.expanduser("~/.ssh/" + SSH_MASTER_CONTROL_DIRNAME)
+
+
+class SSHMaster():
+    """
+    Each SSH master connection in the pool has an object of this type
+    """
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    def __init__(self, key, ssh_string, hostname, control_path):
+        # Key in the pool, (login_name, hostname, port, identity_file)
+        self.sm_key = key
+        # The SSH command without the control options
+        self.sm_ssh_string = ssh_string
+        # The hostname to connect to
+        self.sm_hostname = hostname
+        # The path of control socket
+        self.sm_control_path = control_path
+        # Lock to serialize the check/startup of the master
+        self.sm_lock = threading.Lock()
+        # Whether the master has been started and checked to be alive
+        self.sm_alive = False
+        # Whether the master is suspected to be broken and needs check
+        self.sm_suspected = False
+        # The last time that a command used this master
+        self.sm_last_used = 0
+        # The last time that the master is checked to be alive
+        self.sm_last_checked = 0
+        # The last time that the master failed to start
+        self.sm_start_failed_time = None
+
+    def _sm_control_command(self, operation):
+        """
+        Return the command to control the master, e.g. "check" or "exit"
+        """
+        return ("%s -o ControlPath=%s -O %s %s" %
+                (self.sm_ssh_string, self.sm_control_path, operation,
+                 self.sm_hostname))
+
+    def sm_check(self):
+        """
+        Return True if the master is alive.
+        """
+        command = self._sm_control_command("check")
+        retval = utils.run(command, timeout=10, silent=True)
+        return retval.cr_exit_status == 0
+
+    def sm_start(self, log, idle_timeout, timeout=SSH_MASTER_START_TIMEOUT):
+        """
+        Start the master connection in background. Return 0 on success.
+        """
+        # A stale socket left by a dead master would prevent the new master
+        # from listening.
+        if os.path.exists(self.sm_control_path):
+            try:
+                os.remove(self.sm_control_path)
+            except OSError:
+                pass
+        # Keepalive makes sure the master exits if the host is gone.
+        command = ("%s -o ControlMaster=yes -o ControlPath=%s "
+                   "-o ControlPersist=%s -o ServerAliveInterval=10 "
+                   "-o ServerAliveCountMax=3 %s true "
+                   "< /dev/null > /dev/null 2>&1" %
+                   (self.sm_ssh_string, self.sm_control_path, idle_timeout,
+                    self.sm_hostname))
+        retval = utils.run(command, timeout=timeout, silent=True)
+        if retval.cr_exit_status:
+            log.cl_debug("failed to start SSH master to host [%s], "
+                         "ret = [%d]", self.sm_hostname,
+                         retval.cr_exit_status)
+            self.sm_start_failed_time = time.time()
+            return -1
+        self.sm_start_failed_time = None
+        return 0
+
+    def sm_exit(self, graceful=False):
+        """
+        Ask the master to exit. If graceful, the master stops accepting new
+        commands, but will not exit until the running commands finish.
+        """
+        if graceful:
+            command = self._sm_control_command("stop")
+        else:
+            command = self._sm_control_command("exit")
+        utils.run(command, timeout=10, silent=True)
+        self.sm_alive = False
+
+
+class SSHMasterPool():
+    """
+    Pool of multiplexed SSH master connections (OpenSSH ControlMaster).
+
+    Commands run through a host share the authenticated session of its
+    master, so they do not need a new TCP connection and key exchange.
+    If a master can not be used for any reason, the command falls back
+    to a normal SSH connection.
+    """
+    def __init__(self, control_dir=None,
+                 max_masters=SSH_MASTER_MAX_NUMBER,
+                 idle_timeout=SSH_MASTER_IDLE_TIMEOUT,
+                 check_interval=SSH_MASTER_CHECK_INTERVAL):
+        if control_dir is None:
+            control_dir = ssh_master_control_dir()
+        # Dir to save the control sockets
+        self.smp_control_dir = control_dir
+        # Max number of masters in this pool
+        self.smp_max_masters = max_masters
+        # Master exits after being idle for this number of seconds
+        self.smp_idle_timeout = idle_timeout
+        # Interval of health checks on a master
+        self.smp_check_interval = check_interval
+        # Condition to protect smp_master_dict
+        self.smp_condition = threading.Condition()
+        # Key is SSHMaster.sm_key, value is SSHMaster
+        self.smp_master_dict = {}
+        # Whether the control dir has been created
+        self._smp_dir_inited = False
+
+    def _smp_init_dir(self, log):
+        """
+        Create the control dir that only the user can access. Refuse to
+        use the dir if it could be controlled by other users.
+        """
+        if self._smp_dir_inited:
+            return 0
+        try:
+            os.makedirs(self.smp_control_dir, mode=0o700, exist_ok=True)
+            dir_stat = os.lstat(self.smp_control_dir)
+        except OSError as error:
+            log.cl_debug("failed to create dir [%s] for SSH masters: %s",
+                         self.smp_control_dir, error)
+            return -1
+        if not stat.S_ISDIR(dir_stat.st_mode):
+            log.cl_debug("path [%s] for SSH masters is not a dir",
+                         self.smp_control_dir)
+            return -1
+        if dir_stat.st_uid != os.geteuid():
+            log.cl_debug("dir [%s] for SSH masters is owned by another "
+                         "user [%s]", self.smp_control_dir,
+                         dir_stat.st_uid)
+            return -1
+        if stat.S_IMODE(dir_stat.st_mode) != 0o700:
+            log.cl_debug("dir [%s] for SSH masters has unsafe mode [%o]",
+                         self.smp_control_dir,
+                         stat.S_IMODE(dir_stat.st_mode))
+            return -1
+        self._smp_dir_inited = True
+        return 0
+
+    def _smp_evict(self, now):
+        """
+        Remove idle masters and the least recently used masters if the
+        pool is full. Return the masters that need to exit.
+        Caller should hold smp_condition.
+        """
+        evicted = []
+        for master in list(self.smp_master_dict.values()):
+            if now - master.sm_last_used > self.smp_idle_timeout:
+                # ControlPersist has already closed it.
+                del self.smp_master_dict[master.sm_key]
+        if len(self.smp_master_dict) < self.smp_max_masters:
+            return evicted
+        masters = sorted(self.smp_master_dict.values(),
+                         key=lambda master: master.sm_last_used)
+        number = len(self.smp_master_dict) - self.smp_max_masters + 1
+        for master in masters[:number]:
+            del self.smp_master_dict[master.sm_key]
+            evicted.append(master)
+        return evicted
+
+    def _smp_get_master(self, log, host, timeout=None):
+        """
+        Return the SSHMaster of the host, None if not able to use master.
+        """
+        key = (host.sh_login_name, host.sh_hostname, host.sh_ssh_port,
+               host.sh_identity_file)
+        now = time.time()
+        self.smp_condition.acquire()
+        if self._smp_init_dir(log):
+            self.smp_condition.release()
+            return None
+        master = self.smp_master_dict.get(key)
+        evicted = []
+        if master is None:
+            evicted = self._smp_evict(now)
+            # Use a hash to keep the socket path short enough.
+            digest = hashlib.sha1(str(key).encode()).hexdigest()[:16]
+            control_path = self.smp_control_dir + "/" + digest
+            # pylint: disable=protected-access
+            master = SSHMaster(key, host._get_ssh_command(),
+                               host.sh_hostname, control_path)
+            self.smp_master_dict[key] = master
+        master.sm_last_used = now
+        self.smp_condition.release()
+
+        for evicted_master in evicted:
+            log.cl_debug("evicting SSH master to host [%s]",
+                         evicted_master.sm_hostname)
+            evicted_master.sm_exit(graceful=True)
+
+        with master.sm_lock:
+            if (master.sm_alive and not master.sm_suspected and
+                    now - master.sm_last_checked < self.smp_check_interval):
+                return master
+            master.sm_suspected = False
+            if master.sm_check():
+                # Could be started by another process
+                master.sm_alive = True
+                master.sm_last_checked = now
+                return master
+            if master.sm_alive:
+                # Let the sessions still running on the master finish.
+                master.sm_exit(graceful=True)
+            master.sm_alive = False
+            if (master.sm_start_failed_time is not None and
+                    now - master.sm_start_failed_time <
+                    SSH_MASTER_START_BACKOFF):
+                return None
+            start_timeout = SSH_MASTER_START_TIMEOUT
+            if timeout is not None:
+                start_timeout = max(1, min(timeout, start_timeout))
+            ret = master.sm_start(log, self.smp_idle_timeout,
+                                  timeout=start_timeout)
+            if ret:
+                return None
+            master.sm_alive = True
+            master.sm_last_checked = time.time()
+        return master
+
+    def smp_ssh_options(self, log, host, timeout=None):
+        """
+        Return the options for ssh command to use the master connection.
+        Return "" if master should not be used.
+        """
+        master = self._smp_get_master(log, host, timeout=timeout)
+        if master is None:
+            return ""
+        # Fall back to a new connection if master is not usable
+        return (" -o ControlMaster=no -o ControlPath=%s" %
+                master.sm_control_path)
+
+    def smp_prepare_hosts(self, log, hosts, timeout=None, parallelism=None):
+        """
+        Check or start the masters of the hosts in parallel, so that the
+        SSH handshakes to many hosts are not done one by one.
+        """
+        remaining = list(hosts)
+        lock = threading.Lock()
+
+        def prepare_masters():
+            """
+            Prepare the masters of the remaining hosts
+            """
+            while True:
+                with lock:
+                    if len(remaining) == 0:
+                        return
+                    host = remaining.pop(0)
+                self._smp_get_master(log, host, timeout=timeout)
+
+        thread_number = len(remaining)
+        if parallelism is not None:
+            thread_number = min(thread_number, parallelism)
+        threads = []
+        for _ in range(thread_number):
+            threads.append(utils.thread_start(prepare_masters, ()))
+        for thread in threads:
+            thread.join()
+
+    def smp_host_invalidate(self, host):
+        """
+        The master of the host is suspected to be broken, e.g. host
+        rebooted or a command exited with 255. The master will be checked
+        before next use, and restarted only if the check fails.
+        """
+        self.smp_condition.acquire()
+        for master in self.smp_master_dict.values():
+            if master.sm_hostname == host.sh_hostname:
+                master.sm_suspected = True
+        self.smp_condition.release()
+
+    def smp_fini(self, log):
+        """
+        Ask all the masters to exit
+        """
+        self.smp_condition.acquire()
+        masters = list(self.smp_master_dict.values())
+        self.smp_master_dict = {}
+        self.smp_condition.release()
+        for master in masters:
+            log.cl_debug("stopping SSH master to host [%s]",
+                         master.sm_hostname)
+            master.sm_exit()
+
+
+# The global SSHMasterPool, None if the pool is disabled
+SSH_MASTER_POOL = None
+
+
+def ssh_master_pool_enable(control_dir=None,
+                           max_masters=SSH_MASTER_MAX_NUMBER,
+                           idle_timeout=SSH_MASTER_IDLE_TIMEOUT,
+                           check_interval=SSH_MASTER_CHECK_INTERVAL):
+    """
+    Enable the SSH master pool for all hosts in this process.
+    """
+    # pylint: disable=global-statement
+    global SSH_MASTER_POOL
+    if SSH_MASTER_POOL is None:
+        SSH_MASTER_POOL = SSHMasterPool(control_dir=control_dir,
+                                        max_masters=max_masters,
+                                        idle_timeout=idle_timeout,
+                                        check_interval=check_interval)
+    return SSH_MASTER_POOL
+
+
+def ssh_master_pool_disable(log, stop_masters=False):
+    """
+    Disable the SSH master pool. If stop_masters, all masters will exit.
+    Otherwise, the masters will exit after being idle for a while, and
+    could be reused by other processes in the meantime.
+    """
+    # pylint: disable=global-statement
+    global SSH_MASTER_POOL
+    pool = SSH_MASTER_POOL
+    SSH_MASTER_POOL = None
+    if pool is not None and stop_masters:
+        pool.smp_fini(log)
+
+
 class SSHBasicHost():
     """
     Baisc SSH host.
@@ -144,12 +505,13 @@ class SSHBasicHost():
         self._sbh_cached_is_local = ret
         return ret
 
-    def _get_ssh_command(self):
+    def _get_ssh_command(self, identity_file=True):
         """
-        Return the ssh cmd string
+        Return the ssh cmd string. If identity_file is False, the identity
+        file is not used, e.g. when ssh is run from another host.
         """
         extra_option = ""
-        if self.sh_identity_file is not None:
+        if identity_file and self.sh_identity_file is not None:
             extra_option += (" -i %s" % self.sh_identity_file)
         if self.sh_ssh_port != 22:
             extra_option += (" -p %s" % self.sh_ssh_port)
@@ -160,7 +522,8 @@ class SSHBasicHost():
     def _sh_run(self, log, command, silent=False, timeout=None,
                 stdout_tee=None, stderr_tee=None, stdin=None,
                 return_stdout=True, return_stderr=True, quit_func=None,
-                flush_tee=False):
+                flush_tee=False, stdout_line_func=None,
+                stderr_line_func=None, max_output_bytes=None):
         """
         Use ssh to run command on the host
         """
@@ -169,14 +532,63 @@ class SSHBasicHost():
             stderr = "type of command argument is not a basestring"
             return utils.CommandResult(stderr=stderr, exit_status=-1)
 
+        full_command = self._sh_ssh_full_command(log, command,
+                                                 timeout=timeout)
+        retval = utils.run(full_command, timeout=timeout, stdout_tee=stdout_tee,
+                           stderr_tee=stderr_tee, stdin=stdin,
+                           return_stdout=return_stdout,
+                           return_stderr=return_stderr,
+                           quit_func=quit_func, flush_tee=flush_tee,
+                           stdout_line_func=stdout_line_func,
+                           stderr_line_func=stderr_line_func,
+                           max_output_bytes=max_output_bytes)
+        self.sh_check_ssh_result(retval)
+        return retval
+
+    def _sh_ssh_full_command(self, log, command, timeout=None):
+        """
+        Return the ssh command to run the command on the host
+        """
         ssh_string = self._get_ssh_command()
-        full_command = ("%s %s \"LANG=en_US %s\"" %
-                        (ssh_string, self.sh_hostname, sh_escape(command)))
+        pool = SSH_MASTER_POOL
+        if pool is not None:
+            ssh_string += pool.smp_ssh_options(log, self, timeout=timeout)
+        return ("%s %s \"LANG=en_US %s\"" %
+                (ssh_string, self.sh_hostname, sh_escape(command)))
 
-        return utils.run(full_command, timeout=timeout, stdout_tee=stdout_tee,
-                         stderr_tee=stderr_tee, stdin=stdin,
-                         return_stdout=return_stdout, return_stderr=return_stderr,
-                         quit_func=quit_func, flush_tee=flush_tee)
+    def sh_check_ssh_result(self, retval):
+        """
+        Check the result of a command run by ssh
+        """
+        # SSH returns 255 when connection has problem. The remote command
+        # could exit with 255 too, so only check the master next time.
+        pool = SSH_MASTER_POOL
+        if pool is not None and retval.cr_exit_status == 255:
+            pool.smp_host_invalidate(self)
+
+    def sh_command_job(self, log, command,
+                       timeout=constant.LONGEST_SIMPLE_COMMAND_TIME,
+                       stdin=None, return_stdout=True, return_stderr=True,
+                       quit_func=None, stdout_line_func=None,
+                       stderr_line_func=None, max_output_bytes=None):
+        """
+        Return a utils.CommandJob that runs the command on the host. The
+        job is not started, it could be added to a CommandReactor so
+        that commands on many hosts are run from a single thread.
+        """
+        if self._sbh_inited_as_local and not self._sbh_ssh_for_local:
+            full_command = command
+        else:
+            full_command = self._sh_ssh_full_command(log, command,
+                                                     timeout=timeout)
+        return utils.CommandJob(full_command, timeout=timeout, stdin=stdin,
+                                return_stdout=return_stdout,
+                                return_stderr=return_stderr,
+                                quit_func=quit_func,
+                                stdout_line_func=stdout_line_func,
+                                stderr_line_func=stderr_line_func,
+                                max_output_bytes=max_output_bytes,
+                                silent=True)
 
     def sh_wait_condition(self, log, command, condition_func, args, timeout=90,
                           sleep_interval=1, quiet=False):
@@ -222,9 +634,16 @@ class SSHBasicHost():
     def sh_run(self, log, command, silent=False,
                timeout=constant.LONGEST_SIMPLE_COMMAND_TIME, stdout_tee=None,
                stderr_tee=None, stdin=None, return_stdout=True,
-               return_stderr=True, quit_func=None, flush_tee=False):
+               return_stderr=True, quit_func=None, flush_tee=False,
+               stdout_line_func=None, stderr_line_func=None,
+               max_output_bytes=None):
         """
         Run a command on the host
+
+        If stdout_line_func/stderr_line_func is specified, it will be called
+        with each line of the output while the command is running. If
+        max_output_bytes is specified, at most that many bytes of
+        stdout/stderr will be saved in the result.
         """
         # pylint: disable=too-many-locals
         if not silent:
@@ -235,7 +654,10 @@ class SSHBasicHost():
                             stderr_tee=stderr_tee, stdin=stdin,
                             return_stdout=return_stdout,
                             return_stderr=return_stderr,
-                            quit_func=quit_func, flush_tee=flush_tee)
+                            quit_func=quit_func, flush_tee=flush_tee,
+                            stdout_line_func=stdout_line_func,
+                            stderr_line_func=stderr_line_func,
+                            max_output_bytes=max_output_bytes)
         else:
             ret = self._sh_run(log, command,
                                silent=silent,
@@ -243,7 +665,10 @@ class SSHBasicHost():
                                stdout_tee=stdout_tee, stderr_tee=stderr_tee,
                                stdin=stdin, return_stdout=return_stdout,
                                return_stderr=return_stderr, quit_func=quit_func,
-                               flush_tee=flush_tee)
+                               flush_tee=flush_tee,
+                               stdout_line_func=stdout_line_func,
+                               stderr_line_func=stderr_line_func,
+                               max_output_bytes=max_output_bytes)
         if not silent:
             log.cl_debug("ran [%s] on host [%s], ret = [%d], stdout = [%s], "
                          "stderr = [%s]",
@@ -252,6 +677,132 @@ class SSHBasicHost():
                          ret.cr_stderr)
         return ret
 
+    async def sh_run_async(self, log, command, silent=False,
+                           timeout=constant.LONGEST_SIMPLE_COMMAND_TIME,
+                           stdin=None, return_stdout=True, return_stderr=True):
+        """
+        Run a command on the host in the event loop. The same as sh_run()
+        except that the commands on many hosts could be run concurrently
+        from a single thread, e.g. with asyncio.gather().
+        """
+        if not silent:
+            log.cl_debug("starting command [%s] on host [%s]", command,
+                         self.sh_hostname)
+        if self._sbh_inited_as_local and not self._sbh_ssh_for_local:
+            ret = await utils.run_async(command, timeout=timeout, stdin=stdin,
+                                        return_stdout=return_stdout,
+                                        return_stderr=return_stderr)
+        else:
+            if not isinstance(command, str):
+                stderr = "type of command argument is not a basestring"
+                return utils.CommandResult(stderr=stderr, exit_status=-1)
+            # Checking or starting the SSH master blocks, so do it in the
+            # default executor instead of stalling the event loop.
+            loop = asyncio.get_event_loop()
+            full_command = \
+                await loop.run_in_executor(None,
+                                           functools.partial(self._sh_ssh_full_command,
+                                                             log, command,
+                                                             timeout=timeout))
+            ret = await utils.run_async(full_command, timeout=timeout,
+                                        stdin=stdin,
+                                        return_stdout=return_stdout,
+                                        return_stderr=return_stderr)
+            self.sh_check_ssh_result(ret)
+        if not silent:
+            log.cl_debug("ran [%s] on host [%s], ret = [%d], stdout = [%s], "
+                         "stderr = [%s]",
+                         command, self.sh_hostname, ret.cr_exit_status,
+                         ret.cr_stdout,
+                         ret.cr_stderr)
+        return ret
+
+    def sh_run_batch(self, log, commands, silent=False,
+                     timeout=constant.LONGEST_SIMPLE_COMMAND_TIME):
+        """
+        Run a list of commands on the host in a single round trip.
+        The commands are run one by one, the failure of a command does not
+        stop the following commands.
+        Return a list of CommandResult, one for each command. Return None
+        if the batch itself failed to run.
+        """
+        # pylint: disable=too-many-locals
+        if len(commands) == 0:
+            return []
+        token = "@coral_batch_%s@" % utils.random_word(16)
+        script = ("coral_batch_dir=$(mktemp -d /tmp/coral_batch.XXXXXXXX) "
+                  "|| exit 1\n")
+        for index, command in enumerate(commands):
+            prefix = "$coral_batch_dir/%d" % index
+            script += ("(\n%s\n) < /dev/null > %s.out 2> %s.err\n"
+                       "echo -n $? > %s.rc\n" %
+                       (command, prefix, prefix, prefix))
+        # Print the results with the exit status and the byte lengths of
+        # stdout/stderr, so that the outputs can be splitted accurately.
+        for index in range(len(commands)):
+            prefix = "$coral_batch_dir/%d" % index
+            script += ("echo \"%s %d $(cat %s.rc) $(wc -c < %s.out) "
+                       "$(wc -c < %s.err)\"\n"
+                       "cat %s.out %s.err\n" %
+                       (token, index, prefix, prefix, prefix, prefix,
+                        prefix))
+        script += "rm -fr $coral_batch_dir\n"
+
+        if not silent:
+            log.cl_debug("starting batch of %d commands on host [%s]: %s",
+                         len(commands), self.sh_hostname, commands)
+        retval = self.sh_run(log, script, silent=True, timeout=timeout)
+        if retval.cr_exit_status:
+            log.cl_error("failed to run batch of commands %s on host [%s], "
+                         "ret = [%d], stdout = [%s], stderr = [%s]",
+                         commands, self.sh_hostname,
+                         retval.cr_exit_status, retval.cr_stdout,
+                         retval.cr_stderr)
+            return None
+
+        output = retval.cr_stdout.encode()
+        header_prefix = (token + " ").encode()
+        results = []
+        offset = 0
+        for index, command in enumerate(commands):
+            newline = output.find(b"\n", offset)
+            if newline < 0 or not output.startswith(header_prefix, offset):
+                log.cl_error("unexpected output of batch commands on "
+                             "host [%s] for command [%s], stdout = [%s]",
+                             self.sh_hostname, command, retval.cr_stdout)
+                return None
+            fields = output[offset:newline].decode().split()
+            try:
+                command_index = int(fields[1])
+                exit_status = int(fields[2])
+                stdout_len = int(fields[3])
+                stderr_len = int(fields[4])
+            except (IndexError, ValueError):
+                log.cl_error("invalid header [%s] of batch commands on "
+                             "host [%s]",
+                             output[offset:newline].decode(),
+                             self.sh_hostname)
+                return None
+            if command_index != index:
+                log.cl_error("unexpected index [%s] of batch commands on "
+                             "host [%s], expected [%s]",
+                             command_index, self.sh_hostname, index)
+                return None
+            offset = newline + 1
+            stdout = output[offset:offset + stdout_len].decode()
+            offset += stdout_len
+            stderr = output[offset:offset + stderr_len].decode()
+            offset += stderr_len
+            result = utils.CommandResult(stdout=stdout, stderr=stderr,
+                                         exit_status=exit_status)
+            if not silent:
+                log.cl_debug("ran [%s] on host [%s] in batch, ret = [%d], "
+                             "stdout = [%s], stderr = [%s]",
+                             command, self.sh_hostname, exit_status,
+                             stdout, stderr)
+            results.append(result)
+        return results
+
     def sh_run_with_logs(self, log, command, stdout_fpath, stderr_fpath,
                          silent=False, timeout=constant.LONGEST_SIMPLE_COMMAND_TIME,
                          stdin=None,
@@ -354,3 +905,46 @@ class SSHBasicHost():
             self._sh_real_hostname = retval.cr_stdout.strip()
             return self._sh_real_hostname
         return None
+
+
+def hosts_run(log, hosts, command, timeout=constant.LONGEST_SIMPLE_COMMAND_TIME,
+              parallelism=None, quit_func=None, return_stdout=True,
+              return_stderr=True, stdout_line_func=None,
+              stderr_line_func=None):
+    """
+    Run the same command on many hosts from a single thread.
+    If stdout_line_func/stderr_line_func is specified, it will be called
+    with the host and each line of the output.
+    Return a list of CommandResult in the same order of the hosts.
+    """
+    # pylint: disable=too-many-locals
+    pool = SSH_MASTER_POOL
+    if pool is not None:
+        # pylint: disable=protected-access
+        remote_hosts = [host for host in hosts
+                        if not (host._sbh_inited_as_local and
+                                not host._sbh_ssh_for_local)]
+        pool.smp_prepare_hosts(log, remote_hosts, timeout=timeout,
+                               parallelism=parallelism)
+    reactor = command_reactor.CommandReactor(parallelism=parallelism,
+                                             quit_func=quit_func)
+    for host in hosts:
+        if stdout_line_func is None:
+            host_stdout_func = None
+        else:
+            host_stdout_func = functools.partial(stdout_line_func, host)
+        if stderr_line_func is None:
+            host_stderr_func = None
+        else:
+            host_stderr_func = functools.partial(stderr_line_func, host)
+        job = host.sh_command_job(log, command, timeout=timeout,
+                                  return_stdout=return_stdout,
+                                  return_stderr=return_stderr,
+                                  stdout_line_func=host_stdout_func,
+                                  stderr_line_func=host_stderr_func)
+        reactor.cre_add_job(job)
+    log.cl_debug("running command [%s] on [%d] hosts", command, len(hosts))
+    results = reactor.cre_run()
+    for host, retval in zip(hosts, results):
+        host.sh_check_ssh_result(retval)
+    return results
@@ -7,6 +7,10 @@ library to install python packages.
 """
 import os
 
+# Max number of files hashed by a single checksum process
+CHECKSUM_FILES_PER_PROCESS = 64
+
+
 class SSHHostChecksumMixin():
     """
     Mixin class of SSHHost for calculating checksum.
@@ -19,6 +23,21 @@ class SSHHostChecksumMixin():
         """
         command = "%s %s" % (checksum_command, path)
         retval = self.sh_run(log, command)
+        return self.sh_get_checksum_parse(log, command, retval)
+
+    async def sh_get_checksum_async(self, log, path,
+                                    checksum_command="sha256sum"):
+        """
+        Async version of sh_get_checksum()
+        """
+        command = "%s %s" % (checksum_command, path)
+        retval = await self.sh_run_async(log, command)
+        return self.sh_get_checksum_parse(log, command, retval)
+
+    def sh_get_checksum_parse(self, log, command, retval):
+        """
+        Parse the checksum from the result of checksum command.
+        """
         if retval.cr_exit_status:
             log.cl_error("failed to run command [%s] on host [%s], "
                          "ret = [%d], stdout = [%s], stderr = [%s]",
@@ -46,6 +65,52 @@ class SSHHostChecksumMixin():
         calculated_checksum = fields[0]
         return calculated_checksum
 
+    def sh_get_checksums(self, log, paths, checksum_command="sha256sum",
+                         parallelism=None):
+        """
+        Get the checksums of many files with a single command. The files
+        are hashed by parallel processes, one per CPU if parallelism is
+        None.
+        Return a dict with file path as key and checksum as value.
+        Return None on error.
+        """
+        if len(paths) == 0:
+            return {}
+        if parallelism is None:
+            parallelism = "$(nproc)"
+        command = ("xargs -0 -P %s -n %d %s" %
+                   (parallelism, CHECKSUM_FILES_PER_PROCESS,
+                    checksum_command))
+        stdin = "\0".join(paths) + "\0"
+        retval = self.sh_run(log, command, stdin=stdin, timeout=None)
+        if retval.cr_exit_status:
+            log.cl_error("failed to run command [%s] on host [%s], "
+                         "ret = [%d], stdout = [%s], stderr = [%s]",
+                         command,
+                         self.sh_hostname,
+                         retval.cr_exit_status,
+                         retval.cr_stdout,
+                         retval.cr_stderr)
+            return None
+
+        checksum_dict = {}
+        for line in retval.cr_stdout.splitlines():
+            # Format: "$checksum $mode$path", mode is " " or "*"
+            fields = line.split(" ", 1)
+            if len(fields) != 2 or len(fields[1]) < 2:
+                log.cl_error("unexpected line [%s] of command [%s] on "
+                             "host [%s]", line, command, self.sh_hostname)
+                return None
+            checksum_dict[fields[1][1:]] = fields[0]
+
+        for path in paths:
+            if path not in checksum_dict:
+                log.cl_error("no checksum of file [%s] in the output of "
+                             "command [%s] on host [%s]", path, command,
+                             self.sh_hostname)
+                return None
+        return checksum_dict
+
     def sh_check_checksum(self, log, path, expected_checksum,
                           checksum_command="sha256sum", quiet=False):
         """
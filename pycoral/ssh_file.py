@@ -150,6 +150,21 @@ class SSHHostFileMixin():
         """
         command = "stat %s" % path
         retval = self.sh_run(log, command)
+        return self.sh_path_exists_parse(log, command, retval)
+
+    async def sh_path_exists_async(self, log, path):
+        """
+        Async version of sh_path_exists()
+        """
+        command = "stat %s" % path
+        retval = await self.sh_run_async(log, command)
+        return self.sh_path_exists_parse(log, command, retval)
+
+    def sh_path_exists_parse(self, log, command, retval):
+        """
+        Parse the result of stat command.
+        Return 1 if exist, 0 if not, negative if error
+        """
         output = retval.cr_stderr.strip()
         if retval.cr_exit_status == 0:
             return 1
@@ -197,6 +212,21 @@ class SSHHostFileMixin():
         # 3.8: Added st_reparse_tag
         command = "stat -c '%f %i %D %h %u %g %s %X %Y %Z' " + path
         retval = self.sh_run(log, command)
+        return self.sh_stat_parse(log, command, path, retval, quiet=quiet)
+
+    async def sh_stat_async(self, log, path, quiet=False):
+        """
+        Async version of sh_stat()
+        """
+        command = "stat -c '%f %i %D %h %u %g %s %X %Y %Z' " + path
+        retval = await self.sh_run_async(log, command)
+        return self.sh_stat_parse(log, command, path, retval, quiet=quiet)
+
+    def sh_stat_parse(self, log, command, path, retval, quiet=False):
+        """
+        Parse the result of stat command, return os.stat_result. Return
+        None on error
+        """
         if retval.cr_exit_status != 0:
             if not quiet:
                 log.cl_error("failed to run [%s] on host [%s], ret = [%d], "
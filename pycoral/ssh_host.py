@@ -285,6 +285,12 @@ class SSHHost(ssh_basic.SSHBasicHost,
         """
         command = "lsmod"
         retval = self.sh_run(log, command)
+        return self.sh_lsmod_parse(log, command, retval)
+
+    def sh_lsmod_parse(self, log, command, retval):
+        """
+        Return the inserted module names from the result of lsmod command
+        """
         if retval.cr_exit_status:
             log.cl_error("failed to run command [%s] on host [%s], "
                          "ret = [%d], stdout = [%s], stderr = [%s]",
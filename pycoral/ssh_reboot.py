@@ -7,6 +7,7 @@ library to install python packages.
 """
 import time
 from pycoral import constant
+from pycoral import ssh_basic
 
 class SSHHostRebootMixin():
     """
@@ -23,6 +24,15 @@ class SSHHostRebootMixin():
             return False
         return True
 
+    async def sh_is_up_async(self, log, timeout=60):
+        """
+        Async version of sh_is_up()
+        """
+        ret = await self.sh_run_async(log, "true", timeout=timeout)
+        if ret.cr_exit_status != 0:
+            return False
+        return True
+
     def sh_wait_up(self, log, timeout=constant.LONGEST_TIME_REBOOT):
         """
         Wait until the host is up
@@ -66,6 +76,11 @@ class SSHHostRebootMixin():
         else:
             retval = self.sh_run(log, "reboot &")
 
+        # The multiplexed connection will be broken by the reboot
+        pool = ssh_basic.SSH_MASTER_POOL
+        if pool is not None:
+            pool.smp_host_invalidate(self)
+
         # We can't really trust the return value or output, sometimes the
         # reboot is so quick that the pipe might be broken and print
         # "Write failed: Broken pipe", so do not check the return value or
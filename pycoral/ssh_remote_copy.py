@@ -47,17 +47,25 @@ class SSHHostCopyMixin():
     To mixin, define a class like:
     class SomeHost(SSHBasicHost, SSHHostCopyMixin)
     """
-    def sh_make_rsync_cmd(self, sources, dest, delete_dest, preserve_symlinks):
+    def sh_make_rsync_cmd(self, sources, dest, delete_dest, preserve_symlinks,
+                          bwlimit=None, files_from_stdin=False,
+                          from_peer=False):
         """
         Given a list of source paths and a destination path, produces the
         appropriate rsync command for copying them. Remote paths must be
         pre-encoded.
+        If bwlimit is not None, the bandwidth is limited to bwlimit KiB/s.
+        If files_from_stdin, only the relative paths read from stdin are
+        copied.
+        If from_peer, the command runs on another host, which uses its own
+        SSH keys instead of the identity file of local host.
         """
-        # pylint: disable=no-self-use
-        if self._sbh_inited_as_local and not self._sbh_ssh_for_local:
+        # pylint: disable=no-self-use,too-many-arguments
+        if (self._sbh_inited_as_local and not self._sbh_ssh_for_local and
+                not from_peer):
             ssh_option = ""
         else:
-            ssh_cmd = self._get_ssh_command()
+            ssh_cmd = self._get_ssh_command(identity_file=not from_peer)
             ssh_option = " --rsh='%s'" % ssh_cmd
         if delete_dest:
             delete_flag = " --delete"
@@ -67,9 +75,34 @@ class SSHHostCopyMixin():
             symlink_flag = ""
         else:
             symlink_flag = " -L"
-        command = "rsync%s%s --timeout=1800%s -az %s %s"
+        extra_option = ""
+        if bwlimit is not None:
+            extra_option += " --bwlimit=%d" % bwlimit
+        if files_from_stdin:
+            extra_option += " --from0 --files-from=-"
+        command = "rsync%s%s --timeout=1800%s -az%s %s %s"
         return command % (symlink_flag, delete_flag, ssh_option,
-                          " ".join(sources), dest)
+                          extra_option, " ".join(sources), dest)
+
+    def sh_peer_trusted(self, log, remote_host):
+        """
+        Check whether this host can SSH to the remote host without password,
+        using its own SSH keys.
+        """
+        # pylint: disable=protected-access
+        command = ("%s -o ConnectTimeout=10 %s true" %
+                   (remote_host._get_ssh_command(identity_file=False),
+                    remote_host.sh_hostname))
+        retval = self.sh_run(log, command, timeout=60)
+        if retval.cr_exit_status:
+            log.cl_debug("host [%s] is not able to SSH to host [%s] without "
+                         "password, command = [%s], ret = [%d], "
+                         "stdout = [%s], stderr = [%s]",
+                         self.sh_hostname, remote_host.sh_hostname, command,
+                         retval.cr_exit_status, retval.cr_stdout,
+                         retval.cr_stderr)
+            return False
+        return True
 
     def sh_has_rsync(self, log):
         """
@@ -81,13 +114,18 @@ class SSHHostCopyMixin():
                      preserve_symlinks=False,
                      from_local=True,
                      remote_host=None,
-                     timeout=None):
+                     timeout=None,
+                     bwlimit=None,
+                     relative_fpaths=None):
         """
         Send file/dir from a host to another host
         If from_local is True, the file will be sent from local host;
         Otherwise, it will be sent from this host (self).
         If remot_host is not none, the file will be sent to that host;
         Otherwise, it will be sent to this host (self).
+        If bwlimit is not None, the bandwidth is limited to bwlimit KiB/s.
+        If relative_fpaths is not None, source should be a dir and only the
+        listed files under it will be sent to the dest dir.
         """
         # pylint: disable=too-many-locals
         if not self.sh_has_rsync(log):
@@ -102,12 +140,19 @@ class SSHHostCopyMixin():
         remote_dest = remote_host.sh_encode_remote_paths([dest], False)
 
         local_sources = [ssh_basic.sh_escape(path) for path in source]
+        stdin = None
+        if relative_fpaths is not None:
+            stdin = "\0".join(relative_fpaths) + "\0"
+        from_peer = not from_local and remote_host is not self
         rsync = remote_host.sh_make_rsync_cmd(local_sources, remote_dest,
-                                              delete_dest, preserve_symlinks)
+                                              delete_dest, preserve_symlinks,
+                                              bwlimit=bwlimit,
+                                              files_from_stdin=stdin is not None,
+                                              from_peer=from_peer)
         if from_local:
-            ret = utils.run(rsync, timeout=timeout)
+            ret = utils.run(rsync, timeout=timeout, stdin=stdin)
         else:
-            ret = self.sh_run(log, rsync, timeout=timeout)
+            ret = self.sh_run(log, rsync, timeout=timeout, stdin=stdin)
         if ret.cr_exit_status:
             log.cl_error("failed to send file [%s] on host [%s] to dest [%s] "
                          "on host [%s], command = [%s], ret = [%d], "
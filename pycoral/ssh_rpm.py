@@ -122,6 +122,20 @@ class SSHHostRPMMixin():
         """
         command = "rpm -qa | grep %s" % rpm_keyword
         retval = self.sh_run(log, command)
+        return self.sh_rpm_version_parse(log, command, retval)
+
+    async def sh_rpm_version_async(self, log, rpm_keyword):
+        """
+        Async version of sh_rpm_version()
+        """
+        command = "rpm -qa | grep %s" % rpm_keyword
+        retval = await self.sh_run_async(log, command)
+        return self.sh_rpm_version_parse(log, command, retval)
+
+    def sh_rpm_version_parse(self, log, command, retval):
+        """
+        Parse the result of the command run by sh_rpm_version()
+        """
         if retval.cr_exit_status == 1 and retval.cr_stdout == "":
             return 0, None
         if retval.cr_exit_status:
@@ -240,6 +254,16 @@ class SSHHostRPMMixin():
             return -1
         return 0
 
+    async def sh_rpm_query_async(self, log, rpm_name):
+        """
+        Async version of sh_rpm_query()
+        """
+        command = "rpm -q %s" % rpm_name
+        retval = await self.sh_run_async(log, command)
+        if retval.cr_exit_status:
+            return -1
+        return 0
+
     def sh_rpm_install_time(self, log, rpm_name, quiet=False):
         """
         Return the installation time of a RPM
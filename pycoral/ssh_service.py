@@ -18,6 +18,21 @@ class SSHHostServiceMixin():
         """
         command = "systemctl is-active %s" % service_name
         retval = self.sh_run(log, command)
+        return self.sh_service_is_active_parse(log, command, retval)
+
+    async def sh_service_is_active_async(self, log, service_name):
+        """
+        Async version of sh_service_is_active()
+        """
+        command = "systemctl is-active %s" % service_name
+        retval = await self.sh_run_async(log, command)
+        return self.sh_service_is_active_parse(log, command, retval)
+
+    def sh_service_is_active_parse(self, log, command, retval):
+        """
+        Parse the result of "systemctl is-active" command.
+        If is active, return 1. If inactive, return 0. Return -1 on error.
+        """
         # Unknown service means this service might have not been configured
         if retval.cr_stdout == "unknown\n":
             return 0
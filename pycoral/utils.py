@@ -11,7 +11,6 @@ import errno
 import time
 import signal
 import subprocess
-import io
 import select
 import logging
 import logging.handlers
@@ -23,6 +22,10 @@ import socket
 import re
 import traceback
 import base64
+from pycoral import lazy_import
+from pycoral import command_reactor
+
+asyncio = lazy_import.lazy_module("asyncio")  # pylint: disable=invalid-name
 
 
 def read_one_line(filename):
@@ -105,6 +108,9 @@ class CommandResult():
         self.cr_duration = duration
         # Whether timeout happens
         self.cr_timeout = False
+        # Whether stdout/stderr is truncated because of max_output_bytes
+        self.cr_stdout_truncated = False
+        self.cr_stderr_truncated = False
 
     def cr_clear(self):
         """
@@ -114,6 +120,8 @@ class CommandResult():
         self.cr_stderr = ""
         self.cr_duration = 0
         self.cr_exit_status = None
+        self.cr_stdout_truncated = False
+        self.cr_stderr_truncated = False
 
 
 class CommandJob():
@@ -124,7 +132,8 @@ class CommandJob():
     def __init__(self, command, timeout=None, stdout_tee=None,
                  stderr_tee=None, stdin=None, return_stdout=True,
                  return_stderr=True, quit_func=None,
-                 flush_tee=False, silent=False):
+                 flush_tee=False, silent=False, stdout_line_func=None,
+                 stderr_line_func=None, max_output_bytes=None):
         self.cj_command = command
         self.cj_result = CommandResult()
         self.cj_timeout = timeout
@@ -142,10 +151,20 @@ class CommandJob():
         else:
             self.cj_string_stdin = None
             self.cj_stdin = None
-        if return_stdout:
-            self.cj_stdout_file = io.BytesIO()
-        if return_stderr:
-            self.cj_stderr_file = io.BytesIO()
+        # If stdout_line_func/stderr_line_func is not None, it will be
+        # called with each line of stdout/stderr when the command is running.
+        # max_output_bytes limits the bytes of stdout/stderr saved in the
+        # result, so huge outputs can be processed with flat memory.
+        self.cj_stdout_stream = \
+            command_reactor.CommandOutputStream(return_output=return_stdout,
+                                                tee=stdout_tee,
+                                                line_func=stdout_line_func,
+                                                max_bytes=max_output_bytes)
+        self.cj_stderr_stream = \
+            command_reactor.CommandOutputStream(return_output=return_stderr,
+                                                tee=stderr_tee,
+                                                line_func=stderr_line_func,
+                                                max_bytes=max_output_bytes)
         self.cj_started = False
         self.cj_killed = False
         self.cj_start_time = None
@@ -193,6 +212,8 @@ class CommandJob():
         """
         self.cj_process_output(is_stdout=True, final_read=True)
         self.cj_process_output(is_stdout=False, final_read=True)
+        self.cj_stdout_stream.cos_finish()
+        self.cj_stderr_stream.cos_finish()
         if self.cj_stdout_tee:
             self.cj_stdout_tee.flush()
         if self.cj_stderr_tee:
@@ -201,9 +222,11 @@ class CommandJob():
         self.cj_subprocess.stderr.close()
         self.cj_stop_time = time.time()
         if self.cj_return_stdout:
-            self.cj_result.cr_stdout = self.cj_stdout_file.getvalue().decode()
+            self.cj_result.cr_stdout = self.cj_stdout_stream.cos_getvalue()
+            self.cj_result.cr_stdout_truncated = self.cj_stdout_stream.cos_truncated
         if self.cj_return_stderr:
-            self.cj_result.cr_stderr = self.cj_stderr_file.getvalue().decode()
+            self.cj_result.cr_stderr = self.cj_stderr_stream.cos_getvalue()
+            self.cj_result.cr_stderr_truncated = self.cj_stderr_stream.cos_truncated
         self.cj_result.cr_duration = self.cj_stop_time - self.cj_start_time
         self.cj_result.cr_timeout = self.cj_killed
         if not self.cj_silent:
@@ -240,33 +263,25 @@ class CommandJob():
         """
         Process the stdout or stderr
         """
-        buf = None
         if is_stdout:
             pipe = self.cj_subprocess.stdout
-            if self.cj_return_stdout:
-                buf = self.cj_stdout_file
-            tee = self.cj_stdout_tee
+            stream = self.cj_stdout_stream
         else:
             pipe = self.cj_subprocess.stderr
-            if self.cj_return_stderr:
-                buf = self.cj_stderr_file
-            tee = self.cj_stderr_tee
+            stream = self.cj_stderr_stream
 
         if final_read:
             # read in all the data we can from pipe and then stop
-            data = bytes()
             while select.select([pipe], [], [], 0)[0]:
-                tmp_data = os.read(pipe.fileno(), 1024)
-                if len(tmp_data) == 0:
+                data = os.read(pipe.fileno(),
+                               command_reactor.COMMAND_READ_SIZE)
+                if len(data) == 0:
                     break
-                data += tmp_data
+                stream.cos_feed(data)
         else:
             # perform a single read
-            data = os.read(pipe.fileno(), 1024)
-        if buf is not None:
-            buf.write(data)
-        if tee:
-            tee.write(data)
+            data = os.read(pipe.fileno(), command_reactor.COMMAND_READ_SIZE)
+            stream.cos_feed(data)
 
     def cj_kill(self):
         """
@@ -346,7 +361,8 @@ class CommandJob():
 
 def run(command, timeout=None, stdout_tee=None, stderr_tee=None, stdin=None,
         return_stdout=True, return_stderr=True, quit_func=None,
-        flush_tee=False, silent=False):
+        flush_tee=False, silent=False, stdout_line_func=None,
+        stderr_line_func=None, max_output_bytes=None):
     """
     Run a command
     """
@@ -357,10 +373,113 @@ def run(command, timeout=None, stdout_tee=None, stderr_tee=None, stdin=None,
     job = CommandJob(command, timeout=timeout, stdout_tee=stdout_tee,
                      stderr_tee=stderr_tee, stdin=stdin,
                      return_stdout=return_stdout, return_stderr=return_stderr,
-                     quit_func=quit_func, flush_tee=flush_tee, silent=silent)
+                     quit_func=quit_func, flush_tee=flush_tee, silent=silent,
+                     stdout_line_func=stdout_line_func,
+                     stderr_line_func=stderr_line_func,
+                     max_output_bytes=max_output_bytes)
     return job.cj_run()
 
 
+async def _kill_subprocess_async(process):
+    """
+    Kill the asyncio subprocess, SIGTERM first and then SIGKILL
+    """
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+        await asyncio.wait_for(process.wait(), 5)
+    except ProcessLookupError:
+        return
+    except asyncio.TimeoutError:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            return
+        await process.wait()
+
+
+async def run_async(command, timeout=None, stdin=None, return_stdout=True,
+                    return_stderr=True):
+    """
+    Run a command in the event loop. The same as run() except that the
+    outputs are returned when the command exits.
+    If the coroutine is cancelled, e.g. by a timeout of the caller, the
+    command will be killed.
+    """
+    if not isinstance(command, str):
+        stderr = "type of command argument is not a basestring"
+        return CommandResult(stderr=stderr, exit_status=-1)
+
+    if isinstance(stdin, str):
+        stdin_pipe = subprocess.PIPE
+        input_data = stdin.encode('utf-8')
+    elif isinstance(stdin, bytes):
+        stdin_pipe = subprocess.PIPE
+        input_data = stdin
+    elif stdin is None:
+        stdin_pipe = None
+        input_data = None
+    else:
+        stderr = "type of stdin argument is neither a string nor bytes"
+        return CommandResult(stderr=stderr, exit_status=-1)
+
+    time_start = time.time()
+    process = await asyncio.create_subprocess_shell("LANG=en_US.UTF-8 " + command,
+                                                    stdin=stdin_pipe,
+                                                    stdout=subprocess.PIPE,
+                                                    stderr=subprocess.PIPE,
+                                                    executable='/bin/bash')
+    timeout_happened = False
+    stdout = b""
+    stderr = b""
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(input_data),
+                                                timeout)
+    except asyncio.TimeoutError:
+        timeout_happened = True
+        await _kill_subprocess_async(process)
+    except asyncio.CancelledError:
+        await _kill_subprocess_async(process)
+        raise
+
+    result = CommandResult(exit_status=process.returncode,
+                           duration=time.time() - time_start)
+    result.cr_timeout = timeout_happened
+    if return_stdout:
+        result.cr_stdout = stdout.decode()
+    if return_stderr:
+        result.cr_stderr = stderr.decode()
+    logging.debug("command [%s] finished, "
+                  "ret = [%d], stdout = [%s], stderr = [%s]",
+                  command, result.cr_exit_status, result.cr_stdout,
+                  result.cr_stderr)
+    return result
+
+
+def run_coroutine(coroutine, timeout=None):
+    """
+    Run the coroutine in a new event loop until it finishes and return
+    its result. asyncio.run() is not available in Python 3.6.
+    If timeout happens, asyncio.TimeoutError will be raised.
+    """
+    async def wait_coroutine():
+        """
+        Wait the coroutine with timeout
+        """
+        return await asyncio.wait_for(coroutine, timeout)
+
+    loop = asyncio.new_event_loop()
+    # Python 3.6 needs the loop to be set as the event loop of the main
+    # thread so that the child watcher of subprocess is attached to it.
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(wait_coroutine())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
 def thread_start(target, args):
     """
     Wrap the target function and start a thread to run it
@@ -62,7 +62,8 @@ class ReleaseStatusCache():
                 if release.rli_file_dict is None or self.rsc_release_dir is None:
                     continue
                 complete = release.rli_files_are_complete(log, self.rsc_local_host,
-                                                          self.rsc_release_dir)
+                                                          self.rsc_release_dir,
+                                                          trust_cache=True)
                 if complete < 0:
                     self.rsc_failed = True
                 self.rsc_complete = complete